@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сценарии замеров для run_bench.py
+Каждый сценарий создает клиента к локальному симулятору принтера и выполняет одну операцию
+"""
+
+import os
+import platform
+import shutil
+import stat
+import sys
+import tempfile
+from typing import Callable, Dict, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from hp_capability_cache import PJLCapabilityCache
+from hp_ipp_simulator import IPPStandInServer
+from hp_m425_scanner_counter import HPM425Printer
+from hp_pjl_protocol import READ_MODE_LEGACY
+from hp_printer_simulator import PRINTER_MODELS, PrinterSimulator
+from hp_rtt import RTTStore
+from hp_scanner_counter import HPPrinterPJL
+from hp_scanner_counter_async import AsyncHPPrinterPJL
+from hp_scanner_counter_auto import HPPrinterAuto
+from hp_scanner_counter_improved import HPPrinterImproved
+from hp_scanner_counter_system import HPPrinterSystem
+
+
+# Заглушки lp/lpstat: задание пересылается в симулятор, как это сделал бы CUPS
+# (lp молчит, как с ключом -s, чтобы вывод подпроцессов не смешивался с отчетом)
+LP_STUB = '''#!{python}
+import socket, sys
+data = sys.stdin.buffer.read()
+with socket.create_connection(("{host}", {port}), timeout=5) as sock:
+    sock.sendall(data)
+'''
+
+LPSTAT_STUB = '''#!{python}
+import sys
+args = sys.argv[1:]
+if "-W" in args:
+    print("{queue}-1    bench    1024   Mon 01 Jan 2024 10:00:00")
+else:
+    print("printer {queue} is idle.  enabled since Mon 01 Jan 2024 10:00:00")
+    if "-l" in args:
+        print("\\tDescription: {model}")
+'''
+
+
+class BenchEnvironment:
+    """Локальный стенд: симулятор принтера, рабочий каталог, заменитель cupsd (IPP) и заглушки CUPS"""
+
+    def __init__(self, model: str = "M425", latency: float = 0.0, jitter: float = 0.0,
+                 drop_rate: float = 0.0, timeout: float = 5.0):
+        """
+        Инициализация стенда
+
+        Args:
+            model: Профиль модели симулятора
+            latency: Задержка ответа симулятора в секундах
+            jitter: Разброс задержки в секундах
+            drop_rate: Доля потерянных ответов
+            timeout: Таймаут клиентов в секундах
+        """
+        self.simulator = PrinterSimulator("127.0.0.1", 0, model=model, latency=latency,
+                                          jitter=jitter, drop_rate=drop_rate, seed=1)
+        self.ipp_server = IPPStandInServer("127.0.0.1", 0)
+        self.model_name = PRINTER_MODELS[model]["id"]
+        self.queue = self.model_name.replace(" ", "_")
+        self.timeout = timeout
+        self.host = "127.0.0.1"
+        self.port = None
+        self.workdir = None
+        self._previous_cwd = None
+        self._previous_path = None
+        self._previous_cups_server = None
+
+    def _write_stub(self, name: str, template: str):
+        path = os.path.join(self.workdir, "bin", name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(template.format(python=sys.executable, host=self.host, port=self.port,
+                                    queue=self.queue, model=self.model_name))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+    def __enter__(self) -> "BenchEnvironment":
+        self.host, self.port = self.simulator.start()
+        self.ipp_server.add_printer(self.queue, self.model_name, forward=(self.host, self.port))
+        cups_server = self.ipp_server.start()
+        # Клиенты системных методов пишут конфигурацию в текущий каталог
+        self.workdir = tempfile.mkdtemp(prefix="hp_bench_")
+        os.makedirs(os.path.join(self.workdir, "bin"))
+        self._write_stub("lp", LP_STUB)
+        self._write_stub("lpstat", LPSTAT_STUB)
+        self._previous_cwd = os.getcwd()
+        self._previous_path = os.environ.get("PATH", "")
+        self._previous_cups_server = os.environ.get("CUPS_SERVER")
+        os.chdir(self.workdir)
+        os.environ["PATH"] = os.path.join(self.workdir, "bin") + os.pathsep + self._previous_path
+        os.environ["CUPS_SERVER"] = cups_server
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        os.chdir(self._previous_cwd)
+        os.environ["PATH"] = self._previous_path
+        if self._previous_cups_server is None:
+            os.environ.pop("CUPS_SERVER", None)
+        else:
+            os.environ["CUPS_SERVER"] = self._previous_cups_server
+        self.ipp_server.stop()
+        self.simulator.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def cups_printer(self) -> Dict[str, str]:
+        """Описание принтера для connect() системных клиентов"""
+        return {"name": self.queue, "port": "CUPS"}
+
+
+class BenchCase:
+    """Описание одного сценария замера"""
+
+    def __init__(self, name: str, setup: Callable, operation: Callable,
+                 teardown: Optional[Callable] = None, iterations: int = 200,
+                 slow: bool = False, is_async: bool = False, available: Callable = None):
+        """
+        Args:
+            name: Имя сценария (transport.operation)
+            setup: setup(env) -> клиент (по одному на поток)
+            operation: operation(client, index) -> результат; None/False считается ошибкой
+            teardown: teardown(client)
+            iterations: Число итераций на поток по умолчанию
+            slow: Сценарий с паузами (запускается только с --include-slow)
+            is_async: operation - корутина, клиент работает в цикле asyncio
+            available: available() -> bool, можно ли запустить сценарий на этой системе
+        """
+        self.name = name
+        self.setup = setup
+        self.operation = operation
+        self.teardown = teardown
+        self.iterations = iterations
+        self.slow = slow
+        self.is_async = is_async
+        self.available = available or (lambda: True)
+
+
+def _connected(client, connect: Callable):
+    if not connect(client):
+        raise ConnectionError("Не удалось подключиться к симулятору")
+    return client
+
+
+def _pjl(env: BenchEnvironment) -> HPPrinterPJL:
+    return _connected(HPPrinterPJL(env.host, env.port, env.timeout), HPPrinterPJL.connect)
+
+
+def _pjl_cached(env: BenchEnvironment) -> HPPrinterPJL:
+    cache = PJLCapabilityCache(os.path.join(env.workdir, "bench_capabilities.json"))
+    return _connected(HPPrinterPJL(env.host, env.port, env.timeout, capabilities=cache),
+                      HPPrinterPJL.connect)
+
+
+def _pjl_legacy(env: BenchEnvironment) -> HPPrinterPJL:
+    # Старый режим читает до таймаута сокета, поэтому таймаут уменьшен
+    return _connected(HPPrinterPJL(env.host, env.port, 1, read_mode=READ_MODE_LEGACY),
+                      HPPrinterPJL.connect)
+
+
+def _pjl_rtt(env: BenchEnvironment) -> HPPrinterPJL:
+    # Тот же старый режим, но ожидание подстраивается под время ответа
+    rtt = RTTStore(os.path.join(env.workdir, "bench_rtt.json"))
+    return _connected(HPPrinterPJL(env.host, env.port, env.timeout, read_mode=READ_MODE_LEGACY,
+                                   rtt=rtt), HPPrinterPJL.connect)
+
+
+def _improved(env: BenchEnvironment) -> HPPrinterImproved:
+    return _connected(HPPrinterImproved(env.host, int(env.timeout), port=env.port),
+                      HPPrinterImproved.detect_and_connect)
+
+
+def _auto(env: BenchEnvironment) -> HPPrinterAuto:
+    return _connected(HPPrinterAuto(env.host, int(env.timeout), port=env.port), HPPrinterAuto.connect)
+
+
+def _system(env: BenchEnvironment) -> HPPrinterSystem:
+    printer = HPPrinterSystem(int(env.timeout))
+    return _connected(printer, lambda client: client.connect(env.cups_printer()))
+
+
+def _system_lp(env: BenchEnvironment) -> HPPrinterSystem:
+    # Прежний путь: запуск lpstat/lp (заглушки) вместо запросов IPP
+    printer = HPPrinterSystem(int(env.timeout), use_ipp=False)
+    return _connected(printer, lambda client: client.connect(env.cups_printer()))
+
+
+def _m425(env: BenchEnvironment) -> HPM425Printer:
+    printer = HPM425Printer(int(env.timeout))
+    return _connected(printer, lambda client: client.connect(env.cups_printer()))
+
+
+def _async_pjl(env: BenchEnvironment) -> AsyncHPPrinterPJL:
+    return AsyncHPPrinterPJL(env.host, env.port, env.timeout, verbose=False)
+
+
+async def _async_get(client: AsyncHPPrinterPJL, index: int):
+    if not client.writer and not await client.connect():
+        return None
+    return await client.get_scanner_counter()
+
+
+async def _async_close(client: AsyncHPPrinterPJL):
+    await client.disconnect()
+
+
+def _disconnect(client):
+    client.disconnect()
+
+
+def _is_linux() -> bool:
+    return platform.system().lower() == "linux"
+
+
+CASES = [
+    BenchCase("pjl.get", _pjl, lambda c, i: c.get_scanner_counter(), _disconnect),
+    BenchCase("pjl.set", _pjl, lambda c, i: c.set_scanner_counter(1000 + i), _disconnect),
+    BenchCase("pjl.info", _pjl, lambda c, i: c.get_printer_info(), _disconnect),
+    BenchCase("pjl_cached.get", _pjl_cached, lambda c, i: c.get_scanner_counter(), _disconnect),
+    BenchCase("pjl_cached.set", _pjl_cached, lambda c, i: c.set_scanner_counter(1000 + i), _disconnect),
+    BenchCase("pjl_legacy.get", _pjl_legacy, lambda c, i: c.get_scanner_counter(), _disconnect,
+              iterations=3, slow=True),
+    BenchCase("pjl_rtt.get", _pjl_rtt, lambda c, i: c.get_scanner_counter(),
+              _disconnect, iterations=20),
+    BenchCase("async.get", _async_pjl, _async_get, _async_close, is_async=True),
+    BenchCase("improved.get", _improved, lambda c, i: c.get_scanner_counter(), _disconnect),
+    BenchCase("improved.set", _improved, lambda c, i: c.set_scanner_counter(1000 + i), _disconnect,
+              iterations=3, slow=True),
+    BenchCase("improved.info", _improved, lambda c, i: c.get_printer_info(), _disconnect),
+    BenchCase("auto.get", _auto, lambda c, i: c.get_scanner_counter(), _disconnect),
+    BenchCase("auto.set", _auto, lambda c, i: c.set_scanner_counter(1000 + i), _disconnect),
+    BenchCase("auto.info", _auto, lambda c, i: c.get_printer_info(), _disconnect),
+    BenchCase("system.get", _system, lambda c, i: c.get_scanner_counter(), _disconnect,
+              iterations=20, available=_is_linux),
+    BenchCase("system.set", _system, lambda c, i: c.set_scanner_counter(1000 + i), _disconnect,
+              iterations=20, available=_is_linux),
+    BenchCase("system.info", _system, lambda c, i: c.get_printer_info(), _disconnect,
+              iterations=20, available=_is_linux),
+    BenchCase("system_lp.get", _system_lp, lambda c, i: c.get_scanner_counter(), _disconnect,
+              iterations=20, available=_is_linux),
+    BenchCase("system_lp.set", _system_lp, lambda c, i: c.set_scanner_counter(1000 + i), _disconnect,
+              iterations=20, available=_is_linux),
+    BenchCase("m425.get", _m425, lambda c, i: c.get_m425_scanner_counter(), _disconnect,
+              iterations=2, slow=True, available=_is_linux),
+    BenchCase("m425.set", _m425, lambda c, i: c.set_m425_scanner_counter(1000 + i), _disconnect,
+              iterations=20, available=_is_linux),
+]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Замер истории счетчика (SQLite hp_counter_history или бинарный hp_counter_series)
+Заполняет временное хранилище отметками нескольких устройств (по одной в
+минуту; счетчик растет в рабочие часы, ночью и в выходные стоит) и измеряет
+размер, скорость пакетной вставки и выборок за период
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from hp_counter_history import ACTION_GET
+from hp_counter_series import SERIES_SUFFIX, open_history
+
+
+def measure(function, number: int) -> float:
+    """Лучшее время одного вызова в секундах (из 5 повторов)"""
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description='Замер истории счетчика')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Число отметок (по умолчанию 1 000 000)')
+    parser.add_argument('--devices', type=int, default=100,
+                        help='Число устройств (по умолчанию 100)')
+    parser.add_argument('--batch', type=int, default=10000,
+                        help='Размер пачки вставки (по умолчанию 10 000)')
+    parser.add_argument('--format', choices=['sqlite', 'series'], default='sqlite',
+                        help='Формат хранилища (по умолчанию sqlite)')
+    parser.add_argument('--output', '-o', help='Сохранить результаты в JSON файл')
+
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hp_history_")
+    try:
+        path = os.path.join(workdir, "history" + (SERIES_SUFFIX if args.format == "series" else ".db"))
+        history = open_history(path, batch_size=args.batch)
+        per_device = args.rows // args.devices
+        start = (int(time.time()) // 86400 - per_device // 1440) * 86400
+        rng = random.Random(42)
+        counters = [0] * args.devices
+
+        began = time.perf_counter()
+        for minute in range(per_device):
+            day, minute_of_day = divmod(minute, 1440)
+            working = day % 7 < 5 and 8 * 60 <= minute_of_day < 18 * 60
+            for device in range(args.devices):
+                if working and rng.random() < 0.2:
+                    counters[device] += rng.randint(1, 20)
+                history.record(f"printer-{device:03d}", counters[device], ACTION_GET, start + minute * 60)
+        history.flush()
+        insert_seconds = time.perf_counter() - began
+
+        # Последний месяц одного устройства и прирост за него
+        month_start = time.time() - 30 * 86400
+        results = {
+            "query_month_last_50": measure(
+                lambda: history.query("printer-042", month_start, limit=50), 20),
+            "usage_month": measure(lambda: history.usage("printer-042", month_start), 20),
+            "query_day_all_devices_last_50": measure(
+                lambda: history.query(since=time.time() - 86400, limit=50), 20),
+        }
+        history.close()
+        size = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    rows = per_device * args.devices
+    print(f"🗄️  Формат: {args.format}, отметок: {rows}, устройств: {args.devices}, "
+          f"размер: {size / 1e6:.1f} МБ ({size / rows:.2f} байт/отметку)")
+    print(f"   вставка пачками по {args.batch}: {insert_seconds:.2f} с "
+          f"({rows / insert_seconds:,.0f} отметок/с)")
+    for name, seconds in results.items():
+        print(f"   {name:<32} {seconds * 1e3:9.3f} мс")
+
+    if args.output:
+        report = {"format": args.format, "rows": rows, "devices": args.devices, "size": size,
+                  "insert_seconds": insert_seconds, "results": results}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
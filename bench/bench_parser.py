@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микро-замер разбора ответов (hp_counter_parser)
+Разбирает синтетический дамп @PJL INFO VARIABLES заданного размера и выводит
+время на весь ответ и на одно поле
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+from typing import Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from hp_counter_parser import find_counter, parse_response, parse_values
+
+
+def build_info_variables(size: int, counter: int = 4321) -> str:
+    """
+    Формирует ответ @PJL INFO VARIABLES примерно заданного размера
+
+    Args:
+        size: Размер ответа в байтах
+        counter: Значение SCANCOUNT (записывается в конец дампа)
+
+    Returns:
+        Текст ответа
+    """
+    lines = ["@PJL INFO VARIABLES"]
+    index = 0
+    length = len(lines[0])
+    while length < size:
+        if index % 3 == 0:
+            block = [f"VARIABLE{index}=OFF [2 ENUMERATED]", "\tOFF", "\tON"]
+        else:
+            block = [f"VARIABLE{index}={index % 1000} [2 RANGE]", "\t0", "\t999"]
+        lines.extend(block)
+        length += sum(len(line) + 2 for line in block)
+        index += 1
+    lines.append(f"SCANCOUNT={counter} [2 RANGE]")
+    return "\r\n".join(lines) + "\r\n\f"
+
+
+def legacy_parse(response: str):
+    """Прежний разбор: перебор шаблонов re.findall без предкомпиляции"""
+    patterns = [
+        r'SCANCOUNT[=:]\s*(\d+)',
+        r'SCANCOUNTER[=:]\s*(\d+)',
+        r'SCANPAGES[=:]\s*(\d+)',
+        r'@PJL\s+INFO\s+\w+\s*[=:]\s*(\d+)',
+        r'[=:]\s*(\d+)',
+        r'\b(\d{1,6})\b'
+    ]
+    for pattern in patterns:
+        for match in re.findall(pattern, response, re.IGNORECASE):
+            value = int(match)
+            if 0 <= value <= 999999:
+                return value
+    return None
+
+
+def measure(function, number: int) -> float:
+    """Лучшее время одного вызова в секундах (из 5 повторов)"""
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description='Микро-замер разбора ответов PJL')
+    parser.add_argument('--size', type=int, default=100 * 1024,
+                        help='Размер ответа INFO VARIABLES в байтах (по умолчанию 100 КБ)')
+    parser.add_argument('--number', type=int, default=20,
+                        help='Вызовов в одном повторе (по умолчанию 20)')
+    parser.add_argument('--output', '-o', help='Сохранить результаты в JSON файл')
+
+    args = parser.parse_args()
+
+    response = build_info_variables(args.size)
+    fields = len(parse_response(response))
+    reading = find_counter(response)
+    assert reading is not None and reading.name == "SCANCOUNT" and reading.value == 4321
+
+    short = "@PJL INQUIRE SCANCOUNT\r\n1234\r\n\f"
+    results = {
+        "parse_response": measure(lambda: parse_response(response), args.number),
+        "parse_values": measure(lambda: parse_values(response), args.number),
+        "find_counter": measure(lambda: find_counter(response), args.number),
+        "legacy_findall": measure(lambda: legacy_parse(response), args.number),
+        "find_counter_short": measure(lambda: find_counter(short), args.number * 100),
+    }  # type: Dict[str, float]
+
+    print(f"📄 Ответ INFO VARIABLES: {len(response)} байт, числовых полей: {fields}")
+    for name, seconds in results.items():
+        per_field = "" if name.endswith("_short") else f"   {seconds / fields * 1e6:8.3f} мкс/поле"
+        print(f"   {name:<20} {seconds * 1e3:9.3f} мс{per_field}")
+
+    if args.output:
+        report = {
+            "size": len(response),
+            "fields": fields,
+            "results": {name: {"seconds": seconds, "us_per_field": seconds / fields * 1e6}
+                        for name, seconds in results.items()},
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
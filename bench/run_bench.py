@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Замер задержки и пропускной способности get/set/info для всех транспортов
+Клиенты работают с локальным симулятором принтера (hp_printer_simulator.py),
+результаты сохраняются в JSON и могут сравниваться с предыдущим прогоном
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bench_cases import CASES, BenchCase, BenchEnvironment
+
+
+class _NullWriter(io.TextIOBase):
+    """Поток вывода, отбрасывающий текст (клиенты много печатают)"""
+
+    def write(self, text):
+        return len(text)
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга
+
+    Args:
+        sorted_values: Отсортированные значения
+        percent: Перцентиль (0..100)
+
+    Returns:
+        Значение перцентиля (0.0 для пустого списка)
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, wall_time: float) -> Dict[str, float]:
+    """
+    Сводка по одному сценарию
+
+    Args:
+        latencies: Задержки успешных операций в секундах
+        errors: Число неудачных операций
+        wall_time: Общее время прогона в секундах
+
+    Returns:
+        Словарь с перцентилями в миллисекундах и числом операций в секунду
+    """
+    values = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3)
+    return {
+        "operations": len(values) + errors,
+        "errors": errors,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "min_ms": ms(values[0]) if values else 0.0,
+        "max_ms": ms(values[-1]) if values else 0.0,
+        "wall_s": round(wall_time, 3),
+        "ops_per_sec": round(len(values) / wall_time, 2) if wall_time > 0 else 0.0,
+    }
+
+
+def _run_sync_worker(case: BenchCase, env: BenchEnvironment, iterations: int, warmup: int,
+                     barrier: threading.Barrier, latencies: List[float], errors: List[int],
+                     worker_id: int):
+    """Поток-клиент: подключение, прогрев и замер каждой операции"""
+    client = None
+    try:
+        client = case.setup(env)
+        for index in range(warmup):
+            case.operation(client, index)
+    except Exception:
+        client = None
+    barrier.wait()
+    if client is None:
+        errors[worker_id] += iterations
+        return
+
+    local = []
+    for index in range(iterations):
+        started = time.perf_counter()
+        try:
+            result = case.operation(client, index)
+        except Exception:
+            result = None
+        elapsed = time.perf_counter() - started
+        if result is None or result is False:
+            errors[worker_id] += 1
+        else:
+            local.append(elapsed)
+    latencies.extend(local)
+
+    if case.teardown:
+        try:
+            case.teardown(client)
+        except Exception:
+            pass
+
+
+async def _run_async_case(case: BenchCase, env: BenchEnvironment, iterations: int,
+                          warmup: int, concurrency: int):
+    """Асинхронные клиенты в одном цикле событий"""
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors, ready
+        client = case.setup(env)
+        for index in range(warmup):
+            await case.operation(client, index)
+        ready += 1
+        await start.wait()
+        for index in range(iterations):
+            started = time.perf_counter()
+            try:
+                result = await case.operation(client, index)
+            except Exception:
+                result = None
+            elapsed = time.perf_counter() - started
+            if result is None or result is False:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+        if case.teardown:
+            await case.teardown(client)
+
+    start = asyncio.Event()
+    ready = 0
+    tasks = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    # Даем клиентам подключиться и прогреться до старта замера
+    while ready < concurrency and not all(task.done() for task in tasks):
+        await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    start.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, errors, time.perf_counter() - started
+
+
+def run_case(case: BenchCase, env: BenchEnvironment, iterations: int, concurrency: int,
+             warmup: int) -> Dict[str, float]:
+    """
+    Выполняет один сценарий
+
+    Args:
+        case: Сценарий
+        env: Запущенный стенд
+        iterations: Итераций на клиента
+        concurrency: Число параллельных клиентов
+        warmup: Итераций прогрева на клиента (не учитываются)
+
+    Returns:
+        Сводка summarize() с параметрами прогона
+    """
+    with contextlib.redirect_stdout(_NullWriter()):
+        if case.is_async:
+            latencies, errors, wall_time = asyncio.run(
+                _run_async_case(case, env, iterations, warmup, concurrency))
+        else:
+            latencies: List[float] = []
+            error_counts = [0] * concurrency
+            barrier = threading.Barrier(concurrency + 1)
+            threads = [threading.Thread(target=_run_sync_worker,
+                                        args=(case, env, iterations, warmup, barrier,
+                                              latencies, error_counts, worker_id),
+                                        daemon=True)
+                       for worker_id in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            wall_time = time.perf_counter() - started
+            errors = sum(error_counts)
+
+    summary = summarize(latencies, errors, wall_time)
+    summary.update({"iterations": iterations, "concurrency": concurrency})
+    return summary
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict],
+            threshold: float) -> List[str]:
+    """
+    Сравнивает результаты с базовым прогоном и печатает изменения
+
+    Args:
+        results: Текущие результаты по сценариям
+        baseline: Результаты базового прогона
+        threshold: Допустимое ухудшение p95 и ops/s в процентах
+
+    Returns:
+        Список сценариев с регрессией
+    """
+    regressions = []
+    print(f"\n📊 Сравнение с базовым прогоном (порог {threshold:.0f}%):")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"   {name:<18} нет в базовом прогоне")
+            continue
+        if base.get("concurrency") != current.get("concurrency"):
+            print(f"   ⚠️  {name}: разное число клиентов "
+                  f"({base.get('concurrency')} → {current.get('concurrency')})")
+        p95_delta = _delta(base.get("p95_ms"), current.get("p95_ms"))
+        ops_delta = _delta(base.get("ops_per_sec"), current.get("ops_per_sec"))
+        regressed = ((p95_delta is not None and p95_delta > threshold) or
+                     (ops_delta is not None and ops_delta < -threshold) or
+                     current.get("errors", 0) > base.get("errors", 0))
+        mark = "❌" if regressed else "✅"
+        print(f"   {mark} {name:<18} p95 {_format_delta(p95_delta):>8}   "
+              f"ops/s {_format_delta(ops_delta):>8}   "
+              f"ошибки {base.get('errors', 0)} → {current.get('errors', 0)}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def _delta(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100.0
+
+
+def _format_delta(value: Optional[float]) -> str:
+    return "—" if value is None else f"{value:+.1f}%"
+
+
+def select_cases(patterns: Optional[List[str]], include_slow: bool) -> List[BenchCase]:
+    """
+    Отбирает сценарии по именам или префиксам (pjl, improved.get, ...)
+
+    Args:
+        patterns: Имена/префиксы сценариев; None - все быстрые сценарии
+        include_slow: Включать сценарии с паузами в клиенте
+
+    Returns:
+        Список сценариев, доступных на этой системе
+    """
+    selected = []
+    for case in CASES:
+        if patterns:
+            transport = case.name.split(".")[0]
+            if case.name not in patterns and transport not in patterns:
+                continue
+        elif case.slow and not include_slow:
+            continue
+        if case.available():
+            selected.append(case)
+    return selected
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(
+        description='Замер get/set/info для всех транспортов на локальном симуляторе')
+    parser.add_argument('--cases', nargs='+',
+                        help='Сценарии или транспорты (pjl, improved.get, ...); по умолчанию все быстрые')
+    parser.add_argument('--include-slow', action='store_true',
+                        help='Включить сценарии с паузами (improved.set, system.set, m425.*, pjl_legacy)')
+    parser.add_argument('--iterations', type=int,
+                        help='Итераций на клиента (по умолчанию - свое для каждого сценария)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Число параллельных клиентов (по умолчанию 1)')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='Итераций прогрева на клиента (по умолчанию 2)')
+    parser.add_argument('--model', default='M425',
+                        help='Профиль модели симулятора (по умолчанию M425)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Задержка ответа симулятора в секундах')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Разброс задержки симулятора в секундах')
+    parser.add_argument('--output', '-o', help='Сохранить результаты в JSON файл')
+    parser.add_argument('--baseline', help='JSON файл предыдущего прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Допустимое ухудшение p95/ops в процентах (по умолчанию 10)')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Код возврата 1 при регрессии')
+    parser.add_argument('--list', action='store_true', help='Показать сценарии и выйти')
+
+    args = parser.parse_args()
+
+    if args.list:
+        for case in CASES:
+            flags = []
+            if case.slow:
+                flags.append("медленный")
+            if not case.available():
+                flags.append("недоступен")
+            suffix = f" ({', '.join(flags)})" if flags else ""
+            print(f"{case.name:<18} {case.iterations} итераций{suffix}")
+        return
+
+    cases = select_cases(args.cases, args.include_slow)
+    if not cases:
+        print("❌ Нет сценариев для запуска")
+        sys.exit(1)
+
+    # Стенд меняет текущий каталог, поэтому пути приводятся к абсолютным заранее
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_file = os.path.abspath(args.baseline) if args.baseline else None
+
+    results = {}
+    print(f"🚀 Сценариев: {len(cases)}, клиентов: {args.concurrency}, модель {args.model}, "
+          f"задержка {args.latency * 1000:.1f} мс")
+    with BenchEnvironment(args.model, args.latency, args.jitter) as env:
+        for case in cases:
+            iterations = args.iterations or case.iterations
+            summary = run_case(case, env, iterations, args.concurrency, args.warmup)
+            results[case.name] = summary
+            print(f"   {case.name:<18} p50 {summary['p50_ms']:>9.3f} мс   "
+                  f"p95 {summary['p95_ms']:>9.3f} мс   p99 {summary['p99_ms']:>9.3f} мс   "
+                  f"{summary['ops_per_sec']:>9.1f} оп/с   ошибок {summary['errors']}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "model": args.model,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены: {output}")
+
+    if baseline_file:
+        with open(baseline_file, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️  Регрессии: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\n✅ Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
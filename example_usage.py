@@ -8,20 +8,27 @@
 import sys
 import time
 from hp_scanner_counter import HPPrinterPJL
+from hp_connection_pool import PJLConnectionPool
 
 
-def demo_scanner_operations(printer_ip: str):
+# Общий пул соединений: повторные подключения к тому же принтеру
+# не требуют нового TCP рукопожатия
+CONNECTION_POOL = PJLConnectionPool(max_per_device=1, idle_timeout=120)
+
+
+def demo_scanner_operations(printer_ip: str, port: int = 9100):
     """
     Демонстрация основных операций со счетчиком сканера
     
     Args:
         printer_ip: IP адрес принтера
+        port: Порт принтера (другой порт - например, для hp_printer_simulator.py)
     """
     print("🖨️  Демонстрация работы со счетчиком сканера HP LaserJet Pro 400")
     print("="*70)
     
     # Создаем объект для работы с принтером
-    printer = HPPrinterPJL(printer_ip)
+    printer = HPPrinterPJL(printer_ip, port, pool=CONNECTION_POOL)
     
     try:
         # Подключаемся к принтеру
@@ -93,18 +100,19 @@ def demo_scanner_operations(printer_ip: str):
         printer.disconnect()
 
 
-def batch_operations_example(printer_ip: str, values: list):
+def batch_operations_example(printer_ip: str, values: list, port: int = 9100):
     """
     Пример пакетных операций со счетчиком
     
     Args:
         printer_ip: IP адрес принтера
         values: Список значений для установки
+        port: Порт принтера
     """
     print(f"\n🔄 Пакетная установка значений: {values}")
     print("-" * 50)
     
-    printer = HPPrinterPJL(printer_ip)
+    printer = HPPrinterPJL(printer_ip, port, pool=CONNECTION_POOL)
     
     try:
         if not printer.connect():
@@ -138,17 +146,19 @@ def batch_operations_example(printer_ip: str, values: list):
 
 def main():
     """Главная функция примера"""
-    if len(sys.argv) != 2:
-        print("Использование: python example_usage.py <IP_принтера>")
+    if len(sys.argv) not in (2, 3):
+        print("Использование: python example_usage.py <IP_принтера> [порт]")
         print("Пример: python example_usage.py 192.168.1.100")
+        print("С симулятором: python example_usage.py 127.0.0.1 9101")
         sys.exit(1)
     
     printer_ip = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 9100
     
     try:
         # Основная демонстрация
         print("🚀 Запуск демонстрации основных функций...")
-        if demo_scanner_operations(printer_ip):
+        if demo_scanner_operations(printer_ip, port):
             
             # Пример пакетных операций
             print("\n" + "="*70)
@@ -156,7 +166,7 @@ def main():
             user_input = input(f"Хотите запустить пакетные операции с значениями {test_values}? (y/n): ").lower().strip()
             
             if user_input == 'y':
-                batch_operations_example(printer_ip, test_values)
+                batch_operations_example(printer_ip, test_values, port)
             else:
                 print("⏭️  Пакетные операции пропущены")
         
@@ -168,6 +178,8 @@ def main():
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {e}")
         sys.exit(1)
+    finally:
+        CONNECTION_POOL.close_all()
 
 
 if __name__ == "__main__":
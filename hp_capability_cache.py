@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш поддерживаемых PJL команд для принтеров HP
+Запоминает, какие варианты команд чтения/установки счетчика работают на устройстве
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from hp_pjl_protocol import SCAN_COUNTER_QUERIES, SCAN_COUNTER_SETTERS
+
+# Команды для определения устройства (модель, серийный номер, прошивка)
+IDENTITY_COMMANDS = {
+    "id": "@PJL INFO ID",
+    "serial": "@PJL INQUIRE SERIALNUMBER",
+    "firmware": "@PJL INFO VERSION"
+}
+
+# Статусы вариантов команд
+STATUS_OK = "ok"
+STATUS_UNSUPPORTED = "unsupported"
+
+# Порядок предпочтения рабочих вариантов: DINQUIRE в конце списка возвращает
+# значение по умолчанию, а не текущее, поэтому время проверки не учитывается
+VARIANT_ORDER = {
+    "read": SCAN_COUNTER_QUERIES,
+    "write": SCAN_COUNTER_SETTERS
+}
+
+
+def parse_identity_value(response: Optional[str]) -> Optional[str]:
+    """
+    Извлекает значение из ответа на команду идентификации
+
+    Ответ обычно содержит эхо команды и значение на следующей строке
+    (или KEY=VALUE). "?" означает, что команда не поддерживается.
+    """
+    if not response:
+        return None
+    lines = [line.strip() for line in response.splitlines()
+             if line.strip() and not line.strip().upper().startswith("@PJL")]
+    if not lines:
+        return None
+    value = lines[0].split("=", 1)[-1].strip().strip('"')
+    if not value or value == "?":
+        return None
+    return value
+
+
+def is_unsupported_reply(response: Optional[str]) -> bool:
+    """
+    Принтер явно отклонил команду ("?" или UNSUPPORTED)
+
+    Пустой ответ или таймаут отказом не считаются: медленный ответ не должен
+    помечать рабочую команду неподдерживаемой.
+    """
+    if not response:
+        return False
+    if "UNSUPPORTED" in response.upper():
+        return True
+    lines = [line.strip() for line in response.splitlines()
+             if line.strip() and not line.strip().upper().startswith("@PJL")]
+    return any(line.split("=", 1)[-1].strip().strip('"') == "?" for line in lines)
+
+
+class PJLCapabilityCache:
+    """Сохраняемый между запусками кэш возможностей устройств"""
+
+    def __init__(self, cache_file: str = "pjl_capabilities.json", ttl: float = 7 * 24 * 3600):
+        """
+        Инициализация кэша
+
+        Args:
+            cache_file: Путь к JSON файлу кэша
+            ttl: Время жизни записи в секундах; устаревшие варианты проверяются заново
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        """Загружает кэш из файла"""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    data.setdefault("devices", {})
+                    data.setdefault("hosts", {})
+                    return data
+        except (OSError, ValueError):
+            pass
+        return {"devices": {}, "hosts": {}}
+
+    def save(self):
+        """Сохраняет кэш (через временный файл, чтобы не повредить его при сбое)"""
+        temp_file = self.cache_file + ".tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print(f"⚠️  Ошибка сохранения кэша возможностей: {e}")
+
+    def _is_fresh(self, timestamp: Optional[float]) -> bool:
+        return timestamp is not None and time.time() - timestamp <= self.ttl
+
+    @staticmethod
+    def device_key(identity: Dict[str, Optional[str]]) -> Optional[str]:
+        """
+        Формирует ключ устройства из INFO ID, серийного номера и прошивки
+
+        Returns:
+            Ключ или None, если модель не определена
+        """
+        if not identity.get("id"):
+            return None
+        return "|".join(identity.get(field) or "-" for field in ("id", "serial", "firmware"))
+
+    def bind_host(self, host: str, key: str, identity: Dict[str, Optional[str]]):
+        """Запоминает, какое устройство отвечает по адресу host (ip:port)"""
+        self.data["hosts"][host] = {"key": key, "checked": time.time()}
+        device = self.data["devices"].setdefault(key, {"read": {}, "write": {}})
+        device["identity"] = identity
+
+    def key_for_host(self, host: str) -> Optional[str]:
+        """Возвращает ключ устройства по адресу, если привязка не устарела"""
+        entry = self.data["hosts"].get(host)
+        if entry and self._is_fresh(entry.get("checked")):
+            return entry.get("key")
+        return None
+
+    def find_by_model(self, pattern: str) -> Optional[str]:
+        """
+        Находит самое свежее устройство, в INFO ID которого есть pattern
+
+        Используется транспортами без чтения ответов (системные методы),
+        чтобы взять варианты команд, проверенные по сети на той же модели.
+        """
+        best_key, best_time = None, 0.0
+        for key, device in self.data["devices"].items():
+            model = (device.get("identity") or {}).get("id") or ""
+            updated = device.get("updated", 0.0)
+            if pattern.lower() in model.lower() and updated > best_time:
+                best_key, best_time = key, updated
+        return best_key
+
+    def record(self, key: str, kind: str, variant: str, ok: bool):
+        """
+        Записывает результат проверки варианта команды
+
+        Args:
+            key: Ключ устройства
+            kind: "read" или "write"
+            variant: Команда чтения или шаблон команды установки
+            ok: Сработал ли вариант
+        """
+        device = self.data["devices"].setdefault(key, {"read": {}, "write": {}})
+        device.setdefault(kind, {})[variant] = {
+            "status": STATUS_OK if ok else STATUS_UNSUPPORTED,
+            "checked": time.time()
+        }
+        device["updated"] = time.time()
+
+    def known_good(self, key: Optional[str], kind: str) -> Optional[str]:
+        """
+        Возвращает проверенный (и не устаревший) рабочий вариант команды
+
+        Из нескольких рабочих вариантов выбирается первый по VARIANT_ORDER
+        (после пакетной проверки у всех вариантов почти одинаковое время).
+        """
+        if not key:
+            return None
+        variants = self.data["devices"].get(key, {}).get(kind, {})
+        order = VARIANT_ORDER.get(kind, [])
+        working = [variant for variant, entry in variants.items()
+                   if entry.get("status") == STATUS_OK and self._is_fresh(entry.get("checked"))]
+        working.sort(key=lambda variant: order.index(variant) if variant in order else len(order))
+        return working[0] if working else None
+
+    def candidates(self, key: Optional[str], kind: str, variants: List[str]) -> List[str]:
+        """
+        Возвращает варианты для проверки без заведомо неподдерживаемых
+
+        Варианты, отклоненные устройством в пределах TTL, пропускаются;
+        устаревшие записи снова попадают в проверку.
+        """
+        if not key:
+            return list(variants)
+        known = self.data["devices"].get(key, {}).get(kind, {})
+        result = []
+        for variant in variants:
+            entry = known.get(variant)
+            if (entry and entry.get("status") == STATUS_UNSUPPORTED
+                    and self._is_fresh(entry.get("checked"))):
+                continue
+            result.append(variant)
+        return result
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пул постоянных TCP соединений с принтерами HP (порт 9100)
+Позволяет повторно использовать соединения в долго работающих процессах
+"""
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class PJLConnectionPool:
+    """Потокобезопасный пул соединений с ключом (ip, port)"""
+
+    def __init__(self, max_per_device: int = 2, idle_timeout: float = 60.0,
+                 connect_timeout: float = 10.0, keepalive: bool = True):
+        """
+        Инициализация пула
+
+        Args:
+            max_per_device: Максимум соединений (свободных и занятых) на один принтер
+            idle_timeout: Через сколько секунд простоя соединение закрывается
+            connect_timeout: Таймаут установки нового соединения в секундах
+            keepalive: Включать TCP keepalive на соединениях
+        """
+        self.max_per_device = max_per_device
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self._idle = {}      # type: Dict[Tuple[str, int], List[Tuple[socket.socket, float]]]
+        self._in_use = {}    # type: Dict[Tuple[str, int], int]
+        self._condition = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "evicted": 0, "unhealthy": 0}
+
+    def _configure_socket(self, sock: socket.socket):
+        """Настраивает TCP_NODELAY и keepalive для соединения"""
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if not self.keepalive:
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Параметры keepalive доступны не на всех платформах
+        for option, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+            if hasattr(socket, option):
+                try:
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+                except OSError:
+                    pass
+
+    def _open(self, key: Tuple[str, int]) -> socket.socket:
+        """Открывает новое соединение с принтером"""
+        sock = socket.create_connection(key, timeout=self.connect_timeout)
+        self._configure_socket(sock)
+        self.stats["created"] += 1
+        return sock
+
+    @staticmethod
+    def _is_healthy(sock: socket.socket) -> bool:
+        """
+        Проверяет, что свободное соединение не закрыто принтером
+
+        Неожиданные данные от предыдущих заданий вычитываются и отбрасываются.
+        """
+        previous_timeout = sock.gettimeout()
+        try:
+            sock.setblocking(False)
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    return False  # Принтер закрыл соединение
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+        finally:
+            try:
+                sock.settimeout(previous_timeout)
+            except OSError:
+                pass
+
+    def _evict_idle_locked(self):
+        """Закрывает соединения, простаивающие дольше idle_timeout"""
+        now = time.monotonic()
+        evicted = False
+        for key, entries in list(self._idle.items()):
+            fresh = []
+            for sock, released_at in entries:
+                if now - released_at > self.idle_timeout:
+                    sock.close()
+                    self.stats["evicted"] += 1
+                    evicted = True
+                else:
+                    fresh.append((sock, released_at))
+            if fresh:
+                self._idle[key] = fresh
+            else:
+                del self._idle[key]
+        if evicted:
+            self._condition.notify_all()
+
+    def _total_locked(self, key: Tuple[str, int]) -> int:
+        return len(self._idle.get(key, [])) + self._in_use.get(key, 0)
+
+    def acquire(self, ip_address: str, port: int = 9100,
+                timeout: Optional[float] = None) -> socket.socket:
+        """
+        Выдает соединение с принтером (из пула или новое)
+
+        Args:
+            ip_address: IP адрес принтера
+            port: Порт принтера
+            timeout: Сколько ждать свободного места при достижении лимита
+
+        Returns:
+            Подключенный сокет
+
+        Raises:
+            socket.timeout: если лимит соединений не освободился вовремя
+            OSError: если не удалось подключиться
+        """
+        key = (ip_address, port)
+        wait_timeout = self.connect_timeout if timeout is None else timeout
+        deadline = time.monotonic() + wait_timeout
+
+        with self._condition:
+            while True:
+                self._evict_idle_locked()
+                entries = self._idle.get(key)
+                while entries:
+                    sock, _ = entries.pop()
+                    if self._is_healthy(sock):
+                        self._in_use[key] = self._in_use.get(key, 0) + 1
+                        self.stats["reused"] += 1
+                        return sock
+                    sock.close()
+                    self.stats["unhealthy"] += 1
+
+                if self._total_locked(key) < self.max_per_device:
+                    # Резервируем место до установки соединения вне блокировки
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout(
+                        f"Достигнут лимит соединений ({self.max_per_device}) для {ip_address}:{port}")
+                self._condition.wait(remaining)
+
+        try:
+            return self._open(key)
+        except OSError:
+            with self._condition:
+                self._in_use[key] -= 1
+                self._condition.notify_all()
+            raise
+
+    def release(self, ip_address: str, port: int, sock: socket.socket, discard: bool = False):
+        """
+        Возвращает соединение в пул
+
+        Args:
+            ip_address: IP адрес принтера
+            port: Порт принтера
+            sock: Сокет, полученный через acquire()
+            discard: Закрыть соединение вместо возврата (например, после ошибки)
+        """
+        key = (ip_address, port)
+        with self._condition:
+            self._in_use[key] = max(0, self._in_use.get(key, 0) - 1)
+            if not self._in_use[key]:
+                del self._in_use[key]
+            if discard:
+                sock.close()
+            else:
+                self._idle.setdefault(key, []).append((sock, time.monotonic()))
+            self._condition.notify_all()
+
+    @contextmanager
+    def connection(self, ip_address: str, port: int = 9100) -> Iterator[socket.socket]:
+        """Контекстный менеджер: выдает соединение и возвращает его в пул"""
+        sock = self.acquire(ip_address, port)
+        try:
+            yield sock
+        except OSError:
+            self.release(ip_address, port, sock, discard=True)
+            raise
+        else:
+            self.release(ip_address, port, sock)
+
+    def evict_idle(self):
+        """Закрывает простаивающие соединения"""
+        with self._condition:
+            self._evict_idle_locked()
+
+    def close_all(self):
+        """Закрывает все свободные соединения пула"""
+        with self._condition:
+            for entries in self._idle.values():
+                for sock, _ in entries:
+                    sock.close()
+            self._idle.clear()
+            self._condition.notify_all()
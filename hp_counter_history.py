@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+История значений счетчика в SQLite
+В конфигурации хранятся только 10 последних команд, поэтому на вопрос
+"сколько сканов сделало устройство за месяц" ответить нельзя. Здесь каждое
+чтение и установка счетчика записываются как отметка (устройство, время,
+значение, действие). Индекс (device, timestamp) позволяет выбирать диапазон
+времени за миллисекунды и на миллионах строк, режим WAL не блокирует чтение
+во время записи, а отметки вставляются пачками.
+"""
+
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Действия
+ACTION_GET = "get"
+ACTION_SET = "set"
+
+# Сколько отметок копится в памяти до записи пачкой
+DEFAULT_BATCH_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    counter INTEGER,
+    action TEXT NOT NULL
+);
+-- counter и action в индексе: прирост за период считается без чтения строк таблицы
+DROP INDEX IF EXISTS idx_samples_device_time;
+CREATE INDEX IF NOT EXISTS idx_samples_device_time_action ON samples (device, timestamp, counter, action);
+CREATE INDEX IF NOT EXISTS idx_samples_time ON samples (timestamp);
+"""
+
+
+def parse_time(text: str) -> float:
+    """
+    Разбирает время для --since/--until
+
+    Args:
+        text: Дата/время ISO 8601 ("2024-05-01", "2024-05-01T12:00")
+              или относительный срок назад ("30d", "12h", "15m")
+
+    Returns:
+        Время Unix
+
+    Raises:
+        ValueError: формат не распознан
+    """
+    text = text.strip()
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    if text[-1:].lower() in units and text[:-1].isdigit():
+        return time.time() - int(text[:-1]) * units[text[-1].lower()]
+    return datetime.fromisoformat(text).timestamp()
+
+
+class CounterHistory:
+    """Хранилище отметок счетчика по устройствам"""
+
+    def __init__(self, db_file: str = "counter_history.db", batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Инициализация хранилища
+
+        Args:
+            db_file: Файл базы SQLite
+            batch_size: Размер пачки вставки (отметки до записи хранятся в памяти)
+        """
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.pending = []  # type: List[Tuple[str, float, Optional[int], str]]
+        self.connection = sqlite3.connect(db_file, timeout=10)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL NORMAL не теряет согласованность при сбое, но не делает fsync на каждую транзакцию
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    def record(self, device: str, counter: Optional[int], action: str,
+               timestamp: Optional[float] = None):
+        """
+        Добавляет отметку (запись в базу - пачкой)
+
+        Args:
+            device: Устройство (device_id(): серийный номер, иначе очередь или порт)
+            counter: Значение счетчика
+            action: Действие (ACTION_GET, ACTION_SET, ...)
+            timestamp: Время Unix (по умолчанию - текущее)
+        """
+        self.pending.append((device, time.time() if timestamp is None else timestamp, counter, action))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные отметки одной транзакцией"""
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO samples (device, timestamp, counter, action) VALUES (?, ?, ?, ?)",
+                self.pending)
+        self.pending = []
+
+    @staticmethod
+    def _where(device: Optional[str], since: Optional[float], until: Optional[float]):
+        conditions, params = [], []  # type: List[str], List[object]
+        if device is not None:
+            conditions.append("device = ?")
+            params.append(device)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def query(self, device: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, object]]:
+        """
+        Отметки за период
+
+        Args:
+            device: Устройство (None - все)
+            since: Начало периода (время Unix, включительно)
+            until: Конец периода (время Unix, не включительно)
+            limit: Вернуть только последние limit отметок
+
+        Returns:
+            Список {"device", "timestamp", "counter", "action"} по возрастанию времени
+        """
+        self.flush()
+        where, params = self._where(device, since, until)
+        sql = f"SELECT device, timestamp, counter, action FROM samples{where} ORDER BY timestamp DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self.connection.execute(sql, params).fetchall()
+        return [{"device": row[0], "timestamp": row[1], "counter": row[2], "action": row[3]}
+                for row in reversed(rows)]
+
+    def devices(self) -> List[str]:
+        """Устройства, для которых есть отметки"""
+        self.flush()
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT device FROM samples ORDER BY device")]
+
+    def usage(self, device: str, since: Optional[float] = None,
+              until: Optional[float] = None) -> Optional[Dict[str, object]]:
+        """
+        Прирост счетчика устройства за период
+
+        Складываются увеличения между соседними отметками. Установка счетчика
+        (ACTION_SET) и уменьшение значения (сброс) начинают отсчет заново и
+        в прирост не входят.
+
+        Args:
+            device: Устройство
+            since: Начало периода (время Unix)
+            until: Конец периода (время Unix)
+
+        Returns:
+            {"device", "first", "last", "delta", "samples"} или None, если отметок нет
+        """
+        self.flush()
+        where, params = self._where(device, since, until)
+        where += " AND counter IS NOT NULL"
+        edge = "SELECT timestamp, counter FROM samples" + where + " ORDER BY timestamp {} LIMIT 1"
+        first = self.connection.execute(edge.format("ASC"), params).fetchone()
+        if not first:
+            return None
+        last = self.connection.execute(edge.format("DESC"), params).fetchone()
+        count, delta = self.connection.execute(
+            "SELECT COUNT(*), SUM(CASE WHEN action != ? AND counter > previous "
+            "THEN counter - previous ELSE 0 END) FROM ("
+            "SELECT counter, action, LAG(counter) OVER (ORDER BY timestamp) AS previous "
+            "FROM samples" + where + ")", [ACTION_SET] + params).fetchone()
+        return {"device": device, "first": first[1], "last": last[1],
+                "delta": delta or 0, "samples": count}
+
+    def close(self):
+        """Записывает накопленные отметки и закрывает базу"""
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+
+
+def print_samples(history: CounterHistory, device: Optional[str] = None,
+                  since: Optional[float] = None, until: Optional[float] = None, limit: int = 50):
+    """
+    Выводит отметки и прирост счетчика за период (для --history)
+
+    Args:
+        history: Хранилище
+        device: Устройство (None - все)
+        since: Начало периода (время Unix)
+        until: Конец периода (время Unix)
+        limit: Сколько последних отметок выводить
+    """
+    samples = history.query(device, since, until, limit)
+    if not samples:
+        print("📭 Отметок счетчика за период нет")
+        return
+
+    print(f"📈 Отметки счетчика (последние {len(samples)}):")
+    print("-" * 50)
+    for sample in samples:
+        when = datetime.fromtimestamp(sample["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{when}  {sample['device']}  {sample['action']:<4} {sample['counter']}")
+
+    print("\n📊 Прирост за период:")
+    for name in ([device] if device else history.devices()):
+        usage = history.usage(name, since, until)
+        if usage:
+            print(f"   {name}: {usage['first']} → {usage['last']} (+{usage['delta']}, "
+                  f"отметок: {usage['samples']})")
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Разбор ответов принтера со значениями счетчиков
+Единые предкомпилированные шаблоны для ответов PJL (INQUIRE/INFO/USTATUS),
+вывода WMI (Format-List) и CUPS (lpstat)
+"""
+
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+
+
+# Источники значений
+SOURCE_PJL = "pjl"
+SOURCE_WMI = "wmi"
+SOURCE_CUPS = "cups"
+SOURCE_TEXT = "text"
+
+# Имена переменных PJL со счетчиком сканера (в порядке приоритета)
+SCAN_COUNTER_KEYS = ("SCANCOUNT", "SCANCOUNTER", "SCANPAGES")
+
+# Счетчики из WMI (Win32_Printer / Win32_PrintJob) в порядке приоритета
+WMI_COUNTER_KEYS = ("PagesPrinted", "TotalPagesPrinted", "JobCountSinceLastReset")
+
+# Границы значения счетчика; верхняя применяется только к эвристикам (WMI, lpstat,
+# число без имени) - значения KEY=VALUE и INQUIRE принимаются любой величины
+COUNTER_MIN = 0
+COUNTER_MAX = 999999
+
+# Заголовок ответа PJL: "@PJL INQUIRE SCANCOUNT", "@PJL INFO VARIABLES", ...
+_HEADER_RE = re.compile(r'^[ \t]*@PJL[ \t]+(\w+)(?:[ \t]+([^\r\n]*?))?[ \t]*\r?$',
+                        re.MULTILINE | re.IGNORECASE)
+# Строка KEY=VALUE с числовым значением (INFO VARIABLES: "COPIES=1 [2 RANGE]")
+_KEY_VALUE_RE = re.compile(r'^[ \t]*([A-Za-z][\w.]*)[ \t]*=[ \t]*"?(\d+)', re.MULTILINE)
+# Строка "Name : 123" из Format-List PowerShell
+_WMI_LINE_RE = re.compile(r'^[ \t]*([A-Za-z]\w*)[ \t]*:[ \t]*(\d+)[ \t]*$', re.MULTILINE)
+# Любое число после двоеточия (запасной вариант для WMI)
+_COLON_NUMBER_RE = re.compile(r':\s*(\d{2,6})')
+# Отдельное число в ответе INQUIRE (возможно, в кавычках)
+_BARE_NUMBER_RE = re.compile(r'^\s*"?(\d+)"?\s*$')
+# Отдельные числа в свободном тексте по минимальному числу цифр
+_NUMBER_RES = {
+    1: re.compile(r'\b(\d{1,6})\b'),
+    2: re.compile(r'\b(\d{2,6})\b'),
+}
+
+# Единицы измерения по имени счетчика (проверяются по порядку)
+_UNIT_RULES = (
+    ("SCAN", "images"),
+    ("BYTE", "bytes"),
+    ("JOB", "jobs"),
+    ("PAGE", "pages"),
+)
+_unit_cache = {}  # type: Dict[str, str]
+# Шаблоны поиска KEY=VALUE по конкретному имени (создаются при первом обращении)
+_named_value_res = {}  # type: Dict[str, Pattern]
+
+
+class CounterReading:
+    """Значение счетчика из ответа принтера"""
+
+    __slots__ = ("name", "value", "unit", "source")
+
+    def __init__(self, name: str, value: int, unit: str, source: str):
+        """
+        Args:
+            name: Имя переменной (SCANCOUNT, PAGECOUNT, TotalPagesPrinted, ...)
+            value: Значение
+            unit: Единица измерения (images, pages, jobs, bytes, count)
+            source: Источник (pjl, wmi, cups, text)
+        """
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.source = source
+
+    def to_dict(self) -> Dict[str, object]:
+        """Значение в виде словаря (для JSON)"""
+        return {"name": self.name, "value": self.value, "unit": self.unit, "source": self.source}
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, CounterReading) and
+                (self.name, self.value, self.unit, self.source) ==
+                (other.name, other.value, other.unit, other.source))
+
+    def __repr__(self) -> str:
+        return f"CounterReading({self.name}={self.value} {self.unit}, {self.source})"
+
+
+def counter_unit(name: str) -> str:
+    """
+    Определяет единицу измерения по имени счетчика
+
+    Args:
+        name: Имя переменной
+
+    Returns:
+        Единица измерения (count, если не удалось определить)
+    """
+    unit = _unit_cache.get(name)
+    if unit is None:
+        upper = name.upper()
+        unit = next((unit for marker, unit in _UNIT_RULES if marker in upper), "count")
+        _unit_cache[name] = unit
+    return unit
+
+
+def _reading(name: str, value: str, source: str) -> CounterReading:
+    return CounterReading(name, int(value), counter_unit(name), source)
+
+
+def _parse_key_values(body: str, source: str) -> List[CounterReading]:
+    return [_reading(key.upper(), value, source) for key, value in _KEY_VALUE_RE.findall(body)]
+
+
+def _parse_inquire(variable: str, body: str, source: str) -> List[CounterReading]:
+    """@PJL INQUIRE/DINQUIRE: значение идет отдельной строкой без имени"""
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        match = _BARE_NUMBER_RE.match(line)
+        if match and variable:
+            return [_reading(variable.upper(), match.group(1), source)]
+        break
+    return _parse_key_values(body, source)
+
+
+def _parse_info(category: str, body: str, source: str) -> List[CounterReading]:
+    """@PJL INFO/USTATUS: строки KEY=VALUE или одно число (INFO PAGECOUNT)"""
+    readings = _parse_key_values(body, source)
+    if not readings and category:
+        readings = _parse_inquire(category, body, source)
+    return readings
+
+
+# Обработчики ответов по команде из заголовка "@PJL <КОМАНДА> <ПЕРЕМЕННАЯ>"
+_REPLY_PARSERS = {
+    "INQUIRE": _parse_inquire,
+    "DINQUIRE": _parse_inquire,
+    "INFO": _parse_info,
+    "USTATUS": _parse_info,
+}  # type: Dict[str, Callable[[str, str, str], List[CounterReading]]]
+
+
+def parse_response(response: Optional[str], source: str = SOURCE_PJL) -> List[CounterReading]:
+    """
+    Извлекает все числовые значения из ответа PJL
+
+    Ответ делится на секции по заголовкам @PJL; каждая секция разбирается
+    обработчиком своей команды. Текст без заголовка разбирается как KEY=VALUE.
+
+    Args:
+        response: Ответ принтера (одна или несколько секций)
+        source: Источник для результатов
+
+    Returns:
+        Список значений в порядке появления
+    """
+    if not response:
+        return []
+
+    readings = []  # type: List[CounterReading]
+    position = 0
+    header = None  # type: Optional[Tuple[str, str]]
+    for match in _HEADER_RE.finditer(response):
+        readings.extend(_parse_section(header, response[position:match.start()], source))
+        header = (match.group(1).upper(), (match.group(2) or "").strip())
+        position = match.end()
+    readings.extend(_parse_section(header, response[position:], source))
+    return readings
+
+
+def _parse_section(header: Optional[Tuple[str, str]], body: str,
+                   source: str) -> List[CounterReading]:
+    if header is None:
+        return _parse_key_values(body, source) if body else []
+    command, variable = header
+    parser = _REPLY_PARSERS.get(command)
+    if parser is None:
+        return _parse_key_values(body, source)
+    return parser(variable.split()[0] if variable else "", body, source)
+
+
+def parse_values(response: Optional[str], source: str = SOURCE_PJL) -> Dict[str, CounterReading]:
+    """
+    Значения ответа по имени переменной (первое вхождение имени)
+
+    Args:
+        response: Ответ принтера (например, @PJL INFO VARIABLES)
+        source: Источник для результатов
+
+    Returns:
+        Словарь {ИМЯ: значение}
+    """
+    values = {}  # type: Dict[str, CounterReading]
+    for reading in parse_response(response, source):
+        values.setdefault(reading.name, reading)
+    return values
+
+
+def _in_bounds(value: int, low: int, high: int) -> bool:
+    return low <= value <= high
+
+
+def _find_named_value(response: str, name: str, source: str) -> Optional[CounterReading]:
+    """Быстрый поиск строки NAME=VALUE без разбора всего ответа"""
+    pattern = _named_value_res.get(name)
+    if pattern is None:
+        pattern = re.compile(r'^[ \t]*' + re.escape(name) + r'[ \t]*=[ \t]*"?(\d+)',
+                             re.MULTILINE | re.IGNORECASE)
+        _named_value_res[name] = pattern
+    for match in pattern.finditer(response):
+        return CounterReading(name, int(match.group(1)), counter_unit(name), source)
+    return None
+
+
+def find_counter(response: Optional[str], names: Iterable[str] = SCAN_COUNTER_KEYS,
+                 source: str = SOURCE_PJL, any_name: bool = False,
+                 fallback_number: bool = False) -> Optional[CounterReading]:
+    """
+    Ищет значение счетчика в ответе принтера
+
+    Args:
+        response: Ответ принтера
+        names: Предпочтительные имена переменных по приоритету
+        source: Источник для результатов
+        any_name: Если нужного имени нет - взять первое значение с любым именем
+                  (в пределах COUNTER_MAX)
+        fallback_number: Если значений нет - взять первое отдельное число в тексте
+                         (в пределах COUNTER_MAX)
+
+    Returns:
+        Значение счетчика или None
+    """
+    names = tuple(names)
+    if response:
+        # Большие дампы (INFO VARIABLES) обычно содержат нужное имя в виде KEY=VALUE
+        for name in names:
+            reading = _find_named_value(response, name, source)
+            if reading:
+                return reading
+
+    readings = parse_response(response, source)
+    by_name = {}  # type: Dict[str, CounterReading]
+    for reading in readings:
+        by_name.setdefault(reading.name, reading)
+    for name in names:
+        if name in by_name:
+            return by_name[name]
+    if any_name:
+        for reading in readings:
+            if _in_bounds(reading.value, COUNTER_MIN, COUNTER_MAX):
+                return reading
+    if fallback_number and response:
+        for match in _NUMBER_RES[1].finditer(response):
+            value = int(match.group(1))
+            if _in_bounds(value, COUNTER_MIN, COUNTER_MAX):
+                return CounterReading("number", value, "count", SOURCE_TEXT)
+    return None
+
+
+def counter_value(response: Optional[str], fallback_number: bool = False,
+                  any_name: bool = False) -> Optional[int]:
+    """
+    Значение счетчика сканера из ответа PJL
+
+    Args:
+        response: Ответ принтера на одну команду
+        fallback_number: Принять первое отдельное число, если значений KEY=VALUE нет
+        any_name: Принять значение с любым именем, если имени счетчика сканера нет
+
+    Returns:
+        Значение счетчика или None
+    """
+    reading = find_counter(response, any_name=any_name, fallback_number=fallback_number)
+    return reading.value if reading else None
+
+
+def parse_wmi_output(output: Optional[str]) -> List[CounterReading]:
+    """
+    Извлекает числовые поля из вывода Format-List PowerShell
+
+    Args:
+        output: Вывод Get-WmiObject ... | Format-List
+
+    Returns:
+        Список значений "Имя : число"
+    """
+    if not output:
+        return []
+    return [_reading(name, value, SOURCE_WMI) for name, value in _WMI_LINE_RE.findall(output)]
+
+
+def find_wmi_counter(output: Optional[str], names: Iterable[str] = WMI_COUNTER_KEYS,
+                     low: int = 10, high: int = COUNTER_MAX) -> Optional[CounterReading]:
+    """
+    Ищет счетчик в выводе WMI: сначала по именам полей, затем любое число после ":"
+
+    Args:
+        output: Вывод PowerShell
+        names: Имена полей по приоритету
+        low: Минимальное допустимое значение
+        high: Максимальное допустимое значение
+
+    Returns:
+        Значение счетчика или None
+    """
+    if not output:
+        return None
+    readings = parse_wmi_output(output)
+    for name in names:
+        lowered = name.lower()
+        for reading in readings:
+            if reading.name.lower() == lowered and _in_bounds(reading.value, low, high):
+                return reading
+    for match in _COLON_NUMBER_RE.finditer(output):
+        value = int(match.group(1))
+        if _in_bounds(value, low, high):
+            return CounterReading("number", value, "count", SOURCE_WMI)
+    return None
+
+
+def largest_number(text: Optional[str], low: int = 10, high: int = COUNTER_MAX,
+                   min_digits: int = 2, source: str = SOURCE_CUPS) -> Optional[CounterReading]:
+    """
+    Наибольшее число в допустимых границах (вывод lpstat, статистика Windows)
+
+    Args:
+        text: Текст для поиска
+        low: Минимальное допустимое значение
+        high: Максимальное допустимое значение
+        min_digits: Минимальное число цифр (1 или 2)
+        source: Источник для результата
+
+    Returns:
+        Значение или None, если подходящих чисел нет
+    """
+    if not text:
+        return None
+    values = [int(number) for number in _NUMBER_RES[min_digits].findall(text)]
+    values = [value for value in values if _in_bounds(value, low, high)]
+    if not values:
+        return None
+    return CounterReading("number", max(values), "count", source)
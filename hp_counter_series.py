@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактный бинарный формат истории счетчика (временные ряды)
+Альтернатива SQLite (hp_counter_history) для долгого мониторинга: строка
+SQLite с индексом занимает десятки байт, а отметки раз в минуту за год для
+сотен принтеров - это сотни миллионов строк. Здесь отметки каждого ряда
+(устройство, действие) хранятся блоками до 4096 штук по столбцам: время -
+разностями второго порядка (delta-of-delta), значение - разностями, обе
+последовательности - varint с кодированием повторов. Для равномерных
+отметок и простаивающего принтера блок занимает несколько байт.
+
+Файл <имя>.hps - заголовок и блоки с заголовком фиксированного размера
+(ряд, число отметок, первое/последнее время и значение). <имя>.hps.idx -
+индекс: те же заголовки со смещениями, массив записей фиксированного размера.
+Выборка за период проверяет индекс и распаковывает через mmap только блоки
+на границах периода; для прироста за период блоки внутри периода не
+распаковываются (крайние значения - в индексе, сумма увеличений - по сериям
+разностей). Индекс можно восстановить по файлу данных, поэтому после
+сбоя (оборванный блок, неполный индекс) хранилище чинит себя при открытии.
+"""
+
+import contextlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from hp_counter_history import ACTION_SET, DEFAULT_BATCH_SIZE, CounterHistory
+from hp_counter_storage import acquire_file_lock, match_file_mode, release_file_lock
+
+# Расширение файла, по которому open_history() выбирает этот формат
+SERIES_SUFFIX = ".hps"
+
+# Заголовок файла данных и индекса: метка и поколение (меняется при сжатии)
+SERIES_MAGIC = b"HPTS"
+_FILE_HEADER = struct.Struct("<4sQ")
+
+# Заголовок блока: ряд, число отметок (0 - блок с именем ряда), длина данных,
+# CRC32 данных, время первой/последней отметки (мс), первое/последнее значение
+_BLOCK_HEADER = struct.Struct("<IIIIqqqq")
+# Запись индекса: смещение блока и поля заголовка без CRC
+_INDEX_ENTRY = struct.Struct("<QIIIqqqq")
+
+# Максимум отметок в блоке
+BLOCK_SAMPLES = 4096
+
+# Сколько лишних неполных блоков (по одному на запуск скрипта) допускается до сжатия
+COMPACT_SMALL_BLOCKS = 256
+
+
+def _put_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_runs(values: List[int]) -> bytes:
+    """
+    Кодирует целые числа со знаком
+
+    Каждая серия одинаковых чисел - два varint: число в zigzag (малые по
+    модулю - короткие) и число повторов минус один.
+
+    Args:
+        values: Числа
+
+    Returns:
+        Байты
+    """
+    out = bytearray()
+    i, count = 0, len(values)
+    while i < count:
+        value = values[i]
+        j = i + 1
+        while j < count and values[j] == value:
+            j += 1
+        _put_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        _put_varint(out, j - i - 1)
+        i = j
+    return bytes(out)
+
+
+def decode_runs(data, pos: int, end: int) -> List[int]:
+    """
+    Раскодирует числа encode_runs()
+
+    Args:
+        data: Байты
+        pos: Начало
+        end: Конец
+
+    Returns:
+        Числа
+    """
+    values = []  # type: List[int]
+    while pos < end:
+        value, pos = _get_varint(data, pos)
+        run, pos = _get_varint(data, pos)
+        value = -((value + 1) >> 1) if value & 1 else value >> 1
+        values.extend([value] * (run + 1))
+    return values
+
+
+def encode_block(samples: List[Tuple[int, int]]) -> bytes:
+    """
+    Кодирует отметки блока (первое время и значение хранятся в заголовке)
+
+    Args:
+        samples: Отметки (время в мс, значение) по возрастанию времени
+
+    Returns:
+        Данные блока: длина столбца времени, столбец времени, столбец значений
+    """
+    deltas = [samples[i][0] - samples[i - 1][0] for i in range(1, len(samples))]
+    times = encode_runs(deltas[:1] + [deltas[i] - deltas[i - 1] for i in range(1, len(deltas))])
+    values = encode_runs([samples[i][1] - samples[i - 1][1] for i in range(1, len(samples))])
+    out = bytearray()
+    _put_varint(out, len(times))
+    return bytes(out) + times + values
+
+
+def decode_block(payload, t_first: int, v_first: int) -> List[Tuple[int, int]]:
+    """
+    Раскодирует отметки блока
+
+    Args:
+        payload: Данные блока (encode_block)
+        t_first: Время первой отметки (мс)
+        v_first: Значение первой отметки
+
+    Returns:
+        Отметки (время в мс, значение)
+    """
+    size, pos = _get_varint(payload, 0)
+    times = accumulate(accumulate(decode_runs(payload, pos, pos + size)), initial=t_first)
+    values = accumulate(decode_runs(payload, pos + size, len(payload)), initial=v_first)
+    return list(zip(times, values))
+
+
+def block_increase(payload) -> int:
+    """
+    Сумма увеличений значения внутри блока
+
+    Считается по сериям столбца разностей значений, без распаковки отметок.
+
+    Args:
+        payload: Данные блока (encode_block)
+
+    Returns:
+        Сумма положительных разностей
+    """
+    size, pos = _get_varint(payload, 0)
+    pos += size
+    total, end = 0, len(payload)
+    while pos < end:
+        value, pos = _get_varint(payload, pos)
+        run, pos = _get_varint(payload, pos)
+        # Положительные числа в zigzag - четные
+        if value and not value & 1:
+            total += (value >> 1) * (run + 1)
+    return total
+
+
+class SeriesBlock:
+    """Блок отметок одного ряда (запись индекса)"""
+
+    __slots__ = ("offset", "series", "count", "length", "t_first", "t_last", "v_first", "v_last")
+
+    def __init__(self, offset: int, series: int, count: int, length: int,
+                 t_first: int, t_last: int, v_first: int, v_last: int):
+        self.offset = offset
+        self.series = series
+        self.count = count
+        self.length = length
+        self.t_first = t_first
+        self.t_last = t_last
+        self.v_first = v_first
+        self.v_last = v_last
+
+    @property
+    def end(self) -> int:
+        return self.offset + _BLOCK_HEADER.size + self.length
+
+
+class CounterSeries:
+    """Хранилище отметок счетчика в бинарном формате (тот же интерфейс, что CounterHistory)"""
+
+    def __init__(self, db_file: str = "counter_history" + SERIES_SUFFIX,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Инициализация хранилища
+
+        Args:
+            db_file: Файл данных (рядом создаются <файл>.idx и <файл>.lock)
+            batch_size: Сколько отметок копится в памяти до записи
+
+        Raises:
+            ValueError: файл существует, но это не файл истории счетчика
+        """
+        self.db_file = db_file
+        self.index_file = db_file + ".idx"
+        self.lock_file = db_file + ".lock"
+        self.batch_size = batch_size
+        self.pending = {}  # type: Dict[Tuple[str, str], List[Tuple[int, int]]]
+        self.pending_count = 0
+        self.lock = threading.RLock()
+        self._data = None  # type: Optional[mmap.mmap]
+        self._reset()
+        with self._locked():
+            self._refresh()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Монопольный доступ к файлам (RLock в процессе, <файл>.lock между процессами)"""
+        with self.lock:
+            handle = acquire_file_lock(self.lock_file)
+            try:
+                yield
+            finally:
+                if handle is not None:
+                    release_file_lock(handle)
+
+    # --- Чтение файла и индекса -----------------------------------------------
+
+    def _reset(self):
+        """Забывает прочитанное (файл заменен или удален)"""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        self.series = []  # type: List[Tuple[str, str]]
+        self.series_ids = {}  # type: Dict[Tuple[str, str], int]
+        self.blocks = {}  # type: Dict[int, List[SeriesBlock]]
+        self.entries = []  # type: List[SeriesBlock]
+        self.generation = None  # type: Optional[int]
+        self._data_end = 0
+        self._small_blocks = 0
+
+    def _map(self, end: int) -> mmap.mmap:
+        """Отображение файла данных не короче end байт"""
+        if self._data is None or len(self._data) < end:
+            if self._data is not None:
+                self._data.close()
+            with open(self.db_file, 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    def _data_header(self) -> Tuple[Optional[int], int]:
+        """(поколение, размер) файла данных; (None, 0) - файла нет или он пуст"""
+        try:
+            with open(self.db_file, 'rb') as f:
+                head = f.read(_FILE_HEADER.size)
+                size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None, 0
+        if not head:
+            return None, 0
+        if len(head) < _FILE_HEADER.size or head[:len(SERIES_MAGIC)] != SERIES_MAGIC:
+            raise ValueError(f"{self.db_file}: не файл истории счетчика")
+        return _FILE_HEADER.unpack(head)[1], size
+
+    def _add(self, block: SeriesBlock, name: Optional[Tuple[str, str]] = None):
+        """Учитывает блок, прочитанный из индекса или файла данных"""
+        self.entries.append(block)
+        self._data_end = block.end
+        if block.count == 0:
+            if name is None:
+                start = block.offset + _BLOCK_HEADER.size
+                device, _, action = bytes(self._map(block.end)[start:block.end]).decode("utf-8").partition("\t")
+                name = (device, action)
+            self.series_ids[name] = len(self.series)
+            self.series.append(name)
+            return
+        self.blocks.setdefault(block.series, []).append(block)
+        if block.count < BLOCK_SAMPLES // 4:
+            self._small_blocks += 1
+
+    def _load_index(self) -> int:
+        """Читает индекс текущего поколения; возвращает число прочитанных блоков"""
+        try:
+            with open(self.index_file, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return 0
+        if len(data) < _FILE_HEADER.size or _FILE_HEADER.unpack_from(data) != (SERIES_MAGIC, self.generation):
+            return 0
+        usable = len(data) - (len(data) - _FILE_HEADER.size) % _INDEX_ENTRY.size
+        loaded = 0
+        for fields in _INDEX_ENTRY.iter_unpack(memoryview(data)[_FILE_HEADER.size:usable]):
+            block = SeriesBlock(*fields)
+            # Индекс отстал от данных (сбой между записью блока и индекса) - остальное дочитаем из данных
+            if block.offset != self._data_end:
+                break
+            self._add(block)
+            loaded += 1
+        return loaded
+
+    def _scan(self, size: int) -> int:
+        """Читает заголовки блоков после прочитанных; возвращает число новых блоков"""
+        if size <= self._data_end:
+            return 0
+        data = self._map(size)
+        pos, found = self._data_end, 0
+        while pos + _BLOCK_HEADER.size <= size:
+            series, count, length, crc, t_first, t_last, v_first, v_last = _BLOCK_HEADER.unpack_from(data, pos)
+            start = pos + _BLOCK_HEADER.size
+            if start + length > size or zlib.crc32(data[start:start + length]) != crc:
+                # Оборванный при сбое блок: будет отрезан перед следующей записью
+                break
+            self._add(SeriesBlock(pos, series, count, length, t_first, t_last, v_first, v_last))
+            pos = start + length
+            found += 1
+        return found
+
+    def _refresh(self):
+        """Подхватывает блоки других процессов (вызывается под блокировкой)"""
+        generation, size = self._data_header()
+        if generation != self.generation:
+            # Первое открытие или файл сжат другим процессом
+            self._reset()
+            if generation is None:
+                return
+            self.generation = generation
+            self._data_end = _FILE_HEADER.size
+            self._load_index()
+            if self._scan(size):
+                self._write_index()
+            return
+        if generation is not None:
+            self._scan(size)
+
+    def _write_index(self):
+        """Перезаписывает индекс целиком по прочитанным блокам"""
+        temp_file = self.index_file + ".tmp"
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(_FILE_HEADER.pack(SERIES_MAGIC, self.generation))
+                f.write(b"".join(self._index_entry(block) for block in self.entries))
+            os.replace(temp_file, self.index_file)
+        except OSError as e:
+            print(f"⚠️  Ошибка записи индекса истории счетчика: {e}")
+
+    @staticmethod
+    def _index_entry(block: SeriesBlock) -> bytes:
+        return _INDEX_ENTRY.pack(block.offset, block.series, block.count, block.length,
+                                 block.t_first, block.t_last, block.v_first, block.v_last)
+
+    # --- Запись -----------------------------------------------------------------
+
+    def record(self, device: str, counter: Optional[int], action: str,
+               timestamp: Optional[float] = None):
+        """
+        Добавляет отметку (запись в файл - пачкой)
+
+        Args:
+            device: Устройство (device_id(): серийный номер, иначе очередь или порт)
+            counter: Значение счетчика (отметки без значения не хранятся)
+            action: Действие (ACTION_GET, ACTION_SET, ...) - отдельный ряд
+            timestamp: Время Unix (по умолчанию - текущее)
+        """
+        if counter is None:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        key = (device.replace("\t", " "), action.replace("\t", " "))
+        self.pending.setdefault(key, []).append((int(round(timestamp * 1000)), int(counter)))
+        self.pending_count += 1
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    def _encode(self, offset: int, series: int, count: int, payload: bytes,
+                first: Tuple[int, int] = (0, 0), last: Tuple[int, int] = (0, 0)) -> Tuple[SeriesBlock, bytes]:
+        block = SeriesBlock(offset, series, count, len(payload), first[0], last[0], first[1], last[1])
+        header = _BLOCK_HEADER.pack(series, count, len(payload), zlib.crc32(payload),
+                                    first[0], last[0], first[1], last[1])
+        return block, header + payload
+
+    def _encode_samples(self, offset: int, series: int,
+                        samples: List[Tuple[int, int]]) -> Iterator[Tuple[SeriesBlock, bytes]]:
+        """Блоки ряда по BLOCK_SAMPLES отметок"""
+        samples.sort()
+        for i in range(0, len(samples), BLOCK_SAMPLES):
+            chunk = samples[i:i + BLOCK_SAMPLES]
+            block, data = self._encode(offset, series, len(chunk), encode_block(chunk), chunk[0], chunk[-1])
+            offset += len(data)
+            yield block, data
+
+    def flush(self):
+        """Записывает накопленные отметки (блоки дописываются в конец файла)"""
+        if not self.pending:
+            return
+        with self._locked():
+            self._refresh()
+            if self.generation is None:
+                self._create()
+            written, names = [], {}  # type: List[Tuple[SeriesBlock, bytes]], Dict[int, Tuple[str, str]]
+            offset = self._data_end
+            for key, samples in self.pending.items():
+                series = self.series_ids.get(key)
+                if series is None:
+                    series = len(self.series) + len(names)
+                    block, data = self._encode(offset, series, 0, "\t".join(key).encode("utf-8"))
+                    names[series] = key
+                    written.append((block, data))
+                    offset += len(data)
+                for block, data in self._encode_samples(offset, series, samples):
+                    written.append((block, data))
+                    offset += len(data)
+
+            try:
+                with open(self.db_file, 'r+b') as f:
+                    # Все после прочитанных блоков - оборванная при сбое запись
+                    f.truncate(self._data_end)
+                    f.seek(self._data_end)
+                    f.write(b"".join(data for _, data in written))
+                    f.flush()
+                    os.fsync(f.fileno())
+                for block, _ in written:
+                    self._add(block, names.get(block.series) if block.count == 0 else None)
+                with open(self.index_file, 'ab') as f:
+                    f.write(b"".join(self._index_entry(block) for block, _ in written))
+            except OSError as e:
+                print(f"⚠️  Ошибка записи истории счетчика: {e}")
+                return
+            self.pending = {}
+            self.pending_count = 0
+
+        # Сжатие копирует весь файл, поэтому допустимое число неполных блоков
+        # растет вместе с числом полных (сжатия реже по мере роста файла).
+        # Вне блокировки: flock не вкладывается (второе открытие файла ждало бы первое)
+        full_blocks = len(self.entries) - len(self.series) - self._small_blocks
+        if self._small_blocks - len(self.blocks) > max(COMPACT_SMALL_BLOCKS, full_blocks):
+            self.compact()
+
+    def _create(self):
+        """Создает пустые файлы данных и индекса с новым поколением"""
+        self._reset()
+        self.generation = int.from_bytes(os.urandom(8), "little")
+        header = _FILE_HEADER.pack(SERIES_MAGIC, self.generation)
+        for path in (self.db_file, self.index_file):
+            with open(path, 'wb') as f:
+                f.write(header)
+                f.flush()
+                os.fsync(f.fileno())
+        self._data_end = _FILE_HEADER.size
+
+    def compact(self):
+        """
+        Переписывает файл, объединяя неполные блоки каждого ряда
+
+        Скрипт при каждом запуске дописывает блок из одной-двух отметок; сжатие
+        объединяет их, чтобы размер и число записей индекса не росли. Полные
+        блоки копируются без распаковки.
+        """
+        with self._locked():
+            self._refresh()
+            if self.generation is None:
+                return
+            generation = int.from_bytes(os.urandom(8), "little")
+            chunks = [_FILE_HEADER.pack(SERIES_MAGIC, generation)]
+            offset = _FILE_HEADER.size
+            for series, key in enumerate(self.series):
+                block, data = self._encode(offset, series, 0, "\t".join(key).encode("utf-8"))
+                chunks.append(data)
+                offset += len(data)
+            data_map = self._map(self._data_end) if self.blocks else None
+            for series, blocks in self.blocks.items():
+                # Полные блоки копируются как есть, объединяются только неполные
+                samples = []  # type: List[Tuple[int, int]]
+                for block in blocks:
+                    if block.count < BLOCK_SAMPLES // 4:
+                        samples.extend(self._samples(block))
+                    else:
+                        chunks.append(data_map[block.offset:block.end])
+                        offset += block.end - block.offset
+                for block, data in self._encode_samples(offset, series, samples):
+                    chunks.append(data)
+                    offset += len(data)
+
+            directory = os.path.dirname(os.path.abspath(self.db_file))
+            fd, temp_file = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.db_file) + ".")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(b"".join(chunks))
+                    f.flush()
+                    os.fsync(f.fileno())
+                match_file_mode(temp_file, self.db_file)
+                # Отображение старого файла закрываем до замены (в Windows иначе замена не пройдет)
+                self._reset()
+                os.replace(temp_file, self.db_file)
+            except OSError as e:
+                print(f"⚠️  Ошибка сжатия истории счетчика: {e}")
+                try:
+                    os.unlink(temp_file)
+                except OSError:
+                    pass
+            # Индекс нового поколения строится по файлу данных
+            self._refresh()
+
+    # --- Выборки ----------------------------------------------------------------
+
+    def _samples(self, block: SeriesBlock) -> List[Tuple[int, int]]:
+        start = block.offset + _BLOCK_HEADER.size
+        return decode_block(self._map(block.end)[start:block.end], block.t_first, block.v_first)
+
+    def _select(self, device: Optional[str], low: float, high: float) -> Iterator[SeriesBlock]:
+        """Блоки, пересекающиеся с периодом [low, high) (мс)"""
+        for series, blocks in self.blocks.items():
+            if device is not None and self.series[series][0] != device:
+                continue
+            for block in blocks:
+                if block.t_last >= low and block.t_first < high:
+                    yield block
+
+    def _prepare(self, since: Optional[float], until: Optional[float]) -> Tuple[float, float]:
+        """Записывает накопленное, дочитывает файл и переводит период в мс"""
+        self.flush()
+        with self._locked():
+            self._refresh()
+        return (float("-inf") if since is None else since * 1000,
+                float("inf") if until is None else until * 1000)
+
+    def query(self, device: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, object]]:
+        """
+        Отметки за период
+
+        Args:
+            device: Устройство (None - все)
+            since: Начало периода (время Unix, включительно)
+            until: Конец периода (время Unix, не включительно)
+            limit: Вернуть только последние limit отметок
+
+        Returns:
+            Список {"device", "timestamp", "counter", "action"} по возрастанию времени
+        """
+        low, high = self._prepare(since, until)
+        rows = []  # type: List[Tuple[int, int, int]]
+        # С конца периода: при limit распаковываются только последние блоки
+        for block in sorted(self._select(device, low, high), key=lambda b: b.t_last, reverse=True):
+            if limit and len(rows) >= limit:
+                rows.sort(reverse=True)
+                del rows[limit:]
+                if block.t_last < rows[-1][0]:
+                    break
+            rows.extend((t, value, block.series) for t, value in self._samples(block) if low <= t < high)
+        rows.sort()
+        if limit:
+            rows = rows[-limit:]
+        return [{"device": self.series[series][0], "timestamp": t / 1000, "counter": value,
+                 "action": self.series[series][1]} for t, value, series in rows]
+
+    def devices(self) -> List[str]:
+        """Устройства, для которых есть отметки"""
+        self._prepare(None, None)
+        return sorted({self.series[series][0] for series in self.blocks})
+
+    def usage(self, device: str, since: Optional[float] = None,
+              until: Optional[float] = None) -> Optional[Dict[str, object]]:
+        """
+        Прирост счетчика устройства за период
+
+        Складываются увеличения между соседними отметками; установка счетчика
+        (ACTION_SET) и уменьшение значения начинают отсчет заново. Блоки
+        целиком внутри периода, в которые не попала установка, не
+        распаковываются: крайние отметки и их число есть в индексе, прирост
+        внутри блока считается по сериям разностей.
+
+        Args:
+            device: Устройство
+            since: Начало периода (время Unix)
+            until: Конец периода (время Unix)
+
+        Returns:
+            {"device", "first", "last", "delta", "samples"} или None, если отметок нет
+        """
+        low, high = self._prepare(since, until)
+        blocks = list(self._select(device, low, high))
+        settings = sorted(sample for block in blocks if self.series[block.series][1] == ACTION_SET
+                          for sample in self._samples(block) if low <= sample[0] < high)
+        # Отрезки: (первое время, первое значение, последнее время, последнее значение,
+        #           прирост внутри, число отметок, установка)
+        segments = [(t, value, t, value, 0, 1, True) for t, value in settings]
+        for block in blocks:
+            if self.series[block.series][1] == ACTION_SET:
+                continue
+            if (block.t_first >= low and block.t_last < high
+                    and not any(block.t_first <= t <= block.t_last for t, _ in settings)):
+                start = block.offset + _BLOCK_HEADER.size
+                segments.append((block.t_first, block.v_first, block.t_last, block.v_last,
+                                 block_increase(self._map(block.end)[start:block.end]),
+                                 block.count, False))
+            else:
+                segments.extend((t, value, t, value, 0, 1, False)
+                                for t, value in self._samples(block) if low <= t < high)
+        if not segments:
+            return None
+
+        segments.sort(key=lambda segment: segment[0])
+        delta = count = 0
+        previous = None  # type: Optional[int]
+        for _, v_first, _, v_last, increase, samples, setting in segments:
+            if not setting and previous is not None and v_first > previous:
+                delta += v_first - previous
+            delta += increase
+            count += samples
+            previous = v_last
+        last = max(segments, key=lambda segment: segment[2])
+        return {"device": device, "first": segments[0][1], "last": last[3],
+                "delta": delta, "samples": count}
+
+    def close(self):
+        """Записывает накопленные отметки и закрывает файл"""
+        try:
+            self.flush()
+        finally:
+            if self._data is not None:
+                self._data.close()
+                self._data = None
+
+
+def open_history(db_file: str, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Открывает историю счетчика в формате по расширению файла
+
+    Args:
+        db_file: Файл истории (*.hps - бинарный формат, иначе SQLite)
+        batch_size: Размер пачки записи
+
+    Returns:
+        CounterSeries или CounterHistory
+    """
+    if db_file.endswith(SERIES_SUFFIX):
+        return CounterSeries(db_file, batch_size)
+    return CounterHistory(db_file, batch_size)
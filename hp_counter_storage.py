@@ -0,0 +1,698 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранение сохраненного значения счетчика и истории команд
+Раньше каждое обновление счетчика заново записывало весь JSON файл конфигурации.
+Теперь файл конфигурации - снимок, а обновления дописываются в журнал
+(<файл>.journal) записями фиксированного формата: одна короткая запись и fsync
+на обновление. При загрузке журнал применяется к снимку, а когда записей
+становится много, фоновый поток сворачивает их в новый снимок.
+
+Счетчик каждого устройства хранится отдельно (DeviceStores): файл
+<конфигурация>.devices/<серийный номер или имя>.json со своим журналом, в
+основной конфигурации остается выбор принтера.
+"""
+
+import contextlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except ImportError:
+    MSVCRT_AVAILABLE = False
+
+# Типы записей журнала
+RECORD_COUNTER = 1
+RECORD_HISTORY = 2
+
+# Заголовок записи: тип, номер, время (Unix), значение, длина текста
+_RECORD_HEADER = struct.Struct("<BQdqH")
+# Контрольная сумма заголовка и текста (обнаруживает оборванную запись)
+_RECORD_CRC = struct.Struct("<I")
+
+# Заголовок журнала: метка и поколение (меняется при каждом сжатии)
+JOURNAL_MAGIC = b"HPCJ"
+_JOURNAL_HEADER = struct.Struct("<4sQ")
+
+# Сколько записей истории хранится в конфигурации
+HISTORY_LIMIT = 10
+
+# После скольких записей журнала снимок обновляется в фоне
+COMPACT_THRESHOLD = 256
+
+# Сколько хранилищ устройств держится открытыми (DeviceStores)
+DEVICE_CACHE_SIZE = 8
+
+# Поля конфигурации, которые относятся к устройству, а не к компьютеру
+DEVICE_FIELDS = ("scanner_counter", "last_updated", "printer_info", "command_history")
+
+DEFAULT_CONFIG = {
+    "scanner_counter": 0,
+    "last_updated": None,
+    "printer_info": {},
+    "command_history": []
+}
+
+
+def acquire_file_lock(lock_file: str):
+    """
+    Берет монопольную advisory блокировку файла (fcntl.flock, в Windows - msvcrt.locking)
+
+    Args:
+        lock_file: Путь к файлу блокировки (создается при необходимости)
+
+    Returns:
+        Открытый файл для release_file_lock() или None, если блокировка недоступна
+    """
+    try:
+        handle = open(lock_file, 'a+b')
+    except OSError as e:
+        # Каталог только для чтения: работаем без блокировки, как раньше
+        print(f"⚠️  Блокировка хранилища недоступна: {e}")
+        return None
+    if FCNTL_AVAILABLE:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+    elif MSVCRT_AVAILABLE:
+        handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                # LK_LOCK сдается через 10 попыток - ждем дальше
+                continue
+    return handle
+
+
+def release_file_lock(handle):
+    """Снимает блокировку, взятую acquire_file_lock()"""
+    try:
+        if FCNTL_AVAILABLE:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        elif MSVCRT_AVAILABLE:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        handle.close()
+
+
+def match_file_mode(temp_file: str, target: str):
+    """
+    Дает временному файлу права заменяемого файла
+
+    tempfile.mkstemp создает файл с правами 0600, и после os.replace его не
+    прочитали бы экземпляры, запущенные от другого пользователя (cron, .bat).
+
+    Args:
+        temp_file: Временный файл
+        target: Файл, который он заменит (если его нет - права по umask, как у open())
+    """
+    try:
+        mode = os.stat(target).st_mode & 0o7777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    try:
+        os.chmod(temp_file, mode)
+    except OSError:
+        pass
+
+
+def encode_record(kind: int, seq: int, timestamp: float, value: int, text: str = "") -> bytes:
+    """
+    Кодирует запись журнала
+
+    Args:
+        kind: RECORD_COUNTER или RECORD_HISTORY
+        seq: Номер записи (растет на 1)
+        timestamp: Время события (Unix)
+        value: Значение счетчика (для RECORD_COUNTER)
+        text: Текст записи истории
+
+    Returns:
+        Байты записи
+    """
+    payload = text.encode("utf-8")[:0xFFFF]
+    body = _RECORD_HEADER.pack(kind, seq, timestamp, value, len(payload)) + payload
+    return body + _RECORD_CRC.pack(zlib.crc32(body))
+
+
+def decode_records(data: bytes):
+    """
+    Разбирает журнал
+
+    Args:
+        data: Содержимое файла журнала
+
+    Returns:
+        (список записей (kind, seq, timestamp, value, text), длина целой части журнала) -
+        разбор останавливается на первой оборванной или испорченной записи
+    """
+    records = []
+    offset = 0
+    while offset + _RECORD_HEADER.size <= len(data):
+        kind, seq, timestamp, value, length = _RECORD_HEADER.unpack_from(data, offset)
+        end = offset + _RECORD_HEADER.size + length
+        if end + _RECORD_CRC.size > len(data):
+            break
+        (crc,) = _RECORD_CRC.unpack_from(data, end)
+        if crc != zlib.crc32(data[offset:end]):
+            break
+        text = data[offset + _RECORD_HEADER.size:end].decode("utf-8", errors="replace")
+        records.append((kind, seq, timestamp, value, text))
+        offset = end + _RECORD_CRC.size
+    return records, offset
+
+
+class CounterStorage:
+    """Класс для хранения значений счетчика: снимок JSON и журнал обновлений"""
+
+    def __init__(self, config_file: str = "printer_counter_config.json",
+                 defaults: Optional[dict] = None, counter_label: str = "счетчик",
+                 compact_threshold: int = COMPACT_THRESHOLD):
+        """
+        Инициализация хранилища
+
+        Args:
+            config_file: Файл конфигурации (снимок)
+            defaults: Конфигурация по умолчанию (DEFAULT_CONFIG)
+            counter_label: Название счетчика в истории ("Установлен <label>: N")
+            compact_threshold: Число записей журнала, после которого снимок обновляется в фоне
+        """
+        self.config_file = config_file
+        self.journal_file = config_file + ".journal"
+        self.lock_file = config_file + ".lock"
+        self.defaults = defaults or DEFAULT_CONFIG
+        self.counter_label = counter_label
+        self.compact_threshold = compact_threshold
+        self.lock = threading.RLock()
+        self.seq = 0
+        self.journal_records = 0
+        self._lock_depth = 0
+        self._lock_handle = None
+        self._journal_generation = None  # type: Optional[int]
+        self._journal_offset = 0
+        self._compactor = None  # type: Optional[threading.Thread]
+        with self._locked():
+            self.config = self._load_config()
+
+    # --- Блокировка между процессами ----------------------------------------
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Монопольный доступ к файлам хранилища
+
+        Внутри процесса - RLock (вложенные вызовы не блокируются), между
+        процессами - advisory блокировка файла <config>.lock (fcntl.flock,
+        в Windows - msvcrt.locking).
+        """
+        with self.lock:
+            if self._lock_depth == 0:
+                self._lock_handle = acquire_file_lock(self.lock_file)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_handle is not None:
+                    release_file_lock(self._lock_handle)
+                    self._lock_handle = None
+
+    # --- Загрузка ----------------------------------------------------------
+
+    def _load_config(self) -> dict:
+        """Загружает снимок и применяет к нему журнал (вызывается под блокировкой)"""
+        config = None
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+        except:
+            pass
+        if not isinstance(config, dict):
+            # Дефолтная конфигурация
+            config = json.loads(json.dumps(self.defaults))
+
+        self.seq = config.pop("journal_seq", 0)
+        self.journal_records = 0
+        self._journal_generation = None
+        self._journal_offset = 0
+        self._read_journal(config)
+        return config
+
+    @staticmethod
+    def _read_header(f) -> Tuple[int, int]:
+        """(поколение журнала, длина заголовка); журнал без заголовка - поколение 0"""
+        head = f.read(_JOURNAL_HEADER.size)
+        if len(head) == _JOURNAL_HEADER.size and head[:len(JOURNAL_MAGIC)] == JOURNAL_MAGIC:
+            return _JOURNAL_HEADER.unpack(head)[1], _JOURNAL_HEADER.size
+        return 0, 0
+
+    def _read_journal(self, config: dict) -> bool:
+        """
+        Применяет записи журнала, появившиеся после прочитанной части
+
+        Returns:
+            False если журнал заменен (другой процесс сжал его в новый снимок) -
+            нужна полная перезагрузка
+        """
+        try:
+            with open(self.journal_file, 'rb') as f:
+                generation, start = self._read_header(f)
+                if self._journal_generation is None:
+                    self._journal_generation, self._journal_offset = generation, start
+                if generation != self._journal_generation:
+                    return False
+                size = os.fstat(f.fileno()).st_size
+                if size < self._journal_offset:
+                    return False
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            if self._journal_generation is None:
+                self._journal_generation = 0
+            return self._journal_generation == 0 and self._journal_offset == 0
+        except OSError:
+            return True
+
+        records, valid = decode_records(data)
+        for record in records:
+            if record[1] > self.seq:
+                self._apply(config, *record)
+                self.seq = record[1]
+                self.journal_records += 1
+        self._journal_offset += valid
+        if valid < len(data):
+            # Оборванная запись после сбоя: отрезаем, чтобы дописывать после целых
+            try:
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(self._journal_offset)
+            except OSError:
+                pass
+        return True
+
+    def _refresh(self):
+        """
+        Подхватывает изменения других процессов (вызывается под блокировкой)
+
+        Обычно дочитывается только хвост журнала; если журнал сменил поколение
+        (сжат в новый снимок), хранилище перезагружается целиком.
+        """
+        if not self._read_journal(self.config):
+            self.config = self._load_config()
+
+    # --- Запись ------------------------------------------------------------
+
+    @staticmethod
+    def _apply(config: dict, kind: int, seq: int, timestamp: float, value: int, text: str):
+        """Применяет запись журнала к конфигурации"""
+        when = datetime.fromtimestamp(timestamp).isoformat()
+        if kind == RECORD_COUNTER:
+            config["scanner_counter"] = value
+            config["last_updated"] = when
+        if text:
+            history = config.setdefault("command_history", [])
+            history.append({"timestamp": when, "action": text})
+            # Оставляем только последние записи
+            del history[:-HISTORY_LIMIT]
+
+    def _append(self, kind: int, value: int = 0, text: str = ""):
+        """Дописывает запись в журнал (с fsync) и применяет ее (вызывается под блокировкой)"""
+        self.seq += 1
+        record = (kind, self.seq, datetime.now().timestamp(), value, text)
+        self._apply(self.config, *record)
+        try:
+            # Журнал открывается на каждую запись: после сжатия другим процессом это новый файл
+            with open(self.journal_file, 'ab') as f:
+                f.write(encode_record(*record))
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_offset = f.tell()
+            self.journal_records += 1
+        except Exception as e:
+            print(f"⚠️  Ошибка записи журнала счетчика: {e}")
+            return
+        if self.journal_records >= self.compact_threshold:
+            self.compact(background=True)
+
+    def _write_snapshot(self, config: dict):
+        """Атомарная запись снимка: временный файл в том же каталоге, fsync, rename"""
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        handle, temp_file = tempfile.mkstemp(prefix=os.path.basename(self.config_file) + ".",
+                                             suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            match_file_mode(temp_file, self.config_file)
+            os.replace(temp_file, self.config_file)
+        except BaseException:
+            try:
+                os.unlink(temp_file)
+            except OSError:
+                pass
+            raise
+
+    def _save_config(self):
+        """Сохраняет конфигурацию целиком (снимок) и очищает журнал"""
+        self.compact()
+
+    def compact(self, background: bool = False):
+        """
+        Сворачивает журнал в снимок
+
+        Args:
+            background: Выполнить в фоновом потоке (обновления счетчика не ждут записи снимка)
+        """
+        if background:
+            with self.lock:
+                if self._compactor and self._compactor.is_alive():
+                    return
+                self._compactor = threading.Thread(target=self._compact, daemon=True)
+                self._compactor.start()
+        else:
+            self._compact()
+
+    def _compact(self):
+        with self._locked():
+            try:
+                self._refresh()
+                self._write_snapshot(dict(self.config, journal_seq=self.seq))
+                # Снимок содержит все записи: журнал начинается заново с новым поколением,
+                # по которому другие процессы узнают, что нужно перечитать снимок
+                generation = int.from_bytes(os.urandom(8), "little") or 1
+                temp_journal = self.journal_file + ".tmp"
+                with open(temp_journal, 'wb') as f:
+                    f.write(_JOURNAL_HEADER.pack(JOURNAL_MAGIC, generation))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_journal, self.journal_file)
+                self._journal_generation = generation
+                self._journal_offset = _JOURNAL_HEADER.size
+                self.journal_records = 0
+            except Exception as e:
+                print(f"⚠️  Ошибка сохранения конфигурации: {e}")
+
+    def close(self):
+        """Дожидается фонового сжатия"""
+        compactor = self._compactor
+        if compactor:
+            compactor.join()
+
+    # --- Счетчик и конфигурация ---------------------------------------------
+
+    def get_counter(self) -> int:
+        """Получает сохраненное значение счетчика (с учетом записей других процессов)"""
+        with self._locked():
+            self._refresh()
+            return self.config.get("scanner_counter", 0)
+
+    def set_counter(self, value: int):
+        """Устанавливает значение счетчика (одна запись журнала, через update_counter)"""
+        current = self.get_counter()
+        while not self.update_counter(current, value):
+            current = self.get_counter()
+
+    def increment(self, delta: int = 1) -> int:
+        """
+        Увеличивает сохраненный счетчик без потери одновременных обновлений
+
+        Args:
+            delta: Приращение
+
+        Returns:
+            Новое значение
+        """
+        while True:
+            current = self.get_counter()
+            if self.update_counter(current, current + delta):
+                return current + delta
+
+    def update_counter(self, expected: int, new: int) -> bool:
+        """
+        Сравнение с обменом: устанавливает new, только если сохранено expected
+
+        Проверка и запись выполняются под блокировкой с учетом изменений
+        других процессов, поэтому одновременные обновления не теряются:
+        проигравший получает False, перечитывает get_counter() и повторяет.
+
+        Args:
+            expected: Ожидаемое текущее значение
+            new: Новое значение
+
+        Returns:
+            True если значение обновлено
+        """
+        with self._locked():
+            self._refresh()
+            if self.config.get("scanner_counter", 0) != expected:
+                return False
+            self._append(RECORD_COUNTER, new, f"Установлен {self.counter_label}: {new}")
+            return True
+
+    def update_config(self, changes: dict):
+        """
+        Изменяет поля конфигурации (например, selected_printer) и сохраняет снимок
+
+        Args:
+            changes: {поле: значение}
+        """
+        with self._locked():
+            self._refresh()
+            self.config.update(changes)
+            self._compact()
+
+    def reload(self):
+        """Перечитывает хранилище (изменения других процессов)"""
+        with self._locked():
+            self._refresh()
+
+    def _add_to_history(self, action: str):
+        """Добавляет действие в историю"""
+        with self._locked():
+            self._refresh()
+            self._append(RECORD_HISTORY, text=action)
+
+    def get_history(self) -> List[dict]:
+        """Получает историю команд"""
+        return self.config.get("command_history", [])
+
+
+def device_id(printer: Optional[Dict[str, str]]) -> Optional[str]:
+    """
+    Идентификатор устройства для DeviceStores
+
+    Args:
+        printer: Информация о принтере ('serial', 'name', 'port')
+
+    Returns:
+        Серийный номер, если он известен, иначе имя очереди или порт (None - неизвестно)
+    """
+    if not printer:
+        return None
+    return printer.get('serial') or printer.get('name') or printer.get('port') or None
+
+
+def device_key(device: str) -> str:
+    """
+    Имя файла хранилища для идентификатора устройства
+
+    Args:
+        device: Серийный номер, имя очереди или порт
+
+    Returns:
+        Имя без недопустимых символов; если символы заменялись - с CRC32
+        исходного идентификатора, чтобы разные устройства не совпали
+    """
+    safe = re.sub(r"[^A-Za-z0-9._-]", "_", device).strip("._")[:64]
+    if safe != device:
+        safe = f"{safe or 'device'}-{zlib.crc32(device.encode('utf-8')):08x}"
+    return safe
+
+
+class DeviceStores:
+    """
+    Хранилища счетчика по устройствам (серийный номер или имя очереди/порт)
+
+    Один процесс может работать с несколькими принтерами: открытые хранилища
+    держатся в LRU (не больше max_open), переключение между устройствами не
+    перечитывает файлы. Старый общий счетчик из основной конфигурации
+    однократно переносится в хранилище устройства.
+    """
+
+    def __init__(self, host: CounterStorage, max_open: int = DEVICE_CACHE_SIZE):
+        """
+        Инициализация
+
+        Args:
+            host: Основная конфигурация (выбор принтера, счетчик до разделения по устройствам)
+            max_open: Сколько хранилищ устройств держать открытыми
+        """
+        self.host = host
+        self.max_open = max_open
+        self.devices_dir = os.path.splitext(host.config_file)[0] + ".devices"
+        self.stores = OrderedDict()  # type: OrderedDict[str, CounterStorage]
+        self.lock = threading.Lock()
+
+    def get(self, device: str, printer: Optional[Dict[str, str]] = None,
+            migrate: bool = True) -> CounterStorage:
+        """
+        Хранилище устройства (открывается при первом обращении)
+
+        Args:
+            device: Идентификатор устройства (device_id())
+            printer: Сведения о принтере ('serial', 'name', 'port') для сопоставления
+                     со старым сохраненным выбором без серийного номера
+            migrate: Перенести старый общий счетчик, если он принадлежит устройству
+
+        Returns:
+            CounterStorage устройства
+        """
+        with self.lock:
+            store = self.stores.get(device)
+            if store is not None:
+                self.stores.move_to_end(device)
+            else:
+                os.makedirs(self.devices_dir, exist_ok=True)
+                store = CounterStorage(os.path.join(self.devices_dir, device_key(device) + ".json"),
+                                       dict(self.host.defaults, device_id=device), self.host.counter_label,
+                                       self.host.compact_threshold)
+                if not os.path.exists(store.config_file):
+                    # Снимок с идентификатором: по нему devices() находит устройство
+                    store.update_config({"device_id": device})
+                self.stores[device] = store
+                if len(self.stores) > self.max_open:
+                    _, evicted = self.stores.popitem(last=False)
+                    evicted.close()
+        # Перенос проверяется и для уже открытого хранилища: его могли открыть без переноса (history())
+        if migrate:
+            self._migrate(device, store, printer)
+        return store
+
+    def _owns_legacy(self, device: str, printer: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Принадлежит ли старый общий счетчик устройству
+
+        Старые версии сохраняли selected_printer без серийного номера
+        ({'name', 'port'}), а теперь устройство может определяться по серийному
+        номеру - тогда сопоставляются имя очереди и порт.
+        """
+        saved = self.host.config.get("selected_printer") or {}
+        owner = device_id(saved)
+        if not owner or owner == device:
+            return True
+        if saved.get('serial'):
+            return False
+        identities = {device}
+        if printer:
+            identities.update(printer.get(key) for key in ('name', 'port') if printer.get(key))
+        return any(saved.get(key) in identities for key in ('name', 'port') if saved.get(key))
+
+    def _migrate(self, device: str, store: CounterStorage, printer: Optional[Dict[str, str]] = None):
+        """
+        Переносит общий счетчик основной конфигурации в хранилище устройства
+
+        Выполняется один раз: счетчик достается устройству из selected_printer
+        (если оно известно) или первому открытому устройству, после чего в
+        основной конфигурации ставится отметка devices_migrated. Старые поля
+        остаются на месте для предыдущих версий скриптов.
+        """
+        host = self.host
+        if host.config.get("devices_migrated"):
+            return
+        with host._locked():
+            host._refresh()
+            if host.config.get("devices_migrated"):
+                return
+            legacy = host.config.get("last_updated") or host.config.get("command_history")
+            if legacy and not self._owns_legacy(device, printer):
+                # Счетчик принадлежит другому принтеру - перенесем, когда откроют его
+                return
+            if legacy:
+                store.update_config({name: host.config[name] for name in DEVICE_FIELDS if name in host.config})
+                print(f"📦 Сохраненный {host.counter_label} перенесен в хранилище устройства {device}")
+            host.update_config({"devices_migrated": device})
+
+    def history(self, device: str, printer: Optional[Dict[str, str]] = None) -> List[dict]:
+        """
+        История команд устройства без переноса старого счетчика
+
+        --history выполняется без подключения, и идентификатор устройства может
+        отличаться от того, под которым принтер будет найден (имя очереди вместо
+        серийного номера), поэтому перенос откладывается до подключения.
+
+        Args:
+            device: Идентификатор устройства
+            printer: Сведения о принтере для сопоставления со старым выбором
+
+        Returns:
+            Записи истории; до переноса - вместе с записями основной конфигурации,
+            если они принадлежат устройству
+        """
+        entries = self.get(device, migrate=False).get_history()
+        if not self.host.config.get("devices_migrated") and self._owns_legacy(device, printer):
+            entries = sorted(self.host.get_history() + entries,
+                             key=lambda entry: entry.get("timestamp") or "")
+        return entries
+
+    def devices(self) -> List[str]:
+        """Идентификаторы устройств, для которых есть хранилища"""
+        try:
+            names = sorted(os.listdir(self.devices_dir))
+        except OSError:
+            return []
+        result = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.devices_dir, name), 'r', encoding='utf-8') as f:
+                    device = json.load(f).get("device_id")
+            except (OSError, ValueError, AttributeError):
+                continue
+            if device:
+                result.append(device)
+        return result
+
+    def all_history(self) -> List[dict]:
+        """
+        История команд всех устройств (для --history без выбранного принтера)
+
+        Returns:
+            Записи {"timestamp", "action", "device"} по времени; до переноса
+            в хранилища устройств - также записи основной конфигурации
+        """
+        entries = []
+        if not self.host.config.get("devices_migrated"):
+            entries += [dict(entry, device=None) for entry in self.host.get_history()]
+        for device in self.devices():
+            entries += [dict(entry, device=device)
+                        for entry in self.get(device, migrate=False).get_history()]
+        entries.sort(key=lambda entry: entry.get("timestamp") or "")
+        return entries
+
+    def close(self):
+        """Закрывает открытые хранилища устройств"""
+        with self.lock:
+            while self.stores:
+                _, store = self.stores.popitem(last=False)
+                store.close()
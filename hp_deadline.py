@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий бюджет времени одной операции
+Системные методы перебирают варианты команд и способы отправки (lpstat, lp,
+PowerShell), у каждого свой таймаут. Deadline передается по цепочке вызовов:
+каждый шаг получает не больше оставшегося времени, а при исчерпании бюджета
+операция прерывается с отчетом о выполненных и пропущенных шагах.
+"""
+
+import time
+from typing import Iterable, List, Optional, Tuple
+
+
+# Итог шага
+STEP_OK = "ok"
+STEP_FAILED = "failed"
+STEP_TIMEOUT = "timeout"
+STEP_SKIPPED = "skipped"
+
+_STEP_ICONS = {
+    STEP_OK: "✓",
+    STEP_FAILED: "❌",
+    STEP_TIMEOUT: "⏱️ ",
+    STEP_SKIPPED: "⏭️ ",
+}
+
+# Шаг не запускается, если до конца бюджета осталось меньше этого времени
+MIN_STEP_TIME = 0.1
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени операции исчерпан"""
+
+    def __init__(self, deadline: "Deadline", step: str = ""):
+        self.deadline = deadline
+        self.step = step
+        super().__init__(f"Бюджет времени {deadline.budget:g} с исчерпан"
+                         + (f" (шаг: {step})" if step else ""))
+
+
+class Deadline:
+    """Срок завершения операции и журнал ее шагов"""
+
+    def __init__(self, budget: Optional[float] = None):
+        """
+        Инициализация срока
+
+        Args:
+            budget: Бюджет времени операции в секундах (None - без ограничения)
+        """
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires_at = None if budget is None else self.started + budget
+        self.steps = []  # type: List[Tuple[str, str, float]]
+
+    def remaining(self) -> Optional[float]:
+        """Оставшееся время в секундах (None - без ограничения)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """Бюджет исчерпан"""
+        remaining = self.remaining()
+        return remaining is not None and remaining < MIN_STEP_TIME
+
+    def timeout(self, step_timeout: float, step: str = "") -> float:
+        """
+        Таймаут очередного шага: собственный таймаут шага, но не больше остатка бюджета
+
+        Args:
+            step_timeout: Обычный таймаут шага в секундах
+            step: Имя шага (для отчета)
+
+        Returns:
+            Таймаут в секундах
+
+        Raises:
+            DeadlineExceeded: времени на шаг не осталось
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return step_timeout
+        if remaining < MIN_STEP_TIME:
+            if step:
+                self.record(step, STEP_TIMEOUT)
+            raise DeadlineExceeded(self, step)
+        return min(step_timeout, remaining)
+
+    def sleep(self, seconds: float):
+        """Пауза между шагами, не выходящая за срок"""
+        remaining = self.remaining()
+        time.sleep(seconds if remaining is None else min(seconds, remaining))
+
+    def record(self, step: str, status: str):
+        """
+        Записывает итог шага
+
+        Args:
+            step: Имя шага (например, отправленная команда)
+            status: STEP_OK, STEP_FAILED, STEP_TIMEOUT или STEP_SKIPPED
+        """
+        self.steps.append((step, status, time.monotonic() - self.started))
+
+    def skip(self, steps: Iterable[str]):
+        """Отмечает шаги, до которых не дошла очередь"""
+        for step in steps:
+            self.record(step, STEP_SKIPPED)
+
+    def completed(self) -> List[str]:
+        """Успешно выполненные шаги"""
+        return [step for step, status, _ in self.steps if status == STEP_OK]
+
+    def print_report(self, error: Optional[DeadlineExceeded] = None):
+        """
+        Выводит отчет о частично выполненной операции
+
+        Args:
+            error: Исключение, прервавшее операцию
+        """
+        elapsed = time.monotonic() - self.started
+        where = f" на шаге: {error.step}" if error and error.step else ""
+        print(f"⏱️  Бюджет операции {self.budget:g} с исчерпан{where} (прошло {elapsed:.1f} с)")
+        done = len(self.completed())
+        print(f"   Выполнено шагов: {done} из {len(self.steps)}")
+        for step, status, at in self.steps:
+            when = "" if status == STEP_SKIPPED else f" ({at:.1f} с)"
+            print(f"   {_STEP_ICONS.get(status, '?')} {step}{when}")
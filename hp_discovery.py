@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Быстрый поиск сетевых принтеров HP (порт 9100) по диапазонам CIDR
+Неблокирующие подключения мультиплексируются через selectors (epoll/kqueue/select),
+найденные узлы подтверждаются командой @PJL INFO ID
+"""
+
+import argparse
+import errno
+import heapq
+import ipaddress
+import selectors
+import socket
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from hp_capability_cache import parse_identity_value
+from hp_pjl_protocol import build_pjl_job, new_echo_token, strip_echo
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+
+# Коды незавершенного неблокирующего подключения
+IN_PROGRESS_ERRNOS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN,
+                      getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
+UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH,
+                      getattr(errno, "EHOSTDOWN", errno.EHOSTUNREACH)}
+
+# Этапы проверки узла
+STAGE_CONNECT = "connect"
+STAGE_PROBE = "probe"
+
+# Запас дескрипторов для остальной программы при ограничении числа подключений
+RESERVED_DESCRIPTORS = 64
+
+
+def local_network(prefix: int = 24) -> Optional[str]:
+    """
+    Возвращает локальную подсеть хоста (как раньше сканировался только /24)
+
+    Args:
+        prefix: Длина префикса сети
+
+    Returns:
+        Сеть в формате CIDR или None
+    """
+    try:
+        local_ip = socket.gethostbyname(socket.gethostname())
+        if local_ip.startswith("127."):
+            # Имя хоста указывает на loopback - узнаем адрес исходящего интерфейса
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                probe.connect(("192.0.2.1", 9))
+                local_ip = probe.getsockname()[0]
+        return str(ipaddress.ip_network(f"{local_ip}/{prefix}", strict=False))
+    except (OSError, ValueError):
+        return None
+
+
+def parse_network(value: str):
+    """
+    Сеть или адрес из аргумента командной строки (как диапазоны - без strict)
+
+    Args:
+        value: Адрес или сеть CIDR (10.0.0.5/24 означает 10.0.0.0/24)
+
+    Returns:
+        ipaddress.IPv4Network / IPv6Network
+
+    Raises:
+        ValueError: некорректный адрес (argparse выводит ошибку аргумента)
+    """
+    return ipaddress.ip_network(value.strip(), strict=False)
+
+
+def _subtract_networks(network, excluded: List) -> List:
+    """
+    Вычитает исключенные сети из сети CIDR
+
+    Args:
+        network: Сеть диапазона
+        excluded: Объединенные исключаемые сети той же версии IP
+
+    Returns:
+        Список непересекающихся подсетей, оставшихся после вычитания
+    """
+    remaining = [network]
+    for ex in excluded:
+        parts = []
+        for part in remaining:
+            if part.subnet_of(ex):
+                continue
+            if ex.subnet_of(part):
+                parts.extend(part.address_exclude(ex))
+            else:
+                parts.append(part)
+        remaining = parts
+    return sorted(remaining)
+
+
+def iter_addresses(ranges: Iterable[str], exclude: Iterable[str] = ()) -> Iterator[str]:
+    """
+    Перебирает адреса диапазонов за вычетом исключений
+
+    Пересекающиеся диапазоны объединяются (ipaddress.collapse_addresses), а
+    исключения вычитаются из сетей целиком, поэтому повторы отбрасываются без
+    хранения уже выданных адресов.
+
+    Args:
+        ranges: IP адреса или сети CIDR (192.168.0.0/16)
+        exclude: Адреса или сети (строки или ip_network), которые не нужно проверять
+
+    Returns:
+        Генератор адресов (без повторов между пересекающимися диапазонами)
+    """
+    networks = {4: [], 6: []}
+    explicit = set()  # Явно указанные адреса (/32, /31) проверяются, даже если попали на границу
+    for spec in ranges:
+        try:
+            network = ipaddress.ip_network(spec.strip(), strict=False)
+        except ValueError:
+            print(f"⚠️  Пропущен некорректный диапазон: {spec}")
+            continue
+        networks[network.version].append(network)
+        if network.num_addresses <= 2:
+            explicit.update(network)
+
+    excluded = {4: [], 6: []}
+    for item in exclude:
+        if isinstance(item, str):
+            if not item.strip():
+                continue
+            item = parse_network(item)
+        excluded[item.version].append(item)
+
+    for version in (4, 6):
+        skip = list(ipaddress.collapse_addresses(excluded[version]))
+        for network in ipaddress.collapse_addresses(networks[version]):
+            # Адрес сети и широковещательный адрес не проверяются (как в hosts()),
+            # если только они не были указаны отдельно
+            boundary = ()
+            if network.num_addresses > 2:
+                boundary = tuple(address for address in (network.network_address,
+                                                         network.broadcast_address)
+                                 if address not in explicit)
+            for part in _subtract_networks(network, skip):
+                for address in part:
+                    if address not in boundary:
+                        yield str(address)
+
+
+def descriptor_limit(requested: int) -> int:
+    """
+    Ограничивает число одновременных подключений лимитом открытых файлов
+
+    При возможности мягкий лимит RLIMIT_NOFILE поднимается до жесткого.
+    """
+    if not RESOURCE_AVAILABLE:
+        return requested
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = requested + RESERVED_DESCRIPTORS
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            new_soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+                soft = new_soft
+            except (OSError, ValueError):
+                pass
+        if soft == resource.RLIM_INFINITY:
+            return requested
+        return max(1, min(requested, soft - RESERVED_DESCRIPTORS))
+    except (OSError, ValueError):
+        return requested
+
+
+class _Probe:
+    """Состояние проверки одного узла"""
+
+    __slots__ = ("ip", "sock", "stage", "deadline", "outgoing", "incoming", "token")
+
+    def __init__(self, ip: str, sock: socket.socket, deadline: float):
+        self.ip = ip
+        self.sock = sock
+        self.stage = STAGE_CONNECT
+        self.deadline = deadline
+        self.outgoing = b""
+        self.incoming = bytearray()
+        self.token = None
+
+
+class PortDiscovery:
+    """Сканер порта 9100 на неблокирующих сокетах с ограничением одновременных подключений"""
+
+    def __init__(self, port: int = 9100, max_in_flight: int = 2048, connect_timeout: float = 0.75,
+                 confirm: bool = True, confirm_timeout: float = 2.0):
+        """
+        Инициализация сканера
+
+        Args:
+            port: Проверяемый порт
+            max_in_flight: Максимум одновременно открытых подключений
+            connect_timeout: Таймаут подключения к одному узлу в секундах
+            confirm: Подтверждать найденные узлы командой @PJL INFO ID
+            confirm_timeout: Таймаут ответа на @PJL INFO ID в секундах
+        """
+        self.port = port
+        self.max_in_flight = descriptor_limit(max_in_flight)
+        self.connect_timeout = connect_timeout
+        self.confirm = confirm
+        self.confirm_timeout = confirm_timeout
+        self.stats = {"scanned": 0, "open": 0, "confirmed": 0, "refused": 0,
+                      "unreachable": 0, "timeout": 0, "errors": 0}
+
+    def _start(self, selector: selectors.BaseSelector, ip: str, now: float) -> Optional[_Probe]:
+        """Начинает неблокирующее подключение к узлу"""
+        self.stats["scanned"] += 1
+        family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+        try:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+        except OSError:
+            self.stats["errors"] += 1
+            return None
+        sock.setblocking(False)
+        probe = _Probe(ip, sock, now + self.connect_timeout)
+        code = sock.connect_ex((ip, self.port))
+        if code == 0 or code in IN_PROGRESS_ERRNOS:
+            selector.register(sock, selectors.EVENT_WRITE, probe)
+            return probe
+        self._count_error(code)
+        sock.close()
+        return None
+
+    def _count_error(self, code: int):
+        if code == errno.ECONNREFUSED:
+            self.stats["refused"] += 1
+        elif code in UNREACHABLE_ERRNOS:
+            self.stats["unreachable"] += 1
+        else:
+            self.stats["errors"] += 1
+
+    def _finish(self, selector: selectors.BaseSelector, probe: _Probe):
+        """Закрывает подключение узла"""
+        try:
+            selector.unregister(probe.sock)
+        except (KeyError, ValueError):
+            pass
+        probe.sock.close()
+
+    def _result(self, probe: _Probe, model: Optional[str]) -> Dict[str, object]:
+        if model:
+            self.stats["confirmed"] += 1
+        return {"ip": probe.ip, "port": self.port, "model": model, "confirmed": bool(model)}
+
+    def _on_connected(self, selector: selectors.BaseSelector, probe: _Probe,
+                      now: float) -> Optional[Dict[str, object]]:
+        """Обрабатывает завершение подключения; возвращает результат, если проверка окончена"""
+        code = probe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code != 0:
+            self._count_error(code)
+            self._finish(selector, probe)
+            return None
+
+        self.stats["open"] += 1
+        if not self.confirm:
+            self._finish(selector, probe)
+            return self._result(probe, None)
+
+        probe.stage = STAGE_PROBE
+        probe.deadline = now + self.confirm_timeout
+        probe.token = new_echo_token()
+        probe.outgoing = build_pjl_job(["@PJL INFO ID"], probe.token).encode('ascii')
+        return self._on_writable(selector, probe)
+
+    def _on_writable(self, selector: selectors.BaseSelector,
+                     probe: _Probe) -> Optional[Dict[str, object]]:
+        """Досылает PJL задание подтверждения"""
+        try:
+            sent = probe.sock.send(probe.outgoing)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except OSError:
+            self._finish(selector, probe)
+            return self._result(probe, None)
+        probe.outgoing = probe.outgoing[sent:]
+        if not probe.outgoing:
+            selector.modify(probe.sock, selectors.EVENT_READ, probe)
+        return None
+
+    def _on_readable(self, selector: selectors.BaseSelector,
+                     probe: _Probe) -> Optional[Dict[str, object]]:
+        """Читает ответ на @PJL INFO ID до маркера ECHO"""
+        try:
+            data = probe.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except OSError:
+            data = b""
+        if data:
+            search_from = max(0, len(probe.incoming) - len(probe.token))
+            probe.incoming.extend(data)
+            if probe.incoming.find(probe.token.encode('ascii'), search_from) == -1:
+                return None
+
+        self._finish(selector, probe)
+        response = strip_echo(probe.incoming.decode('ascii', errors='ignore'), probe.token)
+        return self._result(probe, parse_identity_value(response))
+
+    def _expire(self, selector: selectors.BaseSelector, probe: _Probe) -> Optional[Dict[str, object]]:
+        """Обрабатывает истечение таймаута узла"""
+        self._finish(selector, probe)
+        if probe.stage == STAGE_CONNECT:
+            self.stats["timeout"] += 1
+            return None
+        # Порт открыт, но @PJL INFO ID не ответил вовремя
+        response = strip_echo(probe.incoming.decode('ascii', errors='ignore'), probe.token)
+        return self._result(probe, parse_identity_value(response))
+
+    def scan(self, addresses: Iterable[str]) -> Iterator[Dict[str, object]]:
+        """
+        Проверяет адреса и выдает узлы с открытым портом по мере обнаружения
+
+        Args:
+            addresses: Проверяемые адреса (см. iter_addresses)
+
+        Returns:
+            Генератор словарей {"ip", "port", "model", "confirmed"}
+        """
+        selector = selectors.DefaultSelector()
+        pending = iter(addresses)
+        exhausted = False
+        active = {}     # type: Dict[int, _Probe]
+        deadlines = []  # Куча (срок, номер, дескриптор); устаревшие записи пропускаются
+        sequence = 0
+
+        try:
+            while True:
+                now = time.monotonic()
+                while not exhausted and len(active) < self.max_in_flight:
+                    ip = next(pending, None)
+                    if ip is None:
+                        exhausted = True
+                        break
+                    probe = self._start(selector, ip, now)
+                    if probe:
+                        active[probe.sock.fileno()] = probe
+                        sequence += 1
+                        heapq.heappush(deadlines, (probe.deadline, sequence, probe.sock.fileno()))
+
+                if not active:
+                    break
+
+                while deadlines and (deadlines[0][2] not in active
+                                     or active[deadlines[0][2]].deadline != deadlines[0][0]):
+                    heapq.heappop(deadlines)
+                wait = max(0.0, deadlines[0][0] - now) if deadlines else self.connect_timeout
+
+                for key, events in selector.select(wait):
+                    probe = key.data
+                    fd = probe.sock.fileno()
+                    if probe.stage == STAGE_CONNECT:
+                        result = self._on_connected(selector, probe, time.monotonic())
+                        if probe.stage == STAGE_PROBE and probe.sock.fileno() != -1:
+                            sequence += 1
+                            heapq.heappush(deadlines, (probe.deadline, sequence, fd))
+                    elif events & selectors.EVENT_WRITE:
+                        result = self._on_writable(selector, probe)
+                    else:
+                        result = self._on_readable(selector, probe)
+                    if probe.sock.fileno() == -1:
+                        active.pop(fd, None)
+                    if result:
+                        yield result
+
+                now = time.monotonic()
+                while deadlines and deadlines[0][0] <= now:
+                    _, _, fd = heapq.heappop(deadlines)
+                    probe = active.get(fd)
+                    if probe is None or probe.deadline > now:
+                        continue
+                    del active[fd]
+                    result = self._expire(selector, probe)
+                    if result:
+                        yield result
+        finally:
+            for probe in active.values():
+                self._finish(selector, probe)
+            selector.close()
+
+
+def describe_printer(printer: Dict[str, object], confirm: bool = True) -> str:
+    """Формирует строку с найденным узлом для вывода"""
+    model = printer["model"] or ("PJL не ответил" if confirm else "порт открыт")
+    return f"{printer['ip']}:{printer['port']} - {model}"
+
+
+def discover_printers(ranges: Iterable[str], exclude: Iterable[str] = (), port: int = 9100,
+                      max_in_flight: int = 2048, connect_timeout: float = 0.75,
+                      confirm: bool = True, verbose: bool = True) -> List[Dict[str, object]]:
+    """
+    Находит принтеры с открытым портом 9100 в заданных диапазонах
+
+    Args:
+        ranges: Адреса или сети CIDR
+        exclude: Исключаемые адреса или сети
+        port: Проверяемый порт
+        max_in_flight: Максимум одновременных подключений
+        connect_timeout: Таймаут подключения в секундах
+        confirm: Подтверждать найденные узлы командой @PJL INFO ID
+        verbose: Печатать найденные узлы по мере обнаружения
+
+    Returns:
+        Список найденных узлов, отсортированный по адресу
+    """
+    scanner = PortDiscovery(port, max_in_flight, connect_timeout, confirm)
+    found = []
+    for printer in scanner.scan(iter_addresses(ranges, exclude)):
+        found.append(printer)
+        if verbose:
+            print(f"   ✅ {describe_printer(printer, confirm)}")
+    found.sort(key=lambda item: ipaddress.ip_address(item["ip"]))
+    return found
+
+
+def main():
+    """Основная функция программы"""
+    parser = argparse.ArgumentParser(
+        description="Быстрый поиск принтеров HP по порту 9100 в диапазонах CIDR",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  python hp_discovery.py                       # локальная подсеть /24
+  python hp_discovery.py 10.0.0.0/16 --exclude 10.0.0.0/24 --exclude 10.0.255.1
+  python hp_discovery.py 192.168.0.0/16 --max-in-flight 4096 --timeout 0.5 --no-confirm
+        """
+    )
+
+    parser.add_argument("ranges", nargs="*", help="Адреса или сети CIDR (по умолчанию: локальная /24)")
+    parser.add_argument("--exclude", action="append", default=[], type=parse_network,
+                        help="Исключить адрес или сеть")
+    parser.add_argument("--port", type=int, default=9100, help="Проверяемый порт (по умолчанию: 9100)")
+    parser.add_argument("--max-in-flight", type=int, default=2048,
+                        help="Максимум одновременных подключений (по умолчанию: 2048)")
+    parser.add_argument("--timeout", type=float, default=0.75,
+                        help="Таймаут подключения в секундах (по умолчанию: 0.75)")
+    parser.add_argument("--no-confirm", action="store_true",
+                        help="Не подтверждать найденные узлы командой @PJL INFO ID")
+
+    args = parser.parse_args()
+
+    ranges = args.ranges or [local_network()]
+    if not ranges[0]:
+        print("✗ Не удалось определить локальную подсеть, укажите диапазон явно")
+        sys.exit(1)
+
+    print(f"🔍 Поиск принтеров на порту {args.port}: {', '.join(ranges)}")
+    started = time.monotonic()
+    scanner = PortDiscovery(args.port, args.max_in_flight, args.timeout, not args.no_confirm)
+    found = []
+    try:
+        for printer in scanner.scan(iter_addresses(ranges, args.exclude)):
+            found.append(printer)
+            print(f"   ✅ {describe_printer(printer, not args.no_confirm)}")
+    except KeyboardInterrupt:
+        print("\n⚠ Поиск прерван пользователем")
+
+    stats = scanner.stats
+    print(f"\n📊 Проверено адресов: {stats['scanned']} за {time.monotonic() - started:.1f} с, "
+          f"открыт порт: {stats['open']}, подтверждено PJL: {stats['confirmed']}")
+    if not found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Одновременный запуск всех способов поиска принтеров
+Поиск через CUPS, lsusb, sysfs, pyusb и сеть раньше шел по очереди, и время
+поиска складывалось из таймаутов всех способов. Здесь каждый способ (проба)
+запускается сразу: внешние команды - как подпроцессы asyncio, блокирующие
+функции (pyusb, IPP, сканирование сети) - в потоках. Результаты объединяются
+по мере поступления, повторы (одно устройство из lsusb и sysfs) склеиваются.
+Находки можно получать потоком (stream()/iter_printers()) и остановить поиск,
+как только найден нужный принтер.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import re
+import signal
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+# Итог пробы
+PROBE_OK = "ok"
+PROBE_FAILED = "failed"
+PROBE_TIMEOUT = "timeout"
+PROBE_CANCELLED = "cancelled"
+
+HP_VENDOR_ID = "03f0"
+
+# Каталог USB устройств в sysfs
+SYSFS_USB_DEVICES = "/sys/bus/usb/devices"
+
+# Ключ склейки одинаковых находок (в словарь принтера не попадает)
+KEY_FIELD = "_key"
+
+_LSUSB_LINE = re.compile(r"Bus\s+(\d+)\s+Device\s+(\d+):\s+ID\s+([0-9a-fA-F]{4}):([0-9a-fA-F]{4})")
+
+
+def usb_key(bus, device) -> str:
+    """Ключ USB устройства, одинаковый для lsusb и sysfs"""
+    return f"usb:{int(bus):03d}:{int(device):03d}"
+
+
+class Probe:
+    """Один способ поиска: внешняя команда или блокирующая функция"""
+
+    __slots__ = ("name", "timeout", "command", "parse", "function")
+
+    def __init__(self, name: str, timeout: float, command: Optional[List[str]] = None,
+                 parse: Optional[Callable[[str], List[Dict[str, str]]]] = None,
+                 function: Optional[Callable[[], List[Dict[str, str]]]] = None):
+        """
+        Args:
+            name: Имя пробы (для отчета)
+            timeout: Таймаут пробы в секундах
+            command: Внешняя команда (запускается подпроцессом asyncio)
+            parse: parse(stdout) -> список принтеров для command
+            function: function() -> список принтеров (выполняется в потоке)
+        """
+        self.name = name
+        self.timeout = timeout
+        self.command = command
+        self.parse = parse
+        self.function = function
+
+
+def command_probe(name: str, command: List[str], parse: Callable[[str], List[Dict[str, str]]],
+                  timeout: float = 10) -> Probe:
+    """Проба, запускающая внешнюю команду"""
+    return Probe(name, timeout, command=command, parse=parse)
+
+
+def call_probe(name: str, function: Callable[[], List[Dict[str, str]]], timeout: float = 10) -> Probe:
+    """Проба, вызывающая блокирующую функцию в потоке"""
+    return Probe(name, timeout, function=function)
+
+
+def lsusb_probe(match: Callable[[str], bool], fields: Optional[Dict[str, str]] = None,
+                timeout: float = 10) -> Probe:
+    """
+    Поиск USB принтеров через lsusb
+
+    Args:
+        match: match(строка lsusb в нижнем регистре) -> подходит ли устройство
+        fields: Дополнительные поля каждой находки (например, {'model': 'M425 MFP'})
+        timeout: Таймаут в секундах
+    """
+    def parse(output: str) -> List[Dict[str, str]]:
+        printers = []
+        for line in output.split('\n'):
+            if not match(line.lower()):
+                continue
+            printer = {'name': line.strip(), 'port': 'USB', 'type': 'USB'}
+            printer.update(fields or {})
+            found = _LSUSB_LINE.search(line)
+            if found:
+                printer[KEY_FIELD] = usb_key(found.group(1), found.group(2))
+            printers.append(printer)
+        return printers
+
+    return command_probe("lsusb", ['lsusb'], parse, timeout)
+
+
+def _read_sysfs(path: str, name: str) -> str:
+    try:
+        with open(os.path.join(path, name), 'r', encoding='utf-8', errors='replace') as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def sysfs_usb_printers(match: Callable[[str], bool], fields: Optional[Dict[str, str]] = None,
+                       root: str = SYSFS_USB_DEVICES) -> List[Dict[str, str]]:
+    """
+    Поиск USB устройств HP через sysfs (без запуска lsusb)
+
+    Args:
+        match: match(строка в формате lsusb в нижнем регистре) -> подходит ли устройство
+        fields: Дополнительные поля каждой находки
+        root: Каталог USB устройств
+
+    Returns:
+        Список принтеров в том же формате, что и у lsusb_probe
+    """
+    printers = []
+    try:
+        entries = sorted(os.listdir(root))
+    except OSError:
+        return printers
+
+    for entry in entries:
+        path = os.path.join(root, entry)
+        if _read_sysfs(path, "idVendor").lower() != HP_VENDOR_ID:
+            continue
+        bus, device = _read_sysfs(path, "busnum"), _read_sysfs(path, "devnum")
+        if not bus.isdigit() or not device.isdigit():
+            continue
+        product = _read_sysfs(path, "product") or "HP USB device"
+        manufacturer = _read_sysfs(path, "manufacturer") or "Hewlett-Packard"
+        line = (f"Bus {int(bus):03d} Device {int(device):03d}: ID {HP_VENDOR_ID}:"
+                f"{_read_sysfs(path, 'idProduct')} Hewlett-Packard {manufacturer} {product}")
+        if not match(line.lower()):
+            continue
+        printer = {'name': product, 'port': 'USB', 'type': 'USB', KEY_FIELD: usb_key(bus, device)}
+        serial = _read_sysfs(path, "serial")
+        if serial:
+            printer['serial'] = serial
+        printer.update(fields or {})
+        printers.append(printer)
+    return printers
+
+
+def sysfs_probe(match: Callable[[str], bool], fields: Optional[Dict[str, str]] = None,
+                timeout: float = 5) -> Probe:
+    """Проба sysfs_usb_printers (чтение файлов выполняется в потоке)"""
+    return call_probe("sysfs", lambda: sysfs_usb_printers(match, fields), timeout)
+
+
+def printer_matches(printer: Dict[str, str], model: Optional[str] = None,
+                    serial: Optional[str] = None, saved: Optional[Dict[str, str]] = None) -> bool:
+    """
+    Подходит ли принтер под условия выбора
+
+    Args:
+        printer: Найденный принтер
+        model: Часть названия модели (без учета регистра)
+        serial: Серийный номер
+        saved: Ранее выбранный принтер (selected_printer из конфигурации)
+
+    Returns:
+        True если выполнены все заданные условия
+    """
+    text = " ".join(str(printer.get(field, "")) for field in ("name", "model", "driver")).lower()
+    if serial and serial.lower() != str(printer.get('serial', '')).lower() and serial.lower() not in text:
+        return False
+    if model and model.lower() not in text:
+        return False
+    if saved and (printer.get('name'), printer.get('port')) != (saved.get('name'), saved.get('port')):
+        return False
+    return True
+
+
+def select_printer(printers: Iterable[Dict[str, str]], model: Optional[str] = None,
+                   serial: Optional[str] = None, saved: Optional[Dict[str, str]] = None
+                   ) -> Optional[Dict[str, str]]:
+    """
+    Выбирает принтер из потока находок с ранним выходом
+
+    Перебор останавливается на первом подходящем принтере (оставшиеся пробы
+    отменяются). Без условий подходит первый найденный. Сохраненный принтер -
+    мягкое условие: если он не найден, выбирается первый найденный; модель и
+    серийный номер - строгие.
+
+    Args:
+        printers: Итератор находок (например, DiscoveryOrchestrator.iter_printers())
+        model: Часть названия модели
+        serial: Серийный номер
+        saved: Ранее выбранный принтер
+
+    Returns:
+        Выбранный принтер или None
+    """
+    first = None
+    iterator = iter(printers)
+    try:
+        for printer in iterator:
+            if first is None:
+                first = printer
+            if printer_matches(printer, model, serial, saved):
+                return printer
+    finally:
+        # Закрываем генератор сразу, не дожидаясь сборщика мусора
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+    return None if model or serial else first
+
+
+class DiscoveryOrchestrator:
+    """Запускает пробы одновременно и объединяет их результаты"""
+
+    def __init__(self, probes: List[Probe], key: Optional[Callable[[Dict[str, str]], str]] = None,
+                 verbose: bool = True):
+        """
+        Инициализация
+
+        Args:
+            probes: Способы поиска
+            key: key(принтер) -> ключ склейки повторов
+                 (по умолчанию поле _key пробы, иначе все поля принтера)
+            verbose: Выводить итог каждой пробы
+        """
+        self.probes = probes
+        self.key = key
+        self.verbose = verbose
+        self.report = []  # type: List[Dict[str, object]]
+        self._merged = {}  # type: Dict[str, Dict[str, str]]
+
+    def _key(self, printer: Dict[str, str]) -> str:
+        if self.key:
+            return self.key(printer)
+        if printer.get(KEY_FIELD):
+            return printer[KEY_FIELD]
+        return "|".join(f"{field}={value}" for field, value in sorted(printer.items()))
+
+    async def _run_command(self, probe: Probe) -> List[Dict[str, str]]:
+        # Своя группа процессов: при отмене завершаются и дочерние процессы команды,
+        # иначе они держат канал вывода открытым
+        process = await asyncio.create_subprocess_exec(
+            *probe.command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=os.name == "posix")
+        try:
+            stdout, _ = await process.communicate()
+        except asyncio.CancelledError:
+            # Таймаут пробы или ранний выход: подпроцесс не должен пережить поиск
+            if process.returncode is None:
+                try:
+                    if os.name == "posix":
+                        os.killpg(process.pid, signal.SIGKILL)
+                    else:
+                        process.kill()
+                except OSError:
+                    pass
+                await process.wait()
+            raise
+        if process.returncode != 0:
+            return []
+        return probe.parse(stdout.decode('utf-8', errors='replace'))
+
+    async def _run_probe(self, probe: Probe, executor: concurrent.futures.Executor):
+        started = time.monotonic()
+        printers = []  # type: List[Dict[str, str]]
+        error = ""
+        try:
+            if probe.command:
+                work = self._run_command(probe)
+            else:
+                work = asyncio.get_event_loop().run_in_executor(executor, probe.function)
+            printers = await asyncio.wait_for(work, probe.timeout) or []
+            status = PROBE_OK
+        except asyncio.CancelledError:
+            # Перебор остановлен раньше (нужный принтер уже найден)
+            self._record(probe, PROBE_CANCELLED, 0, started)
+            raise
+        except asyncio.TimeoutError:
+            status = PROBE_TIMEOUT
+        except Exception as e:
+            status, error = PROBE_FAILED, str(e)
+        self._record(probe, status, len(printers), started, error)
+        return printers
+
+    def _record(self, probe: Probe, status: str, found: int, started: float, error: str = ""):
+        self.report.append({"probe": probe.name, "status": status, "found": found,
+                            "elapsed": time.monotonic() - started, "error": error})
+
+    async def stream(self) -> AsyncIterator[Dict[str, str]]:
+        """
+        Асинхронный перебор: принтеры выдаются по мере находки, без повторов
+
+        Если перебор остановлен раньше (break), незавершенные пробы отменяются,
+        а их подпроцессы завершаются.
+
+        Yields:
+            Словарь нового принтера
+        """
+        self.report = []
+        self._merged = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(self.probes)),
+                                                         thread_name_prefix="discovery")
+        tasks = [asyncio.ensure_future(self._run_probe(probe, executor)) for probe in self.probes]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for printer in await finished:
+                    key = self._key(printer)
+                    if key in self._merged:
+                        # Повтор: дополняем недостающие поля
+                        for field, value in printer.items():
+                            self._merged[key].setdefault(field, value)
+                        continue
+                    self._merged[key] = printer
+                    yield self._public(printer)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Зависший поток (pyusb, сеть) не должен задерживать возврат
+            executor.shutdown(wait=False)
+            if self.verbose:
+                self.print_report()
+
+    def iter_printers(self) -> Iterator[Dict[str, str]]:
+        """
+        Синхронный перебор поверх stream() в собственном цикле asyncio
+
+        Yields:
+            Словарь нового принтера
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        printers = self.stream()
+        try:
+            while True:
+                try:
+                    printer = loop.run_until_complete(printers.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield printer
+        finally:
+            loop.run_until_complete(printers.aclose())
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def results(self) -> List[Dict[str, str]]:
+        """Найденные принтеры (после перебора, повторы объединены)"""
+        return [self._public(printer) for printer in self._merged.values()]
+
+    async def discover_async(self, on_found: Optional[Callable[[Dict[str, str]], None]] = None
+                             ) -> List[Dict[str, str]]:
+        """
+        Запускает все пробы и собирает принтеры по мере поступления
+
+        Args:
+            on_found: Вызывается для каждого нового принтера сразу после его находки
+
+        Returns:
+            Список принтеров без повторов (в порядке находки)
+        """
+        async for printer in self.stream():
+            if on_found:
+                on_found(printer)
+        return self.results()
+
+    def discover(self, on_found: Optional[Callable[[Dict[str, str]], None]] = None
+                 ) -> List[Dict[str, str]]:
+        """Синхронный вариант discover_async()"""
+        for printer in self.iter_printers():
+            if on_found:
+                on_found(printer)
+        return self.results()
+
+    @staticmethod
+    def _public(printer: Dict[str, str]) -> Dict[str, str]:
+        return {field: value for field, value in printer.items() if field != KEY_FIELD}
+
+    def print_report(self):
+        """Выводит итог каждой пробы"""
+        icons = {PROBE_OK: "✓", PROBE_FAILED: "⚠️ ", PROBE_TIMEOUT: "⏱️ ", PROBE_CANCELLED: "⏭️ "}
+        for entry in self.report:
+            detail = f": {entry['error']}" if entry["error"] else ""
+            print(f"   {icons[entry['status']]} {entry['probe']}: найдено {entry['found']} "
+                  f"({entry['elapsed']:.1f} с){detail}")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш результатов поиска принтеров (имена, порты, драйверы, устройства)
+Поиск через lpstat/WMI/lsusb занимает секунды, поэтому его результаты хранятся
+в памяти и на диске. Запись устаревает по времени жизни или раньше - если
+изменились /dev/usb (подключено/отключено USB устройство) или printers.conf
+CUPS (добавлена/удалена очередь).
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+# Пути, изменение которых означает, что список принтеров мог измениться
+WATCH_PATHS = ("/dev/usb", "/etc/cups/printers.conf")
+
+# Время жизни записи по умолчанию (секунды)
+DEFAULT_TTL = 300
+
+# Ключи записей
+KEY_HP_PRINTERS = "printers:hp"
+KEY_M425_PRINTERS = "printers:m425"
+KEY_CUPS_QUEUES = "cups:queues"
+KEY_USB_PORTS = "usb:ports"
+
+
+def change_stamp(paths=WATCH_PATHS) -> Dict[str, Optional[float]]:
+    """
+    Время изменения отслеживаемых путей
+
+    Args:
+        paths: Пути к файлам/каталогам
+
+    Returns:
+        Словарь {путь: mtime или None, если пути нет}
+    """
+    stamp = {}  # type: Dict[str, Optional[float]]
+    for path in paths:
+        try:
+            stamp[path] = os.stat(path).st_mtime
+        except OSError:
+            stamp[path] = None
+    return stamp
+
+
+class EnumerationCache:
+    """Кэш результатов поиска с временем жизни и проверкой изменений"""
+
+    def __init__(self, cache_file: str = "printer_enumeration.json", ttl: float = DEFAULT_TTL,
+                 watch_paths=WATCH_PATHS):
+        """
+        Инициализация кэша
+
+        Args:
+            cache_file: Путь к JSON файлу кэша (None - только в памяти)
+            ttl: Время жизни записи в секундах
+            watch_paths: Пути, при изменении которых записи сбрасываются
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.watch_paths = tuple(watch_paths)
+        self.entries = self._load()
+        self._stamp = None  # type: Optional[Dict[str, Optional[float]]]
+
+    def _load(self) -> dict:
+        """Загружает записи из файла"""
+        try:
+            if self.cache_file and os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def save(self):
+        """Сохраняет записи (через временный файл)"""
+        if not self.cache_file:
+            return
+        temp_file = self.cache_file + ".tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print(f"⚠️  Ошибка сохранения кэша поиска принтеров: {e}")
+
+    def _current_stamp(self) -> Dict[str, Optional[float]]:
+        # stat() дешевый, но в пределах одного вызова get/put достаточно одного
+        if self._stamp is None:
+            self._stamp = change_stamp(self.watch_paths)
+        return self._stamp
+
+    def get(self, key: str):
+        """
+        Возвращает запись, если она свежая и полная
+
+        Args:
+            key: Ключ записи (KEY_HP_PRINTERS, KEY_CUPS_QUEUES, ...)
+
+        Returns:
+            Сохраненное значение или None
+        """
+        value, partial = self.lookup(key)
+        return None if partial else value
+
+    def lookup(self, key: str):
+        """
+        Возвращает свежую запись и признак неполноты
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Кортеж (значение или None, True если перебор был остановлен раньше)
+        """
+        self._stamp = None
+        entry = self.entries.get(key)
+        if not entry:
+            return None, False
+        if time.time() - entry.get("stored", 0) > self.ttl:
+            return None, False
+        if entry.get("stamp") != self._current_stamp():
+            return None, False
+        return entry.get("value"), bool(entry.get("partial"))
+
+    def put(self, key: str, value, partial: bool = False):
+        """
+        Сохраняет запись в памяти и на диске
+
+        Args:
+            key: Ключ записи
+            value: Значение (должно сериализоваться в JSON)
+            partial: Перебор остановлен раньше - в списке могут быть не все находки
+        """
+        self._stamp = None
+        self.entries[key] = {"value": value, "stored": time.time(), "stamp": self._current_stamp()}
+        if partial:
+            self.entries[key]["partial"] = True
+        self.save()
+
+    def get_or_load(self, key: str, loader: Callable[[], List], label: str = ""):
+        """
+        Возвращает запись или выполняет поиск и сохраняет результат
+
+        Пустой результат не сохраняется: принтер могли еще не подключить.
+
+        Args:
+            key: Ключ записи
+            loader: Функция поиска
+            label: Что ищется (для сообщения об использовании кэша)
+
+        Returns:
+            Результат поиска
+        """
+        value = self.get(key)
+        if value is not None:
+            if label:
+                print(f"💾 {label}: из кэша ({len(value)}), обновить - --refresh")
+            return value
+        value = loader()
+        if value:
+            self.put(key, value)
+        return value
+
+    def iter_or_load(self, key: str, loader: Callable[[], Iterable], label: str = "") -> Iterator:
+        """
+        Как get_or_load(), но выдает находки по мере поиска
+
+        Если перебор остановлен раньше (принтер уже выбран), найденное
+        сохраняется с признаком partial. Такой список выдается из кэша первым;
+        если нужного принтера в нем не оказалось и перебор продолжается,
+        выполняется поиск (уже выданные находки не повторяются).
+
+        Args:
+            key: Ключ записи
+            loader: loader() -> итератор находок
+            label: Что ищется (для сообщения об использовании кэша)
+
+        Yields:
+            Находки из кэша или из поиска
+        """
+        cached, partial = self.lookup(key)
+        if cached is not None:
+            if label:
+                print(f"💾 {label}: из кэша ({len(cached)}{', неполный' if partial else ''}), "
+                      f"обновить - --refresh")
+            yield from cached
+            if not partial:
+                return
+        cached = list(cached or [])
+        found, complete = [], False
+        try:
+            for item in loader():
+                found.append(item)
+                if item not in cached:
+                    yield item
+            complete = True
+        finally:
+            if complete:
+                if found:
+                    self.put(key, found)
+            else:
+                merged = cached + [item for item in found if item not in cached]
+                if merged:
+                    self.put(key, merged, partial=True)
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        Сбрасывает запись (или весь кэш)
+
+        Args:
+            key: Ключ записи (None - все записи)
+        """
+        if key is None:
+            self.entries = {}
+        else:
+            self.entries.pop(key, None)
+        self.save()
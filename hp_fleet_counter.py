@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HP LaserJet Pro 400 Scanner Counter Control (Опрос парка принтеров)
+Одновременно читает счетчики сканера со списка IP адресов и CIDR диапазонов
+и выводит результаты потоком в формате NDJSON или CSV по мере поступления
+"""
+
+import argparse
+import asyncio
+import csv
+import errno
+import ipaddress
+import json
+import socket
+import sys
+import time
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, TextIO
+
+from hp_capability_cache import parse_identity_value
+from hp_discovery import iter_addresses
+from hp_pjl_protocol import SCAN_COUNTER_QUERIES, extract_counter_value
+from hp_scanner_counter_async import AsyncHPPrinterPJL
+from hp_snmp import SNMP_VERSIONS, SNMPPoller, pick_scan_counter
+
+
+# Классы результата опроса устройства
+STATUS_OK = "ok"                     # Счетчик прочитан
+STATUS_TIMEOUT = "timeout"           # Истек таймаут операции или общий лимит на устройство
+STATUS_REFUSED = "refused"           # Порт закрыт (соединение отклонено)
+STATUS_UNREACHABLE = "unreachable"   # Нет маршрута до узла / узел недоступен
+STATUS_UNRESOLVED = "unresolved"     # Не удалось разрешить имя узла
+STATUS_CLOSED = "closed"             # Принтер закрыл или сбросил соединение во время обмена
+STATUS_NO_COUNTER = "no_counter"     # Принтер ответил, но счетчик сканера не найден
+STATUS_ERROR = "error"               # Прочие ошибки
+
+UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH,
+                      getattr(errno, "EHOSTDOWN", errno.EHOSTUNREACH)}
+
+# Поля записи результата (порядок колонок CSV)
+RESULT_FIELDS = ["ip", "port", "status", "counter", "model", "elapsed_ms", "error", "timestamp"]
+
+# Команда идентификации отправляется в том же задании, что и запросы счетчика
+MODEL_COMMAND = "@PJL INFO ID"
+
+
+def classify_error(error: Optional[BaseException]) -> str:
+    """
+    Определяет класс ошибки опроса устройства
+
+    Args:
+        error: Исключение подключения/обмена (или None)
+
+    Returns:
+        Один из статусов STATUS_*
+    """
+    if error is None:
+        return STATUS_ERROR
+    if isinstance(error, (asyncio.TimeoutError, socket.timeout)):
+        return STATUS_TIMEOUT
+    if isinstance(error, ConnectionRefusedError):
+        return STATUS_REFUSED
+    if isinstance(error, socket.gaierror):
+        return STATUS_UNRESOLVED
+    if isinstance(error, ConnectionError):
+        return STATUS_CLOSED
+    if isinstance(error, OSError) and error.errno in UNREACHABLE_ERRNOS:
+        return STATUS_UNREACHABLE
+    return STATUS_ERROR
+
+
+def expand_targets(specs: Iterable[str]) -> Iterator[str]:
+    """
+    Разворачивает список адресов и CIDR диапазонов в отдельные адреса
+
+    Диапазоны объединяются и перебираются hp_discovery.iter_addresses без
+    хранения выданных адресов; повторы отбрасываются только среди отдельных
+    адресов и имен (их столько же, сколько строк во входном списке). Строки,
+    не являющиеся IP адресом или сетью, считаются именами узлов.
+
+    Args:
+        specs: IP адреса, сети (192.168.1.0/24) или имена узлов
+
+    Returns:
+        Генератор адресов (диапазоны не разворачиваются целиком в память)
+    """
+    ranges = []
+    literals = []
+    for spec in specs:
+        spec = spec.strip()
+        if not spec:
+            continue
+        if "/" in spec:
+            try:
+                ranges.append(ipaddress.ip_network(spec, strict=False))
+            except ValueError:
+                print(f"⚠️  Пропущен некорректный диапазон: {spec}", file=sys.stderr)
+        else:
+            literals.append(spec)
+
+    seen = set()
+    covered = []  # Адреса внутри диапазонов: iter_addresses выдаст их один раз, даже на границе сети
+    for spec in literals:
+        if spec in seen:
+            continue
+        seen.add(spec)
+        try:
+            address = ipaddress.ip_address(spec)
+        except ValueError:
+            address = None
+        if address is not None and any(address in network for network in ranges):
+            covered.append(spec)
+            continue
+        yield spec
+    yield from iter_addresses([str(network) for network in ranges] + covered)
+
+
+def read_target_file(path: str) -> List[str]:
+    """
+    Читает список целей из файла (по одной на строку, # - комментарий)
+
+    Args:
+        path: Путь к файлу или "-" для стандартного ввода
+
+    Returns:
+        Список строк с адресами/диапазонами
+    """
+    handle = sys.stdin if path == "-" else open(path, 'r', encoding='utf-8')
+    try:
+        specs = []
+        for line in handle:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                specs.extend(line.replace(",", " ").split())
+        return specs
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+class ResultWriter:
+    """Потоковая запись результатов в NDJSON или CSV"""
+
+    def __init__(self, stream: TextIO, output_format: str = "ndjson"):
+        """
+        Инициализация
+
+        Args:
+            stream: Поток вывода
+            output_format: "ndjson" или "csv"
+        """
+        self.stream = stream
+        self.output_format = output_format
+        self._csv = None
+        if output_format == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=RESULT_FIELDS, lineterminator="\n")
+            self._csv.writeheader()
+            stream.flush()
+
+    def write(self, record: dict):
+        """Записывает одну запись и сразу сбрасывает буфер"""
+        if self._csv:
+            self._csv.writerow({field: "" if record.get(field) is None else record[field]
+                                for field in RESULT_FIELDS})
+        else:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+async def collect_counter(ip_address: str, port: int, timeout: float) -> dict:
+    """
+    Читает счетчик сканера и модель одного принтера одним PJL заданием
+
+    Args:
+        ip_address: IP адрес принтера
+        port: Порт принтера
+        timeout: Таймаут каждой сетевой операции в секундах
+
+    Returns:
+        Запись результата (без полей elapsed_ms/timestamp)
+    """
+    record = {"ip": ip_address, "port": port, "status": STATUS_ERROR,
+              "counter": None, "model": None, "error": None}
+    printer = AsyncHPPrinterPJL(ip_address, port, timeout, verbose=False)
+    if not await printer.connect():
+        record["status"] = classify_error(printer.last_error)
+        if record["status"] == STATUS_CLOSED:
+            # Сброс во время установки соединения - порт фильтруется с отказом
+            record["status"] = STATUS_REFUSED
+        record["error"] = str(printer.last_error or "") or record["status"]
+        return record
+
+    try:
+        responses = await printer.send_pjl_batch([MODEL_COMMAND] + SCAN_COUNTER_QUERIES)
+    finally:
+        await printer.disconnect()
+
+    if all(response is None for response in responses.values()):
+        record["status"] = classify_error(printer.last_error)
+        record["error"] = str(printer.last_error or "") or record["status"]
+        return record
+
+    record["model"] = parse_identity_value(responses.get(MODEL_COMMAND))
+    for command in SCAN_COUNTER_QUERIES:
+        counter_value = extract_counter_value(responses.get(command))
+        if counter_value is not None:
+            record["status"] = STATUS_OK
+            record["counter"] = counter_value
+            return record
+
+    record["status"] = STATUS_NO_COUNTER
+    record["error"] = "Принтер не вернул значение счетчика сканера"
+    return record
+
+
+async def poll_device(ip_address: str, port: int, timeout: float, deadline: float) -> dict:
+    """
+    Опрашивает устройство с общим ограничением времени
+
+    Args:
+        ip_address: IP адрес принтера
+        port: Порт принтера
+        timeout: Таймаут каждой операции в секундах
+        deadline: Максимальное время на все устройство в секундах
+
+    Returns:
+        Полная запись результата
+    """
+    started = time.monotonic()
+    try:
+        record = await asyncio.wait_for(
+            collect_counter(ip_address, port, min(timeout, deadline)), deadline)
+    except asyncio.TimeoutError:
+        record = {"ip": ip_address, "port": port, "status": STATUS_TIMEOUT, "counter": None,
+                  "model": None, "error": f"Превышен лимит {deadline:g} с на устройство"}
+    except Exception as e:
+        record = {"ip": ip_address, "port": port, "status": classify_error(e), "counter": None,
+                  "model": None, "error": str(e) or type(e).__name__}
+    record["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    record["timestamp"] = datetime.now().isoformat(timespec="seconds")
+    return record
+
+
+async def run_fleet(targets: Iterable[str], writer: ResultWriter, port: int = 9100,
+                    workers: int = 200, timeout: float = 3.0, deadline: float = 5.0) -> dict:
+    """
+    Опрашивает все цели ограниченным числом параллельных обработчиков
+
+    Адреса подаются через ограниченную очередь, поэтому даже большие диапазоны
+    не создают задачи для всех адресов сразу. Результаты записываются
+    по мере готовности.
+
+    Args:
+        targets: Адреса принтеров
+        writer: Куда записывать результаты
+        port: Порт принтеров
+        workers: Число одновременно опрашиваемых устройств
+        timeout: Таймаут каждой операции в секундах
+        deadline: Максимальное время на одно устройство в секундах
+
+    Returns:
+        Словарь {статус: количество устройств}
+    """
+    queue = asyncio.Queue(maxsize=workers * 2)
+    summary = {}
+
+    async def worker():
+        while True:
+            ip_address = await queue.get()
+            try:
+                if ip_address is None:
+                    return
+                record = await poll_device(ip_address, port, timeout, deadline)
+                writer.write(record)
+                summary[record["status"]] = summary.get(record["status"], 0) + 1
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+    try:
+        for ip_address in targets:
+            await queue.put(ip_address)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return summary
+
+
+def run_fleet_snmp(targets: Iterable[str], writer: ResultWriter, poller: SNMPPoller) -> dict:
+    """
+    Опрашивает все цели по SNMP через один UDP сокет
+
+    Args:
+        targets: Адреса принтеров
+        writer: Куда записывать результаты
+        poller: Настроенный SNMPPoller (статистика обхода остается в poller.stats)
+
+    Returns:
+        Словарь {статус: количество устройств}
+    """
+    summary = {}
+    for result in poller.poll(targets):
+        status = result["status"]
+        counter = None
+        if status == "ok":
+            counter = pick_scan_counter(result["counters"])
+            status = STATUS_OK if counter is not None else STATUS_NO_COUNTER
+        elif status == "timeout":
+            status = STATUS_TIMEOUT
+        else:
+            status = STATUS_ERROR
+        record = {"ip": result["ip"], "port": poller.port, "status": status, "counter": counter,
+                  "model": None, "elapsed_ms": result["elapsed_ms"],
+                  "error": result["error"] if status != STATUS_NO_COUNTER
+                  else "Агент не вернул счетчик сканера",
+                  "timestamp": datetime.now().isoformat(timespec="seconds")}
+        writer.write(record)
+        summary[status] = summary.get(status, 0) + 1
+    return summary
+
+
+def main():
+    """Основная функция программы"""
+    parser = argparse.ArgumentParser(
+        description="Опрос счетчиков сканера на парке принтеров HP LaserJet Pro 400",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  python hp_fleet_counter.py 192.168.1.0/24
+  python hp_fleet_counter.py 192.168.1.100 192.168.1.101 10.0.5.0/26 --format csv -o counters.csv
+  python hp_fleet_counter.py --file printers.txt --workers 500 --deadline 3
+  python hp_fleet_counter.py 10.0.0.0/16 --transport snmp --community public
+        """
+    )
+
+    parser.add_argument("targets", nargs="*", help="IP адреса или CIDR диапазоны (192.168.1.0/24)")
+    parser.add_argument("--file", "-f", action="append", default=[],
+                        help="Файл со списком адресов/диапазонов (по одному на строку, '-' - stdin)")
+    parser.add_argument("--transport", choices=["pjl", "snmp"], default="pjl",
+                        help="Протокол опроса: PJL (TCP 9100) или SNMP (UDP 161) (по умолчанию: pjl)")
+    parser.add_argument("--port", type=int, help="Порт подключения (по умолчанию: 9100 для PJL, 161 для SNMP)")
+    parser.add_argument("--workers", type=int, default=200,
+                        help="Число одновременно опрашиваемых устройств (по умолчанию: 200, для SNMP: 2048)")
+    parser.add_argument("--timeout", type=float,
+                        help="Таймаут каждой операции в секундах (по умолчанию: 3, для SNMP: 1)")
+    parser.add_argument("--deadline", type=float, default=5,
+                        help="Максимальное время на одно устройство в секундах (по умолчанию: 5)")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson",
+                        help="Формат вывода результатов (по умолчанию: ndjson)")
+    parser.add_argument("--output", "-o", help="Файл результатов (по умолчанию: стандартный вывод)")
+    parser.add_argument("--community", default="public", help="Строка сообщества SNMP (по умолчанию: public)")
+    parser.add_argument("--snmp-version", choices=sorted(SNMP_VERSIONS), default="2c",
+                        help="Версия SNMP (по умолчанию: 2c)")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Повторы SNMP запроса одному устройству (по умолчанию: 2)")
+
+    args = parser.parse_args()
+
+    specs = list(args.targets)
+    try:
+        for path in args.file:
+            specs.extend(read_target_file(path))
+    except OSError as e:
+        print(f"✗ Ошибка чтения списка адресов: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not specs:
+        parser.error("укажите адреса/диапазоны или --file")
+    snmp = args.transport == "snmp"
+    if args.port is None:
+        args.port = 161 if snmp else 9100
+    if args.timeout is None:
+        args.timeout = 1 if snmp else 3
+    if snmp and args.workers == parser.get_default("workers"):
+        args.workers = 2048
+    if args.workers < 1 or args.deadline <= 0 or args.timeout <= 0:
+        parser.error("--workers, --timeout и --deadline должны быть положительными")
+
+    stream = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    writer = ResultWriter(stream, args.format)
+    started = time.monotonic()
+
+    poller = None
+    try:
+        if snmp:
+            poller = SNMPPoller(args.community, args.snmp_version, port=args.port,
+                                timeout=args.timeout, retries=args.retries,
+                                max_outstanding=args.workers, deadline=args.deadline)
+            summary = run_fleet_snmp(expand_targets(specs), writer, poller)
+        else:
+            summary = asyncio.run(run_fleet(expand_targets(specs), writer, args.port,
+                                            args.workers, args.timeout, args.deadline))
+    except KeyboardInterrupt:
+        print("\n⚠ Опрос прерван пользователем", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    total = sum(summary.values())
+    elapsed = time.monotonic() - started
+    details = ", ".join(f"{status}: {count}" for status, count in sorted(summary.items()))
+    print(f"📊 Опрошено устройств: {total} за {elapsed:.1f} с ({details or 'нет результатов'})",
+          file=sys.stderr)
+    if poller:
+        stats = poller.stats
+        print(f"📡 SNMP: {stats['devices_per_second']} устройств/с, отправлено запросов: "
+              f"{stats['requests_sent']} (повторов: {stats['retransmits']}), "
+              f"ответов: {stats['responses']}, потери: {stats['packet_loss'] * 100:.1f}%",
+              file=sys.stderr)
+
+    if not summary.get(STATUS_OK):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
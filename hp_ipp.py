@@ -0,0 +1,682 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Минимальный клиент IPP/1.1 для локального CUPS
+Заменяет запуск lpstat/lp: запросы CUPS-Get-Printers, Get-Printer-Attributes,
+Get-Jobs и Print-Job отправляются в cupsd через /run/cups/cups.sock или
+localhost:631 по одному постоянному HTTP соединению.
+"""
+
+import getpass
+import http.client
+import os
+import socket
+import struct
+import subprocess
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlsplit
+
+from hp_rtt import communicate_adaptive
+
+
+IPP_VERSION = (1, 1)
+CONTENT_TYPE = "application/ipp"
+DEFAULT_PORT = 631
+SOCKET_PATHS = ("/run/cups/cups.sock", "/var/run/cups/cups.sock")
+
+# Операции
+OP_PRINT_JOB = 0x0002
+OP_GET_JOBS = 0x000A
+OP_GET_PRINTER_ATTRIBUTES = 0x000B
+OP_CUPS_GET_PRINTERS = 0x4002
+
+# Коды состояния
+STATUS_OK = 0x0000
+STATUS_NOT_FOUND = 0x0406
+
+# Теги групп атрибутов
+TAG_OPERATION = 0x01
+TAG_JOB = 0x02
+TAG_END = 0x03
+TAG_PRINTER = 0x04
+TAG_UNSUPPORTED_GROUP = 0x05
+
+# Теги значений
+TAG_UNSUPPORTED = 0x10
+TAG_UNKNOWN = 0x12
+TAG_NO_VALUE = 0x13
+TAG_INTEGER = 0x21
+TAG_BOOLEAN = 0x22
+TAG_ENUM = 0x23
+TAG_OCTET_STRING = 0x30
+TAG_DATETIME = 0x31
+TAG_RESOLUTION = 0x32
+TAG_RANGE = 0x33
+TAG_BEGIN_COLLECTION = 0x34
+TAG_END_COLLECTION = 0x37
+TAG_TEXT = 0x41
+TAG_NAME = 0x42
+TAG_KEYWORD = 0x44
+TAG_URI = 0x45
+TAG_CHARSET = 0x47
+TAG_LANGUAGE = 0x48
+TAG_MIME_TYPE = 0x49
+TAG_MEMBER_NAME = 0x4A
+
+# Формат документа, который CUPS передает принтеру без фильтров (как lp -o raw)
+RAW_DOCUMENT_FORMAT = "application/vnd.cups-raw"
+
+# Состояния принтера (printer-state)
+PRINTER_STATES = {3: "idle", 4: "processing", 5: "stopped"}
+
+# Атрибуты для вывода в стиле lpstat
+PRINTER_ATTRIBUTES = ["printer-name", "printer-state", "printer-state-message", "printer-info",
+                      "printer-make-and-model", "printer-location", "device-uri",
+                      "printer-is-accepting-jobs"]
+JOB_ATTRIBUTES = ["job-id", "job-printer-uri", "job-originating-user-name", "job-k-octets",
+                  "job-impressions-completed", "time-at-completed", "job-state"]
+
+
+class IPPError(Exception):
+    """Ошибка IPP запроса (нет связи с CUPS или код ошибки в ответе)"""
+
+    def __init__(self, message: str, status: Optional[int] = None, sent: bool = False):
+        """
+        Args:
+            message: Текст ошибки
+            status: Код статуса IPP (None - ответа нет)
+            sent: Запрос был полностью отправлен до ошибки (cupsd мог его выполнить)
+        """
+        super().__init__(message)
+        self.status = status
+        self.sent = sent
+
+
+class IPPMessage:
+    """Разобранное сообщение IPP (запрос или ответ)"""
+
+    __slots__ = ("version", "code", "request_id", "groups", "data")
+
+    def __init__(self, version: Tuple[int, int], code: int, request_id: int,
+                 groups: List[Tuple[int, Dict[str, list]]], data: bytes = b""):
+        """
+        Args:
+            version: Версия протокола (major, minor)
+            code: Операция (запрос) или код состояния (ответ)
+            request_id: Номер запроса
+            groups: Группы атрибутов [(тег группы, {имя: [значения]})]
+            data: Данные документа после атрибутов (Print-Job)
+        """
+        self.version = version
+        self.code = code
+        self.request_id = request_id
+        self.groups = groups
+        self.data = data
+
+    def group(self, tag: int) -> Dict[str, list]:
+        """Первая группа с тегом (пустой словарь, если ее нет)"""
+        return next((attributes for group_tag, attributes in self.groups if group_tag == tag), {})
+
+    def all_groups(self, tag: int) -> List[Dict[str, list]]:
+        """Все группы с тегом (например, по одной на принтер или задание)"""
+        return [attributes for group_tag, attributes in self.groups if group_tag == tag]
+
+
+def _encode_value(tag: int, value) -> bytes:
+    if tag in (TAG_INTEGER, TAG_ENUM):
+        return struct.pack(">i", value)
+    if tag == TAG_BOOLEAN:
+        return b"\x01" if value else b"\x00"
+    if tag == TAG_RANGE:
+        return struct.pack(">ii", *value)
+    if tag in (TAG_UNSUPPORTED, TAG_UNKNOWN, TAG_NO_VALUE):
+        return b""
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+def _decode_value(tag: int, raw: bytes):
+    if tag in (TAG_INTEGER, TAG_ENUM) and len(raw) == 4:
+        return struct.unpack(">i", raw)[0]
+    if tag == TAG_BOOLEAN and len(raw) == 1:
+        return raw != b"\x00"
+    if tag == TAG_RANGE and len(raw) == 8:
+        return struct.unpack(">ii", raw)
+    if tag == TAG_RESOLUTION and len(raw) == 9:
+        return struct.unpack(">iib", raw)
+    if tag in (TAG_OCTET_STRING, TAG_DATETIME) or tag < TAG_TEXT:
+        return raw
+    return raw.decode('utf-8', errors='replace')
+
+
+def encode_message(code: int, request_id: int,
+                   groups: Iterable[Tuple[int, Iterable[Tuple[int, str, object]]]],
+                   data: bytes = b"", version: Tuple[int, int] = IPP_VERSION) -> bytes:
+    """
+    Кодирует сообщение IPP
+
+    Args:
+        code: Операция или код состояния
+        request_id: Номер запроса
+        groups: [(тег группы, [(тег значения, имя, значение или список значений)])]
+        data: Данные документа
+        version: Версия протокола
+
+    Returns:
+        Тело HTTP запроса/ответа
+    """
+    parts = [struct.pack(">bbHi", version[0], version[1], code, request_id)]
+    for group_tag, attributes in groups:
+        parts.append(bytes([group_tag]))
+        for tag, name, value in attributes:
+            values = value if isinstance(value, (list, tuple)) and tag != TAG_RANGE else [value]
+            for index, item in enumerate(values):
+                # Дополнительные значения атрибута идут с пустым именем
+                encoded_name = name.encode('utf-8') if index == 0 else b""
+                encoded = _encode_value(tag, item)
+                parts.append(struct.pack(">BH", tag, len(encoded_name)) + encoded_name +
+                             struct.pack(">H", len(encoded)) + encoded)
+    parts.append(bytes([TAG_END]))
+    parts.append(data)
+    return b"".join(parts)
+
+
+def decode_message(payload: bytes) -> IPPMessage:
+    """
+    Разбирает сообщение IPP
+
+    Коллекции (begCollection ... endCollection) пропускаются: значение
+    такого атрибута - пустой словарь.
+
+    Args:
+        payload: Тело HTTP запроса/ответа
+
+    Returns:
+        Разобранное сообщение
+
+    Raises:
+        IPPError: сообщение обрезано или повреждено
+    """
+    if len(payload) < 9:
+        raise IPPError("Слишком короткое сообщение IPP")
+    major, minor, code, request_id = struct.unpack(">bbHi", payload[:8])
+    groups = []  # type: List[Tuple[int, Dict[str, list]]]
+    attributes = None  # type: Optional[Dict[str, list]]
+    name = None
+    depth = 0
+    position = 8
+    try:
+        while True:
+            tag = payload[position]
+            position += 1
+            if tag == TAG_END:
+                break
+            if tag < 0x10:
+                attributes = {}
+                groups.append((tag, attributes))
+                continue
+            name_length = struct.unpack(">H", payload[position:position + 2])[0]
+            position += 2
+            next_name = payload[position:position + name_length].decode('utf-8', errors='replace')
+            position += name_length
+            value_length = struct.unpack(">H", payload[position:position + 2])[0]
+            position += 2
+            raw = payload[position:position + value_length]
+            if len(raw) != value_length:
+                raise IPPError("Обрезанное значение атрибута IPP")
+            position += value_length
+            if attributes is None:
+                raise IPPError("Атрибут IPP вне группы")
+            if depth:
+                # Члены коллекции не разбираются
+                if tag == TAG_BEGIN_COLLECTION:
+                    depth += 1
+                elif tag == TAG_END_COLLECTION:
+                    depth -= 1
+                continue
+            if next_name:
+                name = next_name
+                attributes[name] = []
+            if name is None:
+                raise IPPError("Дополнительное значение IPP без имени атрибута")
+            if tag == TAG_BEGIN_COLLECTION:
+                depth = 1
+                attributes[name].append({})
+            else:
+                attributes[name].append(_decode_value(tag, raw))
+    except (IndexError, struct.error):
+        raise IPPError("Обрезанное сообщение IPP")
+    return IPPMessage((major, minor), code, request_id, groups, payload[position:])
+
+
+def first(attributes: Dict[str, list], name: str, default=None):
+    """Первое значение атрибута"""
+    values = attributes.get(name)
+    return values[0] if values else default
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP соединение через локальный сокет cupsd"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def default_server() -> str:
+    """
+    Адрес cupsd: переменная CUPS_SERVER (host[:port] или путь к сокету),
+    затем локальный сокет, затем localhost:631
+    """
+    server = os.environ.get("CUPS_SERVER")
+    if server:
+        return server
+    for path in SOCKET_PATHS:
+        if os.path.exists(path):
+            return path
+    return f"localhost:{DEFAULT_PORT}"
+
+
+class IPPClient:
+    """Клиент IPP/1.1 к cupsd с одним постоянным соединением"""
+
+    def __init__(self, server: Optional[str] = None, timeout: float = 10.0,
+                 user: Optional[str] = None):
+        """
+        Инициализация клиента (соединение открывается при первом запросе)
+
+        Args:
+            server: host[:port] или путь к сокету (по умолчанию - default_server())
+            timeout: Таймаут запроса в секундах
+            user: Имя пользователя для заданий (по умолчанию - текущий)
+        """
+        self.server = server or default_server()
+        self.timeout = timeout
+        self.user = user
+        self._connection = None  # type: Optional[http.client.HTTPConnection]
+        self._request_id = 0
+        host, separator, port = self.server.rpartition(":")
+        if not separator or not port.isdigit():
+            host, port = self.server, str(DEFAULT_PORT)
+        self.host = "localhost" if self.server.startswith("/") else host
+        self.port = int(port)
+
+    def _user(self) -> str:
+        if self.user is None:
+            try:
+                self.user = getpass.getuser()
+            except Exception:
+                self.user = "anonymous"
+        return self.user
+
+    def _connect(self, timeout: float) -> http.client.HTTPConnection:
+        if self._connection is None:
+            if self.server.startswith("/"):
+                self._connection = _UnixHTTPConnection(self.server, timeout)
+            else:
+                self._connection = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        self._connection.timeout = timeout
+        if self._connection.sock is None:
+            self._connection.connect()
+            if self._connection.sock.family != socket.AF_UNIX:
+                # Запрос уходит одним send(), ответ не должен ждать задержанного ACK
+                self._connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self._connection.sock.settimeout(timeout)
+        return self._connection
+
+    def close(self):
+        """Закрывает соединение"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def printer_uri(self, printer: str) -> str:
+        """URI очереди CUPS"""
+        return f"ipp://localhost/printers/{quote(printer, safe='')}"
+
+    def _operation_attributes(self, printer: Optional[str] = None) -> List[Tuple[int, str, object]]:
+        attributes = [
+            (TAG_CHARSET, "attributes-charset", "utf-8"),
+            (TAG_LANGUAGE, "attributes-natural-language", "en"),
+        ]  # type: List[Tuple[int, str, object]]
+        if printer:
+            attributes.append((TAG_URI, "printer-uri", self.printer_uri(printer)))
+        attributes.append((TAG_NAME, "requesting-user-name", self._user()))
+        return attributes
+
+    def request(self, operation: int, attributes: List[Tuple[int, str, object]],
+                path: str = "/", data: bytes = b"", timeout: Optional[float] = None,
+                retry: bool = True, not_found_ok: bool = False) -> IPPMessage:
+        """
+        Отправляет запрос IPP и возвращает ответ
+
+        Args:
+            operation: Код операции
+            attributes: Атрибуты группы operation
+            path: Путь HTTP (/, /printers/<имя>, /jobs)
+            data: Документ (для Print-Job)
+            timeout: Таймаут запроса (по умолчанию - self.timeout)
+            retry: Повторить запрос один раз, если постоянное соединение было закрыто сервером
+            not_found_ok: Статус not-found означает пустой результат, а не ошибку
+
+        Returns:
+            Ответ
+
+        Raises:
+            IPPError: нет связи с cupsd или код ошибки в ответе
+        """
+        self._request_id += 1
+        body = encode_message(operation, self._request_id, [(TAG_OPERATION, attributes)], data)
+        headers = {"Content-Type": CONTENT_TYPE}
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(2 if retry else 1):
+            sent = False
+            try:
+                connection = self._connect(timeout)
+                connection.request("POST", path, body, headers)
+                sent = True
+                response = connection.getresponse()
+                payload = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if attempt == 0 and retry and isinstance(e, (http.client.RemoteDisconnected,
+                                                             ConnectionResetError, BrokenPipeError)):
+                    continue
+                raise IPPError(f"Нет связи с CUPS ({self.server}): {e}", sent=sent)
+            if response.will_close:
+                self.close()
+            if response.status != 200:
+                raise IPPError(f"CUPS ответил HTTP {response.status} {response.reason}", sent=True)
+            message = decode_message(payload)
+            if message.code >= 0x0100 and not (not_found_ok and message.code == STATUS_NOT_FOUND):
+                status_message = first(message.group(TAG_OPERATION), "status-message", "")
+                raise IPPError(f"Ошибка IPP 0x{message.code:04x} {status_message}".rstrip(),
+                               message.code, sent=True)
+            return message
+        raise IPPError(f"Нет связи с CUPS ({self.server})")
+
+    def get_printers(self, attributes: Optional[List[str]] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, list]]:
+        """
+        CUPS-Get-Printers: все очереди CUPS
+
+        Args:
+            attributes: Запрашиваемые атрибуты (по умолчанию PRINTER_ATTRIBUTES)
+            timeout: Таймаут запроса
+
+        Returns:
+            Список атрибутов принтеров
+        """
+        request = self._operation_attributes()
+        request.append((TAG_KEYWORD, "requested-attributes", attributes or PRINTER_ATTRIBUTES))
+        response = self.request(OP_CUPS_GET_PRINTERS, request, timeout=timeout, not_found_ok=True)
+        return response.all_groups(TAG_PRINTER)
+
+    def get_printer_attributes(self, printer: str, attributes: Optional[List[str]] = None,
+                               timeout: Optional[float] = None) -> Dict[str, list]:
+        """
+        Get-Printer-Attributes: атрибуты одной очереди
+
+        Args:
+            printer: Имя очереди CUPS
+            attributes: Запрашиваемые атрибуты (по умолчанию PRINTER_ATTRIBUTES)
+            timeout: Таймаут запроса
+
+        Returns:
+            Атрибуты принтера
+
+        Raises:
+            IPPError: очереди нет (статус 0x0406) или нет связи с cupsd
+        """
+        request = self._operation_attributes(printer)
+        request.append((TAG_KEYWORD, "requested-attributes", attributes or PRINTER_ATTRIBUTES))
+        response = self.request(OP_GET_PRINTER_ATTRIBUTES, request,
+                                f"/printers/{quote(printer, safe='')}", timeout=timeout)
+        return response.group(TAG_PRINTER)
+
+    def get_jobs(self, printer: Optional[str] = None, which: str = "completed",
+                 attributes: Optional[List[str]] = None,
+                 timeout: Optional[float] = None) -> List[Dict[str, list]]:
+        """
+        Get-Jobs: задания очереди (или всех очередей)
+
+        Args:
+            printer: Имя очереди (None - все очереди)
+            which: completed или not-completed
+            attributes: Запрашиваемые атрибуты (по умолчанию JOB_ATTRIBUTES)
+            timeout: Таймаут запроса
+
+        Returns:
+            Список атрибутов заданий
+        """
+        request = self._operation_attributes(printer)
+        if not printer:
+            request.insert(2, (TAG_URI, "printer-uri", "ipp://localhost/"))
+        request.append((TAG_KEYWORD, "which-jobs", which))
+        request.append((TAG_KEYWORD, "requested-attributes", attributes or JOB_ATTRIBUTES))
+        response = self.request(OP_GET_JOBS, request, "/jobs", timeout=timeout, not_found_ok=True)
+        return response.all_groups(TAG_JOB)
+
+    def print_job(self, printer: str, data: bytes, job_name: str = "hp_scanner_counter",
+                  document_format: str = RAW_DOCUMENT_FORMAT,
+                  timeout: Optional[float] = None) -> int:
+        """
+        Print-Job: отправляет документ в очередь (по умолчанию без фильтров, как lp -o raw)
+
+        Запрос не повторяется автоматически, чтобы задание не было напечатано дважды.
+
+        Args:
+            printer: Имя очереди CUPS
+            data: Содержимое задания
+            job_name: Имя задания
+            document_format: MIME тип документа
+            timeout: Таймаут запроса
+
+        Returns:
+            Номер задания CUPS
+
+        Raises:
+            IPPError: очереди нет, cupsd отклонил задание или не вернул номер задания
+        """
+        request = self._operation_attributes(printer)
+        request.append((TAG_NAME, "job-name", job_name))
+        request.append((TAG_MIME_TYPE, "document-format", document_format))
+        response = self.request(OP_PRINT_JOB, request, f"/printers/{quote(printer, safe='')}",
+                                data, timeout=timeout, retry=False)
+        job_id = first(response.group(TAG_JOB), "job-id")
+        if not job_id:
+            raise IPPError(f"CUPS не вернул номер задания (статус 0x{response.code:04x})",
+                           response.code, sent=True)
+        return job_id
+
+
+def printer_queue(uri: str) -> str:
+    """Имя очереди из printer-uri / job-printer-uri"""
+    return uri.rstrip("/").rsplit("/", 1)[-1]
+
+
+def device_serial(device_uri: str) -> str:
+    """Серийный номер из device-uri очереди (usb://HP/...?serial=XXXX), иначе пустая строка"""
+    query = parse_qs(urlsplit(device_uri).query)
+    return query.get("serial", [""])[0]
+
+
+def lpstat_printers(printers: List[Dict[str, list]], long: bool = False) -> str:
+    """
+    Вывод в формате `lpstat -p` (`lpstat -l -p` при long=True), чтобы разбор вывода не менялся
+
+    Args:
+        printers: Атрибуты принтеров из get_printers()
+        long: Добавить описание, модель и адрес устройства
+
+    Returns:
+        Текст вывода
+    """
+    lines = []
+    for printer in printers:
+        state = PRINTER_STATES.get(first(printer, "printer-state"), "idle")
+        enabled = "enabled" if first(printer, "printer-is-accepting-jobs", True) else "disabled"
+        lines.append(f"printer {first(printer, 'printer-name', '')} is {state}.  {enabled}")
+        message = first(printer, "printer-state-message")
+        if message:
+            lines.append(f"\t{message}")
+        if long:
+            for label, name in (("Description", "printer-info"), ("Location", "printer-location"),
+                                ("Model", "printer-make-and-model"), ("Connection", "device-uri")):
+                value = first(printer, name)
+                if value:
+                    lines.append(f"\t{label}: {value}")
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+def lpstat_jobs(jobs: List[Dict[str, list]]) -> str:
+    """
+    Вывод в формате `lpstat -W completed`: "<очередь>-<номер> <пользователь> <размер>"
+
+    Args:
+        jobs: Атрибуты заданий из get_jobs()
+
+    Returns:
+        Текст вывода
+    """
+    lines = []
+    for job in jobs:
+        queue = printer_queue(first(job, "job-printer-uri", ""))
+        size = first(job, "job-k-octets", 0) * 1024
+        lines.append(f"{queue}-{first(job, 'job-id', 0)} "
+                     f"{first(job, 'job-originating-user-name', '')} {size}")
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+class CupsCommands:
+    """
+    lpstat / lp для системных скриптов: запросы через IPPClient, а если cupsd
+    недоступен по IPP - запуск команд, как раньше
+    """
+
+    def __init__(self, use_ipp: bool = True, client: Optional[IPPClient] = None,
+                 timeout: float = 10.0):
+        """
+        Args:
+            use_ipp: Использовать IPP (False - всегда запускать lpstat/lp)
+            client: Готовый клиент (по умолчанию создается при первом запросе)
+            timeout: Таймаут запроса IPP по умолчанию
+        """
+        self.use_ipp = use_ipp
+        self.client = client
+        self.timeout = timeout
+
+    def _ipp(self) -> Optional[IPPClient]:
+        if not self.use_ipp:
+            return None
+        if self.client is None:
+            self.client = IPPClient(timeout=self.timeout)
+        return self.client
+
+    def _ipp_unavailable(self, error: IPPError):
+        """Связи с cupsd нет: дальше используются команды"""
+        print(f"   ⚠️  {error}, используются lpstat/lp")
+        self.use_ipp = False
+        self.close()
+
+    def close(self):
+        """Закрывает соединение IPP"""
+        if self.client is not None:
+            self.client.close()
+
+    def lpstat(self, args: List[str], timeout: float) -> Optional[str]:
+        """
+        Вывод lpstat: -p, -l -p или -W completed
+
+        Args:
+            args: Аргументы lpstat
+            timeout: Таймаут в секундах
+
+        Returns:
+            Текст вывода или None при ошибке
+        """
+        client = self._ipp()
+        if client is not None:
+            try:
+                if args == ['-W', 'completed']:
+                    return lpstat_jobs(client.get_jobs(timeout=timeout))
+                if args in (['-p'], ['-l', '-p']):
+                    return lpstat_printers(client.get_printers(timeout=timeout), long='-l' in args)
+            except IPPError as e:
+                if e.status is not None:
+                    return None
+                self._ipp_unavailable(e)
+
+        result = subprocess.run(['lpstat'] + args, capture_output=True, text=True, timeout=timeout)
+        return result.stdout if result.returncode == 0 else None
+
+    def printers(self, timeout: float) -> List[Dict[str, str]]:
+        """
+        Очереди CUPS
+
+        Args:
+            timeout: Таймаут в секундах
+
+        Returns:
+            [{"name": очередь, "model": модель, "device_uri": адрес устройства,
+              "line": строка lpstat -p}]
+        """
+        client = self._ipp()
+        if client is not None:
+            try:
+                return [{"name": first(printer, "printer-name", ""),
+                         "model": first(printer, "printer-make-and-model", ""),
+                         "device_uri": first(printer, "device-uri", ""),
+                         "line": lpstat_printers([printer]).split("\n")[0]}
+                        for printer in client.get_printers(timeout=timeout)]
+            except IPPError as e:
+                if e.status is not None:
+                    return []
+                self._ipp_unavailable(e)
+
+        output = self.lpstat(['-p'], timeout) or ""
+        return [{"name": line.split()[1], "model": "", "device_uri": "", "line": line.strip()}
+                for line in output.split('\n') if line.startswith('printer ') and len(line.split()) > 1]
+
+    def submit_raw(self, printer: str, data: bytes, timeout: float, rtt=None, estimator=None) -> bool:
+        """
+        Отправляет задание без фильтров (Print-Job с application/vnd.cups-raw или lp -o raw)
+
+        Args:
+            printer: Имя очереди CUPS
+            data: Содержимое задания
+            timeout: Таймаут в секундах
+            rtt: Хранилище оценок времени ответа для lp (RTTStore)
+            estimator: Оценка очереди из rtt.estimator()
+
+        Returns:
+            True если задание принято
+        """
+        client = self._ipp()
+        if client is not None:
+            try:
+                client.print_job(printer, data, timeout=timeout)
+                return True
+            except IPPError as e:
+                if e.status is not None or e.sent:
+                    # Задание могло быть принято: повтор через lp напечатал бы его дважды
+                    print(f"   ⚠️  {e}")
+                    return False
+                self._ipp_unavailable(e)
+
+        proc = subprocess.Popen(['lp', '-d', printer, '-o', 'raw'], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        communicate_adaptive(proc, data, timeout, rtt, estimator)
+        return proc.returncode == 0
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Заменитель cupsd для проверки клиента IPP (hp_ipp.py) без CUPS
+Отвечает на CUPS-Get-Printers, Get-Printer-Attributes, Get-Jobs и Print-Job.
+Задания Print-Job можно пересылать в симулятор принтера (hp_printer_simulator.py),
+как это делает очередь CUPS с raw-заданиями.
+"""
+
+import argparse
+import http.server
+import math
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from hp_ipp import (CONTENT_TYPE, OP_CUPS_GET_PRINTERS, OP_GET_JOBS, OP_GET_PRINTER_ATTRIBUTES,
+                    OP_PRINT_JOB, STATUS_NOT_FOUND, STATUS_OK, TAG_BOOLEAN, TAG_CHARSET, TAG_ENUM,
+                    TAG_INTEGER, TAG_JOB, TAG_LANGUAGE, TAG_NAME, TAG_OPERATION, TAG_PRINTER,
+                    TAG_TEXT, TAG_URI, IPPError, decode_message, encode_message, first,
+                    printer_queue)
+
+# Коды состояния для ошибок запроса
+STATUS_BAD_REQUEST = 0x0400
+STATUS_OPERATION_NOT_SUPPORTED = 0x0501
+
+# Состояние завершенного задания (job-state completed)
+JOB_STATE_COMPLETED = 9
+
+
+class IPPStandInServer:
+    """Минимальный IPP сервер с очередями и журналом заданий"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, socket_path: Optional[str] = None):
+        """
+        Инициализация сервера
+
+        Args:
+            host: Адрес для прослушивания (TCP)
+            port: Порт (0 - выбрать свободный)
+            socket_path: Слушать локальный сокет вместо TCP
+        """
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.printers = {}  # type: Dict[str, Dict[str, object]]
+        self.jobs = []  # type: List[Dict[str, object]]
+        self.lock = threading.Lock()
+        self.stats = {"connections": 0, "requests": 0, "jobs": 0}
+        self.server = None
+        self.thread = None
+
+    def add_printer(self, name: str, make_and_model: str, info: str = "",
+                    forward: Optional[Tuple[str, int]] = None):
+        """
+        Добавляет очередь
+
+        Args:
+            name: Имя очереди
+            make_and_model: Модель (printer-make-and-model)
+            info: Описание (printer-info)
+            forward: (адрес, порт) принтера, которому пересылаются задания
+        """
+        device_uri = f"socket://{forward[0]}:{forward[1]}" if forward else "file:///dev/null"
+        self.printers[name] = {"name": name, "make_and_model": make_and_model,
+                               "info": info or make_and_model, "device_uri": device_uri,
+                               "forward": forward}
+
+    # --- Обработка операций -----------------------------------------------
+
+    def _printer_attributes(self, printer: Dict[str, object]) -> List[Tuple[int, str, object]]:
+        return [
+            (TAG_NAME, "printer-name", printer["name"]),
+            (TAG_URI, "printer-uri-supported", f"ipp://localhost/printers/{printer['name']}"),
+            (TAG_ENUM, "printer-state", 3),
+            (TAG_TEXT, "printer-state-message", ""),
+            (TAG_TEXT, "printer-info", printer["info"]),
+            (TAG_TEXT, "printer-make-and-model", printer["make_and_model"]),
+            (TAG_TEXT, "printer-location", ""),
+            (TAG_URI, "device-uri", printer["device_uri"]),
+            (TAG_BOOLEAN, "printer-is-accepting-jobs", True),
+        ]
+
+    def _job_attributes(self, job: Dict[str, object]) -> List[Tuple[int, str, object]]:
+        return [
+            (TAG_INTEGER, "job-id", job["id"]),
+            (TAG_URI, "job-printer-uri", f"ipp://localhost/printers/{job['printer']}"),
+            (TAG_NAME, "job-originating-user-name", job["user"]),
+            (TAG_NAME, "job-name", job["name"]),
+            (TAG_INTEGER, "job-k-octets", job["k_octets"]),
+            (TAG_INTEGER, "time-at-completed", job["completed"]),
+            (TAG_ENUM, "job-state", JOB_STATE_COMPLETED),
+        ]
+
+    @staticmethod
+    def _filter(attributes: List[Tuple[int, str, object]],
+                requested: Optional[List[str]]) -> List[Tuple[int, str, object]]:
+        if not requested or "all" in requested:
+            return attributes
+        return [attribute for attribute in attributes if attribute[1] in requested]
+
+    def _forward(self, address: Tuple[str, int], data: bytes):
+        """Передает задание принтеру (как бэкенд socket:// в CUPS)"""
+        try:
+            with socket.create_connection(address, timeout=5) as sock:
+                sock.sendall(data)
+        except OSError:
+            pass
+
+    def handle_request(self, payload: bytes) -> bytes:
+        """
+        Обрабатывает один запрос IPP
+
+        Args:
+            payload: Тело HTTP запроса
+
+        Returns:
+            Тело HTTP ответа
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+        try:
+            request = decode_message(payload)
+        except IPPError:
+            return encode_message(STATUS_BAD_REQUEST, 0, [])
+
+        operation = request.group(TAG_OPERATION)
+        requested = operation.get("requested-attributes")
+        printer_name = printer_queue(first(operation, "printer-uri", ""))
+        printer = self.printers.get(printer_name)
+        status = STATUS_OK
+        groups = []  # type: List[Tuple[int, List[Tuple[int, str, object]]]]
+
+        if request.code == OP_CUPS_GET_PRINTERS:
+            groups = [(TAG_PRINTER, self._filter(self._printer_attributes(printer), requested))
+                      for printer in self.printers.values()]
+            status = STATUS_OK if groups else STATUS_NOT_FOUND
+        elif request.code == OP_GET_PRINTER_ATTRIBUTES:
+            if printer:
+                groups = [(TAG_PRINTER, self._filter(self._printer_attributes(printer), requested))]
+            else:
+                status = STATUS_NOT_FOUND
+        elif request.code == OP_GET_JOBS:
+            which = first(operation, "which-jobs", "not-completed")
+            with self.lock:
+                jobs = [job for job in self.jobs
+                        if which == "completed" and (not printer or job["printer"] == printer_name)]
+            groups = [(TAG_JOB, self._filter(self._job_attributes(job), requested)) for job in jobs]
+        elif request.code == OP_PRINT_JOB:
+            if not printer:
+                status = STATUS_NOT_FOUND
+            else:
+                if printer["forward"]:
+                    self._forward(printer["forward"], request.data)
+                with self.lock:
+                    self.stats["jobs"] += 1
+                    job = {"id": len(self.jobs) + 1, "printer": printer_name,
+                           "user": first(operation, "requesting-user-name", "anonymous"),
+                           "name": first(operation, "job-name", "untitled"),
+                           "k_octets": math.ceil(len(request.data) / 1024),
+                           "completed": int(time.time())}
+                    self.jobs.append(job)
+                groups = [(TAG_JOB, [(TAG_INTEGER, "job-id", job["id"]),
+                                     (TAG_ENUM, "job-state", JOB_STATE_COMPLETED)])]
+        else:
+            status = STATUS_OPERATION_NOT_SUPPORTED
+
+        operation_group = (TAG_OPERATION, [(TAG_CHARSET, "attributes-charset", "utf-8"),
+                                           (TAG_LANGUAGE, "attributes-natural-language", "en")])
+        return encode_message(status, request.request_id, [operation_group] + groups)
+
+    # --- Сервер -----------------------------------------------------------
+
+    def start(self) -> str:
+        """
+        Запускает сервер в фоновом потоке
+
+        Returns:
+            Адрес для CUPS_SERVER / IPPClient: "адрес:порт" или путь к сокету
+        """
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                if not stand_in.socket_path:
+                    # Заголовки и тело ответа пишутся отдельно - без задержки Нейгла
+                    self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stand_in.lock:
+                    stand_in.stats["connections"] += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = stand_in.handle_request(self.rfile.read(length))
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def address_string(self):
+                return str(self.client_address[0]) if self.client_address else "local"
+
+            def log_message(self, format, *args):
+                pass
+
+        if self.socket_path:
+            class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.server = UnixServer(self.socket_path, Handler)
+            address = self.socket_path
+        else:
+            class Server(http.server.ThreadingHTTPServer):
+                allow_reuse_address = True
+                daemon_threads = True
+
+            self.server = Server((self.host, self.port), Handler)
+            self.port = self.server.server_address[1]
+            address = f"{self.host}:{self.port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return address
+
+    def stop(self):
+        """Останавливает сервер"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if self.socket_path and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def __enter__(self) -> "IPPStandInServer":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    """Основная функция программы"""
+    parser = argparse.ArgumentParser(
+        description="Заменитель cupsd для проверки клиента IPP",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  python hp_printer_simulator.py --port 9101 &
+  python hp_ipp_simulator.py --port 8631 --printer HP_M425 --forward 127.0.0.1:9101
+
+Затем, например:
+  CUPS_SERVER=127.0.0.1:8631 python hp_m425_scanner_counter.py --get
+        """
+    )
+
+    parser.add_argument("--bind", default="127.0.0.1", help="Адрес прослушивания (по умолчанию: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8631, help="Порт (по умолчанию: 8631)")
+    parser.add_argument("--socket", metavar="PATH", help="Слушать локальный сокет вместо TCP")
+    parser.add_argument("--printer", default="HP_LaserJet_400_MFP_M425dn", help="Имя очереди")
+    parser.add_argument("--model", default="HP LaserJet 400 MFP M425dn", help="Модель очереди")
+    parser.add_argument("--forward", metavar="HOST:PORT",
+                        help="Пересылать задания принтеру (например, симулятору)")
+
+    args = parser.parse_args()
+
+    forward = None
+    if args.forward:
+        host, _, port = args.forward.rpartition(":")
+        forward = (host, int(port))
+
+    server = IPPStandInServer(args.bind, args.port, args.socket)
+    server.add_printer(args.printer, args.model, forward=forward)
+    try:
+        address = server.start()
+    except OSError as e:
+        print(f"✗ Не удалось запустить сервер IPP: {e}")
+        sys.exit(1)
+
+    print(f"🖨️  Сервер IPP запущен: {address} (очередь {args.printer})")
+    print(f"   CUPS_SERVER={address}")
+    print("Ctrl+C для остановки")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n⚠ Остановка сервера IPP")
+    finally:
+        server.stop()
+        print(f"📊 Статистика: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,99 +7,88 @@ HP LaserJet Pro 400 MFP M425 PCL Scanner Counter Control
 
 import argparse
 import sys
-import time
 import tempfile
 import os
-import json
 import re
 import subprocess
 import platform
-from typing import Optional, Dict, List
-from datetime import datetime
+from typing import Optional, Dict, Iterator, List
 
+from hp_capability_cache import PJLCapabilityCache
+from hp_counter_history import ACTION_GET, ACTION_SET, parse_time, print_samples
+from hp_counter_series import open_history
+from hp_counter_parser import find_wmi_counter, largest_number
+from hp_counter_storage import CounterStorage, DeviceStores, device_id
+from hp_deadline import STEP_FAILED, STEP_OK, STEP_TIMEOUT, Deadline, DeadlineExceeded
+from hp_discovery_orchestrator import (DiscoveryOrchestrator, call_probe, lsusb_probe, select_printer,
+                                       sysfs_probe)
+from hp_enum_cache import (DEFAULT_TTL, KEY_CUPS_QUEUES, KEY_M425_PRINTERS, KEY_USB_PORTS,
+                           EnumerationCache)
+from hp_ipp import CupsCommands, device_serial
+from hp_pjl_protocol import build_pjl_job
+from hp_rtt import TRANSPORT_LP, RTTStore
 
-class CounterStorage:
-    """Класс для хранения значений счетчика в файле конфигурации"""
-    
-    def __init__(self, config_file: str = "m425_counter_config.json"):
-        self.config_file = config_file
-        self.config = self._load_config()
-    
-    def _load_config(self) -> dict:
-        """Загружает конфигурацию из файла"""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except:
-            pass
-        
-        # Дефолтная конфигурация для M425
-        return {
-            "scanner_counter": 0,
-            "last_updated": None,
-            "printer_model": "HP LaserJet Pro 400 MFP M425",
-            "printer_info": {},
-            "command_history": [],
-            "mfp_features": {
-                "scan_enabled": True,
-                "copy_enabled": True,
-                "fax_enabled": True
-            }
-        }
-    
-    def _save_config(self):
-        """Сохраняет конфигурацию в файл"""
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"⚠️  Ошибка сохранения конфигурации: {e}")
-    
-    def get_counter(self) -> int:
-        """Получает сохраненное значение счетчика"""
-        return self.config.get("scanner_counter", 0)
-    
-    def set_counter(self, value: int):
-        """Устанавливает значение счетчика"""
-        self.config["scanner_counter"] = value
-        self.config["last_updated"] = datetime.now().isoformat()
-        self._add_to_history(f"Установлен счетчик сканера: {value}")
-        self._save_config()
-    
-    def _add_to_history(self, action: str):
-        """Добавляет действие в историю"""
-        if "command_history" not in self.config:
-            self.config["command_history"] = []
-        
-        self.config["command_history"].append({
-            "timestamp": datetime.now().isoformat(),
-            "action": action
-        })
-        
-        # Оставляем только последние 10 записей
-        self.config["command_history"] = self.config["command_history"][-10:]
-    
-    def get_history(self) -> List[dict]:
-        """Получает историю команд"""
-        return self.config.get("command_history", [])
+
+# Первая строка каждого задания M425 (помечает задание в журнале принтера)
+M425_JOB_COMMENT = "@PJL COMMENT M425 MFP SCANNER COMMAND"
+
+# Поля WMI со счетчиками M425 в порядке приоритета
+M425_WMI_COUNTER_KEYS = ("TotalPagesPrinted", "PagesPrinted", "JobCountSinceLastReset", "ByteCount")
+
+
+# Конфигурация M425 по умолчанию (хранилище счетчика)
+M425_DEFAULT_CONFIG = {
+    "scanner_counter": 0,
+    "last_updated": None,
+    "printer_model": "HP LaserJet Pro 400 MFP M425",
+    "printer_info": {},
+    "command_history": [],
+    "mfp_features": {
+        "scan_enabled": True,
+        "copy_enabled": True,
+        "fax_enabled": True
+    }
+}
 
 
 class HPM425Printer:
     """Класс для работы с HP LaserJet Pro 400 MFP M425 PCL через системные команды"""
     
-    def __init__(self, timeout: int = 15):
+    def __init__(self, timeout: int = 15, rtt=None, deadline: Optional[float] = None,
+                 batch: bool = True, use_ipp: bool = True, enum_cache=None, history=None):
         """
         Инициализация для M425 MFP
         
         Args:
             timeout: Таймаут операций в секундах (увеличен для MFP)
+            rtt: Хранилище оценок времени ответа RTTStore (опционально) -
+                 ожидание lp подстраивается под очередь принтера
+            deadline: Общий бюджет времени одной операции (--get, --set, --info)
+                      в секундах, None - без ограничения
+            batch: Отправлять все варианты команд одним заданием
+                   (False - каждую команду отдельным заданием с паузами)
+            use_ipp: В Linux обращаться к CUPS по IPP вместо запуска lpstat/lp
+            enum_cache: Кэш результатов поиска EnumerationCache
+                        (по умолчанию printer_enumeration.json в текущем каталоге)
+            history: История значений счетчика CounterHistory/CounterSeries (опционально) -
+                     каждое чтение и установка счетчика записываются с временем
         """
         self.timeout = timeout
+        self.rtt = rtt
+        self.deadline = deadline
+        self.batch = batch
+        self.cups = CupsCommands(use_ipp, timeout=timeout)
+        self.enum_cache = enum_cache if enum_cache is not None else EnumerationCache()
+        self.history = history
         self.system = platform.system().lower()
         self.printer_name = None
         self.printer_port = None
-        self.storage = CounterStorage()
+        self.printer_serial = None
+        self.storage = CounterStorage("m425_counter_config.json", M425_DEFAULT_CONFIG,
+                                      "счетчик сканера")
+        # Счетчики по устройствам: selected_printer остается в основной конфигурации
+        self.devices = DeviceStores(self.storage)
+        self.capabilities = PJLCapabilityCache()
         self.model_variations = [
             "HP LaserJet Pro 400 MFP M425",
             "HP LaserJet Pro 400 M425",
@@ -110,19 +99,24 @@ class HPM425Printer:
         ]
         
     def find_m425_printers(self) -> List[Dict[str, str]]:
-        """Находит HP M425 принтеры в системе"""
-        printers = []
-        
+        """Находит HP M425 принтеры в системе (результат кэшируется, см. EnumerationCache)"""
+        return list(self.iter_m425_printers())
+    
+    def iter_m425_printers(self) -> Iterator[Dict[str, str]]:
+        """Выдает M425 принтеры по мере находки (из кэша, если он свежий)"""
+        return self.enum_cache.iter_or_load(KEY_M425_PRINTERS, self._stream_m425_printers,
+                                            "M425 принтеры")
+    
+    def _stream_m425_printers(self) -> Iterator[Dict[str, str]]:
+        """Поиск M425 принтеров без кэша"""
         print("🔍 Поиск HP LaserJet Pro 400 MFP M425 PCL принтеров...")
         
         if self.system == "windows":
-            printers = self._find_windows_m425()
+            yield from self._find_windows_m425()
         elif self.system == "linux":
-            printers = self._find_linux_m425()
+            yield from self._iter_linux_m425()
         else:
             print(f"❌ Система {self.system} не поддерживается")
-        
-        return printers
     
     def _find_windows_m425(self) -> List[Dict[str, str]]:
         """Поиск M425 принтеров в Windows"""
@@ -289,42 +283,48 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
         print(f"   📊 Всего найдено потенциальных M425: {len(printers)}")
         return printers
     
-    def _find_linux_m425(self) -> List[Dict[str, str]]:
-        """Поиск M425 принтеров в Linux"""
-        printers = []
-        
+    def _iter_linux_m425(self) -> Iterator[Dict[str, str]]:
+        """Поиск M425 принтеров в Linux (CUPS, lsusb и sysfs опрашиваются одновременно)"""
+        print("   🐧 Поиск M425 через Linux...")
+        
+        def is_m425_usb(line: str) -> bool:
+            return 'hewlett-packard' in line and ('m425' in line or 'laserjet' in line)
+        
+        usb_fields = {'model': 'M425 MFP'}
+        orchestrator = DiscoveryOrchestrator([
+            call_probe("cups", self._find_cups_m425, timeout=15),
+            lsusb_probe(is_m425_usb, usb_fields, timeout=10),
+            sysfs_probe(is_m425_usb, usb_fields),
+        ])
         try:
-            print("   🐧 Поиск M425 через Linux...")
-            
-            # Через CUPS
-            result = subprocess.run(['lpstat', '-p'], capture_output=True, text=True, timeout=15)
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if any(model.lower() in line.lower() for model in self.model_variations):
-                        printers.append({
-                            'name': line.strip(),
-                            'port': 'CUPS',
-                            'type': 'CUPS',
-                            'model': 'M425 MFP'
-                        })
-            
-            # Через lsusb для USB устройств
-            result = subprocess.run(['lsusb'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'hewlett-packard' in line.lower() and ('m425' in line.lower() or 'laserjet' in line.lower()):
-                        printers.append({
-                            'name': line.strip(),
-                            'port': 'USB',
-                            'type': 'USB',
-                            'model': 'M425 MFP'
-                        })
-                        
+            yield from orchestrator.iter_printers()
         except Exception as e:
             print(f"   ⚠️  Ошибка поиска M425 в Linux: {e}")
-        
+    
+    def _find_cups_m425(self) -> List[Dict[str, str]]:
+        """M425 очереди CUPS (список очередей сохраняется и для отправки команд)"""
+        printers = []
+        queues = self.enum_cache.get_or_load(KEY_CUPS_QUEUES,
+                                             lambda: self.cups.printers(timeout=15))
+        for queue in queues:
+            if self._is_m425_queue(queue):
+                printer = {
+                    'name': queue['name'],
+                    'port': 'CUPS',
+                    'type': 'CUPS',
+                    'model': 'M425 MFP'
+                }
+                serial = device_serial(queue.get('device_uri', ''))
+                if serial:
+                    printer['serial'] = serial
+                printers.append(printer)
         return printers
     
+    def _is_m425_queue(self, queue: Dict[str, str]) -> bool:
+        """Очередь CUPS из CupsCommands.printers() относится к M425"""
+        text = f"{queue['line']} {queue['model']}".lower()
+        return any(model.lower() in text for model in self.model_variations)
+    
     def _is_m425_printer(self, printer_info: Dict[str, str]) -> bool:
         """Проверяет, является ли принтер M425 (улучшенная проверка)"""
         name = printer_info.get('name', '').lower()
@@ -364,13 +364,31 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
         return False
     
     def connect(self, printer_info: Optional[Dict[str, str]] = None, 
-                interactive: bool = False, usb_port: Optional[str] = None) -> bool:
-        """Подключается к M425 принтеру"""
+                interactive: bool = False, usb_port: Optional[str] = None,
+                model: Optional[str] = None, serial: Optional[str] = None) -> bool:
+        """
+        Подключается к M425 принтеру
+        
+        Без интерактивного выбора поиск останавливается на первом подходящем M425:
+        с нужной моделью/серийным номером, ранее выбранном (selected_printer)
+        или просто первом найденном.
+        
+        Args:
+            printer_info: Информация о принтере из find_m425_printers()
+            interactive: Включить интерактивный выбор принтера
+            usb_port: Принудительно указать USB порт (например, "USB001")
+            model: Выбрать принтер, в названии которого есть эта строка (например, "M425dw")
+            serial: Выбрать принтер с этим серийным номером
+        
+        Returns:
+            True если принтер выбран успешно
+        """
         
         # Если указан конкретный USB порт
         if usb_port:
             self.printer_name = f"HP M425 MFP on {usb_port}"
             self.printer_port = usb_port
+            self.printer_serial = None
             print(f"✓ Принудительно выбран USB порт: {usb_port}")
             return True
         
@@ -378,27 +396,32 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
         if printer_info:
             self.printer_name = printer_info.get('name')
             self.printer_port = printer_info.get('port')
+            self.printer_serial = printer_info.get('serial')
             print(f"✓ Выбран M425: {self.printer_name} ({self.printer_port})")
             return True
         
+        # Автоматический выбор: первый подходящий M425, не дожидаясь конца поиска
+        if not interactive:
+            printer = select_printer(self.iter_m425_printers(), model, serial,
+                                     self.get_saved_printer())
+            if not printer:
+                wanted = " ".join(filter(None, [model, serial]))
+                print(f"❌ HP M425 {wanted} не найден" if wanted else "❌ HP M425 принтеры не найдены")
+                return False
+            self.printer_name = printer.get('name')
+            self.printer_port = printer.get('port')
+            self.printer_serial = printer.get('serial')
+            print(f"✓ Автоматически выбран M425: {self.printer_name} ({self.printer_port})")
+            return True
+        
         # Поиск M425 принтеров
         printers = self.find_m425_printers()
         if not printers:
             print("❌ HP M425 принтеры не найдены")
-            
-            if interactive:
-                return self._manual_usb_port_selection()
-            return False
+            return self._manual_usb_port_selection()
         
         # Интерактивный выбор
-        if interactive:
-            return self._interactive_m425_selection(printers)
-        else:
-            # Автоматический выбор первого M425
-            self.printer_name = printers[0].get('name')
-            self.printer_port = printers[0].get('port')
-            print(f"✓ Автоматически выбран M425: {self.printer_name} ({self.printer_port})")
-            return True
+        return self._interactive_m425_selection(printers)
     
     def _interactive_m425_selection(self, printers: List[Dict[str, str]]) -> bool:
         """Интерактивный выбор M425 принтера"""
@@ -432,10 +455,10 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
                     selected = printers[choice_num - 1]
                     self.printer_name = selected.get('name')
                     self.printer_port = selected.get('port')
+                    self.printer_serial = selected.get('serial')
                     
                     # Сохраняем выбор
-                    self.storage.config['selected_printer'] = selected
-                    self.storage._save_config()
+                    self.storage.update_config({'selected_printer': selected})
                     
                     print(f"✓ Выбран M425: {self.printer_name} ({self.printer_port})")
                     return True
@@ -489,16 +512,16 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
                 
                 self.printer_name = f"HP M425 MFP on {normalized_port}"
                 self.printer_port = normalized_port
+                self.printer_serial = None
                 
                 # Сохраняем выбор
-                self.storage.config['selected_printer'] = {
+                self.storage.update_config({'selected_printer': {
                     'name': self.printer_name,
                     'port': self.printer_port,
                     'type': 'Manual USB',
                     'model': 'M425 MFP',
                     'manual': True
-                }
-                self.storage._save_config()
+                }})
                 
                 print(f"✓ Установлен USB порт для M425: {normalized_port}")
                 return True
@@ -508,23 +531,28 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
                 return False
     
     def _get_available_usb_ports(self) -> List[str]:
-        """Получает список доступных USB портов"""
+        """Получает список доступных USB портов (результат кэшируется)"""
+        return self.enum_cache.get_or_load(KEY_USB_PORTS, self._enumerate_usb_ports)
+    
+    def _enumerate_usb_ports(self) -> List[str]:
+        """Проверка USB портов без кэша"""
         ports = []
         
         if self.system == "windows":
-            for port in ['USB001', 'USB002', 'USB003', 'USB004']:
-                try:
-                    result = subprocess.run([
-                        'wmic', 'printer', 'where', f'PortName="{port}"', 'get', 'Name'
-                    ], capture_output=True, text=True, timeout=5)
-                    
-                    if result.returncode == 0 and result.stdout.strip():
-                        ports.append(port)
-                except:
-                    continue
+            # Один запрос WMI на все порты
+            try:
+                result = subprocess.run([
+                    'wmic', 'printer', 'get', 'PortName'
+                ], capture_output=True, text=True, timeout=5)
+                
+                if result.returncode == 0:
+                    used = {line.strip().upper() for line in result.stdout.splitlines()}
+                    ports = [port for port in ['USB001', 'USB002', 'USB003', 'USB004']
+                             if port in used]
+            except:
+                pass
         
         elif self.system == "linux":
-            import os
             for i in range(4):
                 device_path = f'/dev/usb/lp{i}'
                 if os.path.exists(device_path):
@@ -552,26 +580,76 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
         
         return None
     
-    def send_m425_pjl_command(self, command: str) -> bool:
-        """Отправляет PJL команду специфично для M425 MFP"""
+    def _new_deadline(self) -> Deadline:
+        """Срок для новой операции по настроенному бюджету"""
+        return Deadline(self.deadline)
+    
+    def send_m425_pjl_command(self, command: str, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Отправляет PJL команду специфично для M425 MFP
+        
+        Args:
+            command: PJL команда
+            deadline: Срок операции (каждый способ отправки получает остаток времени)
+        
+        Raises:
+            DeadlineExceeded: бюджет операции исчерпан
+        """
         if not self.printer_name:
             print("❌ M425 принтер не выбран")
             return False
         
-        # Формируем PJL команду с дополнительными параметрами для MFP
-        full_command = f"\x1B%-12345X@PJL\r\n@PJL COMMENT M425 MFP SCANNER COMMAND\r\n{command}\r\n@PJL EOJ\r\n\x1B%-12345X"
-        
         print(f"→ Отправка M425 команды: {command}")
+        return self._send_job([command], deadline or self._new_deadline())
+    
+    def send_m425_pjl_batch(self, commands: List[str], deadline: Optional[Deadline] = None) -> bool:
+        """
+        Отправляет несколько PJL команд M425 одним заданием
         
-        if self.system == "windows":
-            return self._send_windows_command(full_command)
-        elif self.system == "linux":
-            return self._send_linux_command(full_command)
-        else:
-            print(f"❌ Система {self.system} не поддерживается")
+        Вместо отдельного задания, поиска очереди через lpstat, запуска lp и
+        паузы на каждую команду - одно задание на все варианты. Принтер
+        пропускает неизвестные ему команды.
+        
+        Args:
+            commands: Список PJL команд
+            deadline: Срок операции
+        
+        Returns:
+            True если задание отправлено успешно
+        
+        Raises:
+            DeadlineExceeded: бюджет операции исчерпан
+        """
+        if not self.printer_name:
+            print("❌ M425 принтер не выбран")
             return False
+        
+        print(f"→ Отправка {len(commands)} M425 команд одним заданием:")
+        for command in commands:
+            print(f"   {command}")
+        return self._send_job(commands, deadline or self._new_deadline())
+    
+    def _send_job(self, commands: List[str], deadline: Deadline) -> bool:
+        """Формирует задание M425 из команд и отправляет его способом текущей системы"""
+        # Задание с дополнительными параметрами для MFP
+        full_command = build_pjl_job([M425_JOB_COMMENT] + list(commands))
+        try:
+            if self.system == "windows":
+                sent = self._send_windows_command(full_command, deadline)
+            elif self.system == "linux":
+                sent = self._send_linux_command(full_command, deadline)
+            else:
+                print(f"❌ Система {self.system} не поддерживается")
+                return False
+        except DeadlineExceeded:
+            for command in commands:
+                deadline.record(command, STEP_TIMEOUT)
+            raise
+        for command in commands:
+            deadline.record(command, STEP_OK if sent else STEP_FAILED)
+        return sent
     
-    def _send_windows_command(self, command: str) -> bool:
+    def _send_windows_command(self, command: str, deadline: Deadline) -> bool:
         """Отправка команды M425 в Windows"""
         try:
             with tempfile.NamedTemporaryFile(mode='w', suffix='.prn', delete=False) as f:
@@ -582,7 +660,8 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
                 # Метод 1: Через имя принтера M425
                 if self.printer_name and 'M425' in self.printer_name:
                     cmd = f'copy /B "{temp_file}" "\\\\localhost\\{self.printer_name}"'
-                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=30)
+                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True,
+                                            timeout=deadline.timeout(30))
                     if result.returncode == 0:
                         print("✓ M425 команда отправлена через имя принтера")
                         return True
@@ -590,13 +669,14 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
                 # Метод 2: Через USB порт
                 if self.printer_port and 'USB' in self.printer_port:
                     cmd = f'copy /B "{temp_file}" "{self.printer_port}"'
-                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=15)
+                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True,
+                                            timeout=deadline.timeout(15))
                     if result.returncode == 0:
                         print(f"✓ M425 команда отправлена через порт {self.printer_port}")
                         return True
                 
                 # Метод 3: Поиск M425 через WMI
-                return self._send_m425_via_wmi(temp_file)
+                return self._send_m425_via_wmi(temp_file, deadline)
                     
             finally:
                 try:
@@ -606,11 +686,13 @@ Get-WmiObject -Class Win32_Printer | Where-Object {
             
             return False
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"❌ Ошибка отправки M425 команды в Windows: {e}")
             return False
     
-    def _send_m425_via_wmi(self, temp_file: str) -> bool:
+    def _send_m425_via_wmi(self, temp_file: str, deadline: Deadline) -> bool:
         """Отправка команды M425 через WMI"""
         try:
             ps_script = f'''
@@ -634,36 +716,43 @@ if ($m425Printers) {{
 '''
             result = subprocess.run([
                 'powershell', '-ExecutionPolicy', 'Bypass', '-Command', ps_script
-            ], capture_output=True, text=True, timeout=30)
+            ], capture_output=True, text=True, timeout=deadline.timeout(30))
             
             if result.returncode == 0 and "Success" in result.stdout:
                 print("✓ M425 команда отправлена через WMI")
                 return True
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"⚠️  Ошибка WMI для M425: {e}")
         
         return False
     
-    def _send_linux_command(self, command: str) -> bool:
+    def _cups_queues(self, deadline: Deadline) -> List[Dict[str, str]]:
+        """Очереди CUPS: из кэша поиска, запрос к CUPS только при устаревшей записи"""
+        return self.enum_cache.get_or_load(
+            KEY_CUPS_QUEUES, lambda: self.cups.printers(timeout=deadline.timeout(10)))
+    
+    def _send_linux_command(self, command: str, deadline: Deadline) -> bool:
         """Отправка команды M425 в Linux"""
         try:
             # Поиск M425 принтера в CUPS
             if 'CUPS' in str(self.printer_port):
                 try:
-                    # Ищем M425 принтер в CUPS
-                    result = subprocess.run(['lpstat', '-p'], capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0:
-                        for line in result.stdout.split('\n'):
-                            if any(model.lower() in line.lower() for model in self.model_variations):
-                                printer_name = line.split()[1] if len(line.split()) > 1 else None
-                                if printer_name:
-                                    proc = subprocess.Popen(['lp', '-d', printer_name, '-o', 'raw'], 
-                                                          stdin=subprocess.PIPE)
-                                    proc.communicate(command.encode('ascii'), timeout=30)
-                                    if proc.returncode == 0:
-                                        print(f"✓ M425 команда отправлена через CUPS: {printer_name}")
-                                        return True
+                    # Ищем M425 принтер в CUPS (список очередей берется из кэша)
+                    for queue in self._cups_queues(deadline):
+                        if self._is_m425_queue(queue):
+                            printer_name = queue['name']
+                            ceiling = deadline.timeout(30)
+                            estimator = (self.rtt.estimator(TRANSPORT_LP, printer_name, 30)
+                                         if self.rtt else None)
+                            if self.cups.submit_raw(printer_name, command.encode('ascii'), ceiling,
+                                                    self.rtt, estimator):
+                                print(f"✓ M425 команда отправлена через CUPS: {printer_name}")
+                                return True
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     print(f"⚠️  Ошибка CUPS для M425: {e}")
             
@@ -681,13 +770,31 @@ if ($m425Printers) {{
             
             return False
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"❌ Ошибка отправки M425 команды в Linux: {e}")
             return False
     
-    def get_m425_scanner_counter(self) -> int:
-        """Получает значение счетчика сканера M425 MFP"""
+    def _known_m425_command(self, kind: str) -> Optional[str]:
+        """
+        Возвращает рабочий вариант команды из кэша возможностей
+        
+        Системные методы не читают ответы, поэтому используются варианты,
+        проверенные на M425 через сетевой клиент (hp_scanner_counter.py).
+        """
+        key = self.capabilities.find_by_model("M425")
+        return self.capabilities.known_good(key, kind)
+    
+    def get_m425_scanner_counter(self, deadline: Optional[Deadline] = None) -> int:
+        """
+        Получает значение счетчика сканера M425 MFP
+        
+        Args:
+            deadline: Срок операции (по умолчанию - новый по настроенному бюджету)
+        """
         print("\n📊 Получение счетчика сканера M425 MFP...")
+        deadline = deadline or self._new_deadline()
         
         # Специфичные команды для M425 MFP
         m425_commands = [
@@ -703,37 +810,59 @@ if ($m425Printers) {{
             "@PJL INFO STATUS"
         ]
         
-        # Отправляем команды (системные методы не могут читать ответы)
-        for command in m425_commands:
-            if self.send_m425_pjl_command(command):
-                print(f"   ✓ Отправлена команда: {command}")
-                time.sleep(0.5)
+        known_command = self._known_m425_command("read")
+        if known_command:
+            print(f"💾 Используется проверенная команда из кэша: {known_command}")
+            m425_commands = [known_command]
         
-        # Пытаемся получить реальное значение через систему
-        real_counter = self._try_get_m425_real_counter()
+        # Значение до чтения: прочитанное сохраняется, только если его никто не изменил
+        expected = self._counter_store().get_counter()
+        
+        # Отправляем команды (системные методы не могут читать ответы)
+        real_counter = None
+        try:
+            if self.batch:
+                if self.send_m425_pjl_batch(m425_commands, deadline):
+                    print(f"   ✓ Отправлено команд: {len(m425_commands)}")
+                    deadline.sleep(0.5)
+            else:
+                for index, command in enumerate(m425_commands):
+                    try:
+                        if self.send_m425_pjl_command(command, deadline):
+                            print(f"   ✓ Отправлена команда: {command}")
+                            deadline.sleep(0.5)
+                    except DeadlineExceeded:
+                        deadline.skip(m425_commands[index + 1:])
+                        raise
+            
+            # Пытаемся получить реальное значение через систему
+            real_counter = self._try_get_m425_real_counter(deadline)
+        except DeadlineExceeded as e:
+            deadline.print_report(e)
         if real_counter is not None:
             print(f"✓ Получен реальный счетчик M425: {real_counter}")
-            self.storage.set_counter(real_counter)
+            self._store_read_counter(expected, real_counter)
+            self._record_sample(real_counter, ACTION_GET)
             return real_counter
         
         # Используем сохраненное значение
-        cached_counter = self.storage.get_counter()
+        cached_counter = self._counter_store().get_counter()
         print(f"📁 Используется сохраненное значение M425: {cached_counter}")
         print("ℹ️  Для получения точного значения требуется двунаправленная связь")
         
         return cached_counter
     
-    def _try_get_m425_real_counter(self) -> Optional[int]:
+    def _try_get_m425_real_counter(self, deadline: Deadline) -> Optional[int]:
         """Попытка получить реальный счетчик M425 через статус системы"""
         
         if self.system == "windows":
-            return self._get_m425_windows_counter()
+            return self._get_m425_windows_counter(deadline)
         elif self.system == "linux":
-            return self._get_m425_linux_counter()
+            return self._get_m425_linux_counter(deadline)
         
         return None
     
-    def _get_m425_windows_counter(self) -> Optional[int]:
+    def _get_m425_windows_counter(self, deadline: Deadline) -> Optional[int]:
         """Получение счетчика M425 в Windows через WMI"""
         try:
             print("   🖥️  Попытка получения M425 статистики через WMI...")
@@ -772,46 +901,35 @@ if ($m425Printer) {
             
             result = subprocess.run([
                 'powershell', '-Command', ps_script
-            ], capture_output=True, text=True, timeout=25)
+            ], capture_output=True, text=True, timeout=deadline.timeout(25, "WMI"))
             
             if result.returncode == 0 and result.stdout:
                 output = result.stdout
                 print(f"   📋 M425 WMI ответ: {output[:300]}...")
                 
-                # Ищем счетчики в выводе
-                patterns = [
-                    r'TotalPagesPrinted\s*:\s*(\d+)',
-                    r'PagesPrinted\s*:\s*(\d+)',
-                    r'JobCountSinceLastReset\s*:\s*(\d+)',
-                    r'ByteCount\s*:\s*(\d+)',
-                    r':\s*(\d{2,6})'
-                ]
-                
-                for pattern in patterns:
-                    matches = re.findall(pattern, output, re.IGNORECASE)
-                    for match in matches:
-                        try:
-                            value = int(match)
-                            if 10 <= value <= 999999:
-                                print(f"   ✓ Найден потенциальный счетчик M425: {value}")
-                                return value
-                        except ValueError:
-                            continue
+                # Сначала известные поля счетчиков M425, затем любое разумное число
+                reading = find_wmi_counter(output, M425_WMI_COUNTER_KEYS)
+                if reading:
+                    print(f"   ✓ Найден потенциальный счетчик M425: {reading.value}")
+                    deadline.record("WMI", STEP_OK)
+                    return reading.value
+            deadline.record("WMI", STEP_FAILED)
                             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"   ⚠️  Ошибка WMI для M425: {e}")
         
         return None
     
-    def _get_m425_linux_counter(self) -> Optional[int]:
+    def _get_m425_linux_counter(self, deadline: Deadline) -> Optional[int]:
         """Получение счетчика M425 в Linux через CUPS"""
         try:
             print("   🐧 Попытка получения M425 статистики через CUPS...")
             
             # Ищем M425 в CUPS
-            result = subprocess.run(['lpstat', '-l', '-p'], capture_output=True, text=True, timeout=15)
-            if result.returncode == 0:
-                output = result.stdout
+            output = self.cups.lpstat(['-l', '-p'], deadline.timeout(15, "lpstat -l -p"))
+            if output is not None:
                 print(f"   📋 CUPS статистика: {output[:200]}...")
                 
                 # Ищем строки с M425
@@ -822,34 +940,40 @@ if ($m425Printer) {
                     print(f"   ✓ Найдены строки M425: {len(m425_lines)}")
                     
                     # Ищем числовые значения
-                    all_text = ' '.join(m425_lines)
-                    numbers = re.findall(r'\b(\d{2,6})\b', all_text)
-                    if numbers:
-                        valid_numbers = [int(n) for n in numbers if 10 <= int(n) <= 999999]
-                        if valid_numbers:
-                            counter = max(valid_numbers)
-                            print(f"   ✓ Найден потенциальный счетчик M425: {counter}")
-                            return counter
+                    reading = largest_number(' '.join(m425_lines))
+                    if reading:
+                        print(f"   ✓ Найден потенциальный счетчик M425: {reading.value}")
+                        deadline.record("lpstat -l -p", STEP_OK)
+                        return reading.value
+            deadline.record("lpstat -l -p", STEP_FAILED)
             
             # Дополнительная проверка через задания
-            result = subprocess.run(['lpstat', '-W', 'completed'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0 and result.stdout:
-                numbers = re.findall(r'\b(\d{2,6})\b', result.stdout)
-                if numbers:
-                    valid_numbers = [int(n) for n in numbers if 50 <= int(n) <= 999999]
-                    if valid_numbers:
-                        counter = max(valid_numbers)
-                        print(f"   ✓ Найден альтернативный счетчик M425: {counter}")
-                        return counter
+            output = self.cups.lpstat(['-W', 'completed'], deadline.timeout(10, "lpstat -W completed"))
+            if output:
+                reading = largest_number(output, low=50)
+                if reading:
+                    print(f"   ✓ Найден альтернативный счетчик M425: {reading.value}")
+                    deadline.record("lpstat -W completed", STEP_OK)
+                    return reading.value
+            deadline.record("lpstat -W completed", STEP_FAILED)
                         
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"   ⚠️  Ошибка CUPS для M425: {e}")
         
         return None
     
-    def set_m425_scanner_counter(self, count: int) -> bool:
-        """Устанавливает значение счетчика сканера M425 MFP"""
+    def set_m425_scanner_counter(self, count: int, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Устанавливает значение счетчика сканера M425 MFP
+        
+        Args:
+            count: Новое значение счетчика
+            deadline: Срок операции (по умолчанию - новый по настроенному бюджету)
+        """
         print(f"\n🔧 Установка счетчика сканера M425 MFP на {count}...")
+        deadline = deadline or self._new_deadline()
         
         # Специфичные команды для M425 MFP
         m425_commands = [
@@ -861,15 +985,32 @@ if ($m425Printer) {
             f"@PJL COMMENT SETTING M425 SCANNER COUNTER TO {count}"
         ]
         
+        known_template = self._known_m425_command("write")
+        if known_template:
+            print(f"💾 Используется проверенная команда из кэша: {known_template.format(count=count)}")
+            m425_commands = [known_template.format(count=count)]
+        
         success = False
-        for command in m425_commands:
-            if self.send_m425_pjl_command(command):
-                success = True
-                time.sleep(0.7)  # Увеличенная задержка для MFP
+        if self.batch:
+            try:
+                success = self.send_m425_pjl_batch(m425_commands, deadline)
+            except DeadlineExceeded as e:
+                deadline.print_report(e)
+        else:
+            for index, command in enumerate(m425_commands):
+                try:
+                    if self.send_m425_pjl_command(command, deadline):
+                        success = True
+                        deadline.sleep(0.7)  # Увеличенная задержка для MFP
+                except DeadlineExceeded as e:
+                    deadline.skip(m425_commands[index + 1:])
+                    deadline.print_report(e)
+                    break
         
         if success:
             # Сохраняем значение
-            self.storage.set_counter(count)
+            self._counter_store().set_counter(count)
+            self._record_sample(count, ACTION_SET)
             print(f"✓ M425 счетчик установлен на {count}")
             print("💾 Значение сохранено в конфигурации")
             
@@ -883,9 +1024,15 @@ if ($m425Printer) {
         print("\n🔄 Сброс счетчика сканера M425 MFP...")
         return self.set_m425_scanner_counter(0)
     
-    def get_m425_info(self) -> Dict[str, str]:
-        """Получает информацию о M425 MFP"""
+    def get_m425_info(self, deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """
+        Получает информацию о M425 MFP
+        
+        Args:
+            deadline: Срок операции (по умолчанию - новый по настроенному бюджету)
+        """
         print("\n📋 Получение информации о M425 MFP...")
+        deadline = deadline or self._new_deadline()
         
         info = {
             "connection_type": "system_only",
@@ -893,7 +1040,7 @@ if ($m425Printer) {
             "printer_name": self.printer_name or "Unknown",
             "printer_port": self.printer_port or "Unknown",
             "system": self.system,
-            "cached_counter": str(self.storage.get_counter()),
+            "cached_counter": str(self._counter_store().get_counter()),
             "mfp_features": "Scan, Copy, Print, Fax"
         }
         
@@ -906,24 +1053,102 @@ if ($m425Printer) {
             "scan_status": "@PJL INFO SCANSTATUS"
         }
         
-        for key, command in m425_info_commands.items():
-            if self.send_m425_pjl_command(command):
-                info[f"{key}_sent"] = "✓"
-            else:
-                info[f"{key}_sent"] = "❌"
+        items = list(m425_info_commands.items())
+        if self.batch:
+            try:
+                sent = "✓" if self.send_m425_pjl_batch(list(m425_info_commands.values()), deadline) else "❌"
+            except DeadlineExceeded as e:
+                sent = "⏱️"
+                deadline.print_report(e)
+            for key in m425_info_commands:
+                info[f"{key}_sent"] = sent
+            return info
+        
+        for index, (key, command) in enumerate(items):
+            try:
+                if self.send_m425_pjl_command(command, deadline):
+                    info[f"{key}_sent"] = "✓"
+                else:
+                    info[f"{key}_sent"] = "❌"
+            except DeadlineExceeded as e:
+                # Оставшиеся команды не отправлялись
+                for skipped_key, _ in items[index:]:
+                    info[f"{skipped_key}_sent"] = "⏱️"
+                deadline.skip(command for _, command in items[index + 1:])
+                deadline.print_report(e)
+                break
         
         return info
     
+    def _record_sample(self, counter: int, action: str):
+        """Записывает отметку счетчика в историю (если она подключена)"""
+        if not self.history:
+            return
+        try:
+            self.history.record(self._device_id() or "unknown", counter, action)
+        except Exception as e:
+            print(f"⚠️  Ошибка записи истории счетчика: {e}")
+    
+    def _printer_info(self) -> Dict[str, Optional[str]]:
+        """Сведения о выбранном принтере для определения устройства"""
+        return {'serial': self.printer_serial, 'name': self.printer_name, 'port': self.printer_port}
+    
+    def _device_id(self) -> Optional[str]:
+        """Идентификатор выбранного принтера (общий для хранилища счетчика и истории)"""
+        return device_id(self._printer_info())
+    
+    def _counter_store(self) -> CounterStorage:
+        """Хранилище счетчика выбранного принтера (до выбора - основная конфигурация)"""
+        device = self._device_id()
+        return self.devices.get(device, self._printer_info()) if device else self.storage
+    
+    def _store_read_counter(self, expected: int, value: int):
+        """
+        Сохраняет прочитанный с принтера счетчик (сравнение с обменом)
+        
+        Если за время чтения другой процесс сохранил новое значение (например,
+        --set), прочитанное раньше значение его не перезаписывает.
+        """
+        if not self._counter_store().update_counter(expected, value):
+            print("ℹ️  Сохраненный счетчик изменен другим процессом во время чтения, оставлено новое значение")
+    
     def get_saved_printer(self) -> Optional[Dict[str, str]]:
         """Получает сохраненный выбор M425 принтера"""
         return self.storage.config.get('selected_printer')
     
-    def get_command_history(self) -> List[dict]:
-        """Получает историю команд M425"""
-        return self.storage.get_history()
+    def get_command_history(self, device: Optional[str] = None) -> List[dict]:
+        """
+        Получает историю команд M425
+        
+        --history выполняется без подключения, поэтому устройство берется из
+        аргумента, выбранного или сохраненного принтера; если оно неизвестно -
+        история всех устройств.
+        
+        Args:
+            device: Устройство (серийный номер, очередь или порт)
+        """
+        if device:
+            return self.devices.history(device)
+        if self.printer_name or self.printer_port:
+            return self._counter_store().get_history()
+        saved_printer = self.get_saved_printer()
+        saved = device_id(saved_printer)
+        if saved:
+            return self.devices.history(saved, saved_printer)
+        return self.devices.all_history()
     
     def disconnect(self):
         """Отключение от M425 принтера"""
+        if self.rtt:
+            self.rtt.save()
+        self.cups.close()
+        self.devices.close()
+        self.storage.close()
+        if self.history:
+            try:
+                self.history.close()
+            except Exception as e:
+                print(f"⚠️  Ошибка записи истории счетчика: {e}")
         print("✓ Подключение к M425 MFP завершено")
 
 
@@ -983,6 +1208,35 @@ def main():
                        help="Выбрать M425 принтер и сохранить")
     parser.add_argument("--use-saved", action="store_true",
                        help="Использовать сохраненный M425 принтер")
+    parser.add_argument("--rtt-file", default="rtt_estimates.json", metavar="FILE",
+                       help="Файл оценок времени ответа устройств (по умолчанию: rtt_estimates.json)")
+    parser.add_argument("--no-adaptive-timeout", action="store_true",
+                       help="Всегда ждать завершения lp полный таймаут (без оценки времени ответа)")
+    parser.add_argument("--no-ipp", action="store_true",
+                       help="Запускать lpstat/lp вместо запросов IPP к CUPS (Linux)")
+    parser.add_argument("--no-batch", action="store_true",
+                       help="Отправлять каждую PJL команду отдельным заданием (как раньше)")
+    parser.add_argument("--deadline", type=float, default=180, metavar="SECONDS",
+                       help="Общий бюджет времени одной операции, 0 - без ограничения (по умолчанию: 180)")
+    parser.add_argument("--model", metavar="TEXT",
+                       help="Подключиться к первому найденному принтеру с этой строкой в названии (например: M425dw)")
+    parser.add_argument("--serial", metavar="SERIAL",
+                       help="Подключиться к принтеру с этим серийным номером")
+    parser.add_argument("--history-db", default="counter_history.db", metavar="FILE",
+                       help="История значений счетчика: SQLite или *.hps - компактный бинарный формат "
+                            "(по умолчанию: counter_history.db)")
+    parser.add_argument("--since", type=parse_time, metavar="TIME",
+                       help="--history: начало периода (2024-05-01, 2024-05-01T12:00 или 30d, 12h)")
+    parser.add_argument("--until", type=parse_time, metavar="TIME",
+                       help="--history: конец периода")
+    parser.add_argument("--device", metavar="NAME",
+                       help="--history: только это устройство (серийный номер, очередь или порт)")
+    parser.add_argument("--limit", type=int, default=50,
+                       help="--history: сколько последних отметок выводить (по умолчанию: 50)")
+    parser.add_argument("--refresh", action="store_true",
+                       help="Заново найти принтеры и порты, не используя кэш поиска")
+    parser.add_argument("--enum-ttl", type=float, default=DEFAULT_TTL, metavar="SECONDS",
+                       help=f"Время жизни кэша поиска принтеров (по умолчанию: {DEFAULT_TTL})")
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--get", action="store_true", help="Получить счетчик сканера M425")
@@ -999,7 +1253,18 @@ def main():
     print()
     
     # Создаем объект для работы с M425
-    printer = HPM425Printer(timeout=args.timeout)
+    rtt = None if args.no_adaptive_timeout else RTTStore(args.rtt_file)
+    enum_cache = EnumerationCache(ttl=args.enum_ttl)
+    if args.refresh:
+        enum_cache.invalidate()
+    try:
+        history = open_history(args.history_db)
+    except Exception as e:
+        print(f"⚠️  История счетчика недоступна ({args.history_db}): {e}")
+        history = None
+    printer = HPM425Printer(timeout=args.timeout, rtt=rtt, deadline=args.deadline or None,
+                            batch=not args.no_batch, use_ipp=not args.no_ipp, enum_cache=enum_cache,
+                            history=history)
     
     try:
         # Показать список M425 принтеров
@@ -1010,18 +1275,23 @@ def main():
         
         # Показать историю команд
         if args.history:
-            history = printer.get_command_history()
-            if history:
+            commands = printer.get_command_history(args.device)
+            if commands:
                 print("📜 История команд M425:")
                 print("-" * 50)
-                for entry in history[-10:]:
+                for entry in commands[-10:]:
                     timestamp = entry.get('timestamp', 'Unknown')
                     action = entry.get('action', 'Unknown')
                     print(f"📅 {timestamp}")
+                    if entry.get('device'):
+                        print(f"   Устройство: {entry['device']}")
                     print(f"   {action}")
                     print()
             else:
                 print("📜 История команд M425 пуста")
+            if history:
+                print()
+                print_samples(history, args.device, args.since, args.until, args.limit)
             return
         
         # Определяем режим подключения к M425
@@ -1058,7 +1328,9 @@ def main():
         success = printer.connect(
             printer_info=saved_printer if args.use_saved else None,
             interactive=interactive_mode,
-            usb_port=usb_port
+            usb_port=usb_port,
+            model=args.model,
+            serial=args.serial
         )
         
         if not success:
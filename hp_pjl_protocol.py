@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общие функции протокола PJL для HP LaserJet Pro 400
+Формирование PJL заданий и чтение ответов принтера с маркером @PJL ECHO
+"""
+
+import os
+import re
+import select
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from hp_counter_parser import counter_value
+from hp_rtt import remaining_wait, wait_plan
+
+
+# Universal Exit Language - начало/конец PJL задания
+UEL = "\x1B%-12345X"
+
+# Режимы чтения ответа
+READ_MODE_ECHO = "echo"      # Читаем до возврата уникального маркера @PJL ECHO
+READ_MODE_LEGACY = "sleep"   # Старый режим: пауза 1 с и чтение до таймаута сокета
+
+# Ограничения приема ответа: буфер recv_into и предел объема одного обмена
+# (USTATUS и неисправные устройства могут слать данные бесконечно)
+RECV_BUFFER_SIZE = 4096
+MAX_RESPONSE_SIZE = 1024 * 1024
+MAX_LINE_LENGTH = 8192
+
+# Варианты PJL команд для чтения счетчика сканера (в порядке приоритета)
+SCAN_COUNTER_QUERIES = [
+    "@PJL INQUIRE SCANCOUNT",
+    "@PJL INQUIRE SCANCOUNTER",
+    "@PJL INQUIRE SCANPAGES",
+    "@PJL INFO SCANCOUNT",
+    "@PJL INFO SCANCOUNTER",
+    "@PJL DINQUIRE SCANCOUNT",
+    "@PJL DINQUIRE SCANCOUNTER"
+]
+
+# Шаблоны PJL команд для установки счетчика сканера
+SCAN_COUNTER_SETTERS = [
+    "@PJL SET SCANCOUNT={count}",
+    "@PJL SET SCANCOUNTER={count}",
+    "@PJL SET SCANPAGES={count}",
+    "@PJL DEFAULT SCANCOUNT={count}",
+    "@PJL DEFAULT SCANCOUNTER={count}"
+]
+
+# Информационные команды принтера
+PRINTER_INFO_COMMANDS = {
+    "model": "@PJL INFO ID",
+    "status": "@PJL INFO STATUS",
+    "memory": "@PJL INFO MEMORY",
+    "version": "@PJL INFO VERSION"
+}
+
+
+def new_echo_token() -> str:
+    """
+    Создает уникальный маркер для команды @PJL ECHO
+
+    Returns:
+        Строка маркера (только ASCII буквы, цифры и дефисы)
+    """
+    return f"HP400-{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+
+def build_pjl_job(commands: List[str], echo_token: Optional[str] = None) -> str:
+    """
+    Формирует полное PJL задание, обрамленное UEL
+
+    Args:
+        commands: Список PJL команд
+        echo_token: Маркер для @PJL ECHO в конце задания (опционально)
+
+    Returns:
+        Строка PJL задания
+    """
+    lines = ["@PJL"] + list(commands)
+    if echo_token:
+        lines.append(f"@PJL ECHO {echo_token}")
+    lines.append("@PJL EOJ")
+    return UEL + "\r\n".join(lines) + "\r\n" + UEL
+
+
+def build_pjl_batch_job(commands: List[str], token_prefix: str) -> Tuple[str, List[str]]:
+    """
+    Формирует одно PJL задание из нескольких команд, помечая каждую маркером ECHO
+
+    Args:
+        commands: Список PJL команд
+        token_prefix: Общий префикс маркеров (см. new_echo_token)
+
+    Returns:
+        Кортеж (строка PJL задания, список маркеров по порядку команд)
+    """
+    tokens = [f"{token_prefix}-{index}" for index in range(len(commands))]
+    lines = ["@PJL"]
+    for command, token in zip(commands, tokens):
+        lines.append(command)
+        lines.append(f"@PJL ECHO {token}")
+    lines.append("@PJL EOJ")
+    return UEL + "\r\n".join(lines) + "\r\n" + UEL, tokens
+
+
+def split_echo_segments(response: str, tokens: List[str]) -> List[Optional[str]]:
+    """
+    Разбирает общий поток ответов пакетного задания на части по маркерам ECHO
+
+    Ответ на команду - все строки между предыдущим маркером ECHO и маркером
+    этой команды. Части, чей маркер не вернулся, равны None.
+
+    Args:
+        response: Полный ответ принтера
+        tokens: Маркеры ECHO в порядке команд
+
+    Returns:
+        Список ответов в порядке команд
+    """
+    segments = [None] * len(tokens)  # type: List[Optional[str]]
+    token_index = {token: index for index, token in enumerate(tokens)}
+    current = []
+
+    for line in response.replace("\f", "\n").splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith("@PJL ECHO "):
+            index = token_index.get(stripped[len("@PJL ECHO "):].strip())
+            if index is not None:
+                segments[index] = "\n".join(current)
+                current = []
+                continue
+        if stripped:
+            current.append(stripped)
+
+    return segments
+
+
+def split_echo_responses(response: str, commands: List[str],
+                         tokens: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Разбирает общий поток ответов пакетного задания по командам
+
+    Args:
+        response: Полный ответ принтера
+        commands: Команды пакета в порядке отправки
+        tokens: Маркеры ECHO в том же порядке
+
+    Returns:
+        Словарь {команда: ответ или None}
+    """
+    return dict(zip(commands, split_echo_segments(response, tokens)))
+
+
+def extract_counter_value(response: Optional[str]) -> Optional[int]:
+    """
+    Извлекает значение счетчика из ответа (KEY=VALUE или число после @PJL INQUIRE)
+
+    Args:
+        response: Ответ принтера на одну команду
+
+    Returns:
+        Значение счетчика или None
+    """
+    return counter_value(response)
+
+
+def strip_echo(response: str, echo_token: str) -> str:
+    """
+    Удаляет строку @PJL ECHO с маркером и символы конца ответа (FF)
+
+    Args:
+        response: Ответ принтера
+        echo_token: Маркер, который нужно удалить
+
+    Returns:
+        Ответ без служебной строки ECHO
+    """
+    lines = [line for line in response.replace("\f", "\n").splitlines()
+             if echo_token not in line]
+    return "\n".join(line for line in lines if line.strip())
+
+
+class PJLResponseParser:
+    """
+    Инкрементальный разбор потока ответов PJL
+
+    Байты подаются частями через feed(); законченные строки сразу разбираются:
+    значения KEY=VALUE, маркеры @PJL ECHO и секции ответов (@PJL INFO ID,
+    @PJL INQUIRE ..., @PJL USTATUS ...), которые заканчиваются символом FF.
+    Объем принятых данных и длина одной строки ограничены.
+    """
+
+    # Состояния разбора: строки вне секции и строки секции ответа
+    STATE_TEXT = "text"
+    STATE_SECTION = "section"
+
+    _LINE_RE = re.compile(rb"([^\r\n\f]*)([\r\n\f])")
+    _ECHO_PREFIX = "@PJL ECHO "
+
+    def __init__(self, max_size: int = MAX_RESPONSE_SIZE, max_line: int = MAX_LINE_LENGTH):
+        """
+        Инициализация разбора
+
+        Args:
+            max_size: Максимальный объем принимаемых данных в байтах
+            max_line: Максимальная длина одной строки в байтах
+        """
+        self.max_size = max_size
+        self.max_line = max_line
+        self.size = 0
+        self.truncated = False
+        self.first_data_at = None  # type: Optional[float]
+        self.state = self.STATE_TEXT
+        self.section = None  # type: Optional[str]
+        self.lines = []  # type: List[str]
+        self.values = {}  # type: Dict[str, str]
+        self.sections = {}  # type: Dict[str, List[str]]
+        self.echoes = {}  # type: Dict[str, str]
+        self._pending = []  # type: List[str]
+        self._partial = bytearray()
+        self._skip_line = False
+
+    def feed(self, data) -> int:
+        """
+        Принимает очередную часть потока
+
+        Args:
+            data: bytes, bytearray или memoryview
+
+        Returns:
+            Число принятых байт (меньше len(data) после достижения предела)
+        """
+        if self.truncated:
+            return 0
+        room = self.max_size - self.size
+        if len(data) > room:
+            data = data[:room]
+            self.truncated = True
+        self.size += len(data)
+
+        partial = self._partial
+        partial += data
+        end = max(partial.rfind(b"\n"), partial.rfind(b"\r"), partial.rfind(b"\f"))
+        if end == -1:
+            if len(partial) > self.max_line:
+                # Слишком длинная строка - отбрасываем ее до конца
+                del partial[:]
+                self._skip_line = True
+            return len(data)
+
+        complete = bytes(partial[:end + 1])
+        del partial[:end + 1]
+        for raw_line, terminator in self._LINE_RE.findall(complete):
+            if self._skip_line:
+                self._skip_line = False
+            else:
+                self._take_line(raw_line)
+            if terminator == b"\f":
+                self._end_section()
+        return len(data)
+
+    def finish(self):
+        """Разбирает незавершенную последнюю строку (конец потока)"""
+        if self._partial and not self._skip_line:
+            self._take_line(bytes(self._partial))
+        del self._partial[:]
+        self._skip_line = False
+
+    def _end_section(self):
+        self.state = self.STATE_TEXT
+        self.section = None
+
+    def _take_line(self, raw_line: bytes):
+        text = raw_line.decode('ascii', errors='ignore').replace(UEL, "").strip()
+        if not text:
+            return
+        self.lines.append(text)
+        upper = text.upper()
+
+        if upper.startswith(self._ECHO_PREFIX):
+            # Маркер закрывает ответ на команду, отправленную перед ним
+            token = text[len(self._ECHO_PREFIX):].strip()
+            self.echoes[token] = "\n".join(self._pending)
+            self._pending = []
+            self._end_section()
+            return
+
+        self._pending.append(text)
+        if upper.startswith("@PJL"):
+            self.state = self.STATE_SECTION
+            self.section = text
+            self.sections.setdefault(text, [])
+            return
+
+        if self.state == self.STATE_SECTION:
+            self.sections[self.section].append(text)
+        if "=" in text:
+            key, value = text.split("=", 1)
+            self.values[key.strip().upper()] = value.strip()
+
+    def has_echo(self, token: str) -> bool:
+        """Проверяет, вернулся ли маркер (в том числе в незавершенной строке)"""
+        return token in self.echoes or token.encode('ascii') in self._partial
+
+    def echo_unsupported(self, token: str) -> bool:
+        """
+        Ответ получен полностью, но без маркера - принтер не поддерживает @PJL ECHO
+
+        Вызывается после ожидания до настроенного таймаута. Если данных не
+        было (принтер медленный), ответ обрезан или вернулся хотя бы один
+        маркер (пакет обработан не полностью), вывод сделать нельзя.
+        """
+        return (self.first_data_at is not None and not self.truncated and not self.echoes
+                and not self.has_echo(token))
+
+    def segments(self, tokens: List[str]) -> List[Optional[str]]:
+        """
+        Ответы пакетного задания в порядке маркеров
+
+        Args:
+            tokens: Маркеры ECHO в порядке команд
+
+        Returns:
+            Список ответов; None для команд, чей маркер не вернулся
+        """
+        return [self.echoes.get(token) for token in tokens]
+
+    @property
+    def text(self) -> str:
+        """Принятые строки без служебных строк @PJL ECHO"""
+        return "\n".join(line for line in self.lines
+                         if not line.upper().startswith(self._ECHO_PREFIX))
+
+    @property
+    def raw_text(self) -> str:
+        """Все принятые непустые строки, включая @PJL ECHO"""
+        return "\n".join(self.lines)
+
+
+def receive_response(sock: socket.socket, echo_token: Optional[str], timeout: Optional[float],
+                     parser: Optional[PJLResponseParser] = None,
+                     buffer_size: int = RECV_BUFFER_SIZE, finish: bool = True) -> PJLResponseParser:
+    """
+    Принимает ответ в заранее выделенный буфер (recv_into) и разбирает его по ходу чтения
+
+    Чтение заканчивается при появлении маркера, закрытии соединения, превышении
+    предела объема или по таймауту.
+
+    Args:
+        sock: Подключенный сокет
+        echo_token: Ожидаемый маркер ECHO (None - читать до таймаута/закрытия)
+        timeout: Общее время ожидания в секундах (None - таймаут сокета на каждое чтение)
+        parser: Разбор ответа (по умолчанию новый PJLResponseParser)
+        buffer_size: Размер буфера приема в байтах
+        finish: Разобрать незавершенную последнюю строку (False - чтение будет продолжено)
+
+    Returns:
+        Разбор с принятыми данными
+    """
+    parser = parser or PJLResponseParser()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    previous_timeout = sock.gettimeout()
+
+    try:
+        while not parser.truncated:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+            try:
+                received = sock.recv_into(buffer)
+            except socket.timeout:
+                break
+            if not received:
+                break
+            if parser.first_data_at is None:
+                parser.first_data_at = time.monotonic()
+            parser.feed(view[:received])
+            if echo_token and parser.has_echo(echo_token):
+                break
+    finally:
+        sock.settimeout(previous_timeout)
+        view.release()
+
+    if finish:
+        parser.finish()
+    return parser
+
+
+def receive_echo_adaptive(sock: socket.socket, echo_token: str, timeout: float,
+                          rtt=None, estimator=None,
+                          sent_at: Optional[float] = None) -> PJLResponseParser:
+    """
+    Ждет маркер ECHO с таймаутом по оценке времени ответа устройства
+
+    Если маркера нет через RTO, это отмечается в оценке (RTO растет), а
+    ожидание продолжается до timeout с момента отправки. Полученное время
+    ответа учитывается в оценке.
+
+    Args:
+        sock: Подключенный сокет
+        echo_token: Ожидаемый маркер
+        timeout: Настроенный таймаут операции в секундах
+        rtt: Хранилище оценок RTTStore (None - обычное ожидание до timeout)
+        estimator: Оценка устройства из rtt.estimator()
+        sent_at: Момент отправки запроса (time.monotonic())
+
+    Returns:
+        Разбор ответа (маркер мог не вернуться - см. has_echo)
+    """
+    if rtt is None:
+        estimator = None
+    sent_at = sent_at if sent_at is not None else time.monotonic()
+    parser = PJLResponseParser()
+    plan = wait_plan(estimator, timeout)
+    for attempt in range(len(plan)):
+        receive_response(sock, echo_token, remaining_wait(plan, attempt, timeout, sent_at),
+                         parser, finish=False)
+        if parser.has_echo(echo_token):
+            if estimator:
+                rtt.sample(estimator, time.monotonic() - sent_at)
+            break
+        if parser.truncated:
+            break
+        if estimator:
+            rtt.expired(estimator)
+    parser.finish()
+    return parser
+
+
+def read_legacy_adaptive(sock: socket.socket, timeout: float, rtt=None, estimator=None,
+                         sent_at: Optional[float] = None) -> str:
+    """
+    Старый режим чтения с учетом оценки времени ответа
+
+    С оценкой пауза перед чтением не нужна: первые данные ждутся до timeout с
+    момента отправки (иначе поздний ответ достался бы следующей команде), а
+    после них чтение заканчивается через RTO тишины. Время прихода первых
+    данных учитывается в оценке.
+
+    Args:
+        sock: Подключенный сокет
+        timeout: Настроенный таймаут операции в секундах
+        rtt: Хранилище оценок RTTStore (None - прежние паузы)
+        estimator: Оценка устройства из rtt.estimator()
+        sent_at: Момент отправки запроса (time.monotonic())
+
+    Returns:
+        Ответ принтера
+    """
+    if rtt is None or estimator is None:
+        return read_until_timeout(sock)
+    sent_at = sent_at if sent_at is not None else time.monotonic()
+    parser = PJLResponseParser()
+    readable, _, _ = select.select([sock], [], [], max(timeout - (time.monotonic() - sent_at), 0.0))
+    response = read_until_timeout(sock, 0, estimator.timeout(timeout), parser) if readable else ""
+    if parser.first_data_at is not None:
+        rtt.sample(estimator, parser.first_data_at - sent_at)
+    else:
+        rtt.expired(estimator)
+    return response
+
+
+def read_until_echo(sock: socket.socket, echo_token: str,
+                    timeout: float) -> Tuple[str, bool]:
+    """
+    Читает ответ принтера, пока не вернется маркер @PJL ECHO
+
+    Args:
+        sock: Подключенный сокет
+        echo_token: Ожидаемый маркер
+        timeout: Максимальное время ожидания в секундах
+
+    Returns:
+        Кортеж (ответ без строки ECHO, получен ли маркер)
+    """
+    parser = receive_response(sock, echo_token, timeout)
+    return parser.text, parser.has_echo(echo_token)
+
+
+def read_until_token(sock: socket.socket, echo_token: str,
+                     timeout: float) -> Tuple[str, bool]:
+    """
+    Читает ответ принтера до появления маркера (строки ECHO не удаляются)
+
+    Args:
+        sock: Подключенный сокет
+        echo_token: Ожидаемый маркер
+        timeout: Максимальное время ожидания в секундах
+
+    Returns:
+        Кортеж (принятые строки, получен ли маркер)
+    """
+    parser = receive_response(sock, echo_token, timeout)
+    return parser.raw_text, parser.has_echo(echo_token)
+
+
+def read_until_timeout(sock: socket.socket, initial_delay: float = 1.0,
+                       idle_timeout: Optional[float] = None,
+                       parser: Optional[PJLResponseParser] = None) -> str:
+    """
+    Старый режим чтения: пауза, затем чтение до таймаута сокета
+
+    Args:
+        sock: Подключенный сокет
+        initial_delay: Пауза перед чтением в секундах
+        idle_timeout: Ожидание очередной порции данных (None - таймаут сокета)
+        parser: Разбор ответа (чтобы узнать время прихода первых данных)
+
+    Returns:
+        Ответ принтера
+    """
+    time.sleep(initial_delay)
+    previous_timeout = sock.gettimeout()
+    if idle_timeout is not None:
+        sock.settimeout(idle_timeout)
+    try:
+        return receive_response(sock, None, None, parser).text
+    finally:
+        sock.settimeout(previous_timeout)
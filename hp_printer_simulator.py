@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Симулятор принтера HP LaserJet Pro 400 (PJL по TCP, порт 9100)
+Позволяет запускать скрипты, тесты и замеры производительности без реального принтера
+"""
+
+import argparse
+import ipaddress
+import random
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+# Universal Exit Language - начало/конец PJL задания
+UEL = b"\x1B%-12345X"
+
+# Профили моделей: строка INFO ID, прошивка и поддерживаемые варианты команд счетчика.
+# Формат ответа на чтение: "value" - только число, "key" - KEY=VALUE
+PRINTER_MODELS = {
+    "M425": {
+        "id": "HP LaserJet 400 MFP M425dn",
+        "firmware": "20150311 CE863-00006",
+        "serial": "CNB8H4X0QZ",
+        "read": {"INQUIRE SCANCOUNT": "value", "INFO SCANCOUNT": "key",
+                 "DINQUIRE SCANCOUNT": "value"},
+        "write": {"SET SCANCOUNT", "DEFAULT SCANCOUNT"}
+    },
+    "M475": {
+        "id": "HP LaserJet Pro 400 color MFP M475dn",
+        "firmware": "20140731 CE863-00004",
+        "serial": "CNC9J2Y1RT",
+        "read": {"INQUIRE SCANCOUNTER": "value", "INFO SCANCOUNTER": "key"},
+        "write": {"SET SCANCOUNTER"}
+    },
+    "M401": {
+        # Принтер без сканера: счетчика сканера нет
+        "id": "HP LaserJet 400 M401dn",
+        "firmware": "20140908 CF278-00002",
+        "serial": "VNB3F12345",
+        "read": {},
+        "write": set()
+    }
+}
+
+DEFAULT_MODEL = "M425"
+
+# Ответ принтера на запрос неизвестной переменной
+UNSUPPORTED_REPLY = "?"
+
+COMMAND_PATTERN = re.compile(r'^@PJL\s+(\w+)\s*(.*)$', re.IGNORECASE)
+
+
+class PrinterSimulator:
+    """Эмулятор одного принтера: состояние счетчика, задержки и потери ответов"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, model: str = DEFAULT_MODEL,
+                 counter: int = 1234, latency: float = 0.0, jitter: float = 0.0,
+                 drop_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        Инициализация симулятора
+
+        Args:
+            host: Адрес для прослушивания
+            port: Порт (0 - выбрать свободный)
+            model: Профиль модели из PRINTER_MODELS
+            counter: Начальное значение счетчика сканера
+            latency: Задержка перед каждым ответом в секундах
+            jitter: Случайная добавка к задержке (0..jitter) в секундах
+            drop_rate: Доля ответов, которые не отправляются (0..1)
+            seed: Начальное значение генератора случайных чисел
+        """
+        if model not in PRINTER_MODELS:
+            raise ValueError(f"Неизвестная модель: {model} (доступны: {', '.join(PRINTER_MODELS)})")
+        self.host = host
+        self.port = port
+        self.model = model
+        self.profile = PRINTER_MODELS[model]
+        self.counter = counter
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"connections": 0, "jobs": 0, "commands": 0, "replies": 0, "dropped": 0}
+        self.server = None
+        self.thread = None
+
+    # --- Обработка команд -------------------------------------------------
+
+    def _count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def _status_lines(self) -> List[str]:
+        return ["CODE=10001", 'DISPLAY="Ready"', "ONLINE=TRUE"]
+
+    def _info(self, category: str) -> Optional[List[str]]:
+        """Ответ на @PJL INFO <category> (строки после эха команды)"""
+        category = category.upper()
+        if category == "ID":
+            return [f'"{self.profile["id"]}"']
+        if category == "STATUS":
+            return self._status_lines()
+        if category == "MEMORY":
+            return ["TOTAL=134217728", "LARGEST=98566144"]
+        if category == "VERSION":
+            return [f'"{self.profile["firmware"]}"']
+        if category == "CONFIG":
+            return ["IN TRAYS [2 ENUMERATED]", "OUT TRAYS [1 ENUMERATED]", "DUPLEX"]
+        return None
+
+    def _read_counter(self, verb: str, variable: str) -> Optional[List[str]]:
+        """Ответ на чтение переменной счетчика или None, если вариант не поддерживается"""
+        reply_format = self.profile["read"].get(f"{verb} {variable}")
+        if reply_format is None:
+            return None
+        with self.lock:
+            value = self.counter
+        return [f"{variable}={value}" if reply_format == "key" else str(value)]
+
+    def handle_command(self, line: str) -> Optional[str]:
+        """
+        Обрабатывает одну строку PJL
+
+        Args:
+            line: Строка команды без перевода строки
+
+        Returns:
+            Текст ответа (с завершающим FF) или None, если ответ не нужен
+        """
+        match = COMMAND_PATTERN.match(line.strip())
+        if not match:
+            return None
+        self._count("commands")
+        verb, rest = match.group(1).upper(), match.group(2).strip()
+        body = None
+
+        if verb == "ECHO":
+            return f"@PJL ECHO {rest}\r\n\f"
+        if verb == "INFO":
+            category = rest.split()[0] if rest else ""
+            body = self._info(category)
+            if body is None:
+                body = self._read_counter("INFO", category.upper()) or [UNSUPPORTED_REPLY]
+        elif verb in ("INQUIRE", "DINQUIRE"):
+            variable = rest.split()[0].upper() if rest else ""
+            if variable == "SERIALNUMBER":
+                body = [self.profile["serial"]]
+            else:
+                body = self._read_counter(verb, variable) or [UNSUPPORTED_REPLY]
+        elif verb in ("SET", "DEFAULT"):
+            name, _, value = rest.partition("=")
+            if f"{verb} {name.strip().upper()}" in self.profile["write"]:
+                try:
+                    with self.lock:
+                        self.counter = int(value.strip())
+                except ValueError:
+                    pass
+            return None
+        elif verb == "USTATUS":
+            # Включение рассылки статуса: сразу отправляем текущий статус устройства
+            if "DEVICE" in rest.upper() and "OFF" not in rest.upper():
+                return "@PJL USTATUS DEVICE\r\n" + "\r\n".join(self._status_lines()) + "\r\n\f"
+            return None
+        else:
+            return None  # EOJ, JOB, ENTER, RESET, COMMENT и т.п. ответа не требуют
+
+        return f"@PJL {verb} {rest}\r\n" + "\r\n".join(body) + "\r\n\f"
+
+    def reply_delay(self) -> float:
+        """Задержка перед ответом с учетом разброса"""
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        return delay
+
+    def should_drop(self) -> bool:
+        return self.drop_rate > 0 and self.random.random() < self.drop_rate
+
+    # --- Сервер -----------------------------------------------------------
+
+    def start(self) -> Tuple[str, int]:
+        """
+        Запускает сервер в фоновом потоке
+
+        Returns:
+            Кортеж (адрес, порт), на котором слушает симулятор
+        """
+        simulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                simulator._serve_connection(self.request)
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.server = Server((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.host, self.port
+
+    def _serve_connection(self, conn: socket.socket):
+        """Читает поток заданий и отвечает на команды построчно"""
+        self._count("connections")
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        buffer = b""
+        markers = 0
+        try:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                found = buffer.count(UEL)
+                if found:
+                    # Каждое задание обрамлено двумя UEL
+                    self._count("jobs", (markers + found) // 2 - markers // 2)
+                    markers += found
+                    buffer = buffer.replace(UEL, b"\n")
+                while b"\n" in buffer:
+                    raw, buffer = buffer.split(b"\n", 1)
+                    reply = self.handle_command(raw.decode('ascii', errors='ignore'))
+                    if reply is None:
+                        continue
+                    delay = self.reply_delay()
+                    if delay:
+                        time.sleep(delay)
+                    if self.should_drop():
+                        self._count("dropped")
+                        continue
+                    conn.sendall(reply.encode('ascii'))
+                    self._count("replies")
+        except OSError:
+            pass
+
+    def stop(self):
+        """Останавливает сервер"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self) -> "PrinterSimulator":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def start_fleet(count: int, first_host: str = "127.0.0.1", port: int = 9100,
+                **options) -> List[PrinterSimulator]:
+    """
+    Запускает несколько симуляторов на последовательных адресах (127.0.0.1, 127.0.0.2, ...)
+
+    Args:
+        count: Число устройств
+        first_host: Первый адрес
+        port: Порт на каждом адресе
+        **options: Параметры PrinterSimulator (model, latency, jitter, drop_rate, ...)
+
+    Returns:
+        Список запущенных симуляторов
+    """
+    start = ipaddress.ip_address(first_host)
+    simulators = []
+    for index in range(count):
+        simulator = PrinterSimulator(str(start + index), port, **options)
+        simulator.start()
+        simulators.append(simulator)
+    return simulators
+
+
+def main():
+    """Основная функция программы"""
+    parser = argparse.ArgumentParser(
+        description="Симулятор принтера HP LaserJet Pro 400 (PJL, порт 9100)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  python hp_printer_simulator.py --port 9100
+  python hp_printer_simulator.py --port 9101 --model M475 --latency 0.02 --jitter 0.01
+  python hp_printer_simulator.py --count 50 --bind 127.0.0.1 --drop-rate 0.01
+
+Затем, например:
+  python hp_scanner_counter.py 127.0.0.1 --port 9101 --get
+        """
+    )
+
+    parser.add_argument("--bind", default="127.0.0.1", help="Адрес прослушивания (по умолчанию: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9100, help="Порт (по умолчанию: 9100)")
+    parser.add_argument("--model", choices=sorted(PRINTER_MODELS), default=DEFAULT_MODEL,
+                        help=f"Профиль модели (по умолчанию: {DEFAULT_MODEL})")
+    parser.add_argument("--counter", type=int, default=1234, help="Начальное значение счетчика сканера")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа в секундах")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке в секундах")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Доля потерянных ответов (0..1)")
+    parser.add_argument("--count", type=int, default=1,
+                        help="Число устройств на последовательных адресах начиная с --bind")
+    parser.add_argument("--seed", type=int, help="Начальное значение генератора случайных чисел")
+
+    args = parser.parse_args()
+
+    options = {"model": args.model, "counter": args.counter, "latency": args.latency,
+               "jitter": args.jitter, "drop_rate": args.drop_rate, "seed": args.seed}
+    try:
+        simulators = start_fleet(args.count, args.bind, args.port, **options)
+    except (OSError, ValueError) as e:
+        print(f"✗ Не удалось запустить симулятор: {e}")
+        sys.exit(1)
+
+    print(f"🖨️  Симулятор {PRINTER_MODELS[args.model]['id']} запущен:")
+    for simulator in simulators[:10]:
+        print(f"   {simulator.host}:{simulator.port}")
+    if len(simulators) > 10:
+        print(f"   ... и еще {len(simulators) - 10}")
+    print("Ctrl+C для остановки")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n⚠ Остановка симулятора")
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+        total = {key: sum(simulator.stats[key] for simulator in simulators)
+                 for key in simulators[0].stats}
+        print(f"📊 Статистика: {total}")
+
+
+if __name__ == "__main__":
+    main()
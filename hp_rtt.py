@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Адаптивные таймауты по времени ответа устройства
+Для каждого устройства и транспорта хранится сглаженное время ответа (SRTT)
+и его разброс (RTTVAR), из которых, как в TCP (RFC 6298), вычисляется
+таймаут ожидания ответа (RTO). Оценки сохраняются между запусками.
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+
+# Транспорты
+TRANSPORT_PJL = "pjl"    # TCP 9100, ответ до маркера @PJL ECHO
+TRANSPORT_USB = "usb"    # Чтение из конечной точки USB (pyusb)
+TRANSPORT_LP = "lp"      # Отправка задания через lp (CUPS)
+
+# Минимальный таймаут по транспорту: ниже него случайная задержка
+# (планировщик ОС, запуск процесса) будет приниматься за потерю ответа
+MIN_RTO = {
+    TRANSPORT_PJL: 0.2,
+    TRANSPORT_USB: 0.2,
+    TRANSPORT_LP: 2.0,
+}
+DEFAULT_MIN_RTO = 0.5
+
+# Записи старше этого срока не используются (устройство могли заменить)
+MAX_AGE = 30 * 24 * 3600
+
+
+class RTTEstimator:
+    """Оценка времени ответа одного устройства (SRTT/RTTVAR/RTO)"""
+
+    ALPHA = 0.125  # Вес нового замера в SRTT
+    BETA = 0.25    # Вес нового отклонения в RTTVAR
+    K = 4          # Множитель разброса в RTO
+
+    def __init__(self, initial_rto: float, min_rto: float = DEFAULT_MIN_RTO,
+                 srtt: Optional[float] = None, rttvar: Optional[float] = None,
+                 samples: int = 0, backoff: int = 0):
+        """
+        Инициализация оценки
+
+        Args:
+            initial_rto: Таймаут до первого замера (обычно настроенный таймаут)
+            min_rto: Нижняя граница таймаута в секундах
+            srtt: Сохраненное сглаженное время ответа
+            rttvar: Сохраненный разброс времени ответа
+            samples: Число учтенных замеров
+            backoff: Число подряд истекших таймаутов (каждый удваивает RTO)
+        """
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.srtt = srtt
+        self.rttvar = rttvar
+        self.samples = samples
+        self.backoff = backoff
+
+    def sample(self, rtt: float):
+        """
+        Учитывает замер времени ответа
+
+        Args:
+            rtt: Время от отправки запроса до полного ответа в секундах
+        """
+        if self.srtt is None or self.rttvar is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+        self.backoff = 0
+
+    def expired(self):
+        """Отмечает истекший таймаут (следующий таймаут будет вдвое больше)"""
+        self.backoff += 1
+
+    def timeout(self, ceiling: Optional[float] = None) -> float:
+        """
+        Текущий таймаут ожидания ответа
+
+        Args:
+            ceiling: Верхняя граница (настроенный таймаут операции)
+
+        Returns:
+            Таймаут в секундах
+        """
+        if self.srtt is None or self.rttvar is None:
+            rto = self.initial_rto
+        else:
+            rto = max(self.min_rto, self.srtt + self.K * self.rttvar)
+        rto *= 2 ** min(self.backoff, 6)
+        return min(rto, ceiling) if ceiling is not None else rto
+
+    def to_dict(self) -> Dict[str, float]:
+        """Состояние оценки для сохранения"""
+        return {"srtt": self.srtt, "rttvar": self.rttvar, "samples": self.samples,
+                "backoff": self.backoff, "updated": time.time()}
+
+
+class RTTStore:
+    """Сохраняемые между запусками оценки времени ответа по устройствам"""
+
+    def __init__(self, store_file: str = "rtt_estimates.json", max_age: float = MAX_AGE):
+        """
+        Инициализация хранилища
+
+        Args:
+            store_file: Путь к JSON файлу с оценками
+            max_age: Срок годности записи в секундах
+        """
+        self.store_file = store_file
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._estimators = {}  # type: Dict[str, RTTEstimator]
+        self._dirty = False
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        """Загружает оценки из файла"""
+        try:
+            if os.path.exists(self.store_file):
+                with open(self.store_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def save(self):
+        """Сохраняет оценки (через временный файл), если были новые замеры"""
+        with self._lock:
+            if not self._dirty:
+                return
+            for key, estimator in self._estimators.items():
+                self.data[key] = estimator.to_dict()
+            data = dict(self.data)
+            self._dirty = False
+        temp_file = self.store_file + ".tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.store_file)
+        except OSError as e:
+            print(f"⚠️  Ошибка сохранения оценок времени ответа: {e}")
+
+    @staticmethod
+    def key(transport: str, device: str) -> str:
+        """Ключ записи: транспорт и адрес/имя устройства"""
+        return f"{transport}:{device}"
+
+    def estimator(self, transport: str, device: str, initial_rto: float) -> RTTEstimator:
+        """
+        Возвращает оценку для устройства (загруженную из файла или новую)
+
+        Args:
+            transport: Транспорт (TRANSPORT_PJL, TRANSPORT_USB, TRANSPORT_LP)
+            device: Адрес или имя устройства
+            initial_rto: Таймаут до первого замера
+
+        Returns:
+            Оценка времени ответа
+        """
+        key = self.key(transport, device)
+        with self._lock:
+            estimator = self._estimators.get(key)
+            if estimator is None:
+                min_rto = MIN_RTO.get(transport, DEFAULT_MIN_RTO)
+                saved = self.data.get(key) or {}
+                if saved and time.time() - saved.get("updated", 0) <= self.max_age:
+                    estimator = RTTEstimator(initial_rto, min_rto, saved.get("srtt"),
+                                             saved.get("rttvar"), saved.get("samples", 0),
+                                             saved.get("backoff", 0))
+                else:
+                    estimator = RTTEstimator(initial_rto, min_rto)
+                self._estimators[key] = estimator
+            return estimator
+
+    def sample(self, estimator: RTTEstimator, rtt: float):
+        """Учитывает замер (потокобезопасно)"""
+        with self._lock:
+            estimator.sample(rtt)
+            self._dirty = True
+
+    def expired(self, estimator: RTTEstimator):
+        """Отмечает истекший таймаут (потокобезопасно)"""
+        with self._lock:
+            estimator.expired()
+            self._dirty = True
+
+
+def wait_plan(estimator: Optional[RTTEstimator], ceiling: float) -> List[float]:
+    """
+    Таймауты ожидания одного ответа: RTO и, после его истечения, остаток настроенного таймаута
+
+    RTO только отмечает медленный ответ (expired() - рост RTO для следующих
+    запросов), но не прерывает ожидание: ответ ждется до настроенного
+    таймаута. Иначе поздний ответ достался бы следующей команде. Поэтому
+    здесь оценка срок не сокращает - она лишь учитывается; время экономится
+    там, где конец ответа определяется по тишине (read_legacy_adaptive: RTO
+    тишины вместо фиксированных пауз). Без оценки - один настроенный таймаут.
+
+    Args:
+        estimator: Оценка времени ответа (None - адаптивные таймауты выключены)
+        ceiling: Настроенный таймаут операции в секундах
+
+    Returns:
+        Список таймаутов в секундах (в сумме - ceiling)
+    """
+    if estimator is None:
+        return [ceiling]
+    first = estimator.timeout(ceiling)
+    return [first, ceiling - first] if ceiling > first else [ceiling]
+
+
+def remaining_wait(plan: List[float], attempt: int, ceiling: float, started: float) -> float:
+    """
+    Таймаут очередного ожидания по плану; последнее - до настроенного таймаута с момента отправки
+
+    Args:
+        plan: План wait_plan()
+        attempt: Номер ожидания
+        ceiling: Настроенный таймаут операции в секундах
+        started: Момент отправки запроса (time.monotonic())
+
+    Returns:
+        Таймаут в секундах (не меньше 0)
+    """
+    if attempt < len(plan) - 1:
+        return plan[attempt]
+    return max(ceiling - (time.monotonic() - started), 0.0)
+
+
+def wait_adaptive(wait: Callable[[float], object], timeout_errors: Tuple[Type[BaseException], ...],
+                  ceiling: float, rtt: Optional[RTTStore] = None,
+                  estimator: Optional[RTTEstimator] = None,
+                  started: Optional[float] = None):
+    """
+    Выполняет ожидание ответа по плану wait_plan() и обновляет оценку
+
+    Args:
+        wait: wait(timeout) - ожидание ответа с таймаутом в секундах
+        timeout_errors: Исключения, которыми wait() сообщает об истечении таймаута
+        ceiling: Настроенный таймаут операции в секундах
+        rtt: Хранилище оценок (None - одно ожидание до ceiling)
+        estimator: Оценка устройства из rtt.estimator()
+        started: Момент отправки запроса (time.monotonic())
+
+    Returns:
+        Результат wait()
+
+    Raises:
+        Последнее исключение таймаута, если ответ не получен
+    """
+    if rtt is None:
+        estimator = None
+    started = started if started is not None else time.monotonic()
+    plan = wait_plan(estimator, ceiling)
+    for attempt in range(len(plan)):
+        try:
+            result = wait(remaining_wait(plan, attempt, ceiling, started))
+        except timeout_errors:
+            if estimator:
+                rtt.expired(estimator)
+            if attempt == len(plan) - 1:
+                raise
+            continue
+        if estimator:
+            rtt.sample(estimator, time.monotonic() - started)
+        return result
+
+
+def communicate_adaptive(proc: subprocess.Popen, data: bytes, ceiling: float,
+                         rtt: Optional[RTTStore] = None,
+                         estimator: Optional[RTTEstimator] = None):
+    """
+    Передает данные процессу (например, lp) и ждет его завершения по плану wait_plan()
+
+    Если процесс не завершился за весь план, он останавливается.
+
+    Args:
+        proc: Запущенный процесс со stdin=PIPE
+        data: Данные для stdin
+        ceiling: Настроенный таймаут в секундах
+        rtt: Хранилище оценок (None - одно ожидание до ceiling)
+        estimator: Оценка устройства из rtt.estimator()
+
+    Returns:
+        Кортеж (stdout, stderr) из proc.communicate()
+
+    Raises:
+        subprocess.TimeoutExpired: процесс не завершился вовремя
+    """
+    pending = [data]
+
+    def wait(timeout: float):
+        # Повторный communicate() после таймаута вызывается без данных
+        return proc.communicate(pending.pop() if pending else None, timeout=timeout)
+
+    try:
+        return wait_adaptive(wait, (subprocess.TimeoutExpired,), ceiling, rtt, estimator)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise
@@ -9,13 +9,23 @@ import socket
 import argparse
 import sys
 import time
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from hp_pjl_protocol import (PRINTER_INFO_COMMANDS, READ_MODE_ECHO, READ_MODE_LEGACY,
+                             SCAN_COUNTER_QUERIES, SCAN_COUNTER_SETTERS, build_pjl_batch_job,
+                             build_pjl_job, new_echo_token, extract_counter_value,
+                             read_legacy_adaptive, receive_echo_adaptive)
+from hp_capability_cache import (IDENTITY_COMMANDS, PJLCapabilityCache, is_unsupported_reply,
+                                  parse_identity_value)
+from hp_rtt import TRANSPORT_PJL, RTTStore
+from hp_snmp import read_scan_counter
 
 
 class HPPrinterPJL:
     """Класс для работы с принтером HP через протокол PJL"""
     
-    def __init__(self, ip_address: str, port: int = 9100, timeout: int = 10):
+    def __init__(self, ip_address: str, port: int = 9100, timeout: int = 10,
+                 read_mode: str = READ_MODE_ECHO, pool=None, capabilities=None, rtt=None):
         """
         Инициализация подключения к принтеру
         
@@ -23,11 +33,24 @@ class HPPrinterPJL:
             ip_address: IP адрес принтера
             port: Порт подключения (по умолчанию 9100 для HP LaserJet)
             timeout: Таймаут подключения в секундах
+            read_mode: Режим чтения ответа: "echo" (до маркера @PJL ECHO)
+                       или "sleep" (старый режим с паузами до таймаута)
+            pool: Пул соединений PJLConnectionPool (опционально); соединение
+                  берется из пула и возвращается в него при disconnect()
+            capabilities: Кэш возможностей PJLCapabilityCache (опционально) -
+                          запоминает рабочие варианты команд для устройства
+            rtt: Хранилище оценок времени ответа RTTStore (опционально) -
+                 таймаут ожидания ответа подстраивается под устройство
         """
         self.ip_address = ip_address
         self.port = port
         self.timeout = timeout
+        self.read_mode = read_mode
+        self.pool = pool
+        self.capabilities = capabilities
+        self.rtt = rtt
         self.socket = None
+        self._socket_broken = False
     
     def connect(self) -> bool:
         """
@@ -37,21 +60,41 @@ class HPPrinterPJL:
             True если соединение установлено успешно, False в противном случае
         """
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(self.timeout)
-            self.socket.connect((self.ip_address, self.port))
+            self._socket_broken = False
+            if self.pool:
+                # Берем готовое соединение из пула (без нового TCP рукопожатия)
+                self.socket = self.pool.acquire(self.ip_address, self.port)
+                self.socket.settimeout(self.timeout)
+            else:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.settimeout(self.timeout)
+                self.socket.connect((self.ip_address, self.port))
             print(f"✓ Соединение с принтером {self.ip_address}:{self.port} установлено")
             return True
         except socket.error as e:
             print(f"✗ Ошибка подключения к принтеру: {e}")
+            self.socket = None
             return False
     
     def disconnect(self):
-        """Закрывает соединение с принтером"""
+        """Закрывает соединение с принтером (или возвращает его в пул)"""
         if self.socket:
-            self.socket.close()
+            if self.pool:
+                self.pool.release(self.ip_address, self.port, self.socket,
+                                  discard=self._socket_broken)
+                print("✓ Соединение с принтером возвращено в пул")
+            else:
+                self.socket.close()
+                print("✓ Соединение с принтером закрыто")
             self.socket = None
-            print("✓ Соединение с принтером закрыто")
+        if self.rtt:
+            self.rtt.save()
+    
+    def _rtt_estimator(self):
+        """Оценка времени ответа устройства (одна на устройство и транспорт)"""
+        if not self.rtt:
+            return None
+        return self.rtt.estimator(TRANSPORT_PJL, f"{self.ip_address}:{self.port}", self.timeout)
     
     def send_pjl_command(self, command: str) -> Optional[str]:
         """
@@ -68,25 +111,29 @@ class HPPrinterPJL:
             return None
         
         try:
-            # Формируем полную PJL команду
-            full_command = f"\x1B%-12345X@PJL\r\n{command}\r\n@PJL EOJ\r\n\x1B%-12345X"
+            # Формируем полную PJL команду (с маркером ECHO в режиме echo)
+            echo_token = new_echo_token() if self.read_mode == READ_MODE_ECHO else None
+            full_command = build_pjl_job([command], echo_token)
             
             # Отправляем команду
-            self.socket.send(full_command.encode('ascii'))
+            sent_at = time.monotonic()
+            self.socket.sendall(full_command.encode('ascii'))
             print(f"→ Отправлена команда: {command}")
             
             # Ждем ответ
-            time.sleep(1)
-            response = ""
-            try:
-                while True:
-                    data = self.socket.recv(1024).decode('ascii', errors='ignore')
-                    if not data:
-                        break
-                    response += data
-                    time.sleep(0.1)
-            except socket.timeout:
-                pass
+            if echo_token:
+                parser = receive_echo_adaptive(self.socket, echo_token, self.timeout,
+                                               self.rtt, self._rtt_estimator(), sent_at)
+                response = parser.text
+                if parser.truncated:
+                    print(f"⚠ Ответ обрезан до {parser.max_size} байт")
+                if parser.echo_unsupported(echo_token):
+                    # Данные пришли без маркера - дальше используем старый режим
+                    print("⚠ Принтер не поддерживает @PJL ECHO, используется режим с паузами")
+                    self.read_mode = READ_MODE_LEGACY
+            else:
+                response = read_legacy_adaptive(self.socket, self.timeout, self.rtt,
+                                                self._rtt_estimator(), sent_at)
             
             if response.strip():
                 print(f"← Ответ принтера: {response.strip()}")
@@ -96,43 +143,186 @@ class HPPrinterPJL:
             
         except socket.error as e:
             print(f"✗ Ошибка отправки команды: {e}")
+            self._socket_broken = True
             return None
     
+    def send_pjl_batch(self, commands: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Отправляет несколько PJL команд одним заданием и разбирает ответы по командам
+        
+        Каждая команда помечается своим маркером @PJL ECHO, поэтому весь пакет
+        занимает один сетевой обмен. В режиме "sleep" команды отправляются
+        по одной.
+        
+        Args:
+            commands: Список PJL команд
+            
+        Returns:
+            Словарь {команда: ответ}; None для команд без ответа или при ошибке
+        """
+        results = dict(zip(commands, self._send_batch_segments(commands)))
+        for command, reply in results.items():
+            if reply:
+                print(f"← {command}: {reply}")
+        return results
+    
+    def _send_batch_segments(self, commands: List[str]) -> List[Optional[str]]:
+        """Отправляет пакет команд и возвращает ответы в порядке команд (повторы допускаются)"""
+        if self.read_mode != READ_MODE_ECHO:
+            return [self.send_pjl_command(command) for command in commands]
+        
+        if not self.socket:
+            print("✗ Нет соединения с принтером")
+            return [None] * len(commands)
+        
+        try:
+            full_command, tokens = build_pjl_batch_job(commands, new_echo_token())
+            sent_at = time.monotonic()
+            self.socket.sendall(full_command.encode('ascii'))
+            print(f"→ Отправлен пакет из {len(commands)} команд")
+            
+            parser = receive_echo_adaptive(self.socket, tokens[-1], self.timeout, self.rtt,
+                                           self._rtt_estimator(), sent_at)
+            if parser.echo_unsupported(tokens[-1]):
+                print("⚠ Принтер не вернул маркеры @PJL ECHO, используется режим с паузами")
+                self.read_mode = READ_MODE_LEGACY
+            elif not parser.has_echo(tokens[-1]):
+                print("⚠ Пакет обработан не полностью за отведенное время")
+            return parser.segments(tokens)
+            
+        except socket.error as e:
+            print(f"✗ Ошибка отправки пакета команд: {e}")
+            self._socket_broken = True
+            return [None] * len(commands)
+    
+    def _device_key(self) -> Optional[str]:
+        """Ключ устройства в кэше возможностей по адресу принтера"""
+        if not self.capabilities:
+            return None
+        return self.capabilities.key_for_host(f"{self.ip_address}:{self.port}")
+    
+    def _learn_identity(self, responses: Dict[str, Optional[str]]) -> Optional[str]:
+        """Определяет устройство по ответам INFO ID / серийный номер / прошивка"""
+        identity = {field: parse_identity_value(responses.get(command))
+                    for field, command in IDENTITY_COMMANDS.items()}
+        key = PJLCapabilityCache.device_key(identity)
+        if key:
+            self.capabilities.bind_host(f"{self.ip_address}:{self.port}", key, identity)
+        return key
+    
+    def _query_counter_variants(self, commands: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Отправляет варианты команд чтения счетчика
+        
+        В режиме echo все варианты уходят одним пакетом (это заодно проверяет
+        все варианты для кэша). В режиме с паузами команды отправляются по
+        одной до первого успешного ответа.
+        """
+        if self.read_mode == READ_MODE_ECHO:
+            responses = self.send_pjl_batch(commands)
+            if self.read_mode == READ_MODE_ECHO:
+                return responses
+            # Принтер не вернул маркеры - повторяем в режиме с паузами
+        
+        responses = {}
+        for command in commands:
+            responses[command] = self.send_pjl_command(command)
+            if command in SCAN_COUNTER_QUERIES and extract_counter_value(responses[command]) is not None:
+                break
+        return responses
+    
     def get_scanner_counter(self) -> Optional[int]:
         """
         Получает текущее значение счетчика отсканированных изображений
         
+        Если в кэше возможностей есть проверенная команда для этого устройства,
+        отправляется только она; иначе проверяются все варианты, кроме
+        недавно отклоненных.
+        
         Returns:
             Текущее значение счетчика или None в случае ошибки
         """
         print("\n📊 Получение текущего значения счетчика...")
         
+        key = self._device_key()
+        known = self.capabilities.known_good(key, "read") if self.capabilities else None
+        if known:
+            response = self.send_pjl_command(known)
+            counter_value = extract_counter_value(response)
+            if counter_value is not None:
+                print(f"✓ Текущий счетчик сканера: {counter_value}")
+                return counter_value
+            if is_unsupported_reply(response):
+                self.capabilities.record(key, "read", known, False)
+        
         # Различные варианты PJL команд для получения счетчика сканера
-        commands = [
-            "@PJL INQUIRE SCANCOUNT",
-            "@PJL INQUIRE SCANCOUNTER", 
-            "@PJL INQUIRE SCANPAGES",
-            "@PJL INFO SCANCOUNT",
-            "@PJL INFO SCANCOUNTER",
-            "@PJL DINQUIRE SCANCOUNT",
-            "@PJL DINQUIRE SCANCOUNTER"
-        ]
+        commands = list(SCAN_COUNTER_QUERIES)
+        if self.capabilities:
+            commands = self.capabilities.candidates(key, "read", commands)
+            if not commands:
+                print("⚠ Устройство отклонило все команды чтения счетчика сканера "
+                      "(кэш возможностей, повторная проверка после истечения срока записи)")
+                return None
+        
+        # Без известного устройства сначала определяем его (в том же пакете)
+        identify = self.capabilities is not None and key is None
+        probe = (list(IDENTITY_COMMANDS.values()) if identify else []) + commands
+        responses = self._query_counter_variants(probe)
+        if identify:
+            key = self._learn_identity(responses)
         
+        result = None
         for command in commands:
-            response = self.send_pjl_command(command)
-            if response and "=" in response:
-                try:
-                    # Извлекаем значение из ответа
-                    value = response.split("=")[-1].strip()
-                    counter_value = int(value)
-                    print(f"✓ Текущий счетчик сканера: {counter_value}")
-                    return counter_value
-                except (ValueError, IndexError):
-                    continue
+            response = responses.get(command)
+            counter_value = extract_counter_value(response)
+            # Без ответа (таймаут) вариант не помечается: отказ - только явный "?"
+            if key and (counter_value is not None or is_unsupported_reply(response)):
+                self.capabilities.record(key, "read", command, counter_value is not None)
+            if counter_value is not None and result is None:
+                result = counter_value
+        
+        if self.capabilities:
+            self.capabilities.save()
+        
+        if result is not None:
+            print(f"✓ Текущий счетчик сканера: {result}")
+            return result
         
         print("⚠ Не удалось получить значение счетчика сканера")
         return None
     
+    def _probe_setters(self, key: str, read_command: str, templates: List[str],
+                       count: int) -> Optional[bool]:
+        """
+        Находит рабочий вариант команды установки одним пакетом
+        
+        После каждой команды SET в пакет добавляется чтение счетчика; первая
+        команда, после которой счетчик стал равен count, считается рабочей.
+        
+        Returns:
+            True/False - удалось ли установить счетчик; None если определить
+            рабочий вариант нельзя (счетчик уже равен count или нет ответа)
+        """
+        probe = [read_command]
+        for template in templates:
+            probe += [template.format(count=count), read_command]
+        segments = self._send_batch_segments(probe)
+        
+        before = extract_counter_value(segments[0])
+        if before is None or before == count:
+            return None
+        
+        for index, template in enumerate(templates):
+            after = extract_counter_value(segments[2 + 2 * index])
+            if after is None:
+                return None
+            if after == count:
+                self.capabilities.record(key, "write", template, True)
+                print(f"✓ Рабочая команда установки: {template.format(count=count)}")
+                return True
+            self.capabilities.record(key, "write", template, False)
+        return False
+    
     def set_scanner_counter(self, count: int) -> bool:
         """
         Устанавливает значение счетчика отсканированных изображений
@@ -146,26 +336,44 @@ class HPPrinterPJL:
         print(f"\n🔧 Установка счетчика сканера на значение: {count}")
         
         # Различные варианты PJL команд для установки счетчика сканера
-        commands = [
-            f"@PJL SET SCANCOUNT={count}",
-            f"@PJL SET SCANCOUNTER={count}",
-            f"@PJL SET SCANPAGES={count}",
-            f"@PJL DEFAULT SCANCOUNT={count}",
-            f"@PJL DEFAULT SCANCOUNTER={count}"
-        ]
-        
-        success = False
-        for command in commands:
-            response = self.send_pjl_command(command)
-            if response is not None:
-                success = True
+        templates = list(SCAN_COUNTER_SETTERS)
+        key = self._device_key()
+        if self.capabilities:
+            known = self.capabilities.known_good(key, "write")
+            templates = [known] if known else self.capabilities.candidates(key, "write", templates)
+            if not templates:
+                print("⚠ Устройство отклонило все команды установки счетчика сканера "
+                      "(кэш возможностей, повторная проверка после истечения срока записи)")
+                return False
+            
+            # Устройство известно, но рабочая команда еще нет - определяем ее
+            read_command = self.capabilities.known_good(key, "read")
+            if (key and read_command and len(templates) > 1
+                    and self.read_mode == READ_MODE_ECHO):
+                probed = self._probe_setters(key, read_command, templates, count)
+                if probed is not None:
+                    self.capabilities.save()
+                    if probed:
+                        print(f"✓ Счетчик успешно установлен на {count}")
+                    else:
+                        print("⚠ Ни один вариант команды не изменил счетчик")
+                    return probed
+        
+        commands = [template.format(count=count) for template in templates]
+        responses = self.send_pjl_batch(commands)
+        success = any(response is not None for response in responses.values())
         
         if success:
             print(f"✓ Команда установки счетчика отправлена")
             
             # Проверяем, установилось ли значение
-            time.sleep(2)
+            # (в режиме echo ответ уже подтвердил обработку команды)
+            if self.read_mode == READ_MODE_LEGACY:
+                time.sleep(2)
             current_count = self.get_scanner_counter()
+            if key and len(templates) == 1 and current_count is not None:
+                self.capabilities.record(key, "write", templates[0], current_count == count)
+                self.capabilities.save()
             if current_count == count:
                 print(f"✓ Счетчик успешно установлен на {count}")
                 return True
@@ -194,15 +402,11 @@ class HPPrinterPJL:
         print("\n📋 Получение информации о принтере...")
         
         info = {}
-        info_commands = {
-            "model": "@PJL INFO ID",
-            "status": "@PJL INFO STATUS", 
-            "memory": "@PJL INFO MEMORY",
-            "version": "@PJL INFO VERSION"
-        }
+        info_commands = dict(PRINTER_INFO_COMMANDS)
         
+        responses = self.send_pjl_batch(list(info_commands.values()))
         for key, command in info_commands.items():
-            response = self.send_pjl_command(command)
+            response = responses.get(command)
             if response:
                 info[key] = response
         
@@ -236,6 +440,19 @@ def main():
     parser.add_argument("ip", help="IP адрес принтера")
     parser.add_argument("--port", type=int, default=9100, help="Порт подключения (по умолчанию: 9100)")
     parser.add_argument("--timeout", type=int, default=10, help="Таймаут подключения в секундах (по умолчанию: 10)")
+    parser.add_argument("--legacy-read", action="store_true",
+                        help="Читать ответы со старыми паузами вместо маркера @PJL ECHO")
+    parser.add_argument("--capability-cache", default="pjl_capabilities.json", metavar="FILE",
+                        help="Файл кэша рабочих PJL команд (по умолчанию: pjl_capabilities.json)")
+    parser.add_argument("--no-capability-cache", action="store_true",
+                        help="Не использовать кэш: каждый раз проверять все варианты команд")
+    parser.add_argument("--rtt-file", default="rtt_estimates.json", metavar="FILE",
+                        help="Файл оценок времени ответа устройств (по умолчанию: rtt_estimates.json)")
+    parser.add_argument("--no-adaptive-timeout", action="store_true",
+                        help="Всегда ждать ответ полный --timeout (без оценки времени ответа)")
+    parser.add_argument("--snmp", action="store_true",
+                        help="Читать счетчик по SNMP (UDP 161) вместо PJL (только с --get)")
+    parser.add_argument("--community", default="public", help="Строка сообщества SNMP (по умолчанию: public)")
     
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--get", action="store_true", help="Получить текущее значение счетчика")
@@ -248,8 +465,23 @@ def main():
     print("🖨️  HP LaserJet Pro 400 Scanner Counter Control")
     print("="*50)
     
+    if args.snmp:
+        if not args.get:
+            print("✗ Через SNMP доступно только чтение счетчика (--get)")
+            sys.exit(1)
+        counter = read_scan_counter(args.ip, args.community, timeout=args.timeout)
+        if counter is None:
+            print("\n✗ SNMP агент не вернул счетчик сканера")
+            sys.exit(1)
+        print(f"\n📊 Текущий счетчик сканера (SNMP): {counter}")
+        return
+    
     # Создаем объект для работы с принтером
-    printer = HPPrinterPJL(args.ip, args.port, args.timeout)
+    read_mode = READ_MODE_LEGACY if args.legacy_read else READ_MODE_ECHO
+    capabilities = None if args.no_capability_cache else PJLCapabilityCache(args.capability_cache)
+    rtt = None if args.no_adaptive_timeout else RTTStore(args.rtt_file)
+    printer = HPPrinterPJL(args.ip, args.port, args.timeout, read_mode=read_mode,
+                           capabilities=capabilities, rtt=rtt)
     
     try:
         # Подключаемся к принтеру
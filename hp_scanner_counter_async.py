@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HP LaserJet Pro 400 Scanner Counter Control (Асинхронная версия)
+Асинхронный PJL клиент на asyncio для одновременного опроса множества принтеров
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import Dict, List, Optional
+
+from hp_pjl_protocol import (PRINTER_INFO_COMMANDS, RECV_BUFFER_SIZE, SCAN_COUNTER_QUERIES,
+                             SCAN_COUNTER_SETTERS, PJLResponseParser, build_pjl_batch_job,
+                             build_pjl_job, extract_counter_value, new_echo_token)
+
+
+class AsyncHPPrinterPJL:
+    """Асинхронный класс для работы с принтером HP через протокол PJL"""
+
+    def __init__(self, ip_address: str, port: int = 9100, timeout: float = 10,
+                 verbose: bool = True):
+        """
+        Инициализация асинхронного клиента
+
+        Args:
+            ip_address: IP адрес принтера
+            port: Порт подключения (по умолчанию 9100)
+            timeout: Таймаут каждой операции (подключение, обмен) в секундах
+            verbose: Выводить подробный лог операций
+        """
+        self.ip_address = ip_address
+        self.port = port
+        self.timeout = timeout
+        self.verbose = verbose
+        self.reader = None
+        self.writer = None
+        self.last_error = None  # Последняя ошибка подключения/обмена (для классификации)
+
+    def _log(self, message: str):
+        """Выводит сообщение с адресом принтера"""
+        if self.verbose:
+            print(f"[{self.ip_address}] {message}")
+
+    async def connect(self) -> bool:
+        """
+        Устанавливает соединение с принтером
+
+        Returns:
+            True если соединение установлено успешно
+        """
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.ip_address, self.port), self.timeout)
+            self._log(f"✓ Соединение установлено (порт {self.port})")
+            return True
+        except (OSError, asyncio.TimeoutError) as e:
+            self.last_error = e
+            self._log(f"✗ Ошибка подключения к принтеру: {e or 'таймаут'}")
+            return False
+
+    async def disconnect(self):
+        """Закрывает соединение с принтером"""
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = None
+            self.writer = None
+            self._log("✓ Соединение закрыто")
+
+    async def __aenter__(self) -> "AsyncHPPrinterPJL":
+        if not await self.connect():
+            raise ConnectionError(f"Не удалось подключиться к {self.ip_address}:{self.port}")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    async def _read_until(self, token: str) -> PJLResponseParser:
+        """Читает и разбирает поток ответа, пока не встретится маркер"""
+        parser = PJLResponseParser()
+        while True:
+            data = await self.reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("Принтер закрыл соединение")
+            parser.feed(data)
+            if parser.has_echo(token):
+                parser.finish()
+                return parser
+            if parser.truncated:
+                raise ConnectionError(f"Ответ превысил {parser.max_size} байт без маркера ECHO")
+
+    async def send_pjl_command(self, command: str) -> Optional[str]:
+        """
+        Отправляет PJL команду и ждет маркер @PJL ECHO
+
+        Args:
+            command: PJL команда
+
+        Returns:
+            Ответ принтера или None в случае ошибки/таймаута
+        """
+        if not self.writer:
+            self._log("✗ Нет соединения с принтером")
+            return None
+
+        echo_token = new_echo_token()
+        try:
+            self.writer.write(build_pjl_job([command], echo_token).encode('ascii'))
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+            parser = await asyncio.wait_for(self._read_until(echo_token), self.timeout)
+        except asyncio.TimeoutError as e:
+            self.last_error = e
+            self._log(f"⚠ Таймаут ответа на команду: {command}")
+            return None
+        except (OSError, ConnectionError) as e:
+            self.last_error = e
+            self._log(f"✗ Ошибка отправки команды: {e}")
+            return None
+
+        response = parser.text
+        self._log(f"← {command}: {response}")
+        return response
+
+    async def send_pjl_batch(self, commands: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Отправляет несколько PJL команд одним заданием
+
+        Args:
+            commands: Список PJL команд
+
+        Returns:
+            Словарь {команда: ответ или None}
+        """
+        if not self.writer:
+            self._log("✗ Нет соединения с принтером")
+            return {command: None for command in commands}
+
+        full_command, tokens = build_pjl_batch_job(commands, new_echo_token())
+        try:
+            self.writer.write(full_command.encode('ascii'))
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+            parser = await asyncio.wait_for(self._read_until(tokens[-1]), self.timeout)
+        except asyncio.TimeoutError as e:
+            self.last_error = e
+            self._log(f"⚠ Таймаут ответа на пакет из {len(commands)} команд")
+            return {command: None for command in commands}
+        except (OSError, ConnectionError) as e:
+            self.last_error = e
+            self._log(f"✗ Ошибка отправки пакета команд: {e}")
+            return {command: None for command in commands}
+
+        return dict(zip(commands, parser.segments(tokens)))
+
+    async def get_scanner_counter(self) -> Optional[int]:
+        """
+        Получает текущее значение счетчика отсканированных изображений
+
+        Returns:
+            Текущее значение счетчика или None
+        """
+        responses = await self.send_pjl_batch(SCAN_COUNTER_QUERIES)
+        for command in SCAN_COUNTER_QUERIES:
+            counter_value = extract_counter_value(responses.get(command))
+            if counter_value is not None:
+                self._log(f"✓ Текущий счетчик сканера: {counter_value}")
+                return counter_value
+
+        self._log("⚠ Не удалось получить значение счетчика сканера")
+        return None
+
+    async def set_scanner_counter(self, count: int) -> bool:
+        """
+        Устанавливает значение счетчика и проверяет результат
+
+        Args:
+            count: Новое значение счетчика
+
+        Returns:
+            True если команды приняты принтером
+        """
+        commands = [template.format(count=count) for template in SCAN_COUNTER_SETTERS]
+        responses = await self.send_pjl_batch(commands)
+        if not any(response is not None for response in responses.values()):
+            return False
+
+        current_count = await self.get_scanner_counter()
+        if current_count == count:
+            self._log(f"✓ Счетчик успешно установлен на {count}")
+        else:
+            self._log(f"⚠ Счетчик не изменился (текущее значение: {current_count})")
+        return True
+
+    async def reset_scanner_counter(self) -> bool:
+        """Сбрасывает счетчик отсканированных изображений в 0"""
+        return await self.set_scanner_counter(0)
+
+    async def get_printer_info(self) -> dict:
+        """
+        Получает основную информацию о принтере
+
+        Returns:
+            Словарь с информацией о принтере
+        """
+        responses = await self.send_pjl_batch(list(PRINTER_INFO_COMMANDS.values()))
+        return {key: responses[command] for key, command in PRINTER_INFO_COMMANDS.items()
+                if responses.get(command)}
+
+
+async def run_operation(ip_address: str, args, semaphore: asyncio.Semaphore) -> Optional[object]:
+    """Выполняет запрошенную операцию для одного принтера"""
+    async with semaphore:
+        printer = AsyncHPPrinterPJL(ip_address, args.port, args.timeout, verbose=args.verbose)
+        if not await printer.connect():
+            return None
+        try:
+            if args.set is not None:
+                return await printer.set_scanner_counter(args.set)
+            elif args.reset:
+                return await printer.reset_scanner_counter()
+            elif args.info:
+                return await printer.get_printer_info()
+            return await printer.get_scanner_counter()
+        finally:
+            await printer.disconnect()
+
+
+async def run_all(args) -> int:
+    """Опрашивает все принтеры одновременно и выводит результаты"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results = await asyncio.gather(*(run_operation(ip, args, semaphore) for ip in args.ips))
+
+    failed = 0
+    for ip_address, result in zip(args.ips, results):
+        if result is None or result is False:
+            failed += 1
+            print(f"✗ {ip_address}: операция не выполнена")
+        else:
+            print(f"✓ {ip_address}: {result}")
+    return failed
+
+
+def main():
+    """Основная функция программы"""
+    parser = argparse.ArgumentParser(
+        description="Асинхронное управление счетчиком сканера HP LaserJet Pro 400 на нескольких принтерах",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  python hp_scanner_counter_async.py 192.168.1.100 192.168.1.101 --get
+  python hp_scanner_counter_async.py 192.168.1.100 --set 1000
+  python hp_scanner_counter_async.py 192.168.1.100 192.168.1.101 --info --concurrency 50
+        """
+    )
+
+    parser.add_argument("ips", nargs="+", help="IP адреса принтеров")
+    parser.add_argument("--port", type=int, default=9100, help="Порт подключения (по умолчанию: 9100)")
+    parser.add_argument("--timeout", type=float, default=5, help="Таймаут каждой операции в секундах (по умолчанию: 5)")
+    parser.add_argument("--concurrency", type=int, default=100, help="Максимум одновременных подключений (по умолчанию: 100)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Подробный лог по каждому принтеру")
+
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--get", action="store_true", help="Получить текущее значение счетчика (по умолчанию)")
+    group.add_argument("--set", type=int, metavar="COUNT", help="Установить значение счетчика")
+    group.add_argument("--reset", action="store_true", help="Сбросить счетчик в 0")
+    group.add_argument("--info", action="store_true", help="Получить информацию о принтере")
+
+    args = parser.parse_args()
+
+    if args.set is not None and args.set < 0:
+        print("✗ Значение счетчика не может быть отрицательным")
+        sys.exit(1)
+
+    print("🖨️  HP LaserJet Pro 400 Scanner Counter Control (asyncio)")
+    print("="*50)
+
+    try:
+        failed = asyncio.run(run_all(args))
+    except KeyboardInterrupt:
+        print("\n\n⚠ Операция прервана пользователем")
+        sys.exit(1)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,9 @@ try:
 except ImportError:
     USB_MODULE_AVAILABLE = False
 
+from hp_discovery import discover_printers, local_network, parse_network
+from hp_discovery_orchestrator import KEY_FIELD, DiscoveryOrchestrator, call_probe, usb_key
+
 try:
     import usb.core
     USB_AVAILABLE = True
@@ -36,15 +39,17 @@ except ImportError:
 class HPPrinterAuto:
     """Универсальный класс для работы с принтером через любое подключение"""
     
-    def __init__(self, ip_address: Optional[str] = None, timeout: int = 10):
+    def __init__(self, ip_address: Optional[str] = None, timeout: int = 10, port: int = 9100):
         """
         Инициализация
         
         Args:
             ip_address: IP адрес для сетевого подключения (опционально)
             timeout: Таймаут операций
+            port: TCP порт для сетевого подключения
         """
         self.ip_address = ip_address
+        self.port = port
         self.timeout = timeout
         self.connection_type = None
         self.printer = None
@@ -85,7 +90,7 @@ class HPPrinterAuto:
             print(f"   🌐 Проверка сетевого подключения к {self.ip_address}...")
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(3)
-            result = sock.connect_ex((self.ip_address, 9100))
+            result = sock.connect_ex((self.ip_address, self.port))
             sock.close()
             return result == 0
         except:
@@ -131,7 +136,7 @@ class HPPrinterAuto:
             return False
             
         print("🌐 Подключение через сеть...")
-        self.printer = HPPrinterPJL(self.ip_address, timeout=self.timeout)
+        self.printer = HPPrinterPJL(self.ip_address, self.port, timeout=self.timeout)
         return self.printer.connect()
     
     def _connect_usb(self) -> bool:
@@ -179,8 +184,15 @@ class HPPrinterAuto:
         return self.printer.get_printer_info()
 
 
-def scan_for_printers() -> Dict[str, List]:
-    """Сканирует все доступные принтеры"""
+def scan_for_printers(ranges: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> Dict[str, List]:
+    """
+    Сканирует все доступные принтеры (сеть и USB опрашиваются одновременно)
+
+    Args:
+        ranges: Сети CIDR для поиска сетевых принтеров (по умолчанию локальная /24)
+        exclude: Исключаемые адреса или сети
+    """
     result = {
         'network': [],
         'usb': []
@@ -189,50 +201,50 @@ def scan_for_printers() -> Dict[str, List]:
     print("🔍 Поиск всех доступных принтеров...")
     print("-" * 50)
     
-    # Поиск сетевых принтеров (сканирование подсети)
-    print("🌐 Поиск сетевых принтеров...")
-    try:
-        # Получаем локальную подсеть
-        hostname = socket.gethostname()
-        local_ip = socket.gethostbyname(hostname)
-        subnet = '.'.join(local_ip.split('.')[:-1]) + '.'
-        
-        print(f"   📡 Сканирование подсети {subnet}0/24...")
+    probes = []
+    
+    # Поиск сетевых принтеров (неблокирующее сканирование порта 9100)
+    ranges = ranges or [local_network()]
+    if ranges[0]:
+        print(f"🌐 Поиск сетевых принтеров: {', '.join(ranges)}...")
         
-        # Быстрое сканирование популярных IP адресов принтеров
-        common_ips = [f"{subnet}{i}" for i in [100, 101, 102, 110, 150, 200, 250]]
+        def find_network() -> List[Dict]:
+            return [{'ip': printer['ip'], KEY_FIELD: f"net:{printer['ip']}"}
+                    for printer in discover_printers(ranges, exclude or [], verbose=False)]
         
-        for ip in common_ips:
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                if sock.connect_ex((ip, 9100)) == 0:
-                    result['network'].append(ip)
-                    print(f"   ✅ Найден сетевой принтер: {ip}")
-                sock.close()
-            except:
-                continue
-                
-    except Exception as e:
-        print(f"   ⚠️  Ошибка поиска сетевых принтеров: {e}")
+        probes.append(call_probe("network", find_network, timeout=120))
+    else:
+        print("   ⚠️  Ошибка поиска сетевых принтеров: не удалось определить локальную подсеть")
     
     # Поиск USB принтеров
-    print("\n🔌 Поиск USB принтеров...")
     if USB_MODULE_AVAILABLE:
-        try:
-            usb_printer = HPPrinterUSB()
-            usb_devices = usb_printer.find_hp_printers()
-            result['usb'] = usb_devices
-            
-            for device in usb_devices:
-                name = device.get('product', device.get('name', 'Unknown'))
-                print(f"   ✅ Найден USB принтер: {name}")
-                
-        except Exception as e:
-            print(f"   ⚠️  Ошибка поиска USB принтеров: {e}")
+        print("🔌 Поиск USB принтеров...")
+        
+        def find_usb() -> List[Dict]:
+            devices = HPPrinterUSB().find_hp_printers()
+            for device in devices:
+                if 'bus' in device and 'address' in device:
+                    device[KEY_FIELD] = usb_key(device['bus'], device['address'])
+            return devices
+        
+        probes.append(call_probe("usb", find_usb, timeout=30))
     else:
         print("   ⚠️  Модуль USB недоступен")
     
+    def on_found(printer: Dict):
+        if 'ip' in printer:
+            result['network'].append(printer['ip'])
+            print(f"   ✅ Найден сетевой принтер: {printer['ip']}")
+        else:
+            result['usb'].append(printer)
+            name = printer.get('product', printer.get('name', 'Unknown'))
+            print(f"   ✅ Найден USB принтер: {name}")
+    
+    try:
+        DiscoveryOrchestrator(probes).discover(on_found)
+    except Exception as e:
+        print(f"   ⚠️  Ошибка поиска принтеров: {e}")
+    
     return result
 
 
@@ -285,6 +297,10 @@ def main():
     parser.add_argument("--ip", help="IP адрес принтера (для принудительного сетевого подключения)")
     parser.add_argument("--timeout", type=int, default=10, help="Таймаут операций (по умолчанию: 10)")
     parser.add_argument("--scan", action="store_true", help="Сканировать все доступные принтеры")
+    parser.add_argument("--range", action="append", default=[], dest="ranges",
+                        help="Сеть CIDR для поиска сетевых принтеров (можно несколько раз)")
+    parser.add_argument("--exclude", action="append", default=[], type=parse_network,
+                        help="Исключить адрес или сеть при поиске")
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--get", action="store_true", help="Получить текущее значение счетчика")
@@ -320,7 +336,7 @@ def main():
     
     # Сканирование принтеров
     if args.scan or not any([args.get, args.set is not None, args.reset, args.info]):
-        results = scan_for_printers()
+        results = scan_for_printers(args.ranges, args.exclude)
         print_scan_results(results)
         
         if args.scan:
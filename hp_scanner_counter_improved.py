@@ -11,11 +11,20 @@ import sys
 import time
 import tempfile
 import os
-import re
 import subprocess
 import platform
 from typing import Optional, List, Dict, Union
 
+from hp_counter_parser import SOURCE_WMI, counter_value, largest_number
+from hp_discovery import discover_printers, local_network, parse_network
+from hp_discovery_orchestrator import (KEY_FIELD, DiscoveryOrchestrator, call_probe, command_probe,
+                                       usb_key)
+from hp_pjl_protocol import (READ_MODE_ECHO, READ_MODE_LEGACY, build_pjl_batch_job,
+                             build_pjl_job, new_echo_token, read_legacy_adaptive,
+                             receive_echo_adaptive)
+from hp_rtt import TRANSPORT_PJL, TRANSPORT_USB, RTTStore, wait_adaptive
+from hp_snmp import read_scan_counter
+
 try:
     import usb.core
     import usb.util
@@ -27,16 +36,26 @@ except ImportError:
 class HPPrinterImproved:
     """Улучшенный класс для работы с принтером HP"""
     
-    def __init__(self, ip_address: Optional[str] = None, timeout: int = 10):
+    def __init__(self, ip_address: Optional[str] = None, timeout: int = 10,
+                 read_mode: str = READ_MODE_ECHO, snmp_community: str = "public",
+                 port: int = 9100, rtt=None):
         """
         Инициализация
         
         Args:
             ip_address: IP адрес для сетевого подключения
             timeout: Таймаут операций
+            read_mode: Режим чтения сетевых ответов ("echo" или "sleep")
+            snmp_community: Строка сообщества SNMP для чтения счетчика без PJL
+            port: TCP порт для сетевого подключения
+            rtt: Хранилище оценок времени ответа RTTStore (опционально)
         """
         self.ip_address = ip_address
+        self.port = port
+        self.rtt = rtt
         self.timeout = timeout
+        self.read_mode = read_mode
+        self.snmp_community = snmp_community
         self.connection_type = None
         self.usb_device = None
         self.endpoint_out = None
@@ -118,7 +137,7 @@ class HPPrinterImproved:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(self.timeout)
-            self.socket.connect((self.ip_address, 9100))
+            self.socket.connect((self.ip_address, self.port))
             return True
         except:
             if self.socket:
@@ -150,28 +169,66 @@ class HPPrinterImproved:
     
     def send_pjl_command(self, command: str) -> Optional[str]:
         """Отправляет PJL команду с получением ответа"""
-        full_command = f"\x1B%-12345X@PJL\r\n{command}\r\n@PJL EOJ\r\n\x1B%-12345X"
+        full_command = build_pjl_job([command])
         
         if self.connection_type == "usb_direct":
             return self._send_usb_direct(full_command)
         elif self.connection_type == "network":
+            if self.read_mode == READ_MODE_ECHO:
+                echo_token = new_echo_token()
+                return self._send_network(build_pjl_job([command], echo_token), echo_token)
             return self._send_network(full_command)
         elif self.connection_type == "usb_system":
             return self._send_usb_system(full_command)
         else:
             return None
     
+    def send_pjl_batch(self, commands: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Отправляет несколько PJL команд одним заданием (только сеть в режиме echo)
+        
+        Для остальных типов подключения команды отправляются по одной.
+        
+        Returns:
+            Словарь {команда: ответ или None}
+        """
+        if self.connection_type != "network" or self.read_mode != READ_MODE_ECHO:
+            return {command: self.send_pjl_command(command) for command in commands}
+        
+        try:
+            full_command, tokens = build_pjl_batch_job(commands, new_echo_token())
+            sent_at = time.monotonic()
+            self.socket.sendall(full_command.encode('ascii'))
+            print(f"→ Сетевой пакет из {len(commands)} команд отправлен")
+            
+            parser = receive_echo_adaptive(self.socket, tokens[-1], self.timeout, self.rtt,
+                                           self._rtt_estimator(), sent_at)
+            if parser.echo_unsupported(tokens[-1]):
+                print("⚠️  Принтер не вернул маркеры @PJL ECHO, переход на режим с паузами")
+                self.read_mode = READ_MODE_LEGACY
+            elif not parser.has_echo(tokens[-1]):
+                print("⚠️  Пакет обработан не полностью за отведенное время")
+            return dict(zip(commands, parser.segments(tokens)))
+            
+        except Exception as e:
+            print(f"❌ Ошибка сетевого пакета: {e}")
+            return {command: None for command in commands}
+    
     def _send_usb_direct(self, command: str) -> Optional[str]:
         """Отправка через прямой USB доступ"""
         try:
             # Отправляем команду
+            sent_at = time.monotonic()
             self.endpoint_out.write(command.encode('ascii'), timeout=self.timeout * 1000)
             print(f"→ USB команда отправлена")
             
-            # Читаем ответ
+            # Читаем ответ (таймаут по оценке времени ответа, не более 3 с)
             if self.endpoint_in:
                 try:
-                    data = self.endpoint_in.read(1024, timeout=3000)
+                    data = wait_adaptive(
+                        lambda wait: self.endpoint_in.read(1024, timeout=max(1, int(wait * 1000))),
+                        (usb.core.USBTimeoutError,), 3.0, self.rtt,
+                        self._rtt_estimator(transport=TRANSPORT_USB, ceiling=3.0), sent_at)
                     response = bytes(data).decode('ascii', errors='ignore').strip()
                     if response:
                         print(f"← Получен ответ: {response}")
@@ -187,24 +244,36 @@ class HPPrinterImproved:
             print(f"❌ Ошибка USB команды: {e}")
             return None
     
-    def _send_network(self, command: str) -> Optional[str]:
+    def _rtt_estimator(self, transport: str = TRANSPORT_PJL, ceiling: Optional[float] = None):
+        """Оценка времени ответа текущего устройства по транспорту"""
+        if not self.rtt:
+            return None
+        if transport == TRANSPORT_USB:
+            device = f"{self.usb_device.idVendor:04x}:{self.usb_device.idProduct:04x}"
+        else:
+            device = f"{self.ip_address}:{self.port}"
+        return self.rtt.estimator(transport, device, ceiling or self.timeout)
+    
+    def _send_network(self, command: str, echo_token: Optional[str] = None) -> Optional[str]:
         """Отправка через сеть"""
         try:
-            self.socket.send(command.encode('ascii'))
+            sent_at = time.monotonic()
+            self.socket.sendall(command.encode('ascii'))
             print(f"→ Сетевая команда отправлена")
             
             # Ждем ответ
-            time.sleep(1)
-            response = ""
-            try:
-                while True:
-                    data = self.socket.recv(1024).decode('ascii', errors='ignore')
-                    if not data:
-                        break
-                    response += data
-                    time.sleep(0.1)
-            except socket.timeout:
-                pass
+            if echo_token:
+                parser = receive_echo_adaptive(self.socket, echo_token, self.timeout, self.rtt,
+                                               self._rtt_estimator(), sent_at)
+                response = parser.text
+                if parser.truncated:
+                    print(f"⚠️  Ответ обрезан до {parser.max_size} байт")
+                if parser.echo_unsupported(echo_token):
+                    print("⚠️  Принтер не вернул @PJL ECHO, переход на режим с паузами")
+                    self.read_mode = READ_MODE_LEGACY
+            else:
+                response = read_legacy_adaptive(self.socket, self.timeout, self.rtt,
+                                                self._rtt_estimator(), sent_at)
             
             if response.strip():
                 print(f"← Получен ответ: {response.strip()}")
@@ -236,9 +305,10 @@ class HPPrinterImproved:
             "@PJL DINQUIRE SCANCOUNT"
         ]
         
+        responses = self.send_pjl_batch(commands)
         for command in commands:
-            print(f"🔍 Пробуем команду: {command}")
-            response = self.send_pjl_command(command)
+            print(f"🔍 Проверяем ответ на команду: {command}")
+            response = responses.get(command)
             
             if response and response != "Command sent via system":
                 counter = self._parse_counter_value(response)
@@ -251,52 +321,49 @@ class HPPrinterImproved:
         if self.connection_type == "usb_system":
             return self._get_counter_alternative()
         
+        if self.ip_address:
+            counter = self._get_snmp_counter()
+            if counter is not None:
+                return counter
+        
         print("⚠️  Не удалось получить счетчик")
         return None
     
+    def _get_snmp_counter(self) -> Optional[int]:
+        """Чтение счетчика сканера по SNMP (один UDP запрос, без PJL)"""
+        counter = read_scan_counter(self.ip_address, self.snmp_community)
+        if counter is not None:
+            print(f"📊 Счетчик получен по SNMP: {counter}")
+            self.counter_cache = counter
+        return counter
+    
     def _parse_counter_value(self, response: str) -> Optional[int]:
         """Парсит ответ для извлечения значения счетчика"""
-        if not response:
-            return None
-        
-        # Паттерны для поиска значения счетчика
-        patterns = [
-            r'SCANCOUNT[=:]\s*(\d+)',
-            r'SCANCOUNTER[=:]\s*(\d+)',
-            r'SCANPAGES[=:]\s*(\d+)',
-            r'@PJL\s+INFO\s+\w+\s*[=:]\s*(\d+)',
-            r'[=:]\s*(\d+)',
-            r'\b(\d{1,6})\b'  # Любое разумное число
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, response, re.IGNORECASE)
-            for match in matches:
-                try:
-                    value = int(match)
-                    if 0 <= value <= 999999:  # Разумные границы для счетчика
-                        return value
-                except ValueError:
-                    continue
-        
-        return None
+        # USB ответы могут приходить без имени переменной - допускаем отдельное число
+        return counter_value(response, fallback_number=True, any_name=True)
     
     def _get_counter_alternative(self) -> Optional[int]:
         """Альтернативные методы получения счетчика"""
         print("🔄 Используются альтернативные методы...")
         
-        # Метод 1: Кэш (если ранее получали значение)
+        # Метод 1: SNMP (если известен сетевой адрес принтера)
+        if self.ip_address:
+            counter = self._get_snmp_counter()
+            if counter is not None:
+                return counter
+        
+        # Метод 2: Кэш (если ранее получали значение)
         if self.counter_cache is not None:
             print(f"💾 Используется кэшированное значение: {self.counter_cache}")
             return self.counter_cache
         
-        # Метод 2: Попытка через статус принтера (Windows)
+        # Метод 3: Попытка через статус принтера (Windows)
         if platform.system().lower() == "windows":
             counter = self._get_windows_printer_stats()
             if counter is not None:
                 return counter
         
-        # Метод 3: Симуляция (возвращаем 0 как базовое значение)
+        # Метод 4: Симуляция (возвращаем 0 как базовое значение)
         print("⚠️  Точное значение недоступно, возвращается 0")
         print("💡 Для корректной работы установите: pip install pyusb")
         return 0
@@ -319,15 +386,11 @@ if ($printer) {
             ], capture_output=True, text=True, timeout=15)
             
             if result.returncode == 0 and result.stdout:
-                # Ищем числовые значения в выводе
-                numbers = re.findall(r'\b(\d{1,6})\b', result.stdout)
-                if numbers:
-                    # Берем наибольшее разумное число
-                    valid_numbers = [int(n) for n in numbers if 10 <= int(n) <= 999999]
-                    if valid_numbers:
-                        counter = max(valid_numbers)
-                        print(f"📊 Найден счетчик через статистику Windows: {counter}")
-                        return counter
+                # Берем наибольшее разумное число в выводе
+                reading = largest_number(result.stdout, min_digits=1, source=SOURCE_WMI)
+                if reading:
+                    print(f"📊 Найден счетчик через статистику Windows: {reading.value}")
+                    return reading.value
         except:
             pass
         
@@ -345,9 +408,9 @@ if ($printer) {
         ]
         
         success = False
+        responses = self.send_pjl_batch(commands)
         for command in commands:
-            response = self.send_pjl_command(command)
-            if response is not None:
+            if responses.get(command) is not None:
                 success = True
                 print(f"✓ Команда выполнена: {command}")
         
@@ -382,8 +445,9 @@ if ($printer) {
             "memory": "@PJL INFO MEMORY"
         }
         
+        responses = self.send_pjl_batch(list(commands.values()))
         for key, command in commands.items():
-            response = self.send_pjl_command(command)
+            response = responses.get(command)
             if response and response != "Command sent via system":
                 info[key] = response
         
@@ -398,85 +462,88 @@ if ($printer) {
             if self.usb_device:
                 usb.util.dispose_resources(self.usb_device)
                 self.usb_device = None
+            if self.rtt:
+                self.rtt.save()
             print("✓ Отключение выполнено")
         except:
             pass
 
 
-def scan_for_printers() -> List[Dict[str, str]]:
-    """Сканирует доступные принтеры"""
+def _find_pyusb_printers() -> List[Dict[str, str]]:
+    """USB принтеры HP через pyusb"""
     printers = []
-    
+    HP_VENDOR_ID = 0x03f0
+    for device in usb.core.find(find_all=True, idVendor=HP_VENDOR_ID):
+        key = usb_key(device.bus, device.address)
+        try:
+            product = usb.util.get_string(device, device.iProduct) if device.iProduct else "HP USB Printer"
+            printers.append({
+                "type": "USB Direct",
+                "name": product,
+                "address": f"Bus {device.bus} Device {device.address}",
+                KEY_FIELD: key
+            })
+        except:
+            printers.append({
+                "type": "USB Direct", 
+                "name": "HP USB Printer",
+                "address": f"VID:PID {device.idVendor:04x}:{device.idProduct:04x}",
+                KEY_FIELD: key
+            })
+    return printers
+
+
+def _parse_wmic_usb_printers(output: str) -> List[Dict[str, str]]:
+    """Принтеры HP на USB портах из вывода wmic"""
+    printers = []
+    lines = output.strip().split('\n')[1:]
+    for line in lines:
+        if line.strip() and 'HP' in line:
+            printers.append({
+                "type": "USB System",
+                "name": line.strip(),
+                "address": "Windows USB Port"
+            })
+    return printers
+
+
+def scan_for_printers(ranges: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    """
+    Сканирует доступные принтеры (USB, сеть и системные принтеры опрашиваются одновременно)
+
+    Args:
+        ranges: Сети CIDR для поиска сетевых принтеров (по умолчанию локальная /24)
+        exclude: Исключаемые адреса или сети
+    """
     print("🔍 Поиск доступных принтеров...")
     
+    probes = []
+    
     # USB принтеры
     if USB_AVAILABLE:
-        try:
-            HP_VENDOR_ID = 0x03f0
-            devices = list(usb.core.find(find_all=True, idVendor=HP_VENDOR_ID))
-            for device in devices:
-                try:
-                    product = usb.util.get_string(device, device.iProduct) if device.iProduct else "HP USB Printer"
-                    printers.append({
-                        "type": "USB Direct",
-                        "name": product,
-                        "address": f"Bus {device.bus} Device {device.address}"
-                    })
-                except:
-                    printers.append({
-                        "type": "USB Direct", 
-                        "name": "HP USB Printer",
-                        "address": f"VID:PID {device.idVendor:04x}:{device.idProduct:04x}"
-                    })
-        except:
-            pass
+        probes.append(call_probe("pyusb", _find_pyusb_printers, timeout=30))
     
-    # Сетевые принтеры (быстрое сканирование)
-    try:
-        import socket
-        hostname = socket.gethostname()
-        local_ip = socket.gethostbyname(hostname)
-        subnet = '.'.join(local_ip.split('.')[:-1]) + '.'
+    # Сетевые принтеры (неблокирующее сканирование порта 9100)
+    ranges = ranges or [local_network()]
+    if ranges[0]:
+        def find_network() -> List[Dict[str, str]]:
+            return [{"type": "Network", "name": found["model"] or "HP Network Printer",
+                     "address": found["ip"]}
+                    for found in discover_printers(ranges, exclude or [], verbose=False)]
         
-        # Проверяем популярные IP адреса принтеров
-        for ip_end in [100, 101, 102, 110, 150, 200]:
-            ip = f"{subnet}{ip_end}"
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                if sock.connect_ex((ip, 9100)) == 0:
-                    printers.append({
-                        "type": "Network",
-                        "name": "HP Network Printer",
-                        "address": ip
-                    })
-                sock.close()
-            except:
-                continue
-    except:
-        pass
+        probes.append(call_probe("network", find_network, timeout=120))
     
     # Системные USB принтеры
-    system = platform.system().lower()
-    if system == "windows":
-        try:
-            result = subprocess.run([
-                'wmic', 'printer', 'where', 'PortName like "USB%" and Name like "%HP%"', 'get', 'Name'
-            ], capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')[1:]
-                for line in lines:
-                    if line.strip() and 'HP' in line:
-                        printers.append({
-                            "type": "USB System",
-                            "name": line.strip(),
-                            "address": "Windows USB Port"
-                        })
-        except:
-            pass
+    if platform.system().lower() == "windows":
+        probes.append(command_probe(
+            "wmic", ['wmic', 'printer', 'where', 'PortName like "USB%" and Name like "%HP%"', 'get', 'Name'],
+            _parse_wmic_usb_printers, timeout=10))
     
-    return printers
+    try:
+        return DiscoveryOrchestrator(probes, verbose=False).discover()
+    except Exception:
+        return []
 
 
 def main():
@@ -488,10 +555,22 @@ def main():
     
     parser.add_argument("--ip", help="IP адрес принтера (для сетевого подключения)")
     parser.add_argument("--scan", action="store_true", help="Сканировать доступные принтеры")
+    parser.add_argument("--range", action="append", default=[], dest="ranges",
+                        help="Сеть CIDR для поиска сетевых принтеров (можно несколько раз)")
+    parser.add_argument("--exclude", action="append", default=[], type=parse_network,
+                        help="Исключить адрес или сеть при поиске")
     parser.add_argument("--get", action="store_true", help="Получить счетчик")
     parser.add_argument("--set", type=int, help="Установить счетчик")
     parser.add_argument("--reset", action="store_true", help="Сбросить счетчик")
     parser.add_argument("--info", action="store_true", help="Информация о принтере")
+    parser.add_argument("--legacy-read", action="store_true",
+                        help="Читать сетевые ответы со старыми паузами вместо маркера @PJL ECHO")
+    parser.add_argument("--community", default="public",
+                        help="Строка сообщества SNMP для чтения счетчика без PJL (по умолчанию: public)")
+    parser.add_argument("--rtt-file", default="rtt_estimates.json", metavar="FILE",
+                        help="Файл оценок времени ответа устройств (по умолчанию: rtt_estimates.json)")
+    parser.add_argument("--no-adaptive-timeout", action="store_true",
+                        help="Всегда ждать ответ полный таймаут (без оценки времени ответа)")
     
     args = parser.parse_args()
     
@@ -499,7 +578,7 @@ def main():
     print("=" * 60)
     
     if args.scan:
-        printers = scan_for_printers()
+        printers = scan_for_printers(args.ranges, args.exclude)
         if printers:
             print(f"\n✅ Найдено принтеров: {len(printers)}")
             for i, printer in enumerate(printers, 1):
@@ -509,7 +588,10 @@ def main():
         return
     
     # Создаем принтер и подключаемся
-    printer = HPPrinterImproved(args.ip)
+    read_mode = READ_MODE_LEGACY if args.legacy_read else READ_MODE_ECHO
+    rtt = None if args.no_adaptive_timeout else RTTStore(args.rtt_file)
+    printer = HPPrinterImproved(args.ip, read_mode=read_mode, snmp_community=args.community,
+                                rtt=rtt)
     
     try:
         if not printer.detect_and_connect():
@@ -7,108 +7,80 @@ HP LaserJet Pro 400 Scanner Counter Control (Только системные м
 
 import argparse
 import sys
-import time
 import tempfile
 import os
-import json
-import re
 import subprocess
 import platform
-from typing import Optional, Dict, List
-from datetime import datetime
+from typing import Optional, Dict, Iterator, List
 
-
-class CounterStorage:
-    """Класс для хранения значений счетчика в файле конфигурации"""
-    
-    def __init__(self, config_file: str = "printer_counter_config.json"):
-        self.config_file = config_file
-        self.config = self._load_config()
-    
-    def _load_config(self) -> dict:
-        """Загружает конфигурацию из файла"""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except:
-            pass
-        
-        # Дефолтная конфигурация
-        return {
-            "scanner_counter": 0,
-            "last_updated": None,
-            "printer_info": {},
-            "command_history": []
-        }
-    
-    def _save_config(self):
-        """Сохраняет конфигурацию в файл"""
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"⚠️  Ошибка сохранения конфигурации: {e}")
-    
-    def get_counter(self) -> int:
-        """Получает сохраненное значение счетчика"""
-        return self.config.get("scanner_counter", 0)
-    
-    def set_counter(self, value: int):
-        """Устанавливает значение счетчика"""
-        self.config["scanner_counter"] = value
-        self.config["last_updated"] = datetime.now().isoformat()
-        self._add_to_history(f"Установлен счетчик: {value}")
-        self._save_config()
-    
-    def _add_to_history(self, action: str):
-        """Добавляет действие в историю"""
-        if "command_history" not in self.config:
-            self.config["command_history"] = []
-        
-        self.config["command_history"].append({
-            "timestamp": datetime.now().isoformat(),
-            "action": action
-        })
-        
-        # Оставляем только последние 10 записей
-        self.config["command_history"] = self.config["command_history"][-10:]
-    
-    def get_history(self) -> List[dict]:
-        """Получает историю команд"""
-        return self.config.get("command_history", [])
+from hp_counter_history import ACTION_GET, ACTION_SET, parse_time, print_samples
+from hp_counter_series import open_history
+from hp_counter_parser import find_wmi_counter, largest_number
+from hp_counter_storage import CounterStorage, DeviceStores, device_id
+from hp_deadline import STEP_FAILED, STEP_OK, STEP_TIMEOUT, Deadline, DeadlineExceeded
+from hp_discovery_orchestrator import (DiscoveryOrchestrator, call_probe, lsusb_probe, select_printer,
+                                       sysfs_probe)
+from hp_enum_cache import DEFAULT_TTL, KEY_HP_PRINTERS, KEY_USB_PORTS, EnumerationCache
+from hp_ipp import CupsCommands, device_serial
+from hp_pjl_protocol import build_pjl_job
+from hp_rtt import TRANSPORT_LP, RTTStore
 
 
 class HPPrinterSystem:
     """Класс для работы с принтером только через системные команды"""
     
-    def __init__(self, timeout: int = 10):
+    def __init__(self, timeout: int = 10, rtt=None, deadline: Optional[float] = None,
+                 batch: bool = True, use_ipp: bool = True, enum_cache=None, history=None):
         """
         Инициализация
         
         Args:
             timeout: Таймаут операций в секундах
+            rtt: Хранилище оценок времени ответа RTTStore (опционально) -
+                 ожидание lp подстраивается под очередь принтера
+            deadline: Общий бюджет времени одной операции (--get, --set, --info)
+                      в секундах, None - без ограничения
+            batch: Отправлять все варианты команд одним заданием
+                   (False - каждую команду отдельным заданием с паузами)
+            use_ipp: В Linux обращаться к CUPS по IPP вместо запуска lpstat/lp
+            enum_cache: Кэш результатов поиска EnumerationCache
+                        (по умолчанию printer_enumeration.json в текущем каталоге)
+            history: История значений счетчика CounterHistory/CounterSeries (опционально) -
+                     каждое чтение и установка счетчика записываются с временем
         """
         self.timeout = timeout
+        self.rtt = rtt
+        self.deadline = deadline
+        self.batch = batch
+        self.cups = CupsCommands(use_ipp, timeout=timeout)
+        self.enum_cache = enum_cache if enum_cache is not None else EnumerationCache()
+        self.history = history
         self.system = platform.system().lower()
         self.printer_name = None
         self.printer_port = None
+        self.printer_serial = None
         self.storage = CounterStorage()
+        # Счетчики по устройствам: selected_printer остается в основной конфигурации
+        self.devices = DeviceStores(self.storage)
         
     def find_hp_printers(self) -> List[Dict[str, str]]:
-        """Находит HP принтеры в системе"""
-        printers = []
-        
+        """Находит HP принтеры в системе (результат кэшируется, см. EnumerationCache)"""
+        return list(self.iter_hp_printers())
+    
+    def iter_hp_printers(self) -> Iterator[Dict[str, str]]:
+        """Выдает HP принтеры по мере находки (из кэша, если он свежий)"""
+        return self.enum_cache.iter_or_load(KEY_HP_PRINTERS, self._stream_hp_printers, "HP принтеры")
+    
+    def _stream_hp_printers(self) -> Iterator[Dict[str, str]]:
+        """Поиск HP принтеров без кэша"""
         print("🔍 Поиск HP принтеров через системные команды...")
         
         if self.system == "windows":
-            printers = self._find_windows_printers()
+            yield from self._find_windows_printers()
         elif self.system == "linux":
-            printers = self._find_linux_printers()
+            yield from self._iter_linux_printers()
         else:
             print(f"❌ Система {self.system} не поддерживается")
-        
-        return printers
     
     def _find_windows_printers(self) -> List[Dict[str, str]]:
         """Поиск принтеров в Windows"""
@@ -161,49 +133,56 @@ class HPPrinterSystem:
         
         return printers
     
-    def _find_linux_printers(self) -> List[Dict[str, str]]:
-        """Поиск принтеров в Linux"""
-        printers = []
+    def _iter_linux_printers(self) -> Iterator[Dict[str, str]]:
+        """Поиск принтеров в Linux (CUPS, lsusb и sysfs опрашиваются одновременно)"""
+        print("   🐧 Поиск через CUPS, lsusb и sysfs...")
         
+        def is_hp_usb(line: str) -> bool:
+            return 'hewlett-packard' in line or ('hp' in line and 'printer' in line)
+        
+        orchestrator = DiscoveryOrchestrator([
+            call_probe("cups", self._find_cups_printers, timeout=10),
+            lsusb_probe(is_hp_usb, timeout=10),
+            sysfs_probe(is_hp_usb),
+        ])
         try:
-            # Через CUPS
-            print("   🐧 Поиск через CUPS...")
-            result = subprocess.run(['lpstat', '-p'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'hp' in line.lower() or 'hewlett' in line.lower():
-                        printers.append({
-                            'name': line.strip(),
-                            'port': 'CUPS',
-                            'type': 'CUPS'
-                        })
-            
-            # Через lsusb
-            print("   🔌 Поиск USB устройств...")
-            result = subprocess.run(['lsusb'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'hewlett-packard' in line.lower() or ('hp' in line.lower() and 'printer' in line.lower()):
-                        printers.append({
-                            'name': line.strip(),
-                            'port': 'USB',
-                            'type': 'USB'
-                        })
-                        
+            yield from orchestrator.iter_printers()
         except Exception as e:
             print(f"   ⚠️  Ошибка поиска в Linux: {e}")
-        
+    
+    def _find_cups_printers(self) -> List[Dict[str, str]]:
+        """HP очереди CUPS"""
+        printers = []
+        for queue in self.cups.printers(timeout=10):
+            text = f"{queue['line']} {queue['model']}".lower()
+            if 'hp' in text or 'hewlett' in text:
+                printer = {
+                    'name': queue['name'],
+                    'port': 'CUPS',
+                    'type': 'CUPS'
+                }
+                serial = device_serial(queue.get('device_uri', ''))
+                if serial:
+                    printer['serial'] = serial
+                printers.append(printer)
         return printers
     
     def connect(self, printer_info: Optional[Dict[str, str]] = None, 
-                interactive: bool = False, usb_port: Optional[str] = None) -> bool:
+                interactive: bool = False, usb_port: Optional[str] = None,
+                model: Optional[str] = None, serial: Optional[str] = None) -> bool:
         """
         Подключается к принтеру (выбирает принтер для работы)
         
+        Без интерактивного выбора поиск останавливается на первом подходящем
+        принтере: с нужной моделью/серийным номером, ранее выбранном
+        (selected_printer) или просто первом найденном.
+        
         Args:
             printer_info: Информация о принтере из find_hp_printers()
             interactive: Включить интерактивный выбор принтера
             usb_port: Принудительно указать USB порт (например, "USB001")
+            model: Выбрать принтер, в названии которого есть эта строка
+            serial: Выбрать принтер с этим серийным номером
         
         Returns:
             True если принтер выбран успешно
@@ -212,6 +191,7 @@ class HPPrinterSystem:
         if usb_port:
             self.printer_name = f"HP Printer on {usb_port}"
             self.printer_port = usb_port
+            self.printer_serial = None
             print(f"✓ Принудительно выбран USB порт: {usb_port}")
             return True
         
@@ -219,28 +199,34 @@ class HPPrinterSystem:
         if printer_info:
             self.printer_name = printer_info.get('name')
             self.printer_port = printer_info.get('port')
+            self.printer_serial = printer_info.get('serial')
             print(f"✓ Выбран принтер: {self.printer_name} ({self.printer_port})")
             return True
         
+        # Автоматический выбор: первый подходящий принтер, не дожидаясь конца поиска
+        if not interactive:
+            printer = select_printer(self.iter_hp_printers(), model, serial,
+                                     self.get_saved_printer())
+            if not printer:
+                wanted = " ".join(filter(None, [model, serial]))
+                print(f"❌ HP принтер {wanted} не найден" if wanted else "❌ HP принтеры не найдены")
+                return False
+            self.printer_name = printer.get('name')
+            self.printer_port = printer.get('port')
+            self.printer_serial = printer.get('serial')
+            print(f"✓ Автоматически выбран: {self.printer_name} ({self.printer_port})")
+            return True
+        
         # Поиск доступных принтеров
         printers = self.find_hp_printers()
         if not printers:
             print("❌ HP принтеры не найдены")
             
             # Предлагаем ручной ввод USB порта
-            if interactive:
-                return self._manual_usb_port_selection()
-            return False
+            return self._manual_usb_port_selection()
         
         # Интерактивный выбор
-        if interactive:
-            return self._interactive_printer_selection(printers)
-        else:
-            # Автоматический выбор первого принтера
-            self.printer_name = printers[0].get('name')
-            self.printer_port = printers[0].get('port')
-            print(f"✓ Автоматически выбран: {self.printer_name} ({self.printer_port})")
-            return True
+        return self._interactive_printer_selection(printers)
     
     def _interactive_printer_selection(self, printers: List[Dict[str, str]]) -> bool:
         """Интерактивный выбор принтера из списка"""
@@ -273,10 +259,10 @@ class HPPrinterSystem:
                     selected = printers[choice_num - 1]
                     self.printer_name = selected.get('name')
                     self.printer_port = selected.get('port')
+                    self.printer_serial = selected.get('serial')
                     
                     # Сохраняем выбор в конфигурации
-                    self.storage.config['selected_printer'] = selected
-                    self.storage._save_config()
+                    self.storage.update_config({'selected_printer': selected})
                     
                     print(f"✓ Выбран: {self.printer_name} ({self.printer_port})")
                     return True
@@ -340,15 +326,15 @@ class HPPrinterSystem:
                 
                 self.printer_name = f"HP Printer on {normalized_port}"
                 self.printer_port = normalized_port
+                self.printer_serial = None
                 
                 # Сохраняем выбор
-                self.storage.config['selected_printer'] = {
+                self.storage.update_config({'selected_printer': {
                     'name': self.printer_name,
                     'port': self.printer_port,
                     'type': 'Manual USB',
                     'manual': True
-                }
-                self.storage._save_config()
+                }})
                 
                 print(f"✓ Установлен USB порт: {normalized_port}")
                 return True
@@ -358,26 +344,29 @@ class HPPrinterSystem:
                 return False
     
     def _get_available_usb_ports(self) -> List[str]:
-        """Получает список доступных USB портов"""
+        """Получает список доступных USB портов (результат кэшируется)"""
+        return self.enum_cache.get_or_load(KEY_USB_PORTS, self._enumerate_usb_ports)
+    
+    def _enumerate_usb_ports(self) -> List[str]:
+        """Проверка USB портов без кэша"""
         ports = []
         
         if self.system == "windows":
-            # Проверяем стандартные USB порты Windows
-            for port in ['USB001', 'USB002', 'USB003', 'USB004']:
-                try:
-                    # Пытаемся получить информацию о порте
-                    result = subprocess.run([
-                        'wmic', 'printer', 'where', f'PortName="{port}"', 'get', 'Name'
-                    ], capture_output=True, text=True, timeout=5)
-                    
-                    if result.returncode == 0 and result.stdout.strip():
-                        ports.append(port)
-                except:
-                    continue
+            # Стандартные USB порты Windows: один запрос WMI на все порты
+            try:
+                result = subprocess.run([
+                    'wmic', 'printer', 'get', 'PortName'
+                ], capture_output=True, text=True, timeout=5)
+                
+                if result.returncode == 0:
+                    used = {line.strip().upper() for line in result.stdout.splitlines()}
+                    ports = [port for port in ['USB001', 'USB002', 'USB003', 'USB004']
+                             if port in used]
+            except:
+                pass
         
         elif self.system == "linux":
             # Проверяем USB устройства Linux
-            import os
             for i in range(4):
                 device_path = f'/dev/usb/lp{i}'
                 if os.path.exists(device_path):
@@ -410,38 +399,113 @@ class HPPrinterSystem:
         
         return None
     
+    def _record_sample(self, counter: int, action: str):
+        """Записывает отметку счетчика в историю (если она подключена)"""
+        if not self.history:
+            return
+        try:
+            self.history.record(self._device_id() or "unknown", counter, action)
+        except Exception as e:
+            print(f"⚠️  Ошибка записи истории счетчика: {e}")
+    
+    def _printer_info(self) -> Dict[str, Optional[str]]:
+        """Сведения о выбранном принтере для определения устройства"""
+        return {'serial': self.printer_serial, 'name': self.printer_name, 'port': self.printer_port}
+    
+    def _device_id(self) -> Optional[str]:
+        """Идентификатор выбранного принтера (общий для хранилища счетчика и истории)"""
+        return device_id(self._printer_info())
+    
+    def _counter_store(self) -> CounterStorage:
+        """Хранилище счетчика выбранного принтера (до выбора - основная конфигурация)"""
+        device = self._device_id()
+        return self.devices.get(device, self._printer_info()) if device else self.storage
+    
+    def _store_read_counter(self, expected: int, value: int):
+        """
+        Сохраняет прочитанный с принтера счетчик (сравнение с обменом)
+        
+        Если за время чтения другой процесс сохранил новое значение (например,
+        --set), прочитанное раньше значение его не перезаписывает.
+        """
+        if not self._counter_store().update_counter(expected, value):
+            print("ℹ️  Сохраненный счетчик изменен другим процессом во время чтения, оставлено новое значение")
+    
     def get_saved_printer(self) -> Optional[Dict[str, str]]:
         """Получает сохраненный выбор принтера"""
         return self.storage.config.get('selected_printer')
     
-    def send_pjl_command(self, command: str) -> bool:
+    def _new_deadline(self) -> Deadline:
+        """Срок для новой операции по настроенному бюджету"""
+        return Deadline(self.deadline)
+    
+    def send_pjl_command(self, command: str, deadline: Optional[Deadline] = None) -> bool:
         """
         Отправляет PJL команду принтеру через системные методы
         
         Args:
             command: PJL команда
+            deadline: Срок операции (каждый способ отправки получает остаток времени)
             
         Returns:
             True если команда отправлена успешно
+        
+        Raises:
+            DeadlineExceeded: бюджет операции исчерпан
         """
         if not self.printer_name:
             print("❌ Принтер не выбран")
             return False
         
-        # Формируем полную PJL команду
-        full_command = f"\x1B%-12345X@PJL\r\n{command}\r\n@PJL EOJ\r\n\x1B%-12345X"
-        
         print(f"→ Отправка команды: {command}")
+        return self._send_job([command], deadline or self._new_deadline())
+    
+    def send_pjl_batch(self, commands: List[str], deadline: Optional[Deadline] = None) -> bool:
+        """
+        Отправляет несколько PJL команд одним заданием (UEL ... EOJ UEL)
         
-        if self.system == "windows":
-            return self._send_windows_command(full_command)
-        elif self.system == "linux":
-            return self._send_linux_command(full_command)
-        else:
-            print(f"❌ Система {self.system} не поддерживается")
+        Вместо отдельного задания, запуска lp и паузы на каждую команду -
+        одно задание на все варианты. Принтер пропускает неизвестные ему команды.
+        
+        Args:
+            commands: Список PJL команд
+            deadline: Срок операции
+            
+        Returns:
+            True если задание отправлено успешно
+        
+        Raises:
+            DeadlineExceeded: бюджет операции исчерпан
+        """
+        if not self.printer_name:
+            print("❌ Принтер не выбран")
             return False
+        
+        print(f"→ Отправка {len(commands)} команд одним заданием:")
+        for command in commands:
+            print(f"   {command}")
+        return self._send_job(commands, deadline or self._new_deadline())
     
-    def _send_windows_command(self, command: str) -> bool:
+    def _send_job(self, commands: List[str], deadline: Deadline) -> bool:
+        """Формирует задание из команд и отправляет его способом текущей системы"""
+        full_command = build_pjl_job(commands)
+        try:
+            if self.system == "windows":
+                sent = self._send_windows_command(full_command, deadline)
+            elif self.system == "linux":
+                sent = self._send_linux_command(full_command, deadline)
+            else:
+                print(f"❌ Система {self.system} не поддерживается")
+                return False
+        except DeadlineExceeded:
+            for command in commands:
+                deadline.record(command, STEP_TIMEOUT)
+            raise
+        for command in commands:
+            deadline.record(command, STEP_OK if sent else STEP_FAILED)
+        return sent
+    
+    def _send_windows_command(self, command: str, deadline: Deadline) -> bool:
         """Отправка команды в Windows"""
         try:
             # Создаем временный файл
@@ -453,7 +517,8 @@ class HPPrinterSystem:
                 # Метод 1: Через имя принтера
                 if self.printer_name:
                     cmd = f'copy /B "{temp_file}" "\\\\localhost\\{self.printer_name}"'
-                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=30)
+                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True,
+                                            timeout=deadline.timeout(30))
                     if result.returncode == 0:
                         print("✓ Команда отправлена через имя принтера")
                         return True
@@ -463,10 +528,13 @@ class HPPrinterSystem:
                     for port in ['USB001', 'USB002', 'USB003']:
                         try:
                             cmd = f'copy /B "{temp_file}" "{port}"'
-                            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=10)
+                            result = subprocess.run(cmd, shell=True, capture_output=True, text=True,
+                                                    timeout=deadline.timeout(10))
                             if result.returncode == 0:
                                 print(f"✓ Команда отправлена через порт {port}")
                                 return True
+                        except DeadlineExceeded:
+                            raise
                         except:
                             continue
                 
@@ -483,7 +551,7 @@ try {{
 '''
                 result = subprocess.run([
                     'powershell', '-ExecutionPolicy', 'Bypass', '-Command', ps_script
-                ], capture_output=True, text=True, timeout=30)
+                ], capture_output=True, text=True, timeout=deadline.timeout(30))
                 
                 if result.returncode == 0 and "Success" in result.stdout:
                     print("✓ Команда отправлена через PowerShell")
@@ -499,25 +567,27 @@ try {{
             print("⚠️  Не удалось отправить команду")
             return False
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"❌ Ошибка отправки в Windows: {e}")
             return False
     
-    def _send_linux_command(self, command: str) -> bool:
+    def _send_linux_command(self, command: str, deadline: Deadline) -> bool:
         """Отправка команды в Linux"""
         try:
-            # Метод 1: Через lp
+            # Метод 1: Через CUPS (IPP Print-Job или lp)
             if self.printer_name and 'CUPS' in str(self.printer_port):
                 try:
-                    proc = subprocess.Popen(['lp', '-d', self.printer_name, '-o', 'raw'], 
-                                          stdin=subprocess.PIPE, 
-                                          stdout=subprocess.PIPE, 
-                                          stderr=subprocess.PIPE)
-                    stdout, stderr = proc.communicate(command.encode('ascii'), timeout=30)
-                    
-                    if proc.returncode == 0:
-                        print("✓ Команда отправлена через lp")
+                    ceiling = deadline.timeout(30)
+                    estimator = (self.rtt.estimator(TRANSPORT_LP, self.printer_name, 30)
+                                 if self.rtt else None)
+                    if self.cups.submit_raw(self.printer_name, command.encode('ascii'), ceiling,
+                                            self.rtt, estimator):
+                        print("✓ Команда отправлена через CUPS")
                         return True
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     print(f"⚠️  Ошибка lp: {e}")
             
@@ -536,42 +606,56 @@ try {{
             print("⚠️  Не удалось отправить команду в Linux")
             return False
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"❌ Ошибка отправки в Linux: {e}")
             return False
     
-    def get_scanner_counter(self) -> int:
+    def get_scanner_counter(self, deadline: Optional[Deadline] = None) -> int:
         """
         Получает значение счетчика сканера
         Использует кэширование, так как системные методы не могут читать ответы
+        
+        Args:
+            deadline: Срок операции (по умолчанию - новый по настроенному бюджету)
         """
         print("\n📊 Получение счетчика сканера...")
+        deadline = deadline or self._new_deadline()
+        
+        # Значение до чтения: прочитанное сохраняется, только если его никто не изменил
+        expected = self._counter_store().get_counter()
         
         # Пытаемся получить реальное значение через статус системы
-        real_counter = self._try_get_real_counter()
+        try:
+            real_counter = self._try_get_real_counter(deadline)
+        except DeadlineExceeded as e:
+            deadline.print_report(e)
+            real_counter = None
         if real_counter is not None:
             print(f"✓ Получен реальный счетчик: {real_counter}")
-            self.storage.set_counter(real_counter)
+            self._store_read_counter(expected, real_counter)
+            self._record_sample(real_counter, ACTION_GET)
             return real_counter
         
         # Если не получилось, используем сохраненное значение
-        cached_counter = self.storage.get_counter()
+        cached_counter = self._counter_store().get_counter()
         print(f"📁 Используется сохраненное значение: {cached_counter}")
         print("ℹ️  Для получения точного значения нужна двунаправленная связь")
         
         return cached_counter
     
-    def _try_get_real_counter(self) -> Optional[int]:
+    def _try_get_real_counter(self, deadline: Deadline) -> Optional[int]:
         """Попытка получить реальный счетчик через статус системы"""
         
         if self.system == "windows":
-            return self._get_windows_counter()
+            return self._get_windows_counter(deadline)
         elif self.system == "linux":
-            return self._get_linux_counter()
+            return self._get_linux_counter(deadline)
         
         return None
     
-    def _get_windows_counter(self) -> Optional[int]:
+    def _get_windows_counter(self, deadline: Deadline) -> Optional[int]:
         """Получение счетчика в Windows через WMI"""
         try:
             print("   🖥️  Попытка получения через WMI...")
@@ -597,68 +681,66 @@ if ($printer) {{
             
             result = subprocess.run([
                 'powershell', '-Command', ps_script
-            ], capture_output=True, text=True, timeout=20)
+            ], capture_output=True, text=True, timeout=deadline.timeout(20, "WMI"))
             
             if result.returncode == 0 and result.stdout:
                 # Ищем числовые значения в выводе
                 output = result.stdout
                 print(f"   📋 WMI ответ: {output[:200]}...")
                 
-                # Паттерны для поиска счетчиков
-                patterns = [
-                    r'PagesPrinted\s*:\s*(\d+)',
-                    r'TotalPagesPrinted\s*:\s*(\d+)',
-                    r'JobCountSinceLastReset\s*:\s*(\d+)',
-                    r':\s*(\d{2,6})'  # Любое разумное число
-                ]
-                
-                for pattern in patterns:
-                    matches = re.findall(pattern, output, re.IGNORECASE)
-                    for match in matches:
-                        try:
-                            value = int(match)
-                            if 10 <= value <= 999999:  # Разумные границы
-                                print(f"   ✓ Найден потенциальный счетчик: {value}")
-                                return value
-                        except ValueError:
-                            continue
+                # Сначала известные поля счетчиков, затем любое разумное число
+                reading = find_wmi_counter(output)
+                if reading:
+                    print(f"   ✓ Найден потенциальный счетчик: {reading.value}")
+                    deadline.record("WMI", STEP_OK)
+                    return reading.value
+            deadline.record("WMI", STEP_FAILED)
                             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"   ⚠️  Ошибка WMI: {e}")
         
         return None
     
-    def _get_linux_counter(self) -> Optional[int]:
+    def _get_linux_counter(self, deadline: Deadline) -> Optional[int]:
         """Получение счетчика в Linux через CUPS"""
         try:
             print("   🐧 Попытка получения через CUPS...")
             
             # Получаем статус принтера
-            result = subprocess.run(['lpstat', '-p'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                print(f"   📋 CUPS статус: {result.stdout[:100]}...")
+            output = self.cups.lpstat(['-p'], deadline.timeout(10, "lpstat -p"))
+            if output is not None:
+                print(f"   📋 CUPS статус: {output[:100]}...")
             
             # Пытаемся получить статистику
-            result = subprocess.run(['lpstat', '-W', 'completed'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0 and result.stdout:
-                # Ищем числовые значения
-                numbers = re.findall(r'\b(\d{2,6})\b', result.stdout)
-                if numbers:
-                    # Берем наибольшее разумное число
-                    valid_numbers = [int(n) for n in numbers if 10 <= int(n) <= 999999]
-                    if valid_numbers:
-                        counter = max(valid_numbers)
-                        print(f"   ✓ Найден потенциальный счетчик: {counter}")
-                        return counter
+            output = self.cups.lpstat(['-W', 'completed'], deadline.timeout(10, "lpstat -W completed"))
+            if output:
+                # Берем наибольшее разумное число
+                reading = largest_number(output)
+                if reading:
+                    print(f"   ✓ Найден потенциальный счетчик: {reading.value}")
+                    deadline.record("lpstat -W completed", STEP_OK)
+                    return reading.value
+            deadline.record("lpstat -W completed", STEP_FAILED)
                         
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"   ⚠️  Ошибка CUPS: {e}")
         
         return None
     
-    def set_scanner_counter(self, count: int) -> bool:
-        """Устанавливает значение счетчика сканера"""
+    def set_scanner_counter(self, count: int, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Устанавливает значение счетчика сканера
+        
+        Args:
+            count: Новое значение счетчика
+            deadline: Срок операции (по умолчанию - новый по настроенному бюджету)
+        """
         print(f"\n🔧 Установка счетчика на {count}...")
+        deadline = deadline or self._new_deadline()
         
         # Отправляем PJL команды
         commands = [
@@ -669,14 +751,26 @@ if ($printer) {{
         ]
         
         success = False
-        for command in commands:
-            if self.send_pjl_command(command):
-                success = True
-                time.sleep(0.5)  # Небольшая задержка между командами
+        if self.batch:
+            try:
+                success = self.send_pjl_batch(commands, deadline)
+            except DeadlineExceeded as e:
+                deadline.print_report(e)
+        else:
+            for index, command in enumerate(commands):
+                try:
+                    if self.send_pjl_command(command, deadline):
+                        success = True
+                        deadline.sleep(0.5)  # Небольшая задержка между командами
+                except DeadlineExceeded as e:
+                    deadline.skip(commands[index + 1:])
+                    deadline.print_report(e)
+                    break
         
         if success:
             # Сохраняем значение в конфигурации
-            self.storage.set_counter(count)
+            self._counter_store().set_counter(count)
+            self._record_sample(count, ACTION_SET)
             print(f"✓ Счетчик установлен на {count}")
             print("💾 Значение сохранено в конфигурации")
             
@@ -690,16 +784,22 @@ if ($printer) {{
         print("\n🔄 Сброс счетчика сканера...")
         return self.set_scanner_counter(0)
     
-    def get_printer_info(self) -> Dict[str, str]:
-        """Получает информацию о принтере"""
+    def get_printer_info(self, deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """
+        Получает информацию о принтере
+        
+        Args:
+            deadline: Срок операции (по умолчанию - новый по настроенному бюджету)
+        """
         print("\n📋 Получение информации о принтере...")
+        deadline = deadline or self._new_deadline()
         
         info = {
             "connection_type": "system_only",
             "printer_name": self.printer_name or "Unknown",
             "printer_port": self.printer_port or "Unknown",
             "system": self.system,
-            "cached_counter": str(self.storage.get_counter())
+            "cached_counter": str(self._counter_store().get_counter())
         }
         
         # Отправляем информационные PJL команды
@@ -709,20 +809,66 @@ if ($printer) {{
             "memory": "@PJL INFO MEMORY"
         }
         
-        for key, command in info_commands.items():
-            if self.send_pjl_command(command):
-                info[f"{key}_sent"] = "✓"
-            else:
-                info[f"{key}_sent"] = "❌"
+        items = list(info_commands.items())
+        if self.batch:
+            try:
+                sent = "✓" if self.send_pjl_batch(list(info_commands.values()), deadline) else "❌"
+            except DeadlineExceeded as e:
+                sent = "⏱️"
+                deadline.print_report(e)
+            for key in info_commands:
+                info[f"{key}_sent"] = sent
+            return info
+        
+        for index, (key, command) in enumerate(items):
+            try:
+                if self.send_pjl_command(command, deadline):
+                    info[f"{key}_sent"] = "✓"
+                else:
+                    info[f"{key}_sent"] = "❌"
+            except DeadlineExceeded as e:
+                # Оставшиеся команды не отправлялись
+                for skipped_key, _ in items[index:]:
+                    info[f"{skipped_key}_sent"] = "⏱️"
+                deadline.skip(command for _, command in items[index + 1:])
+                deadline.print_report(e)
+                break
         
         return info
     
-    def get_command_history(self) -> List[dict]:
-        """Получает историю команд"""
-        return self.storage.get_history()
+    def get_command_history(self, device: Optional[str] = None) -> List[dict]:
+        """
+        Получает историю команд
+        
+        --history выполняется без подключения, поэтому устройство берется из
+        аргумента, выбранного или сохраненного принтера; если оно неизвестно -
+        история всех устройств.
+        
+        Args:
+            device: Устройство (серийный номер, очередь или порт)
+        """
+        if device:
+            return self.devices.history(device)
+        if self.printer_name or self.printer_port:
+            return self._counter_store().get_history()
+        saved_printer = self.get_saved_printer()
+        saved = device_id(saved_printer)
+        if saved:
+            return self.devices.history(saved, saved_printer)
+        return self.devices.all_history()
     
     def disconnect(self):
         """Отключение (очистка ресурсов)"""
+        if self.rtt:
+            self.rtt.save()
+        self.cups.close()
+        self.devices.close()
+        self.storage.close()
+        if self.history:
+            try:
+                self.history.close()
+            except Exception as e:
+                print(f"⚠️  Ошибка записи истории счетчика: {e}")
         print("✓ Системное подключение завершено")
 
 
@@ -779,6 +925,35 @@ def main():
                        help="Только выбрать принтер и сохранить в конфигурации")
     parser.add_argument("--use-saved", action="store_true",
                        help="Использовать сохраненный принтер из предыдущего выбора")
+    parser.add_argument("--rtt-file", default="rtt_estimates.json", metavar="FILE",
+                       help="Файл оценок времени ответа устройств (по умолчанию: rtt_estimates.json)")
+    parser.add_argument("--no-adaptive-timeout", action="store_true",
+                       help="Всегда ждать завершения lp полный таймаут (без оценки времени ответа)")
+    parser.add_argument("--no-ipp", action="store_true",
+                       help="Запускать lpstat/lp вместо запросов IPP к CUPS (Linux)")
+    parser.add_argument("--no-batch", action="store_true",
+                       help="Отправлять каждую PJL команду отдельным заданием (как раньше)")
+    parser.add_argument("--deadline", type=float, default=120, metavar="SECONDS",
+                       help="Общий бюджет времени одной операции, 0 - без ограничения (по умолчанию: 120)")
+    parser.add_argument("--model", metavar="TEXT",
+                       help="Подключиться к первому найденному принтеру с этой строкой в названии (например: LaserJet)")
+    parser.add_argument("--serial", metavar="SERIAL",
+                       help="Подключиться к принтеру с этим серийным номером")
+    parser.add_argument("--history-db", default="counter_history.db", metavar="FILE",
+                       help="История значений счетчика: SQLite или *.hps - компактный бинарный формат "
+                            "(по умолчанию: counter_history.db)")
+    parser.add_argument("--since", type=parse_time, metavar="TIME",
+                       help="--history: начало периода (2024-05-01, 2024-05-01T12:00 или 30d, 12h)")
+    parser.add_argument("--until", type=parse_time, metavar="TIME",
+                       help="--history: конец периода")
+    parser.add_argument("--device", metavar="NAME",
+                       help="--history: только это устройство (серийный номер, очередь или порт)")
+    parser.add_argument("--limit", type=int, default=50,
+                       help="--history: сколько последних отметок выводить (по умолчанию: 50)")
+    parser.add_argument("--refresh", action="store_true",
+                       help="Заново найти принтеры и порты, не используя кэш поиска")
+    parser.add_argument("--enum-ttl", type=float, default=DEFAULT_TTL, metavar="SECONDS",
+                       help=f"Время жизни кэша поиска принтеров (по умолчанию: {DEFAULT_TTL})")
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--get", action="store_true", help="Получить текущее значение счетчика")
@@ -794,7 +969,18 @@ def main():
     print()
     
     # Создаем объект для работы с принтером
-    printer = HPPrinterSystem(timeout=args.timeout)
+    rtt = None if args.no_adaptive_timeout else RTTStore(args.rtt_file)
+    enum_cache = EnumerationCache(ttl=args.enum_ttl)
+    if args.refresh:
+        enum_cache.invalidate()
+    try:
+        history = open_history(args.history_db)
+    except Exception as e:
+        print(f"⚠️  История счетчика недоступна ({args.history_db}): {e}")
+        history = None
+    printer = HPPrinterSystem(timeout=args.timeout, rtt=rtt, deadline=args.deadline or None,
+                              batch=not args.no_batch, use_ipp=not args.no_ipp, enum_cache=enum_cache,
+                              history=history)
     
     try:
         # Показать список принтеров
@@ -805,18 +991,23 @@ def main():
         
         # Показать историю команд
         if args.history:
-            history = printer.get_command_history()
-            if history:
+            commands = printer.get_command_history(args.device)
+            if commands:
                 print("📜 История команд:")
                 print("-" * 50)
-                for entry in history[-10:]:  # Последние 10 записей
+                for entry in commands[-10:]:  # Последние 10 записей
                     timestamp = entry.get('timestamp', 'Unknown')
                     action = entry.get('action', 'Unknown')
                     print(f"📅 {timestamp}")
+                    if entry.get('device'):
+                        print(f"   Устройство: {entry['device']}")
                     print(f"   {action}")
                     print()
             else:
                 print("📜 История команд пуста")
+            if history:
+                print()
+                print_samples(history, args.device, args.since, args.until, args.limit)
             return
         
         # Определяем режим подключения
@@ -855,7 +1046,9 @@ def main():
         success = printer.connect(
             printer_info=saved_printer if args.use_saved else None,
             interactive=interactive_mode,
-            usb_port=usb_port
+            usb_port=usb_port,
+            model=args.model,
+            serial=args.serial
         )
         
         if not success:
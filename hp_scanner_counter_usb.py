@@ -14,6 +14,10 @@ import tempfile
 import os
 from typing import Optional, List, Tuple
 
+from hp_counter_parser import SOURCE_WMI, counter_value, largest_number
+from hp_rtt import TRANSPORT_USB, RTTStore, wait_adaptive
+from hp_snmp import read_scan_counter
+
 try:
     import usb.core
     import usb.util
@@ -25,16 +29,24 @@ except ImportError:
 class HPPrinterUSB:
     """Класс для работы с принтером HP через USB порт"""
     
-    def __init__(self, device_path: Optional[str] = None, timeout: int = 10):
+    def __init__(self, device_path: Optional[str] = None, timeout: int = 10,
+                 snmp_host: Optional[str] = None, snmp_community: str = "public", rtt=None):
         """
         Инициализация подключения к USB принтеру
         
         Args:
             device_path: Путь к USB устройству (опционально)
             timeout: Таймаут операций в секундах
+            snmp_host: Сетевой адрес того же принтера для чтения счетчика по SNMP (опционально)
+            snmp_community: Строка сообщества SNMP
+            rtt: Хранилище оценок времени ответа RTTStore (опционально) -
+                 таймаут чтения ответа подстраивается под устройство
         """
         self.device_path = device_path
+        self.rtt = rtt
         self.timeout = timeout
+        self.snmp_host = snmp_host
+        self.snmp_community = snmp_community
         self.usb_device = None
         self.endpoint_out = None
         self.endpoint_in = None
@@ -210,6 +222,8 @@ class HPPrinterUSB:
                 self.endpoint_out = None
                 self.endpoint_in = None
                 print("✓ USB соединение закрыто")
+                if self.rtt:
+                    self.rtt.save()
             except:
                 pass
     
@@ -235,14 +249,21 @@ class HPPrinterUSB:
             full_command = f"\x1B%-12345X@PJL\r\n{command}\r\n@PJL EOJ\r\n\x1B%-12345X"
             
             # Отправляем команду
+            sent_at = time.monotonic()
             self.endpoint_out.write(full_command.encode('ascii'), timeout=self.timeout * 1000)
             print(f"→ Отправлена USB команда: {command}")
             
-            # Пытаемся прочитать ответ
+            # Пытаемся прочитать ответ (таймаут по оценке времени ответа, не более 2 с)
             response = ""
             if self.endpoint_in:
                 try:
-                    data = self.endpoint_in.read(1024, timeout=2000)
+                    estimator = None
+                    if self.rtt:
+                        device = f"{self.usb_device.idVendor:04x}:{self.usb_device.idProduct:04x}"
+                        estimator = self.rtt.estimator(TRANSPORT_USB, device, 2.0)
+                    data = wait_adaptive(
+                        lambda wait: self.endpoint_in.read(1024, timeout=max(1, int(wait * 1000))),
+                        (usb.core.USBTimeoutError,), 2.0, self.rtt, estimator, sent_at)
                     response = bytes(data).decode('ascii', errors='ignore')
                     if response.strip():
                         print(f"← Ответ принтера: {response.strip()}")
@@ -478,37 +499,20 @@ Get-WmiObject -Class Win32_Printer | Where-Object {$_.PortName -like "USB*" -and
         """Парсит ответ PJL команды для извлечения значения счетчика"""
         if not response or response == "Command sent":
             return None
-        
-        try:
-            # Ищем паттерны ответов PJL
-            patterns = [
-                r'SCANCOUNT[=:]\s*(\d+)',
-                r'SCANCOUNTER[=:]\s*(\d+)', 
-                r'SCANPAGES[=:]\s*(\d+)',
-                r'=\s*(\d+)',
-                r':\s*(\d+)',
-                r'(\d+)'
-            ]
-            
-            import re
-            for pattern in patterns:
-                match = re.search(pattern, response, re.IGNORECASE)
-                if match:
-                    counter_value = int(match.group(1))
-                    # Санитарная проверка значения
-                    if 0 <= counter_value <= 999999:
-                        return counter_value
-            
-        except (ValueError, AttributeError):
-            pass
-        
-        return None
+        return counter_value(response, fallback_number=True, any_name=True)
     
     def _try_snmp_counter(self) -> Optional[int]:
         """Попытка получить счетчик через SNMP (если доступно)"""
+        if self.snmp_host:
+            # Принтер также подключен к сети - один UDP запрос без PJL
+            counter = read_scan_counter(self.snmp_host, self.snmp_community)
+            if counter is not None:
+                print(f"✓ Счетчик сканера получен по SNMP: {counter}")
+                return counter
+            print(f"⚠️  SNMP агент {self.snmp_host} не вернул счетчик сканера")
+        
         try:
-            # SNMP OID для счетчиков HP принтеров
-            # Это требует библиотеки pysnmp, но мы можем попробовать системные команды
+            # Без сетевого адреса остается статистика Windows через PowerShell и WMI
             if platform.system().lower() == "windows":
                 # В Windows можно попробовать через PowerShell и WMI
                 ps_script = '''
@@ -550,14 +554,10 @@ Select-Object Name, Comment, Description, PrinterPaperNames | Format-List
                 ], capture_output=True, text=True, timeout=10)
                 
                 if result.returncode == 0:
-                    # Ищем числовые значения в ответе
-                    import re
-                    numbers = re.findall(r'\b(\d{1,6})\b', result.stdout)
-                    if numbers:
-                        # Возвращаем наибольшее разумное число (вероятно счетчик)
-                        valid_numbers = [int(n) for n in numbers if 0 <= int(n) <= 999999]
-                        if valid_numbers:
-                            return max(valid_numbers)
+                    # Возвращаем наибольшее разумное число (вероятно счетчик)
+                    reading = largest_number(result.stdout, low=0, min_digits=1, source=SOURCE_WMI)
+                    if reading:
+                        return reading.value
                             
         except:
             pass
@@ -652,6 +652,12 @@ def main():
     
     parser.add_argument("--timeout", type=int, default=10, help="Таймаут операций в секундах (по умолчанию: 10)")
     parser.add_argument("--list", action="store_true", help="Показать список USB принтеров")
+    parser.add_argument("--snmp-host", help="IP адрес принтера для чтения счетчика по SNMP")
+    parser.add_argument("--community", default="public", help="Строка сообщества SNMP (по умолчанию: public)")
+    parser.add_argument("--rtt-file", default="rtt_estimates.json", metavar="FILE",
+                        help="Файл оценок времени ответа устройств (по умолчанию: rtt_estimates.json)")
+    parser.add_argument("--no-adaptive-timeout", action="store_true",
+                        help="Всегда ждать ответ полный таймаут (без оценки времени ответа)")
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--get", action="store_true", help="Получить текущее значение счетчика")
@@ -670,7 +676,9 @@ def main():
         print()
     
     # Создаем объект для работы с USB принтером
-    printer = HPPrinterUSB(timeout=args.timeout)
+    rtt = None if args.no_adaptive_timeout else RTTStore(args.rtt_file)
+    printer = HPPrinterUSB(timeout=args.timeout, snmp_host=args.snmp_host,
+                           snmp_community=args.community, rtt=rtt)
     
     try:
         # Показываем список принтеров
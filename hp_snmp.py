@@ -0,0 +1,769 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Минимальный SNMP v1/v2c клиент без внешних зависимостей
+Кодирование/разбор BER поверх UDP для чтения счетчиков принтеров HP
+(Printer-MIB prtMarkerLifeCount и счетчики сканера/копира HP)
+"""
+
+import argparse
+import heapq
+import random
+import selectors
+import socket
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from hp_deadline import Deadline
+
+
+# Версии протокола (значение поля version в сообщении)
+SNMP_V1 = 0
+SNMP_V2C = 1
+SNMP_VERSIONS = {"1": SNMP_V1, "2c": SNMP_V2C}
+
+# Типы BER
+TAG_INTEGER = 0x02
+TAG_OCTET_STRING = 0x04
+TAG_NULL = 0x05
+TAG_OID = 0x06
+TAG_SEQUENCE = 0x30
+TAG_IP_ADDRESS = 0x40
+TAG_COUNTER32 = 0x41
+TAG_GAUGE32 = 0x42
+TAG_TIMETICKS = 0x43
+TAG_OPAQUE = 0x44
+TAG_COUNTER64 = 0x46
+TAG_NO_SUCH_OBJECT = 0x80
+TAG_NO_SUCH_INSTANCE = 0x81
+TAG_END_OF_MIB_VIEW = 0x82
+
+# Типы PDU
+PDU_GET = 0xA0
+PDU_GET_NEXT = 0xA1
+PDU_RESPONSE = 0xA2
+PDU_GET_BULK = 0xA5
+
+# Коды ошибок ответа
+ERROR_NO_SUCH_NAME = 2  # SNMP v1: один из OID не найден (error-index указывает какой)
+
+UNSIGNED_TAGS = {TAG_COUNTER32, TAG_GAUGE32, TAG_TIMETICKS, TAG_COUNTER64}
+
+# Printer-MIB: общий счетчик отпечатанных страниц (prtMarkerLifeCount.1.1)
+PRT_MARKER_LIFE_COUNT = "1.3.6.1.2.1.43.10.2.1.4.1.1"
+
+# Счетчики из частного дерева HP (1.3.6.1.4.1.11). Набор зависит от модели и
+# прошивки, поэтому это кандидаты: на конкретном устройстве их стоит проверить
+# через --walk и при необходимости передать свои OID (--oid NAME=OID)
+HP_COUNTER_OIDS = {
+    "scan_count": "1.3.6.1.4.1.11.2.3.9.4.2.1.2.2.1.69.0",
+    "adf_scan_count": "1.3.6.1.4.1.11.2.3.9.4.2.1.2.2.1.70.0",
+    "flatbed_scan_count": "1.3.6.1.4.1.11.2.3.9.4.2.1.2.2.1.71.0",
+    "copy_count": "1.3.6.1.4.1.11.2.3.9.4.2.1.2.2.1.72.0"
+}
+
+# Все счетчики, читаемые одним запросом
+SNMP_COUNTER_OIDS = dict([("total_pages", PRT_MARKER_LIFE_COUNT)] + list(HP_COUNTER_OIDS.items()))
+
+# Имена счетчиков сканера в порядке приоритета
+SCAN_COUNTER_NAMES = ["scan_count", "adf_scan_count", "flatbed_scan_count"]
+
+# Корень частного дерева HP для поиска счетчиков через GETBULK
+HP_ENTERPRISE_OID = "1.3.6.1.4.1.11.2.3.9.4.2.1"
+
+
+class SNMPError(Exception):
+    """Ошибка разбора или обмена SNMP"""
+
+
+def encode_length(length: int) -> bytes:
+    """Кодирует длину BER (короткая или длинная форма)"""
+    if length < 0x80:
+        return bytes([length])
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(encoded)]) + encoded
+
+
+def encode_tlv(tag: int, value: bytes) -> bytes:
+    """Кодирует элемент тег-длина-значение"""
+    return bytes([tag]) + encode_length(len(value)) + value
+
+
+def encode_integer(value: int, tag: int = TAG_INTEGER) -> bytes:
+    """Кодирует целое со знаком (минимальное дополнение до двух)"""
+    length = max(1, (value.bit_length() + 8) // 8)
+    return encode_tlv(tag, value.to_bytes(length, 'big', signed=True))
+
+
+def encode_oid(oid: str) -> bytes:
+    """Кодирует OID вида 1.3.6.1..."""
+    arcs = [int(arc) for arc in oid.strip(".").split(".")]
+    if len(arcs) < 2:
+        raise SNMPError(f"Некорректный OID: {oid}")
+    body = bytearray([arcs[0] * 40 + arcs[1]])
+    for arc in arcs[2:]:
+        chunk = [arc & 0x7F]
+        arc >>= 7
+        while arc:
+            chunk.append(0x80 | (arc & 0x7F))
+            arc >>= 7
+        body.extend(reversed(chunk))
+    return encode_tlv(TAG_OID, bytes(body))
+
+
+def decode_tlv(data: bytes, offset: int = 0) -> Tuple[int, bytes, int]:
+    """
+    Разбирает один элемент BER
+
+    Args:
+        data: Буфер
+        offset: Смещение начала элемента
+
+    Returns:
+        Кортеж (тег, значение, смещение следующего элемента)
+    """
+    try:
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            size = length & 0x7F
+            length = int.from_bytes(data[offset:offset + size], 'big')
+            offset += size
+    except IndexError:
+        raise SNMPError("Обрезанный BER элемент")
+    end = offset + length
+    if end > len(data):
+        raise SNMPError("Длина BER элемента выходит за пределы пакета")
+    return tag, data[offset:end], end
+
+
+def decode_oid(value: bytes) -> str:
+    """Разбирает значение OID в строку 1.3.6.1..."""
+    if not value:
+        return ""
+    arcs = [value[0] // 40, value[0] % 40]
+    arc = 0
+    for byte in value[1:]:
+        arc = (arc << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            arcs.append(arc)
+            arc = 0
+    return ".".join(str(item) for item in arcs)
+
+
+def decode_value(tag: int, value: bytes):
+    """
+    Преобразует значение переменной SNMP в тип Python
+
+    Returns:
+        int для числовых типов, str для строк/OID/IP, None для NULL и исключений
+    """
+    if tag == TAG_INTEGER:
+        return int.from_bytes(value, 'big', signed=True)
+    if tag in UNSIGNED_TAGS:
+        return int.from_bytes(value, 'big', signed=False)
+    if tag == TAG_OCTET_STRING:
+        return value.decode('utf-8', errors='replace')
+    if tag == TAG_OID:
+        return decode_oid(value)
+    if tag == TAG_IP_ADDRESS:
+        return ".".join(str(byte) for byte in value)
+    if tag == TAG_OPAQUE:
+        return value.hex()
+    return None  # NULL, noSuchObject, noSuchInstance, endOfMibView
+
+
+def build_request(community: str, oids: List[str], request_id: int, version: int = SNMP_V2C,
+                  pdu_type: int = PDU_GET, non_repeaters: int = 0, max_repetitions: int = 0) -> bytes:
+    """
+    Формирует SNMP сообщение со всеми OID в одном PDU
+
+    Args:
+        community: Строка сообщества
+        oids: Запрашиваемые OID
+        request_id: Идентификатор запроса
+        version: SNMP_V1 или SNMP_V2C
+        pdu_type: PDU_GET, PDU_GET_NEXT или PDU_GET_BULK
+        non_repeaters: Для GETBULK - число первых OID, читаемых как GETNEXT
+        max_repetitions: Для GETBULK - число повторений для остальных OID
+
+    Returns:
+        Закодированное сообщение
+    """
+    varbinds = b"".join(encode_tlv(TAG_SEQUENCE, encode_oid(oid) + encode_tlv(TAG_NULL, b""))
+                        for oid in oids)
+    if pdu_type == PDU_GET_BULK:
+        fields = encode_integer(non_repeaters) + encode_integer(max_repetitions)
+    else:
+        fields = encode_integer(0) + encode_integer(0)
+    pdu = encode_tlv(pdu_type, encode_integer(request_id) + fields + encode_tlv(TAG_SEQUENCE, varbinds))
+    message = encode_integer(version) + encode_tlv(TAG_OCTET_STRING, community.encode('ascii')) + pdu
+    return encode_tlv(TAG_SEQUENCE, message)
+
+
+def parse_response(data: bytes) -> dict:
+    """
+    Разбирает ответ SNMP
+
+    Args:
+        data: UDP датаграмма
+
+    Returns:
+        Словарь {"request_id", "error_status", "error_index", "varbinds": [(oid, значение), ...]}
+
+    Raises:
+        SNMPError: если пакет не является корректным ответом
+    """
+    tag, message, _ = decode_tlv(data)
+    if tag != TAG_SEQUENCE:
+        raise SNMPError("Ответ не является SNMP сообщением")
+    _, _, offset = decode_tlv(message)              # version
+    _, _, offset = decode_tlv(message, offset)      # community
+    pdu_type, pdu, _ = decode_tlv(message, offset)
+    if pdu_type != PDU_RESPONSE:
+        raise SNMPError(f"Неожиданный тип PDU: 0x{pdu_type:02X}")
+
+    fields = []
+    offset = 0
+    for _ in range(3):
+        _, value, offset = decode_tlv(pdu, offset)
+        fields.append(int.from_bytes(value, 'big', signed=True))
+    _, varbind_list, _ = decode_tlv(pdu, offset)
+
+    varbinds = []
+    offset = 0
+    while offset < len(varbind_list):
+        _, varbind, offset = decode_tlv(varbind_list, offset)
+        _, oid_value, value_offset = decode_tlv(varbind)
+        value_tag, value, _ = decode_tlv(varbind, value_offset)
+        varbinds.append((decode_oid(oid_value), decode_value(value_tag, value)))
+
+    return {"request_id": fields[0], "error_status": fields[1],
+            "error_index": fields[2], "varbinds": varbinds}
+
+
+class SNMPClient:
+    """SNMP v1/v2c клиент поверх одного UDP сокета"""
+
+    def __init__(self, host: str, community: str = "public", version: str = "2c",
+                 port: int = 161, timeout: float = 2.0, retries: int = 1):
+        """
+        Инициализация клиента
+
+        Args:
+            host: Адрес принтера
+            community: Строка сообщества (по умолчанию public)
+            version: "1" или "2c"
+            port: UDP порт агента
+            timeout: Таймаут ожидания ответа в секундах
+            retries: Число повторных отправок при отсутствии ответа
+        """
+        if version not in SNMP_VERSIONS:
+            raise ValueError(f"Неподдерживаемая версия SNMP: {version}")
+        self.host = host
+        self.community = community
+        self.version = SNMP_VERSIONS[version]
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.socket = None
+        self._request_id = random.randint(1, 0x7FFFFFFF)
+
+    def _next_request_id(self) -> int:
+        self._request_id = self._request_id % 0x7FFFFFFF + 1
+        return self._request_id
+
+    def _exchange(self, request_id: int, message: bytes) -> dict:
+        """Отправляет запрос и ждет ответ с тем же request-id (с повторами)"""
+        if self.socket is None:
+            family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+            self.socket = socket.socket(family, socket.SOCK_DGRAM)
+            self.socket.connect((self.host, self.port))
+
+        for _ in range(self.retries + 1):
+            self.socket.send(message)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.socket.settimeout(remaining)
+                try:
+                    data = self.socket.recv(65535)
+                except socket.timeout:
+                    break
+                try:
+                    response = parse_response(data)
+                except SNMPError:
+                    continue
+                if response["request_id"] == request_id:
+                    return response
+                # Опоздавший ответ на предыдущий запрос - пропускаем
+        raise socket.timeout(f"SNMP агент {self.host} не ответил")
+
+    def get(self, oids: List[str]) -> Dict[str, object]:
+        """
+        Читает все OID одним GET запросом
+
+        В SNMP v1 отсутствующий OID делает ошибочным весь ответ: такой OID
+        исключается и запрос повторяется для остальных.
+
+        Args:
+            oids: Список OID
+
+        Returns:
+            Словарь {OID: значение или None}
+        """
+        result = {oid: None for oid in oids}
+        remaining = list(oids)
+        while remaining:
+            request_id = self._next_request_id()
+            response = self._exchange(request_id, build_request(
+                self.community, remaining, request_id, self.version, PDU_GET))
+            status, index = response["error_status"], response["error_index"]
+            if status == ERROR_NO_SUCH_NAME and 1 <= index <= len(remaining):
+                del remaining[index - 1]
+                continue
+            if status:
+                raise SNMPError(f"Агент вернул ошибку {status} (индекс {index})")
+            for oid, value in response["varbinds"]:
+                if oid in result:
+                    result[oid] = value
+            break
+        return result
+
+    def get_bulk(self, oids: List[str], max_repetitions: int = 25,
+                 non_repeaters: int = 0) -> List[Tuple[str, object]]:
+        """
+        Выполняет один GETBULK запрос (только SNMP v2c)
+
+        Args:
+            oids: Начальные OID
+            max_repetitions: Сколько следующих значений вернуть для каждого OID
+            non_repeaters: Сколько первых OID читать однократно (как GETNEXT)
+
+        Returns:
+            Список пар (OID, значение) в порядке ответа
+        """
+        if self.version == SNMP_V1:
+            raise SNMPError("GETBULK доступен только в SNMP v2c")
+        request_id = self._next_request_id()
+        response = self._exchange(request_id, build_request(
+            self.community, oids, request_id, self.version, PDU_GET_BULK,
+            non_repeaters, max_repetitions))
+        if response["error_status"]:
+            raise SNMPError(f"Агент вернул ошибку {response['error_status']}")
+        return response["varbinds"]
+
+    def walk(self, root: str, max_repetitions: int = 25) -> List[Tuple[str, object]]:
+        """
+        Обходит поддерево OID запросами GETBULK (GETNEXT в SNMP v1)
+
+        Args:
+            root: Корень поддерева
+            max_repetitions: Значений на один запрос
+
+        Returns:
+            Список пар (OID, значение) внутри поддерева
+        """
+        prefix = root.strip(".") + "."
+        current = root.strip(".")
+        result = []
+        while True:
+            if self.version == SNMP_V1:
+                request_id = self._next_request_id()
+                response = self._exchange(request_id, build_request(
+                    self.community, [current], request_id, self.version, PDU_GET_NEXT))
+                varbinds = [] if response["error_status"] else response["varbinds"]
+            else:
+                varbinds = self.get_bulk([current], max_repetitions)
+            if not varbinds:
+                return result
+            for oid, value in varbinds:
+                if not oid.startswith(prefix) or value is None:
+                    return result
+                result.append((oid, value))
+                current = oid
+
+    def close(self):
+        """Закрывает сокет"""
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    def __enter__(self) -> "SNMPClient":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _PendingRequest:
+    """Ожидающий ответа запрос к одному устройству"""
+
+    __slots__ = ("host", "address", "oids", "request_id", "message", "attempts", "deadline",
+                 "started", "sent_at", "budget")
+
+    def __init__(self, host: str, oids: List[str]):
+        self.host = host
+        self.address = host
+        self.oids = oids
+        self.request_id = 0
+        self.message = b""
+        self.attempts = 0
+        self.deadline = 0.0
+        self.started = 0.0
+        self.sent_at = 0.0
+        self.budget = None  # type: Optional[Deadline]
+
+
+class SNMPPoller:
+    """
+    Опрос множества устройств через один UDP сокет
+
+    Ответы сопоставляются с запросами по request-id, у каждого устройства
+    свой таймер повторной отправки (с удвоением таймаута). Число одновременно
+    ожидающих запросов ограничено max_outstanding, время на одно устройство
+    (вместе с повторами) - deadline.
+    """
+
+    def __init__(self, community: str = "public", version: str = "2c",
+                 oids: Optional[Dict[str, str]] = None, port: int = 161, timeout: float = 1.0,
+                 retries: int = 2, max_outstanding: int = 2048, deadline: Optional[float] = None):
+        """
+        Инициализация
+
+        Args:
+            community: Строка сообщества
+            version: "1" или "2c"
+            oids: Словарь {имя: OID} (по умолчанию SNMP_COUNTER_OIDS)
+            port: UDP порт агентов
+            timeout: Начальный таймаут ответа в секундах (удваивается при повторе)
+            retries: Число повторных отправок одному устройству
+            max_outstanding: Максимум одновременно ожидающих запросов
+            deadline: Максимальное время на одно устройство в секундах (None - без ограничения);
+                      таймаут повтора не выходит за остаток, повторы прекращаются при его исчерпании
+        """
+        if version not in SNMP_VERSIONS:
+            raise ValueError(f"Неподдерживаемая версия SNMP: {version}")
+        self.community = community
+        self.version = SNMP_VERSIONS[version]
+        self.oids = oids or SNMP_COUNTER_OIDS
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.max_outstanding = max_outstanding
+        self.deadline = deadline
+        self.stats = {}
+        self._request_id = random.randint(1, 0x7FFFFFFF)
+
+    def _reset_stats(self):
+        self.stats = {"devices": 0, "answered": 0, "timeouts": 0, "errors": 0,
+                      "requests_sent": 0, "retransmits": 0, "responses": 0,
+                      "late_responses": 0, "unmatched": 0, "elapsed": 0.0,
+                      "devices_per_second": 0.0, "packet_loss": 0.0}
+
+    def _next_request_id(self) -> int:
+        self._request_id = self._request_id % 0x7FFFFFFF + 1
+        return self._request_id
+
+    def _send(self, sock: socket.socket, request: _PendingRequest, now: float):
+        """Отправляет (или повторяет) запрос и взводит таймер устройства"""
+        try:
+            sock.sendto(request.message, (request.address, self.port))
+        except OSError:
+            pass  # Недоступная сеть и т.п. - устройство уйдет по таймауту
+        request.attempts += 1
+        request.sent_at = now
+        wait = self.timeout * (2 ** (request.attempts - 1))
+        remaining = request.budget.remaining()
+        request.deadline = now + (wait if remaining is None else min(wait, remaining))
+        self.stats["requests_sent"] += 1
+        if request.attempts > 1:
+            self.stats["retransmits"] += 1
+
+    def _timed_out(self, request: _PendingRequest, now: float) -> dict:
+        """Результат устройства, не ответившего за отведенные попытки или время"""
+        self.stats["timeouts"] += 1
+        error = (f"Превышен лимит {self.deadline:g} с на устройство" if request.budget.expired
+                 else "Агент не ответил")
+        return self._result(request, "timeout", now, error=error)
+
+    def _prepare(self, request: _PendingRequest):
+        """Формирует сообщение запроса с новым request-id"""
+        request.request_id = self._next_request_id()
+        request.message = build_request(self.community, request.oids, request.request_id,
+                                        self.version, PDU_GET)
+        request.attempts = 0
+
+    def _result(self, request: _PendingRequest, status: str, now: float,
+                values: Optional[Dict[str, object]] = None, error: Optional[str] = None) -> dict:
+        values = values or {}
+        counters = {name: values.get(oid) if isinstance(values.get(oid), int) else None
+                    for name, oid in self.oids.items()}
+        return {"ip": request.host, "status": status, "counters": counters,
+                "attempts": request.attempts, "error": error,
+                "rtt_ms": round((now - request.sent_at) * 1000, 1) if status == "ok" else None,
+                "elapsed_ms": round((now - request.started) * 1000, 1)}
+
+    def poll(self, hosts: Iterable[str]) -> Iterator[dict]:
+        """
+        Опрашивает устройства и выдает результаты по мере поступления
+
+        Args:
+            hosts: IP адреса агентов
+
+        Returns:
+            Генератор словарей {"ip", "status" ("ok"/"timeout"/"error"), "counters",
+            "attempts", "rtt_ms", "elapsed_ms", "error"}; статистика обхода - в self.stats
+        """
+        self._reset_stats()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Больший буфер приема, чтобы пачка ответов не терялась в ядре
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError:
+            pass
+        sock.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+
+        pending_hosts = iter(hosts)
+        exhausted = False
+        outstanding = {}  # type: Dict[int, _PendingRequest]
+        retired = set()   # request-id уже завершенных запросов (для учета опоздавших ответов)
+        timers = []       # Куча (срок, request-id); устаревшие записи пропускаются
+        started = time.monotonic()
+
+        try:
+            while True:
+                now = time.monotonic()
+                while not exhausted and len(outstanding) < self.max_outstanding:
+                    host = next(pending_hosts, None)
+                    if host is None:
+                        exhausted = True
+                        break
+                    request = _PendingRequest(host, list(self.oids.values()))
+                    request.started = now
+                    request.budget = Deadline(self.deadline)
+                    self.stats["devices"] += 1
+                    try:
+                        request.address = socket.gethostbyname(host)
+                    except OSError as e:
+                        self.stats["errors"] += 1
+                        yield self._result(request, "error", now, error=f"Имя не разрешено: {e}")
+                        continue
+                    if request.budget.expired:
+                        yield self._timed_out(request, time.monotonic())
+                        continue
+                    self._prepare(request)
+                    self._send(sock, request, now)
+                    outstanding[request.request_id] = request
+                    heapq.heappush(timers, (request.deadline, request.request_id))
+
+                if not outstanding:
+                    break
+
+                while timers and (timers[0][1] not in outstanding
+                                  or outstanding[timers[0][1]].deadline != timers[0][0]):
+                    heapq.heappop(timers)
+                wait = max(0.0, timers[0][0] - now) if timers else self.timeout
+
+                if selector.select(wait):
+                    while True:
+                        try:
+                            data, address = sock.recvfrom(65535)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        except OSError:
+                            continue  # ICMP ошибка от одного из агентов
+                        self.stats["responses"] += 1
+                        try:
+                            response = parse_response(data)
+                        except SNMPError:
+                            self.stats["unmatched"] += 1
+                            continue
+                        request = outstanding.get(response["request_id"])
+                        if request is None or request.address != address[0]:
+                            if response["request_id"] in retired:
+                                self.stats["late_responses"] += 1
+                            else:
+                                self.stats["unmatched"] += 1
+                            continue
+
+                        now = time.monotonic()
+                        del outstanding[request.request_id]
+                        retired.add(request.request_id)
+                        status, index = response["error_status"], response["error_index"]
+                        if (status == ERROR_NO_SUCH_NAME and 1 <= index <= len(request.oids)
+                                and len(request.oids) > 1):
+                            if request.budget.expired:
+                                yield self._timed_out(request, now)
+                                continue
+                            # SNMP v1: исключаем неизвестный OID и спрашиваем остальные
+                            del request.oids[index - 1]
+                            self._prepare(request)
+                            self._send(sock, request, now)
+                            outstanding[request.request_id] = request
+                            heapq.heappush(timers, (request.deadline, request.request_id))
+                            continue
+                        if status and status != ERROR_NO_SUCH_NAME:
+                            self.stats["errors"] += 1
+                            yield self._result(request, "error", now,
+                                               error=f"Агент вернул ошибку {status}")
+                            continue
+                        self.stats["answered"] += 1
+                        values = dict(response["varbinds"]) if not status else {}
+                        yield self._result(request, "ok", now, values)
+
+                now = time.monotonic()
+                while timers and timers[0][0] <= now:
+                    _, request_id = heapq.heappop(timers)
+                    request = outstanding.get(request_id)
+                    if request is None or request.deadline > now:
+                        continue
+                    if request.attempts <= self.retries and not request.budget.expired:
+                        # Повтор с тем же request-id: опоздавший первый ответ тоже подойдет
+                        self._send(sock, request, now)
+                        heapq.heappush(timers, (request.deadline, request_id))
+                        continue
+                    del outstanding[request_id]
+                    retired.add(request_id)
+                    yield self._timed_out(request, now)
+        finally:
+            selector.close()
+            sock.close()
+            elapsed = time.monotonic() - started
+            sent = self.stats["requests_sent"]
+            received = self.stats["responses"] - self.stats["unmatched"]
+            self.stats["elapsed"] = round(elapsed, 3)
+            self.stats["devices_per_second"] = round(self.stats["devices"] / elapsed, 1) if elapsed else 0.0
+            self.stats["packet_loss"] = round(max(0, sent - received) / sent, 4) if sent else 0.0
+
+
+def read_counters(host: str, community: str = "public", version: str = "2c",
+                  oids: Optional[Dict[str, str]] = None, timeout: float = 2.0,
+                  retries: int = 1) -> Dict[str, Optional[int]]:
+    """
+    Читает счетчики принтера одним SNMP запросом
+
+    Args:
+        host: Адрес принтера
+        community: Строка сообщества
+        version: "1" или "2c"
+        oids: Словарь {имя: OID} (по умолчанию SNMP_COUNTER_OIDS)
+        timeout: Таймаут ожидания ответа в секундах
+        retries: Число повторов
+
+    Returns:
+        Словарь {имя счетчика: значение или None}
+    """
+    oids = oids or SNMP_COUNTER_OIDS
+    with SNMPClient(host, community, version, timeout=timeout, retries=retries) as client:
+        values = client.get(list(oids.values()))
+    return {name: values.get(oid) if isinstance(values.get(oid), int) else None
+            for name, oid in oids.items()}
+
+
+def read_scan_counter(host: str, community: str = "public", version: str = "2c",
+                      oids: Optional[Dict[str, str]] = None,
+                      timeout: float = 2.0) -> Optional[int]:
+    """
+    Возвращает счетчик сканера по SNMP (первый найденный из SCAN_COUNTER_NAMES)
+
+    Returns:
+        Значение счетчика или None (нет ответа или OID не поддерживается)
+    """
+    try:
+        counters = read_counters(host, community, version, oids, timeout)
+    except (OSError, SNMPError):
+        return None
+    return pick_scan_counter(counters, oids)
+
+
+def pick_scan_counter(counters: Dict[str, Optional[int]],
+                      oids: Optional[Dict[str, str]] = None) -> Optional[int]:
+    """
+    Выбирает счетчик сканера из прочитанных значений
+
+    Args:
+        counters: Словарь {имя счетчика: значение}
+        oids: Набор OID, по которому читались значения (None - стандартный)
+
+    Returns:
+        Первое найденное значение из SCAN_COUNTER_NAMES (или из своих OID)
+    """
+    names = SCAN_COUNTER_NAMES if oids is None else [name for name in oids if name != "total_pages"]
+    for name in names:
+        if counters.get(name) is not None:
+            return counters[name]
+    return None
+
+
+def parse_oid_overrides(items: List[str]) -> Dict[str, str]:
+    """Разбирает аргументы вида NAME=OID"""
+    oids = {}
+    for item in items:
+        name, _, oid = item.partition("=")
+        if not name or not oid:
+            raise ValueError(f"Ожидается NAME=OID: {item}")
+        oids[name.strip()] = oid.strip()
+    return oids
+
+
+def main():
+    """Основная функция программы"""
+    parser = argparse.ArgumentParser(
+        description="Чтение счетчиков принтера HP по SNMP v1/v2c (без внешних библиотек)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  python hp_snmp.py 192.168.1.100
+  python hp_snmp.py 192.168.1.100 --community private --version 1
+  python hp_snmp.py 192.168.1.100 --oid scan_count=1.3.6.1.4.1.11.2.3.9.4.2.1.2.2.1.69.0
+  python hp_snmp.py 192.168.1.100 --walk 1.3.6.1.4.1.11.2.3.9.4.2.1
+        """
+    )
+
+    parser.add_argument("host", help="IP адрес принтера")
+    parser.add_argument("--community", default="public", help="Строка сообщества (по умолчанию: public)")
+    parser.add_argument("--version", choices=sorted(SNMP_VERSIONS), default="2c",
+                        help="Версия SNMP (по умолчанию: 2c)")
+    parser.add_argument("--timeout", type=float, default=2, help="Таймаут ответа в секундах (по умолчанию: 2)")
+    parser.add_argument("--retries", type=int, default=1, help="Число повторов (по умолчанию: 1)")
+    parser.add_argument("--oid", action="append", default=[], metavar="NAME=OID",
+                        help="Читать свой OID вместо стандартного набора (можно несколько раз)")
+    parser.add_argument("--walk", metavar="OID", nargs="?", const=HP_ENTERPRISE_OID,
+                        help="Обойти поддерево OID через GETBULK (по умолчанию: дерево HP)")
+
+    args = parser.parse_args()
+
+    try:
+        if args.walk:
+            with SNMPClient(args.host, args.community, args.version,
+                            timeout=args.timeout, retries=args.retries) as client:
+                for oid, value in client.walk(args.walk):
+                    print(f"{oid} = {value}")
+            return
+
+        oids = parse_oid_overrides(args.oid) if args.oid else None
+        counters = read_counters(args.host, args.community, args.version, oids,
+                                 args.timeout, args.retries)
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    except (OSError, SNMPError) as e:
+        print(f"✗ Ошибка SNMP: {e}")
+        sys.exit(1)
+
+    print(f"📊 Счетчики {args.host} (SNMP v{args.version}):")
+    for name, value in counters.items():
+        print(f"  {name}: {value if value is not None else 'не поддерживается'}")
+    if all(value is None for value in counters.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
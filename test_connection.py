@@ -7,7 +7,8 @@
 
 import socket
 import sys
-import time
+
+from hp_pjl_protocol import build_pjl_job, new_echo_token, receive_response
 
 
 def test_printer_connection(ip_address: str, port: int = 9100, timeout: int = 5):
@@ -41,23 +42,12 @@ def test_printer_connection(ip_address: str, port: int = 9100, timeout: int = 5)
         
         # Тест 2: Отправка PJL команды INFO ID
         print("2️⃣  Отправка PJL команды INFO ID...")
-        pjl_command = "\x1B%-12345X@PJL\r\n@PJL INFO ID\r\n@PJL EOJ\r\n\x1B%-12345X"
-        
-        sock.send(pjl_command.encode('ascii'))
+        echo_token = new_echo_token()
+        sock.sendall(build_pjl_job(["@PJL INFO ID"], echo_token).encode('ascii'))
         print("   📤 Команда отправлена")
         
-        # Ожидаем ответ
-        time.sleep(2)
-        response = ""
-        try:
-            while True:
-                data = sock.recv(1024).decode('ascii', errors='ignore')
-                if not data:
-                    break
-                response += data
-                time.sleep(0.1)
-        except socket.timeout:
-            pass
+        # Ожидаем ответ до маркера @PJL ECHO (или до таймаута)
+        response = receive_response(sock, echo_token, timeout).text
         
         if response.strip():
             print("   ✅ Получен ответ от принтера:")
@@ -74,15 +64,16 @@ def test_printer_connection(ip_address: str, port: int = 9100, timeout: int = 5)
         
         counter_found = False
         for cmd in counter_commands:
-            full_cmd = f"\x1B%-12345X@PJL\r\n{cmd}\r\n@PJL EOJ\r\n\x1B%-12345X"
-            sock.send(full_cmd.encode('ascii'))
-            time.sleep(1)
+            echo_token = new_echo_token()
+            sock.sendall(build_pjl_job([cmd], echo_token).encode('ascii'))
             
             try:
-                response = sock.recv(1024).decode('ascii', errors='ignore')
-                if response and "=" in response:
+                parser = receive_response(sock, echo_token, timeout)
+                # KEY=VALUE (INFO) или число в секции ответа (INQUIRE)
+                section_values = [line for lines in parser.sections.values() for line in lines]
+                if parser.values or any(line.isdigit() for line in section_values):
                     print(f"   ✅ Команда {cmd} поддерживается")
-                    print(f"      📊 Ответ: {response.strip()}")
+                    print(f"      📊 Ответ: {parser.text}")
                     counter_found = True
                     break
             except:
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общие фикстуры: симулятор принтера и IPP сервер на свободных локальных портах
+"""
+
+import pytest
+
+from hp_ipp_simulator import IPPStandInServer
+from hp_printer_simulator import PrinterSimulator
+
+
+@pytest.fixture
+def printer():
+    """Симулятор M425 (счетчик 1234) на свободном порту"""
+    simulator = PrinterSimulator(port=0, model="M425", counter=1234)
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def ipp_server():
+    """IPP сервер с одной очередью HP_M425; адрес - в ipp_server.address"""
+    server = IPPStandInServer()
+    server.add_printer("HP_M425", "HP LaserJet 400 MFP M425dn")
+    server.address = server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бинарная история счетчика (hp_counter_series) и совпадение результатов с SQLite
+"""
+
+import random
+
+import pytest
+
+from hp_counter_history import CounterHistory
+from hp_counter_series import CounterSeries, block_increase, decode_block, encode_block
+
+BASE = 1700000000
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Бинарное хранилище и SQLite с одинаковым размером пачки"""
+    series = CounterSeries(str(tmp_path / "history.hps"), batch_size=50)
+    history = CounterHistory(str(tmp_path / "history.db"), batch_size=50)
+    yield series, history
+    series.close()
+    history.close()
+
+
+def _fill(stores, count, seed):
+    """Случайные отметки двух устройств: рост, установки и сбросы без установки"""
+    rng = random.Random(seed)
+    values = {"a": 0, "b": 0}
+    for i in range(count):
+        device = rng.choice("ab")
+        if rng.random() < 0.003:
+            values[device] = rng.randint(0, 50)
+            action = "set"
+        elif rng.random() < 0.002:
+            values[device] = 0
+            action = "get"
+        else:
+            values[device] += rng.choice([0, 0, 0, 1, 3])
+            action = "get"
+        for store in stores:
+            store.record(device, values[device], action, BASE + i * 60)
+    return rng
+
+
+@pytest.mark.parametrize("samples", [
+    [(1000, 5)],
+    [(1000, 5), (2000, 6), (3000, 7), (4000, 8)],
+    [(1000, 100), (1500, 90), (61000, 90), (61001, 1234567), (61002, 0)],
+])
+def test_block_round_trip(samples):
+    payload = encode_block(samples)
+    assert decode_block(payload, *samples[0]) == samples
+    increase = sum(max(0, samples[i][1] - samples[i - 1][1]) for i in range(1, len(samples)))
+    assert block_increase(payload) == increase
+
+
+def test_regular_samples_compress():
+    samples = [(BASE * 1000 + i * 60000, 1000 + i) for i in range(1000)]
+    assert len(encode_block(samples)) < 16
+
+
+def test_usage_counts_resets_and_settings(stores):
+    series, history = stores
+    samples = [(1, 10, "get"), (2, 15, "get"), (3, 100, "set"), (4, 103, "get"), (5, 0, "get"), (6, 4, "get")]
+    for store in stores:
+        for timestamp, value, action in samples:
+            store.record("x", value, action, BASE + timestamp)
+    # 10 -> 15 (+5), установка 100, 100 -> 103 (+3), сброс 0, 0 -> 4 (+4)
+    assert series.usage("x")["delta"] == 12
+    assert series.usage("x") == history.usage("x")
+    assert series.usage("missing") is None
+
+
+def test_usage_and_query_match_sqlite(stores):
+    series, history = stores
+    rng = _fill(stores, 5000, seed=5)
+    series.compact()
+    for _ in range(30):
+        since = BASE + rng.randint(0, 5000) * 60 - 30
+        until = since + rng.randint(1, 5000) * 60
+        for device in "ab":
+            assert series.usage(device, since, until) == history.usage(device, since, until)
+    for device in ("a", None):
+        assert series.query(device, BASE + 600, BASE + 60000) == history.query(device, BASE + 600, BASE + 60000)
+        assert series.query(device, limit=25) == history.query(device, limit=25)
+    assert series.devices() == history.devices() == ["a", "b"]
+
+
+def test_reopen_reads_flushed_samples(tmp_path):
+    db_file = str(tmp_path / "history.hps")
+    series = CounterSeries(db_file, batch_size=10)
+    for i in range(25):
+        series.record("a", i, "get", BASE + i)
+    series.close()
+    reopened = CounterSeries(db_file)
+    try:
+        assert [row["counter"] for row in reopened.query("a")] == list(range(25))
+        assert reopened.usage("a")["delta"] == 24
+    finally:
+        reopened.close()
+
+
+def test_foreign_file_rejected(tmp_path):
+    db_file = tmp_path / "history.hps"
+    db_file.write_bytes(b"not a series file" * 4)
+    with pytest.raises(ValueError):
+        CounterSeries(str(db_file))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище счетчика: журнал, восстановление после сбоя, несколько процессов, устройства
+"""
+
+import json
+import multiprocessing
+import os
+import stat
+
+import pytest
+
+from hp_counter_storage import (RECORD_COUNTER, CounterStorage, DeviceStores, decode_records,
+                                encode_record)
+
+
+def _increment_worker(config_file, count):
+    """Процесс, увеличивающий счетчик через сравнение с обменом"""
+    store = CounterStorage(config_file, compact_threshold=37)
+    done = 0
+    while done < count:
+        current = store.get_counter()
+        if store.update_counter(current, current + 1):
+            done += 1
+    store.close()
+
+
+def test_record_round_trip():
+    data = encode_record(RECORD_COUNTER, 5, 1700000000.5, 1234567, "Установлен счетчик: 1234567")
+    records, valid = decode_records(data + data[:7])
+    assert records == [(RECORD_COUNTER, 5, 1700000000.5, 1234567, "Установлен счетчик: 1234567")]
+    assert valid == len(data)
+
+
+def test_journal_replay(tmp_path):
+    config_file = str(tmp_path / "c.json")
+    store = CounterStorage(config_file)
+    store.set_counter(10)
+    store.set_counter(42)
+    store._add_to_history("Сброс")
+    store.close()
+    assert os.path.getsize(store.journal_file) > 0
+
+    reopened = CounterStorage(config_file)
+    assert reopened.get_counter() == 42
+    assert [entry["action"] for entry in reopened.get_history()] == [
+        "Установлен счетчик: 10", "Установлен счетчик: 42", "Сброс"]
+
+
+def test_other_instance_sees_updates(tmp_path):
+    config_file = str(tmp_path / "c.json")
+    first = CounterStorage(config_file)
+    second = CounterStorage(config_file)
+    first.set_counter(7)
+    assert second.get_counter() == 7
+    assert not second.update_counter(0, 1)
+    assert second.increment(3) == 10
+    assert first.get_counter() == 10
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    config_file = str(tmp_path / "c.json")
+    store = CounterStorage(config_file)
+    store.set_counter(100)
+    store.close()
+    intact = os.path.getsize(store.journal_file)
+    # Оборванная запись: процесс упал посреди write()
+    with open(store.journal_file, 'ab') as f:
+        f.write(encode_record(RECORD_COUNTER, 99, 0.0, 555)[:-3])
+
+    reopened = CounterStorage(config_file)
+    assert reopened.get_counter() == 100
+    assert os.path.getsize(store.journal_file) == intact
+    reopened.set_counter(101)
+    assert CounterStorage(config_file).get_counter() == 101
+
+
+def test_compaction_keeps_state(tmp_path):
+    config_file = str(tmp_path / "c.json")
+    store = CounterStorage(config_file, compact_threshold=5)
+    for value in range(1, 13):
+        store.set_counter(value)
+    store.compact()
+    with open(config_file, encoding='utf-8') as f:
+        assert json.load(f)["scanner_counter"] == 12
+    assert CounterStorage(config_file).get_counter() == 12
+    assert len(store.get_history()) == 10
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="права доступа POSIX")
+def test_snapshot_keeps_file_mode(tmp_path):
+    config_file = str(tmp_path / "c.json")
+    store = CounterStorage(config_file)
+    store.set_counter(1)
+    store.compact()
+    os.chmod(config_file, 0o640)
+    store.set_counter(2)
+    store.compact()
+    assert stat.S_IMODE(os.stat(config_file).st_mode) == 0o640
+
+
+def test_concurrent_processes_lose_no_updates(tmp_path):
+    config_file = str(tmp_path / "c.json")
+    processes = [multiprocessing.Process(target=_increment_worker, args=(config_file, 100))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+    assert CounterStorage(config_file).get_counter() == 400
+
+
+def test_legacy_counter_migrates_by_queue_name(tmp_path):
+    """Старый выбор без серийного номера переносится на устройство с тем же именем очереди"""
+    config_file = str(tmp_path / "c.json")
+    host = CounterStorage(config_file)
+    host.set_counter(4321)
+    host.update_config({"selected_printer": {"name": "HP_M425", "port": "/dev/usb/lp0"}})
+    devices = DeviceStores(host)
+
+    other = devices.get("CNB9999", {"serial": "CNB9999", "name": "HP_M401"})
+    assert other.get_counter() == 0
+    assert not host.config.get("devices_migrated")
+
+    printer = {"serial": "CNB1234", "name": "HP_M425", "port": "/dev/usb/lp0"}
+    assert [entry["action"] for entry in devices.history("CNB1234", printer)] == [
+        "Установлен счетчик: 4321"]
+    store = devices.get("CNB1234", printer)
+    assert store.get_counter() == 4321
+    assert store.config["device_id"] == "CNB1234"
+    assert host.config["devices_migrated"] == "CNB1234"
+    assert sorted(devices.devices()) == ["CNB1234", "CNB9999"]
+    devices.close()
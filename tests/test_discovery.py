@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Перебор адресов диапазонов (hp_discovery) и список целей опроса парка (hp_fleet_counter)
+"""
+
+from hp_discovery import iter_addresses, parse_network
+from hp_fleet_counter import expand_targets
+
+
+def test_overlapping_ranges_yield_each_address_once():
+    addresses = list(iter_addresses(["10.0.0.0/24", "10.0.0.128/25", "10.0.0.5"]))
+    assert len(addresses) == len(set(addresses)) == 254
+    assert "10.0.0.0" not in addresses and "10.0.0.255" not in addresses
+
+
+def test_exclude_accepts_host_bits():
+    excluded = [parse_network("10.0.0.77/30"), "10.0.0.200"]
+    addresses = list(iter_addresses(["10.0.0.0/24"], excluded))
+    assert len(addresses) == 254 - 5
+    assert not {"10.0.0.76", "10.0.0.79", "10.0.0.200"} & set(addresses)
+
+
+def test_explicit_boundary_address_is_kept():
+    addresses = list(iter_addresses(["10.0.0.0/30", "10.0.0.3/32"]))
+    assert addresses == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+
+def test_expand_targets_dedupes_literals():
+    targets = list(expand_targets(["10.0.0.0/30", "10.0.0.0", "10.0.0.2", "printer1",
+                                   "printer1", "10.0.0.9", "bad/99"]))
+    assert targets == ["printer1", "10.0.0.9", "10.0.0.0", "10.0.0.1", "10.0.0.2"]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IPP клиент CUPS против локального IPP сервера (hp_ipp_simulator)
+"""
+
+import socket
+import threading
+
+import pytest
+
+from hp_ipp import (STATUS_NOT_FOUND, TAG_CHARSET, TAG_INTEGER, TAG_OPERATION, CupsCommands,
+                    IPPClient, IPPError, decode_message, encode_message)
+from hp_ipp_simulator import IPPStandInServer
+
+
+def test_message_round_trip():
+    payload = encode_message(0x0002, 7, [(TAG_OPERATION, [(TAG_CHARSET, "attributes-charset", "utf-8"),
+                                                          (TAG_INTEGER, "job-id", 12)])], b"data")
+    message = decode_message(payload)
+    assert (message.code, message.request_id, message.data) == (0x0002, 7, b"data")
+    assert message.group(TAG_OPERATION)["job-id"] == [12]
+
+
+def test_printers_and_jobs(ipp_server):
+    client = IPPClient(ipp_server.address, timeout=5)
+    try:
+        printers = client.get_printers()
+        assert [printer["printer-name"][0] for printer in printers] == ["HP_M425"]
+        assert client.get_jobs() == []
+
+        job_id = client.print_job("HP_M425", b"@PJL INFO ID\r\n")
+        assert job_id == 1
+        jobs = client.get_jobs("HP_M425")
+        assert [job["job-id"][0] for job in jobs] == [1]
+    finally:
+        client.close()
+
+
+def test_empty_server_lists_nothing():
+    server = IPPStandInServer()
+    client = IPPClient(server.start(), timeout=5)
+    try:
+        assert client.get_printers() == []
+        assert client.get_jobs() == []
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_print_job_to_missing_queue_fails(ipp_server):
+    client = IPPClient(ipp_server.address, timeout=5)
+    try:
+        with pytest.raises(IPPError) as error:
+            client.print_job("Nope", b"data")
+        assert error.value.status == STATUS_NOT_FOUND
+        with pytest.raises(IPPError):
+            client.get_printer_attributes("Nope")
+    finally:
+        client.close()
+    assert ipp_server.stats["jobs"] == 0
+
+
+def test_submit_raw_reports_missing_queue(ipp_server):
+    cups = CupsCommands(client=IPPClient(ipp_server.address, timeout=5))
+    try:
+        assert not cups.submit_raw("Nope", b"data", 5)
+        assert cups.use_ipp
+        assert cups.submit_raw("HP_M425", b"data", 5)
+    finally:
+        cups.close()
+    assert ipp_server.stats["jobs"] == 1
+
+
+def test_submit_raw_does_not_resubmit_after_timeout():
+    """Задание ушло, ответа нет: повтор через lp мог бы напечатать его дважды"""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    accepted = []
+    thread = threading.Thread(target=lambda: accepted.append(listener.accept()[0]), daemon=True)
+    thread.start()
+    cups = CupsCommands(client=IPPClient("127.0.0.1:%d" % listener.getsockname()[1], timeout=0.3))
+    try:
+        assert not cups.submit_raw("HP_M425", b"data", 0.3)
+        # Связь с cupsd была - переход на lp/lpstat не нужен
+        assert cups.use_ipp
+    finally:
+        cups.close()
+        for conn in accepted:
+            conn.close()
+        listener.close()
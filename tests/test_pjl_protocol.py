@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пакетные задания PJL и разбор ответов по маркерам @PJL ECHO (симулятор принтера)
+"""
+
+import socket
+import threading
+import time
+
+from hp_pjl_protocol import (READ_MODE_ECHO, PJLResponseParser, build_pjl_batch_job,
+                             read_legacy_adaptive, split_echo_segments)
+from hp_rtt import RTTStore, TRANSPORT_PJL
+from hp_scanner_counter import HPPrinterPJL
+
+
+def _stream(tokens):
+    """Поток ответов принтера на пакет из трех команд"""
+    return ("@PJL INQUIRE SCANCOUNT\r\n1234\r\n\f"
+            f"@PJL ECHO {tokens[0]}\r\n"
+            "@PJL INQUIRE SCANCOUNTER\r\n?\r\n\f"
+            f"@PJL ECHO {tokens[1]}\r\n"
+            "@PJL INFO ID\r\n\"HP LaserJet 400 MFP M425dn\"\r\n\f"
+            f"@PJL ECHO {tokens[2]}\r\n").encode("ascii")
+
+
+def test_batch_job_marks_every_command():
+    job, tokens = build_pjl_batch_job(["@PJL INQUIRE SCANCOUNT", "@PJL INFO ID"], "T")
+    assert tokens == ["T-0", "T-1"]
+    assert job.index("@PJL INQUIRE SCANCOUNT") < job.index("@PJL ECHO T-0") < job.index("@PJL INFO ID")
+
+
+def test_parser_demuxes_byte_by_byte():
+    tokens = ["T-0", "T-1", "T-2"]
+    data = _stream(tokens)
+    parser = PJLResponseParser()
+    for index in range(len(data)):
+        parser.feed(data[index:index + 1])
+    parser.finish()
+    first, second, third = parser.segments(tokens)
+    assert first.splitlines() == ["@PJL INQUIRE SCANCOUNT", "1234"]
+    assert second.splitlines()[-1] == "?"
+    assert "M425dn" in third
+    assert parser.segments(tokens) == split_echo_segments(data.decode("ascii"), tokens)
+
+
+def test_missing_marker_gives_none():
+    tokens = ["T-0", "T-1", "T-2"]
+    data = _stream(tokens).decode("ascii")
+    data = data[:data.index("@PJL ECHO T-2")]
+    assert split_echo_segments(data, tokens)[2] is None
+
+
+def test_parser_limits_size_and_line_length():
+    parser = PJLResponseParser(max_size=64, max_line=16)
+    parser.feed(b"X" * 20)
+    parser.feed(b"X" * 20 + b"\r\nA=1\r\n")
+    parser.feed(b"B=2\r\n" * 10)
+    parser.finish()
+    assert parser.truncated
+    assert parser.size == 64
+    assert "X" not in parser.text
+    assert parser.values["A"] == "1"
+
+
+def test_batch_against_simulator(printer):
+    client = HPPrinterPJL("127.0.0.1", printer.port, timeout=2)
+    assert client.connect()
+    try:
+        commands = ["@PJL INQUIRE SCANCOUNT", "@PJL INQUIRE SCANCOUNTER", "@PJL INFO ID"]
+        responses = client.send_pjl_batch(commands)
+    finally:
+        client.disconnect()
+    assert responses["@PJL INQUIRE SCANCOUNT"].splitlines()[-1] == "1234"
+    assert responses["@PJL INQUIRE SCANCOUNTER"].splitlines()[-1] == "?"
+    assert "M425dn" in responses["@PJL INFO ID"]
+    assert printer.stats["jobs"] == 1
+
+
+def test_set_and_get_counter(printer):
+    client = HPPrinterPJL("127.0.0.1", printer.port, timeout=2)
+    assert client.connect()
+    try:
+        assert client.set_scanner_counter(42)
+        assert client.get_scanner_counter() == 42
+    finally:
+        client.disconnect()
+    assert printer.counter == 42
+    assert client.read_mode == READ_MODE_ECHO
+
+
+def test_counter_above_six_digits(printer):
+    printer.counter = 1234567
+    client = HPPrinterPJL("127.0.0.1", printer.port, timeout=2)
+    assert client.connect()
+    try:
+        assert client.get_scanner_counter() == 1234567
+    finally:
+        client.disconnect()
+
+
+def test_reply_slower_than_rto_keeps_echo_mode(printer, tmp_path):
+    printer.latency = 0.5
+    rtt = RTTStore(str(tmp_path / "rtt.json"))
+    estimator = rtt.estimator(TRANSPORT_PJL, f"127.0.0.1:{printer.port}", 2)
+    for _ in range(5):
+        estimator.sample(0.01)
+    client = HPPrinterPJL("127.0.0.1", printer.port, timeout=2, rtt=rtt)
+    assert client.connect()
+    try:
+        # Ответ и маркер приходят через 0.5 с каждый - позже RTO (0.2 с)
+        response = client.send_pjl_command("@PJL INQUIRE SCANCOUNT")
+    finally:
+        client.disconnect()
+    assert response.splitlines()[-1] == "1234"
+    assert client.read_mode == READ_MODE_ECHO
+    assert estimator.backoff == 0
+
+
+def test_legacy_read_waits_for_late_reply(tmp_path):
+    ours, theirs = socket.socketpair()
+    rtt = RTTStore(str(tmp_path / "rtt.json"))
+    estimator = rtt.estimator(TRANSPORT_PJL, "legacy", 2)
+    for _ in range(5):
+        estimator.sample(0.01)
+
+    def reply():
+        time.sleep(0.5)
+        theirs.sendall(b"@PJL INFO SCANCOUNT\r\nSCANCOUNT=7\r\n\f")
+
+    thread = threading.Thread(target=reply)
+    thread.start()
+    try:
+        response = read_legacy_adaptive(ours, 2.0, rtt, estimator, time.monotonic())
+    finally:
+        thread.join()
+        ours.close()
+        theirs.close()
+    assert "SCANCOUNT=7" in response
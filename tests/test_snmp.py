@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кодирование BER и опрос SNMP агентов через один UDP сокет
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from hp_snmp import (PDU_GET, PDU_RESPONSE, SNMP_V2C, TAG_COUNTER32, TAG_NULL, TAG_OCTET_STRING,
+                     TAG_SEQUENCE, SNMPError, SNMPPoller, build_request, decode_oid, decode_tlv,
+                     encode_integer, encode_length, encode_oid, encode_tlv, parse_response)
+
+OIDS = {"total_pages": "1.3.6.1.2.1.43.10.2.1.4.1.1",
+        "scan_count": "1.3.6.1.4.1.11.2.3.9.4.2.1.2.2.1.8.0"}
+
+
+def _response(request_id, varbinds):
+    """Ответ агента: varbinds - список (OID, закодированное значение)"""
+    body = b"".join(encode_tlv(TAG_SEQUENCE, encode_oid(oid) + value) for oid, value in varbinds)
+    pdu = encode_tlv(PDU_RESPONSE, encode_integer(request_id) + encode_integer(0) + encode_integer(0)
+                     + encode_tlv(TAG_SEQUENCE, body))
+    return encode_tlv(TAG_SEQUENCE, encode_integer(SNMP_V2C)
+                      + encode_tlv(TAG_OCTET_STRING, b"public") + pdu)
+
+
+@pytest.mark.parametrize("oid", ["1.3.6.1.2.1.1.1.0", "1.3.6.1.4.1.11.2.3.9.4.2.1.2.2.1.8.0",
+                                 "1.3.268435455.4294967295.128.127"])
+def test_oid_round_trip(oid):
+    tag, value, end = decode_tlv(encode_oid(oid))
+    assert decode_oid(value) == oid
+    assert end == len(encode_oid(oid))
+
+
+def test_long_form_length():
+    assert encode_length(0x7F) == b"\x7f"
+    assert encode_length(0x80) == b"\x81\x80"
+    assert encode_length(0x1234) == b"\x82\x12\x34"
+    tag, value, _ = decode_tlv(encode_tlv(TAG_OCTET_STRING, b"x" * 300))
+    assert value == b"x" * 300
+
+
+def test_truncated_element_rejected():
+    with pytest.raises(SNMPError):
+        decode_tlv(encode_tlv(TAG_OCTET_STRING, b"x" * 300)[:100])
+
+
+def test_request_layout():
+    message = build_request("public", list(OIDS.values()), 77)
+    tag, body, _ = decode_tlv(message)
+    assert tag == TAG_SEQUENCE
+    _, version, offset = decode_tlv(body)
+    _, community, offset = decode_tlv(body, offset)
+    pdu_type, pdu, _ = decode_tlv(body, offset)
+    assert (version, community, pdu_type) == (bytes([SNMP_V2C]), b"public", PDU_GET)
+    _, request_id, offset = decode_tlv(pdu)
+    assert int.from_bytes(request_id, "big") == 77
+
+
+def test_response_round_trip():
+    data = _response(0x7FFFFFFF, [(OIDS["total_pages"], encode_integer(4000000000, TAG_COUNTER32)),
+                                  (OIDS["scan_count"], encode_integer(-5)),
+                                  ("1.3.6.1.2.1.1.5.0", encode_tlv(TAG_NULL, b""))])
+    response = parse_response(data)
+    assert response["request_id"] == 0x7FFFFFFF
+    assert response["error_status"] == 0
+    assert response["varbinds"] == [(OIDS["total_pages"], 4000000000), (OIDS["scan_count"], -5),
+                                     ("1.3.6.1.2.1.1.5.0", None)]
+
+
+class Agent:
+    """SNMP агент на свободном UDP порту; отвечает, если задан values {OID: значение}"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.values = None
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while not self.stop.is_set():
+            try:
+                data, peer = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            if self.values is None:
+                continue
+            _, body, _ = decode_tlv(data)
+            _, _, offset = decode_tlv(body)
+            _, _, offset = decode_tlv(body, offset)
+            _, pdu, _ = decode_tlv(body, offset)
+            _, request_id, _ = decode_tlv(pdu)
+            varbinds = [(oid, encode_integer(value, TAG_COUNTER32)) for oid, value in self.values.items()]
+            self.sock.sendto(_response(int.from_bytes(request_id, "big"), varbinds), peer)
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def agent():
+    agent = Agent()
+    yield agent
+    agent.close()
+
+
+def test_poller_reads_counters(agent):
+    agent.values = {OIDS["total_pages"]: 5000, OIDS["scan_count"]: 1234}
+    poller = SNMPPoller(oids=OIDS, port=agent.port, timeout=0.5, retries=1)
+    results = list(poller.poll(["127.0.0.1"]))
+    assert [result["status"] for result in results] == ["ok"]
+    assert results[0]["counters"] == {"total_pages": 5000, "scan_count": 1234}
+    assert poller.stats["answered"] == 1
+
+
+def test_poller_deadline_limits_retries(agent):
+    poller = SNMPPoller(oids=OIDS, port=agent.port, timeout=0.2, retries=5, deadline=0.3)
+    started = time.monotonic()
+    results = list(poller.poll(["127.0.0.1"]))
+    # Без лимита повторы заняли бы 0.2 * (2^6 - 1) = 12.6 с
+    assert time.monotonic() - started < 1.5
+    assert results[0]["status"] == "timeout"
+    assert results[0]["error"].startswith("Превышен лимит")